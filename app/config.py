@@ -7,6 +7,35 @@ class Settings:
     jwt_secret: str = os.getenv("JWT_SECRET", "change-me")
     jwt_algorithm: str = "HS256"
     jwt_expires_minutes: int = 60 * 24  # 1 día
+    bulk_insert_batch_size: int = int(os.getenv("BULK_INSERT_BATCH_SIZE", "1000"))
+    # Sincronización Open Banking: peticiones simultáneas en total y por banco
+    openbanking_sync_concurrency: int = int(os.getenv("OPENBANKING_SYNC_CONCURRENCY", "8"))
+    openbanking_institution_concurrency: int = int(os.getenv("OPENBANKING_INSTITUTION_CONCURRENCY", "2"))
+    openbanking_institution_min_interval: float = float(os.getenv("OPENBANKING_INSTITUTION_MIN_INTERVAL", "0"))
+    # Reconciliación completa (semanal): una petición por banco, espaciadas
+    openbanking_reconciliation_min_interval: float = float(os.getenv("OPENBANKING_RECONCILIATION_MIN_INTERVAL", "1"))
+    # Trabajos en segundo plano (scrapers, scripts de subida): hilos worker dentro de la API
+    # (0 si corren en un proceso aparte: python -m app.services.sync_jobs)
+    sync_job_workers: int = int(os.getenv("SYNC_JOB_WORKERS", "1"))
+    sync_job_poll_interval: float = float(os.getenv("SYNC_JOB_POLL_INTERVAL", "2"))
+    sync_job_stale_seconds: int = int(os.getenv("SYNC_JOB_STALE_SECONDS", "1800"))
+    # Pool de Chrome de los scrapers: navegadores abiertos, cierre por inactividad y
+    # tiempo durante el que se reutiliza la sesión bancaria sin volver a hacer login
+    browser_pool_size: int = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+    browser_idle_seconds: int = int(os.getenv("BROWSER_IDLE_SECONDS", "600"))
+    browser_session_seconds: int = int(os.getenv("BROWSER_SESSION_SECONDS", "480"))
+    browser_headless: bool = os.getenv("BROWSER_HEADLESS", "1") not in ("0", "false", "False")
+    # Documentos subidos (contratos, documentos de inquilinos, fotos), guardados por hash SHA-256:
+    # "local" en document_storage_dir o "s3" en cualquier servicio compatible (p.ej. MinIO en local)
+    document_storage_backend: str = os.getenv("DOCUMENT_STORAGE_BACKEND", "local")
+    document_storage_dir: str = os.getenv("DOCUMENT_STORAGE_DIR", os.path.join(app_data_dir, "documents"))
+    s3_endpoint_url: str = os.getenv("S3_ENDPOINT_URL") or None
+    s3_bucket: str = os.getenv("S3_BUCKET", "documents")
+    s3_access_key: str = os.getenv("S3_ACCESS_KEY") or None
+    s3_secret_key: str = os.getenv("S3_SECRET_KEY") or None
+    s3_region: str = os.getenv("S3_REGION") or None
+    # Procesos que generan las miniaturas de las fotos (0: en un hilo del propio servidor)
+    image_workers: int = int(os.getenv("IMAGE_WORKERS", "2"))
 
 settings = Settings()
 
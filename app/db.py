@@ -9,15 +9,20 @@ from .models import (
     FinancialMovement, RentalContract, 
     MortgageDetails, MortgageRevision, MortgagePrepayment,
     ClassificationRule, PaymentRule, EuriborRate, 
-    BankConnection, BankAccount, TenantDocument
+    BankConnection, BankAccount, TenantDocument, SyncJob
 )
 
+# Listeners que mantienen FinancialMovement.dedup_key
+from .services import movement_dedup  # noqa: F401
+
 os.makedirs(settings.app_data_dir, exist_ok=True)
 
 engine = create_engine(settings.database_url, pool_pre_ping=True)
 
 def init_db():
+    from .migrations import run_migrations
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
 
 def get_session():
     with Session(engine) as session:
@@ -6,20 +6,24 @@ from sqlmodel import Session, select
 
 from .config import settings
 from .db import get_session
-from .models import User
+from .services.principals import Principal, get_principal
 
 oauth2 = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 def get_current_user(
     token: str = Depends(oauth2),
     session: Session = Depends(get_session),
-) -> User:
+) -> Principal:
+    """
+    Authenticated user as a cached Principal (id, email, is_active, property_ids).
+    The token is verified on every request; the database is only read when the cache expires.
+    """
     try:
         data = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
         user_id = int(data.get("sub"))
     except Exception:
         raise HTTPException(401, "Token inválido")
-    user = session.get(User, user_id)
+    user = get_principal(session, user_id)
     if not user or not user.is_active:
         raise HTTPException(401, "Usuario inactivo o no existe")
     return user
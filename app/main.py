@@ -6,7 +6,7 @@ from .db import init_db, get_session
 from .deps import get_current_user
 from .routers import (
     properties, rules, movements, cashflow, auth,
-    financial_movements, rental_contracts, mortgage_details, classification_rules, uploads, euribor_rates, analytics, mortgage_calculator, document_manager, notifications, tax_assistant, integrations, bank_integration, bankinter_v2, bankinter_simple, bankinter_real, payment_rules, bankinter_upload, bankinter_local, viability, openbanking_tink
+    financial_movements, rental_contracts, mortgage_details, classification_rules, uploads, euribor_rates, analytics, mortgage_calculator, document_manager, notifications, tax_assistant, integrations, bank_integration, bankinter_v2, bankinter_simple, bankinter_real, payment_rules, bankinter_upload, bankinter_local, viability, openbanking_tink, sync_jobs
 )
 
 app = FastAPI(title="Inmuebles API", version="0.1.1")
@@ -17,6 +17,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
 # Routers
@@ -48,6 +49,7 @@ app.include_router(bankinter_local.router)
 app.include_router(payment_rules.router)
 app.include_router(viability.router)
 app.include_router(openbanking_tink.router)
+app.include_router(sync_jobs.router)
 
 @app.on_event("startup")
 def on_startup():
@@ -59,6 +61,14 @@ def on_startup():
     except Exception as e:
         import logging
         logging.warning(f"Could not start OpenBanking scheduler: {e}")
+    # Workers de trabajos en segundo plano (scrapers, scripts de subida)
+    from .services.sync_jobs import sync_job_worker
+    sync_job_worker.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    from .services.sync_jobs import sync_job_worker
+    sync_job_worker.stop(timeout=5)
 
 @app.get("/health")
 def health():
@@ -0,0 +1,122 @@
+# app/migrations.py
+"""
+Idempotent schema upgrades for databases created before a model change.
+SQLModel.metadata.create_all only creates missing tables, so new columns and indexes on
+existing tables are added here. Every step is safe to run on each startup.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel
+
+from .models import FinancialMovement
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+def _columns(engine: Engine, table: str) -> set:
+    return {col["name"] for col in inspect(engine).get_columns(table)}
+
+
+def _create_index(engine: Engine, index) -> None:
+    index.create(engine, checkfirst=True)
+
+
+def _backfill_dedup_keys(conn, has_external_id: bool) -> int:
+    """Compute dedup_key for movements without one; identical movements get successive occurrence keys"""
+    from .services.movement_dedup import compute_dedup_key, occurrence_key
+
+    external_id = "external_id" if has_external_id else "NULL AS external_id"
+    rows = conn.execute(text(
+        f"SELECT id, user_id, date, concept, amount, {external_id} "
+        "FROM financialmovement WHERE dedup_key IS NULL ORDER BY id"
+    )).fetchall()
+    if not rows:
+        return 0
+
+    taken = set(conn.execute(text(
+        "SELECT user_id, dedup_key FROM financialmovement WHERE dedup_key IS NOT NULL"
+    )).fetchall())
+    updates = []
+    for row in rows:
+        key = compute_dedup_key(row.date, row.concept, row.amount, row.external_id)
+        occurrence = 0
+        while (row.user_id, occurrence_key(key, occurrence)) in taken:
+            occurrence += 1
+        key = occurrence_key(key, occurrence)
+        taken.add((row.user_id, key))
+        updates.append({"id": row.id, "dedup_key": key})
+
+    for start in range(0, len(updates), BACKFILL_BATCH_SIZE):
+        conn.execute(
+            text("UPDATE financialmovement SET dedup_key = :dedup_key WHERE id = :id"),
+            updates[start:start + BACKFILL_BATCH_SIZE]
+        )
+    return len(updates)
+
+
+def add_financialmovement_dedup_key(engine: Engine) -> None:
+    columns = _columns(engine, "financialmovement")
+    # Column and backfill in one transaction so a failed run is retried next startup;
+    # later runs key the movements left without one (historical duplicates before occurrence keys)
+    with engine.begin() as conn:
+        if "dedup_key" not in columns:
+            conn.execute(text("ALTER TABLE financialmovement ADD COLUMN dedup_key VARCHAR"))
+        count = _backfill_dedup_keys(conn, "external_id" in columns)
+    if count:
+        logger.info(f"Migration: financialmovement.dedup_key set for {count} movements")
+    for index in FinancialMovement.__table__.indexes:
+        if index.name == "ix_financialmovement_user_dedup":
+            _create_index(engine, index)
+
+
+BANKACCOUNT_WATERMARK_COLUMNS = {
+    "last_booked_date": "DATE",
+    "last_booked_transaction_id": "VARCHAR",
+    "pending_since": "DATE",
+    "last_full_reconciliation": "TIMESTAMP",
+}
+
+
+def add_bankaccount_sync_watermarks(engine: Engine) -> None:
+    if "bankaccount" not in inspect(engine).get_table_names():
+        return
+    columns = _columns(engine, "bankaccount")
+    missing = {
+        name: sql_type for name, sql_type in BANKACCOUNT_WATERMARK_COLUMNS.items() if name not in columns
+    }
+    if not missing:
+        return
+    with engine.begin() as conn:
+        for name, sql_type in missing.items():
+            conn.execute(text(f"ALTER TABLE bankaccount ADD COLUMN {name} {sql_type}"))
+    logger.info(f"Migration: added bankaccount sync watermark columns {sorted(missing)}")
+
+
+def create_model_indexes(engine: Engine) -> None:
+    """Create every index declared on the models that an existing database is missing"""
+    existing_tables = set(inspect(engine).get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        for index in table.indexes:
+            try:
+                _create_index(engine, index)
+            except Exception as e:
+                # p.ej. una base antigua sin alguna de las columnas indexadas
+                logger.warning(f"Migration: could not create index {index.name}: {e}")
+
+
+MIGRATIONS = [
+    add_financialmovement_dedup_key,
+    add_bankaccount_sync_watermarks,
+    create_model_indexes,
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    for migration in MIGRATIONS:
+        migration(engine)
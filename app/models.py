@@ -1,6 +1,7 @@
 # app/models.py
 from typing import Optional, List, TYPE_CHECKING
 from datetime import date, datetime
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
 if TYPE_CHECKING:
@@ -18,7 +19,7 @@ class User(SQLModel, table=True):
 
 class Property(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    owner_id: int = Field(foreign_key="user.id")
+    owner_id: int = Field(foreign_key="user.id", index=True)
     address: str
     rooms: Optional[int] = None
     m2: Optional[int] = None
@@ -65,6 +66,15 @@ class Movement(SQLModel, table=True):
     property: Optional[Property] = Relationship(back_populates="movements")
 
 class FinancialMovement(SQLModel, table=True):
+    __table_args__ = (
+        # Un mismo movimiento no puede importarse dos veces para el mismo usuario
+        Index("ix_financialmovement_user_dedup", "user_id", "dedup_key", unique=True),
+        # Filtros habituales: property_id IN (...) + rango de fechas, y movimientos sin asignar del usuario
+        Index("ix_financialmovement_property_date", "property_id", "date"),
+        Index("ix_financialmovement_user_property_date", "user_id", "property_id", "date"),
+        Index("ix_financialmovement_user_external_id", "user_id", "external_id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")  # Owner of the movement
     property_id: Optional[int] = Field(default=None, foreign_key="property.id")  # Can be null initially
@@ -82,12 +92,16 @@ class FinancialMovement(SQLModel, table=True):
     bank_account_id: Optional[str] = None  # ID de la cuenta bancaria origen
     source: str = "manual"  # "manual", "nordigen", "bankinter", etc.
     
+    # Huella de deduplicación: hash de fecha + concepto + importe (+ external_id) y nº de ocurrencia
+    # para movimientos idénticos reales, ver services/movement_dedup
+    dedup_key: Optional[str] = None
+    
     user: Optional[User] = Relationship()
     property: Optional[Property] = Relationship(back_populates="financial_movements")
 
 class RentalContract(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    property_id: int = Field(foreign_key="property.id")
+    property_id: int = Field(foreign_key="property.id", index=True)
     tenant_name: str
     start_date: date
     end_date: Optional[date] = None
@@ -121,6 +135,22 @@ class TenantDocument(SQLModel, table=True):
     
     rental_contract: Optional[RentalContract] = Relationship(back_populates="tenant_documents")
 
+class ImageVariant(SQLModel, table=True):
+    """Foto subida ("original") y sus derivadas por tamaño y formato, ver services/image_variants"""
+    __table_args__ = (
+        Index("ix_imagevariant_source_label_format", "source_digest", "label", "format", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    source_digest: str  # SHA-256 de la foto original (document_store)
+    label: str  # "original", "thumb", "medium"
+    format: str  # "jpeg", "png", "webp", "avif"...
+    width: int
+    height: int
+    digest: str = Field(index=True)  # SHA-256 del fichero de esta variante (el del original en "original")
+    size: int  # Bytes
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
 class MortgageDetails(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     property_id: int = Field(foreign_key="property.id", unique=True)
@@ -139,6 +169,10 @@ class MortgageDetails(SQLModel, table=True):
     prepayments: List["MortgagePrepayment"] = Relationship(back_populates="mortgage")
 
 class MortgageRevision(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_mortgagerevision_mortgage_date", "mortgage_id", "effective_date"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     mortgage_id: int = Field(foreign_key="mortgagedetails.id")
     effective_date: date
@@ -157,6 +191,10 @@ class MortgagePrepayment(SQLModel, table=True):
     mortgage: Optional[MortgageDetails] = Relationship(back_populates="prepayments")
 
 class ClassificationRule(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_classificationrule_property_active", "property_id", "is_active"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     property_id: int = Field(foreign_key="property.id")
     keyword: str  # Palabra clave a buscar en el concepto
@@ -227,9 +265,32 @@ class BankAccount(SQLModel, table=True):
     # Control de sincronización
     last_transaction_sync: Optional[datetime] = None
     sync_from_date: Optional[date] = None  # Desde qué fecha sincronizar
+    # Marca de agua de la sincronización incremental
+    last_booked_date: Optional[date] = None  # Fecha contable más reciente recibida
+    last_booked_transaction_id: Optional[str] = None  # Transacción de esa fecha
+    pending_since: Optional[date] = None  # Fecha más antigua entre las transacciones pendientes
+    last_full_reconciliation: Optional[datetime] = None
     
     connection: Optional[BankConnection] = Relationship(back_populates="bank_accounts")
 
+class SyncJob(SQLModel, table=True):
+    """Sincronización en segundo plano (scrapers, scripts de subida); los workers escriben aquí el progreso"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    kind: str  # bankinter_upload_latest, bankinter_local_sync, bankinter_sync_now
+    status: str = Field(default="queued", index=True)  # queued, running, completed, failed, cancelled
+    params: Optional[str] = None  # JSON string con los parámetros del trabajo
+    progress: int = 0  # 0-100
+    current_step: Optional[str] = None
+    stats: Optional[str] = None  # JSON string con contadores parciales
+    result: Optional[str] = None  # JSON string con el resultado final
+    error: Optional[str] = None
+    worker_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None  # Última escritura de progreso del worker
+    finished_at: Optional[datetime] = None
+
 class PaymentRule(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
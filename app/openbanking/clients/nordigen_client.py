@@ -4,29 +4,41 @@ from typing import Dict, List, Optional, Any
 from datetime import datetime, date, timedelta
 import logging
 
+from ..http_pool import PooledHttpClient
+
 logger = logging.getLogger(__name__)
 
 class NordigenClient:
     """Cliente para la API de Nordigen (GoCardless Bank Account Data)"""
     
-    def __init__(self):
-        self.secret_id = os.getenv("NORDIGEN_SECRET_ID")
-        self.secret_key = os.getenv("NORDIGEN_SECRET_KEY")
-        self.base_url = "https://ob.nordigen.com/api/v2"
+    def __init__(self, secret_id: Optional[str] = None, secret_key: Optional[str] = None,
+                 base_url: Optional[str] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.secret_id = secret_id or os.getenv("NORDIGEN_SECRET_ID")
+        self.secret_key = secret_key or os.getenv("NORDIGEN_SECRET_KEY")
+        self.base_url = base_url or os.getenv("NORDIGEN_BASE_URL", "https://ob.nordigen.com/api/v2")
         self._access_token = None
         self._token_expires_at = None
+        # Un único cliente HTTP (pool de conexiones) para todas las peticiones
+        self.http = PooledHttpClient(self.base_url, transport=transport)
         
         if not self.secret_id or not self.secret_key:
             raise ValueError("Nordigen credentials not found in environment variables")
 
+    def _token_is_valid(self) -> bool:
+        return bool(self._access_token and self._token_expires_at and datetime.now() < self._token_expires_at)
+
     async def _get_access_token(self) -> str:
         """Obtiene o renueva el token de acceso"""
-        if self._access_token and self._token_expires_at and datetime.now() < self._token_expires_at:
+        if self._token_is_valid():
             return self._access_token
+        
+        async with self.http.token_lock:
+            if self._token_is_valid():
+                return self._access_token
             
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/token/new/",
+            response = await self.http.request(
+                "POST",
+                "/token/new/",
                 json={
                     "secret_id": self.secret_id,
                     "secret_key": self.secret_key
@@ -47,15 +59,13 @@ class NordigenClient:
         token = await self._get_access_token()
         headers = {"Authorization": f"Bearer {token}"}
         
-        async with httpx.AsyncClient() as client:
-            response = await client.request(
-                method,
-                f"{self.base_url}{endpoint}",
-                headers=headers,
-                **kwargs
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.http.request(method, endpoint, headers=headers, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self) -> None:
+        """Cierra las conexiones del pool"""
+        await self.http.aclose()
 
     async def get_institutions(self, country_code: str = "ES") -> List[Dict[str, Any]]:
         """Obtiene la lista de instituciones bancarias disponibles"""
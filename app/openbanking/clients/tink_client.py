@@ -5,17 +5,21 @@ from datetime import datetime, date, timedelta
 import logging
 import base64
 
+from ..http_pool import PooledHttpClient
+
 logger = logging.getLogger(__name__)
 
 class TinkClient:
     """Cliente para la API de Tink Open Banking"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
         self.client_id = os.getenv("TINK_CLIENT_ID")
         self.client_secret = os.getenv("TINK_CLIENT_SECRET")
         self.base_url = "https://api.tink.se"
         self._access_token = None
         self._token_expires_at = None
+        # Un único cliente HTTP (pool de conexiones) para todas las peticiones
+        self.http = PooledHttpClient(self.base_url, transport=transport)
         
         # Allow demo mode without credentials for production testing
         self.demo_mode = not (self.client_id and self.client_secret)
@@ -23,18 +27,25 @@ class TinkClient:
             import logging
             logging.warning("Tink running in demo mode - no API credentials found")
 
+    def _token_is_valid(self) -> bool:
+        return bool(self._access_token and self._token_expires_at and datetime.now() < self._token_expires_at)
+
     async def _get_access_token(self) -> str:
         """Obtiene o renueva el token de acceso"""
         if self.demo_mode:
             # En modo demo, usar token falso
             return "demo_token_for_sandbox_testing"
             
-        if self._access_token and self._token_expires_at and datetime.now() < self._token_expires_at:
+        if self._token_is_valid():
             return self._access_token
+        
+        async with self.http.token_lock:
+            if self._token_is_valid():
+                return self._access_token
             
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/v1/oauth/token",
+            response = await self.http.request(
+                "POST",
+                "/api/v1/oauth/token",
                 headers={
                     "Content-Type": "application/x-www-form-urlencoded"
                 },
@@ -65,15 +76,13 @@ class TinkClient:
         if "headers" in kwargs:
             headers.update(kwargs.pop("headers"))
         
-        async with httpx.AsyncClient() as client:
-            response = await client.request(
-                method,
-                f"{self.base_url}{endpoint}",
-                headers=headers,
-                **kwargs
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.http.request(method, endpoint, headers=headers, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self) -> None:
+        """Cierra las conexiones del pool"""
+        await self.http.aclose()
 
     async def get_providers(self, country_code: str = "ES") -> List[Dict[str, Any]]:
         """Obtiene la lista de proveedores bancarios disponibles"""
@@ -0,0 +1,141 @@
+# app/openbanking/http_pool.py
+"""
+Shared HTTP plumbing for the Open Banking clients: one pooled (HTTP/2 when the h2
+package is installed) httpx.AsyncClient per provider, and per-institution rate limits.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+DEFAULT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+# Reintentos ante 429 Too Many Requests (respetando Retry-After)
+MAX_RATE_LIMIT_RETRIES = 2
+MAX_RETRY_AFTER_SECONDS = 30.0
+
+
+class PooledHttpClient:
+    """
+    Lazily created httpx.AsyncClient reused for every request of a provider, so the TLS
+    handshake and connection are paid once. The client is rebuilt if the event loop changed
+    (e.g. between asyncio.run calls in scripts), since httpx clients are bound to their loop.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        limits: httpx.Limits = DEFAULT_LIMITS,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT
+    ):
+        self.base_url = base_url
+        self.transport = transport
+        self.limits = limits
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._token_lock: Optional[asyncio.Lock] = None
+
+    def get(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=HTTP2_AVAILABLE and self.transport is None,
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=self.transport,
+            )
+            self._loop = loop
+            self._token_lock = asyncio.Lock()
+        return self._client
+
+    @property
+    def token_lock(self) -> asyncio.Lock:
+        """Lock so concurrent requests refresh the provider access token only once"""
+        self.get()
+        return self._token_lock
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request, waiting and retrying when the provider answers 429"""
+        client = self.get()
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            response = await client.request(method, url, **kwargs)
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                return response
+            try:
+                wait = float(response.headers.get("Retry-After", 1))
+            except ValueError:
+                wait = 1.0
+            wait = min(wait, MAX_RETRY_AFTER_SECONDS)
+            logger.warning(f"Rate limited by {self.base_url}{url}, retrying in {wait}s")
+            await asyncio.sleep(wait)
+        return response
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+class InstitutionRateLimiter:
+    """
+    Per-institution limits: at most max_concurrent requests in flight and at least
+    min_interval seconds between request starts for the same institution.
+    """
+
+    def __init__(self, max_concurrent: int = 2, min_interval: float = 0.0):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_start: Dict[str, float] = {}
+
+    def _semaphore(self, institution_id: str) -> asyncio.Semaphore:
+        if institution_id not in self._semaphores:
+            self._semaphores[institution_id] = asyncio.Semaphore(self.max_concurrent)
+            self._locks[institution_id] = asyncio.Lock()
+        return self._semaphores[institution_id]
+
+    async def _space_out(self, institution_id: str) -> None:
+        if self.min_interval <= 0:
+            return
+        async with self._locks[institution_id]:
+            last = self._last_start.get(institution_id)
+            now = time.monotonic()
+            if last is not None and now - last < self.min_interval:
+                await asyncio.sleep(self.min_interval - (now - last))
+            self._last_start[institution_id] = time.monotonic()
+
+    def limit(self, institution_id: str) -> "_InstitutionSlot":
+        return _InstitutionSlot(self, institution_id)
+
+
+class _InstitutionSlot:
+    def __init__(self, limiter: InstitutionRateLimiter, institution_id: str):
+        self.limiter = limiter
+        self.institution_id = institution_id
+        self.semaphore = limiter._semaphore(institution_id)
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            await self.limiter._space_out(self.institution_id)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
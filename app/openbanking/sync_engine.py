@@ -0,0 +1,295 @@
+# app/openbanking/sync_engine.py
+"""
+Concurrent Open Banking sync: connections and their accounts are fetched in parallel over
+the provider's pooled client, bounded by a global semaphore and per-institution limits.
+Database work runs in worker threads with its own sessions so it never blocks the loop.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from ..config import settings
+from ..models import BankConnection, BankAccount
+from ..services.synced_transactions import WATERMARK_OVERLAP_DAYS, store_synced_transactions
+from .http_pool import InstitutionRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Días hacia atrás que se piden al banco en la primera sincronización de una cuenta
+DEFAULT_LOOKBACK_DAYS = 7
+# Ventana de la reconciliación completa si la cuenta no tiene sync_from_date (máximo habitual de Nordigen)
+FULL_RECONCILIATION_DAYS = 90
+
+SYNC_MODE_INCREMENTAL = "incremental"  # solo lo nuevo desde la marca de agua de cada cuenta
+SYNC_MODE_FULL = "full"  # toda la ventana de reconciliación
+
+
+def _parse_date(value) -> Optional[date]:
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def sync_date_from(account: Dict[str, Any], today: date, mode: str, lookback_days: int) -> date:
+    """First date to request for an account in the given mode"""
+    sync_from_date = account.get("sync_from_date")
+    if mode == SYNC_MODE_FULL:
+        return sync_from_date or today - timedelta(days=FULL_RECONCILIATION_DAYS)
+    if account.get("last_booked_date") is None:
+        # Primera sincronización de la cuenta
+        return sync_from_date or today - timedelta(days=lookback_days)
+
+    date_from = account["last_booked_date"] - timedelta(days=WATERMARK_OVERLAP_DAYS)
+    pending_since = account.get("pending_since")
+    if pending_since and pending_since < date_from:
+        # Vuelve a pedir desde la pendiente más antigua para recoger su paso a contabilizada
+        date_from = pending_since
+    if sync_from_date and sync_from_date > date_from:
+        date_from = sync_from_date
+    return date_from
+
+
+def booked_watermark(movements: List[Dict[str, Any]]) -> Tuple[Optional[date], Optional[str]]:
+    """Latest booking date among formatted movements and the transaction id booked that day"""
+    latest_date, latest_id = None, None
+    for movement in movements:
+        movement_date = _parse_date(movement.get("date"))
+        if movement_date and (latest_date is None or movement_date >= latest_date):
+            latest_date, latest_id = movement_date, movement.get("external_id")
+    return latest_date, latest_id
+
+
+def pending_since(pending: List[Dict[str, Any]]) -> Optional[date]:
+    """Oldest date among the provider's pending (not yet booked) transactions"""
+    dates = []
+    for transaction in pending:
+        details = transaction.get("transactionDetails") or transaction
+        pending_date = _parse_date(
+            details.get("bookingDate") or details.get("valueDate") or details.get("transactionDate") or ""
+        )
+        if pending_date:
+            dates.append(pending_date)
+    return min(dates) if dates else None
+
+
+@dataclass
+class ConnectionSyncResult:
+    connection_id: int
+    institution_id: str
+    mode: str = SYNC_MODE_INCREMENTAL
+    status: str = "SUCCESS"  # SUCCESS, ERROR
+    accounts: int = 0
+    failed_accounts: int = 0
+    transactions: int = 0
+    new_transactions: int = 0
+    fetch_seconds: float = 0.0
+    store_seconds: float = 0.0
+    duration_seconds: float = 0.0
+    error: Optional[str] = None
+    account_errors: Dict[str, str] = field(default_factory=dict)
+
+
+class SyncEngine:
+    """
+    Syncs bank connections concurrently. At most max_concurrency provider requests are in
+    flight overall and per_institution_concurrency per bank (min_interval seconds apart).
+    """
+
+    def __init__(
+        self,
+        client=None,
+        db_engine: Optional[Engine] = None,
+        max_concurrency: Optional[int] = None,
+        per_institution_concurrency: Optional[int] = None,
+        min_interval: Optional[float] = None,
+        lookback_days: int = DEFAULT_LOOKBACK_DAYS
+    ):
+        self._client = client
+        self._db_engine = db_engine
+        self.max_concurrency = max_concurrency or settings.openbanking_sync_concurrency
+        self.per_institution_concurrency = per_institution_concurrency or settings.openbanking_institution_concurrency
+        self.min_interval = settings.openbanking_institution_min_interval if min_interval is None else min_interval
+        self.lookback_days = lookback_days
+
+    @property
+    def client(self):
+        if self._client is None:
+            from .clients.nordigen_client import nordigen_client
+            self._client = nordigen_client
+        return self._client
+
+    @property
+    def db_engine(self) -> Engine:
+        if self._db_engine is None:
+            from ..db import engine
+            self._db_engine = engine
+        return self._db_engine
+
+    async def sync_connections(
+        self,
+        connection_ids: List[int],
+        mode: str = SYNC_MODE_INCREMENTAL
+    ) -> List[ConnectionSyncResult]:
+        """Sync the given connections concurrently and return one result per connection"""
+        # Semáforos creados por ejecución: quedan ligados al event loop actual
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = InstitutionRateLimiter(self.per_institution_concurrency, self.min_interval)
+        # Cada conexión devuelve su propio resultado con el error: una que falle no corta las demás
+        return list(await asyncio.gather(
+            *(self._sync_connection(connection_id, semaphore, limiter, mode) for connection_id in connection_ids)
+        ))
+
+    async def sync_connection(self, connection_id: int, mode: str = SYNC_MODE_INCREMENTAL) -> ConnectionSyncResult:
+        return (await self.sync_connections([connection_id], mode))[0]
+
+    async def _sync_connection(
+        self,
+        connection_id: int,
+        semaphore: asyncio.Semaphore,
+        limiter: InstitutionRateLimiter,
+        mode: str = SYNC_MODE_INCREMENTAL
+    ) -> ConnectionSyncResult:
+        started = time.perf_counter()
+        result = ConnectionSyncResult(connection_id=connection_id, institution_id="", mode=mode)
+
+        try:
+            connection = await asyncio.to_thread(self._start_connection, connection_id)
+            result.institution_id = connection["institution_id"]
+            date_to = datetime.now().date()
+            accounts = connection["accounts"]
+            result.accounts = len(accounts)
+
+            async def fetch(account: Dict[str, Any]):
+                date_from = sync_date_from(account, date_to, mode, self.lookback_days)
+                # Primero el hueco del banco: una petición que espera a un banco limitado no ocupa
+                # un hueco global que podrían usar otros bancos
+                async with limiter.limit(connection["institution_id"]), semaphore:
+                    return await self.client.get_account_transactions(account["account_id"], date_from, date_to)
+
+            fetch_started = time.perf_counter()
+            responses = await asyncio.gather(*(fetch(a) for a in accounts), return_exceptions=True)
+            result.fetch_seconds = time.perf_counter() - fetch_started
+
+            fetched: Dict[int, Dict[str, Any]] = {}
+            for account, response in zip(accounts, responses):
+                if isinstance(response, BaseException):
+                    logger.error(f"Error syncing account {account['account_id']}: {response}")
+                    result.account_errors[account["account_id"]] = str(response)
+                    continue
+                transactions = response.get("transactions", {})
+                movements = [
+                    self.client.format_transaction_to_financial_movement(t, account["account_id"])
+                    for t in transactions.get("booked", [])
+                ]
+                last_booked_date, last_booked_id = booked_watermark(movements)
+                fetched[account["id"]] = {
+                    "movements": movements,
+                    "last_booked_date": last_booked_date,
+                    "last_booked_transaction_id": last_booked_id,
+                    "pending_since": pending_since(transactions.get("pending", [])),
+                }
+            result.failed_accounts = len(result.account_errors)
+            if accounts and result.failed_accounts == len(accounts):
+                raise RuntimeError(next(iter(result.account_errors.values())))
+
+            store_started = time.perf_counter()
+            result.transactions, result.new_transactions = await asyncio.to_thread(
+                self._store_transactions, connection_id, connection["user_id"], fetched, mode
+            )
+            result.store_seconds = time.perf_counter() - store_started
+        except Exception as e:
+            logger.error(f"Error syncing connection {connection_id}: {e}")
+            result.status = "ERROR"
+            result.error = str(e)
+
+        try:
+            await asyncio.to_thread(self._finish_connection, connection_id, result.error)
+        except Exception as e:
+            logger.error(f"Error saving sync status of connection {connection_id}: {e}")
+            if result.error is None:
+                result.status = "ERROR"
+                result.error = str(e)
+        result.duration_seconds = time.perf_counter() - started
+        return result
+
+    def _start_connection(self, connection_id: int) -> Dict[str, Any]:
+        """Mark the connection as SYNCING and return what the async side needs (no ORM objects)"""
+        with Session(self.db_engine) as session:
+            connection = session.get(BankConnection, connection_id)
+            if connection is None:
+                raise ValueError(f"Bank connection {connection_id} not found")
+            connection.sync_status = "SYNCING"
+            connection.sync_error = None
+            session.add(connection)
+            accounts = session.exec(
+                select(
+                    BankAccount.id, BankAccount.account_id, BankAccount.sync_from_date,
+                    BankAccount.last_booked_date, BankAccount.pending_since
+                ).where(BankAccount.connection_id == connection_id)
+            ).all()
+            data = {
+                "user_id": connection.user_id,
+                "institution_id": connection.institution_id,
+                "accounts": [dict(a._mapping) for a in accounts],
+            }
+            session.commit()
+            return data
+
+    def _finish_connection(self, connection_id: int, error: Optional[str]) -> None:
+        with Session(self.db_engine) as session:
+            connection = session.get(BankConnection, connection_id)
+            if connection is None:
+                return
+            if error:
+                connection.sync_status = "ERROR"
+                connection.sync_error = error
+            else:
+                connection.sync_status = "SUCCESS"
+                connection.last_sync = datetime.now()
+            session.add(connection)
+            session.commit()
+
+    def _store_transactions(
+        self,
+        connection_id: int,
+        user_id: int,
+        fetched: Dict[int, Dict[str, Any]],
+        mode: str = SYNC_MODE_INCREMENTAL
+    ) -> tuple:
+        """
+        Insert the transactions not seen before (batched, see services/synced_transactions)
+        and advance each account's watermark; returns (total, new)
+        """
+        total = 0
+        new = 0
+        now = datetime.now()
+        with Session(self.db_engine) as session:
+            for account_pk, data in fetched.items():
+                account_total, account_new = store_synced_transactions(
+                    session, user_id, data["movements"], source="nordigen"
+                )
+                total += account_total
+                new += account_new
+
+                account = session.get(BankAccount, account_pk)
+                account.last_transaction_sync = now
+                last_booked_date = data["last_booked_date"]
+                if last_booked_date and (account.last_booked_date is None or last_booked_date >= account.last_booked_date):
+                    account.last_booked_date = last_booked_date
+                    account.last_booked_transaction_id = data["last_booked_transaction_id"]
+                account.pending_since = data["pending_since"]
+                if mode == SYNC_MODE_FULL:
+                    account.last_full_reconciliation = now
+                session.add(account)
+            session.commit()
+        logger.info(f"Connection {connection_id} synced ({mode}): {new}/{total} new transactions")
+        return total, new
@@ -7,6 +7,7 @@ import logging
 from ..db import get_session
 from ..deps import get_current_user
 from ..models import Property, FinancialMovement, RentalContract, MortgageDetails
+from ..services.movement_aggregates import PropertyTotals, property_totals
 
 logger = logging.getLogger(__name__)
 
@@ -111,28 +112,19 @@ def get_property_dashboard(
     start_date = date(year, 1, 1)
     end_date = date(year, 12, 31)
     
-    # Movimientos del año
-    movements = session.exec(
-        select(FinancialMovement)
-        .where(FinancialMovement.property_id == property_id)
-        .where(FinancialMovement.date >= start_date)
-        .where(FinancialMovement.date <= end_date)
-    ).all()
-    
-    # Cálculos básicos
-    total_income = sum(m.amount for m in movements if m.amount > 0)
-    total_expenses = sum(abs(m.amount) for m in movements if m.amount < 0)
-    net_income = total_income - total_expenses
+    # Totales del año agregados en SQL (una fila por categoría/subcategoría/signo)
+    totals = property_totals(
+        session, start_date, end_date, property_ids=[property_id]
+    ).get(property_id, PropertyTotals())
+    total_income = totals.income
+    total_expenses = totals.expenses
+    net_income = totals.net_income
     
     # Ingresos por categoría
-    rent_income = sum(m.amount for m in movements if m.category == "Renta" and m.amount > 0)
+    rent_income = totals.rent_income
     
     # Gastos por categoría
-    expenses_by_category = {}
-    for movement in movements:
-        if movement.amount < 0:
-            category = movement.subcategory or movement.category
-            expenses_by_category[category] = expenses_by_category.get(category, 0) + abs(movement.amount)
+    expenses_by_category = totals.expenses_by_category
     
     # Obtener hipoteca de la propiedad
     mortgage = session.exec(
@@ -269,18 +261,14 @@ def get_portfolio_summary(
     
     valid_rois = []
     
+    # Totales de todas las propiedades en una sola consulta agregada
+    totals_by_property = property_totals(session, start_date, end_date, owner_id=current_user.id)
+    
     for prop in properties:
-        # Movimientos de la propiedad
-        movements = session.exec(
-            select(FinancialMovement)
-            .where(FinancialMovement.property_id == prop.id)
-            .where(FinancialMovement.date >= start_date)
-            .where(FinancialMovement.date <= end_date)
-        ).all()
-        
-        income = sum(m.amount for m in movements if m.amount > 0)
-        expenses = sum(abs(m.amount) for m in movements if m.amount < 0)
-        net_income = income - expenses
+        totals = totals_by_property.get(prop.id, PropertyTotals())
+        income = totals.income
+        expenses = totals.expenses
+        net_income = totals.net_income
         
         # Inversión total: precio de compra + 10% proxy para impuestos y gastos
         purchase_price = prop.purchase_price or 0
@@ -327,8 +315,7 @@ def get_cash_flow_projection(
     current_user = Depends(get_current_user)
 ):
     """Proyección de cash flow para los próximos meses"""
-    property_data = session.get(Property, property_id)
-    if not property_data or property_data.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         return {"error": "Propiedad no encontrada"}
     
     # Obtener histórico de movimientos (últimos 12 meses)
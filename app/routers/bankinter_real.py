@@ -46,7 +46,7 @@ async def update_bankinter_movements_real(
             )
             
             # Setup and run scraper
-            scraper.setup_driver()
+            await asyncio.to_thread(scraper.setup_driver)
             transactions, excel_file, api_excel_file, csv_file, _ = await scraper.get_august_movements_corrected()
             
             if not transactions:
@@ -1,5 +1,6 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlmodel import Session, select
+from sqlmodel import Session
 from typing import List, Dict
 from datetime import date, timedelta
 import logging
@@ -11,6 +12,7 @@ from ..db import get_session
 from ..models import User, FinancialMovement
 from ..services.bankinter_scraper_v2 import BankinterScraperV2
 from ..services.bankinter_scraper_v7 import BankinterScraperV7
+from ..services.movement_dedup import compute_dedup_key, new_dedup_keys
 
 router = APIRouter(prefix="/bankinter", tags=["Bankinter"])
 
@@ -79,23 +81,21 @@ async def _sync_transactions_background(
         with get_session() as db:
             saved_count = 0
             
-            for t in transactions:
-                # Verificar si ya existe la transacción
-                existing = db.query(FinancialMovement).filter(
-                    FinancialMovement.user_id == user_id,
-                    FinancialMovement.date == t.date,
-                    FinancialMovement.amount == t.amount,
-                    FinancialMovement.description.contains(t.description[:20])
-                ).first()
-                
-                if not existing:
+            # Verificar qué transacciones ya existen, por lotes con el índice (user_id, dedup_key)
+            dedup_keys = new_dedup_keys(db, user_id, [
+                compute_dedup_key(t.date, t.description, t.amount) for t in transactions
+            ])
+            
+            for t, dedup_key in zip(transactions, dedup_keys):
+                if dedup_key is not None:
                     movement = FinancialMovement(
                         user_id=user_id,
                         date=t.date,
-                        description=t.description,
+                        concept=t.description,
                         amount=t.amount,
                         category="Bankinter Import",
-                        source="bankinter_v2"
+                        source="bankinter_v2",
+                        dedup_key=dedup_key
                     )
                     
                     db.add(movement)
@@ -159,7 +159,7 @@ async def update_bankinter_movements_v2(
     )
     
     try:
-        scraper.setup_driver()
+        await asyncio.to_thread(scraper.setup_driver)
         transactions, excel_file, api_excel_file, csv_file, upload_result = await scraper.get_august_movements_corrected()
         
         logger.info(f"Extracted {len(transactions)} transactions from Bankinter")
@@ -171,24 +171,21 @@ async def update_bankinter_movements_v2(
                 "created_movements": 0,
                 "duplicates_skipped": 0,
                 "total_movements": 0,
-                "total_processed": 0
+                "total_processed": 0,
+                "timings": scraper.timer.as_dict()
             }
         
         # Direct database insertion (same logic as the working frontend approach)
         new_movements = 0
         duplicates_skipped = 0
         
-        for transaction in transactions:
-            # Check for duplicates
-            statement = select(FinancialMovement).where(
-                FinancialMovement.user_id == current_user.id,
-                FinancialMovement.date == transaction.date,
-                FinancialMovement.amount == transaction.amount,
-                FinancialMovement.concept.contains(transaction.description[:20] if len(transaction.description) > 20 else transaction.description)
-            )
-            existing = db.exec(statement).first()
-            
-            if not existing:
+        # Check duplicates for the whole batch through the (user_id, dedup_key) index
+        dedup_keys = new_dedup_keys(db, current_user.id, [
+            compute_dedup_key(t.date, t.description, t.amount) for t in transactions
+        ])
+        
+        for transaction, dedup_key in zip(transactions, dedup_keys):
+            if dedup_key is not None:
                 # Create new movement
                 movement = FinancialMovement(
                     user_id=current_user.id,
@@ -200,7 +197,8 @@ async def update_bankinter_movements_v2(
                     bank_balance=transaction.balance,
                     is_classified=True,
                     tenant_name=None,
-                    property_id=None  # Will be assigned later by rules
+                    property_id=None,  # Will be assigned later by rules
+                    dedup_key=dedup_key
                 )
                 
                 db.add(movement)
@@ -223,7 +221,8 @@ async def update_bankinter_movements_v2(
             "total_processed": len(transactions),
             "excel_generated": excel_file is not None,
             "upload_successful": True,
-            "date_range": "Agosto 2025"
+            "date_range": "Agosto 2025",
+            "timings": scraper.timer.as_dict()
         }
         
     except Exception as e:
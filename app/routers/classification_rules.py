@@ -7,6 +7,8 @@ from pydantic import BaseModel
 from ..db import get_session
 from ..deps import get_current_user
 from ..models import User, Property, ClassificationRule, RentalContract
+from ..services.classification import get_user_engine, invalidate_user_rules
+from ..services.bulk_write import bulk_insert
 
 router = APIRouter(prefix="/classification-rules", tags=["classification-rules"])
 
@@ -67,8 +69,7 @@ def create_classification_rule(
 ):
     """Create a new classification rule"""
     # Verify property ownership
-    property_obj = session.get(Property, rule_data.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(rule_data.property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     # Validate category
@@ -80,6 +81,7 @@ def create_classification_rule(
     session.add(rule)
     session.commit()
     session.refresh(rule)
+    invalidate_user_rules(current_user.id)
     return rule
 
 @router.get("/{rule_id}", response_model=ClassificationRuleResponse)
@@ -94,8 +96,7 @@ def get_classification_rule(
         raise HTTPException(status_code=404, detail="Rule not found")
     
     # Verify ownership through property
-    property_obj = session.get(Property, rule.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(rule.property_id):
         raise HTTPException(status_code=404, detail="Rule not found")
     
     return rule
@@ -113,8 +114,7 @@ def update_classification_rule(
         raise HTTPException(status_code=404, detail="Rule not found")
     
     # Verify ownership
-    property_obj = session.get(Property, rule.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(rule.property_id):
         raise HTTPException(status_code=404, detail="Rule not found")
     
     # Validate category if provided
@@ -129,6 +129,7 @@ def update_classification_rule(
     
     session.commit()
     session.refresh(rule)
+    invalidate_user_rules(current_user.id)
     return rule
 
 @router.delete("/{rule_id}")
@@ -143,12 +144,12 @@ def delete_classification_rule(
         raise HTTPException(status_code=404, detail="Rule not found")
     
     # Verify ownership
-    property_obj = session.get(Property, rule.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(rule.property_id):
         raise HTTPException(status_code=404, detail="Rule not found")
     
     session.delete(rule)
     session.commit()
+    invalidate_user_rules(current_user.id)
     return {"message": "Classification rule deleted successfully"}
 
 @router.post("/bulk", response_model=List[ClassificationRuleResponse])
@@ -159,8 +160,7 @@ def create_bulk_classification_rules(
 ):
     """Create multiple classification rules at once"""
     # Verify property ownership
-    property_obj = session.get(Property, bulk_data.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(bulk_data.property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     created_rules = []
@@ -173,25 +173,24 @@ def create_bulk_classification_rules(
             if category not in valid_categories:
                 continue  # Skip invalid rules
             
-            rule = ClassificationRule(
+            created_rules.append(dict(
                 property_id=bulk_data.property_id,
                 keyword=rule_data.get("keyword", ""),
                 category=category,
                 subcategory=rule_data.get("subcategory"),
                 tenant_name=rule_data.get("tenant_name"),
                 is_active=rule_data.get("is_active", True)
-            )
-            session.add(rule)
-            created_rules.append(rule)
+            ))
         except Exception:
             # Skip invalid rules but continue processing
             continue
     
+    # Ids come back from the INSERT itself, no refresh per rule
+    rule_ids = bulk_insert(session, ClassificationRule, created_rules, return_ids=True)
     session.commit()
-    for rule in created_rules:
-        session.refresh(rule)
+    invalidate_user_rules(current_user.id)
     
-    return created_rules
+    return [dict(rule, id=rule_id) for rule, rule_id in zip(created_rules, rule_ids)]
 
 @router.get("/property/{property_id}/by-category")
 def get_rules_by_category_for_property(
@@ -201,8 +200,7 @@ def get_rules_by_category_for_property(
 ):
     """Get classification rules grouped by category for a property"""
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     query = select(ClassificationRule).where(
@@ -239,28 +237,16 @@ def test_classification_rules(
 ):
     """Test how concepts would be classified with current rules"""
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
-    # Get active rules for the property
-    query = select(ClassificationRule).where(
-        ClassificationRule.property_id == property_id,
-        ClassificationRule.is_active == True
-    )
-    rules = session.exec(query).all()
+    # Compiled active rules, restricted to this property
+    engine = get_user_engine(session, current_user.id)
     
     results = []
     
     for concept in test_concepts:
-        matched_rule = None
-        concept_lower = concept.lower()
-        
-        # Find first matching rule
-        for rule in rules:
-            if rule.keyword.lower() in concept_lower:
-                matched_rule = rule
-                break
+        matched_rule, _ = engine.match(concept, property_id=property_id)
         
         result = {
             "concept": concept,
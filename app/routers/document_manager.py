@@ -4,13 +4,12 @@ from typing import Dict, List, Optional
 from datetime import date, datetime, timedelta
 from sqlmodel import Session, select
 from pydantic import BaseModel
-import os
-import uuid
-import shutil
+import asyncio
 from pathlib import Path
 from ..db import get_session
 from ..deps import get_current_user
 from ..models import Property, RentalContract, TenantDocument
+from ..services.document_store import parse_blob_ref, release_blob, store_stream
 
 router = APIRouter(prefix="/documents", tags=["document-manager"])
 
@@ -173,8 +172,7 @@ async def upload_document(
         raise HTTPException(status_code=404, detail="Contrato no encontrado")
     
     # Verificar propiedad
-    property_data = session.get(Property, contract.property_id)
-    if not property_data or property_data.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=403, detail="No autorizado")
     
     # Validar tipo de archivo
@@ -187,27 +185,18 @@ async def upload_document(
             detail=f"Tipo de archivo no permitido. Permitidos: {allowed_extensions}"
         )
     
-    # Crear directorio si no existe
-    upload_dir = Path("uploads/documents")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Generar nombre único
-    file_id = str(uuid.uuid4())
-    safe_filename = f"{file_id}_{file.filename}"
-    file_path = upload_dir / safe_filename
-    
+    blob = None
     try:
-        # Guardar archivo
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Guardar archivo: en bloques y fuera del event loop, por hash de contenido
+        blob = await asyncio.to_thread(store_stream, file.file)
         
         # Crear registro en base de datos
         tenant_doc = TenantDocument(
             rental_contract_id=contract_id,
             document_type=document_type,
             document_name=file.filename,
-            file_path=str(file_path),
-            file_size=file.size,
+            file_path=blob.ref,
+            file_size=blob.size,
             description=description
         )
         
@@ -227,9 +216,10 @@ async def upload_document(
         }
         
     except Exception as e:
-        # Limpiar archivo si algo sale mal
-        if file_path.exists():
-            file_path.unlink()
+        # Limpiar archivo si algo sale mal (salvo que otro documento use el mismo contenido)
+        session.rollback()
+        if blob and blob.created:
+            release_blob(session, blob.digest)
         raise HTTPException(status_code=500, detail=f"Error al subir archivo: {str(e)}")
 
 @router.delete("/document/{document_id}")
@@ -249,18 +239,19 @@ def delete_document(
     if not contract:
         raise HTTPException(status_code=404, detail="Contrato no encontrado")
     
-    property_data = session.get(Property, contract.property_id)
-    if not property_data or property_data.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=403, detail="No autorizado")
     
-    # Eliminar archivo físico
+    # Eliminar archivo físico (los blobs compartidos, solo cuando ya nadie los referencia)
+    digest = parse_blob_ref(document.file_path)
     file_path = Path(document.file_path)
-    if file_path.exists():
+    if not digest and file_path.exists():
         file_path.unlink()
     
     # Eliminar registro
     session.delete(document)
     session.commit()
+    release_blob(session, digest)
     
     return {"message": "Documento eliminado exitosamente"}
 
@@ -8,6 +8,7 @@ from pydantic import BaseModel
 from ..db import get_session
 from ..deps import get_current_user
 from ..models import User, EuriborRate
+from ..services.euribor_cache import invalidate_euribor_cache
 
 router = APIRouter(prefix="/euribor-rates", tags=["euribor-rates"])
 
@@ -76,6 +77,7 @@ def create_euribor_rate(
     rate = EuriborRate(**rate_data.dict(), created_at=date.today())
     session.add(rate)
     session.commit()
+    invalidate_euribor_cache()
     session.refresh(rate)
     return rate
 
@@ -119,6 +121,7 @@ def create_bulk_euribor_rates(
             continue
     
     session.commit()
+    invalidate_euribor_cache()
     
     # Refresh all created rates
     for rate in created_rates:
@@ -151,6 +154,7 @@ def update_euribor_rate(
         setattr(rate, field, value)
     
     session.commit()
+    invalidate_euribor_cache()
     session.refresh(rate)
     return rate
 
@@ -167,6 +171,7 @@ def delete_euribor_rate(
     
     session.delete(rate)
     session.commit()
+    invalidate_euribor_cache()
     return {"message": "Rate deleted successfully"}
 
 @router.get("/latest", response_model=Optional[EuriborRateResponse])
@@ -1,18 +1,26 @@
 # app/routers/financial_movements.py
 from datetime import date
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi.responses import StreamingResponse, JSONResponse
+from sqlmodel import Session, select, func
+from sqlalchemy import case
 from pydantic import BaseModel
 import pandas as pd
-import io
 from datetime import datetime
 import re
+import base64
 
-from ..db import get_session
+from ..db import get_session, engine
 from ..deps import get_current_user
-from ..models import User, Property, FinancialMovement, ClassificationRule
+from ..services.principals import Principal
+from ..models import User, Property, FinancialMovement
+from ..services.classification import get_user_engine
+from ..services.statement_ingestion import ingest_statement, StatementFormatError, STATEMENT_EXTENSIONS
+from ..services.movement_dedup import compute_dedup_key, new_dedup_keys
+from ..services.movement_purge import purge_movements
+from ..services.bulk_write import bulk_insert
+from ..services.movement_export import iter_export_rows, stream_csv, stream_xlsx, export_filename
 
 router = APIRouter(prefix="/financial-movements", tags=["financial-movements"])
 
@@ -113,235 +121,243 @@ class FinancialMovementResponse(BaseModel):
 class BulkMovementUpload(BaseModel):
     movements: List[dict]
 
-@router.get("/", response_model=List[FinancialMovementResponse])
-def get_financial_movements(
+MOVEMENT_FIELDS = list(FinancialMovementResponse.model_fields)
+MAX_PAGE_SIZE = 1000
+
+def encode_movement_cursor(movement_date: date, movement_id: int) -> str:
+    """Opaque cursor for the (date, id) keyset of GET /financial-movements"""
+    raw = f"{movement_date.isoformat()}|{movement_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_movement_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date_str, id_str = raw.split("|")
+        return date.fromisoformat(date_str), int(id_str)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_movement_fields(fields: Optional[str]) -> List[str]:
+    """Comma separated projection; id is always returned"""
+    if not fields:
+        return MOVEMENT_FIELDS
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in MOVEMENT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(MOVEMENT_FIELDS)}"
+        )
+    return ["id"] + [f for f in dict.fromkeys(requested) if f != "id"]
+
+def movement_filter_conditions(
+    current_user: Principal,
     property_id: Optional[int] = None,
     category: Optional[str] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    unassigned_only: Optional[bool] = None,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
-):
-    """Get financial movements with optional filters"""
-    # Get user's property IDs for filtering
-    user_properties = session.exec(
-        select(Property).where(Property.owner_id == current_user.id)
-    ).all()
-    property_ids = [prop.id for prop in user_properties]
+    unassigned_only: Optional[bool] = None
+) -> list:
+    """WHERE conditions shared by the movements list and the exports"""
+    # User's property IDs come with the cached principal
+    property_ids = list(current_user.property_ids)
+    own_unassigned = (FinancialMovement.property_id.is_(None)) & (FinancialMovement.user_id == current_user.id)
     
     # Handle unassigned_only filter first
     if unassigned_only:
         # Only show unassigned movements for the user
-        query = select(FinancialMovement).where(
-            (FinancialMovement.property_id.is_(None)) & (FinancialMovement.user_id == current_user.id)
-        )
+        conditions = [own_unassigned]
     else:
         # Include both movements assigned to user properties AND unassigned movements for the user
         if property_ids:
-            query = select(FinancialMovement).where(
-                (FinancialMovement.property_id.in_(property_ids)) |
-                ((FinancialMovement.property_id.is_(None)) & (FinancialMovement.user_id == current_user.id))
-            )
+            conditions = [FinancialMovement.property_id.in_(property_ids) | own_unassigned]
         else:
             # If user has no properties, only show their unassigned movements
-            query = select(FinancialMovement).where(
-                (FinancialMovement.property_id.is_(None)) & (FinancialMovement.user_id == current_user.id)
-            )
+            conditions = [own_unassigned]
         
         if property_id:
-            query = query.where(FinancialMovement.property_id == property_id)
+            conditions.append(FinancialMovement.property_id == property_id)
     
     if category:
-        query = query.where(FinancialMovement.category == category)
+        conditions.append(FinancialMovement.category == category)
     if start_date:
-        query = query.where(FinancialMovement.date >= start_date)
+        conditions.append(FinancialMovement.date >= start_date)
     if end_date:
-        query = query.where(FinancialMovement.date <= end_date)
+        conditions.append(FinancialMovement.date <= end_date)
+    return conditions
+
+@router.get("/", response_model=List[FinancialMovementResponse])
+def get_financial_movements(
+    property_id: Optional[int] = None,
+    category: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    unassigned_only: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get financial movements with optional filters, newest first.
+    With limit the result is paginated on (date, id): pass the X-Next-Cursor header of a
+    page as cursor to get the next one. X-Total-Count holds the number of matching movements.
+    fields=date,concept,amount returns only those columns (plus id).
+    """
+    conditions = movement_filter_conditions(
+        current_user, property_id, category, start_date, end_date, unassigned_only
+    )
+    
+    columns = parse_movement_fields(fields)
+    query = select(*[getattr(FinancialMovement, c) for c in columns])
+    if "date" not in columns:
+        query = query.add_columns(FinancialMovement.date)
+    query = query.where(*conditions).order_by(FinancialMovement.date.desc(), FinancialMovement.id.desc())
+    
+    if cursor:
+        # Keyset: filas estrictamente posteriores a la última de la página anterior
+        cursor_date, cursor_id = decode_movement_cursor(cursor)
+        query = query.where(
+            (FinancialMovement.date < cursor_date) |
+            ((FinancialMovement.date == cursor_date) & (FinancialMovement.id < cursor_id))
+        )
+    if limit:
+        query = query.limit(limit + 1)
+    
+    rows = session.exec(query).all()
+    headers = {}
+    if limit:
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = encode_movement_cursor(rows[-1].date, rows[-1].id)
+        total = session.exec(
+            select(func.count()).select_from(FinancialMovement).where(*conditions)
+        ).one()
+    else:
+        total = len(rows)
+    headers["X-Total-Count"] = str(total)
     
-    movements = session.exec(query).all()
-    return movements
+    content = [
+        {c: (row.date.isoformat() if c == "date" else getattr(row, c)) for c in columns}
+        for row in rows
+    ]
+    return JSONResponse(content=content, headers=headers)
+
+@router.get("/summary")
+def get_financial_movements_summary(
+    property_id: Optional[int] = None,
+    category: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    unassigned_only: Optional[bool] = None,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Count and income/expense totals of every movement GET / lists with the same filters"""
+    conditions = movement_filter_conditions(
+        current_user, property_id, category, start_date, end_date, unassigned_only
+    )
+    count, income, expenses = session.exec(
+        select(
+            func.count(),
+            func.coalesce(func.sum(case((FinancialMovement.amount > 0, FinancialMovement.amount), else_=0)), 0),
+            func.coalesce(func.sum(case((FinancialMovement.amount < 0, -FinancialMovement.amount), else_=0)), 0),
+        ).select_from(FinancialMovement).where(*conditions)
+    ).one()
+    return {
+        "count": count,
+        "income": float(income),
+        "expenses": float(expenses),
+        "net": float(income) - float(expenses)
+    }
 
 @router.post("/bulk-delete")
 def delete_all_movements_bulk(
+    dry_run: bool = False,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    """Delete all financial movements for current user"""
-    print(f"DEBUG: delete_all_movements endpoint reached")
+    """Delete all financial movements for current user (dry_run only counts them)"""
     try:
-        print(f"DEBUG: delete_all_movements called for user {current_user.id}")
-        # Get all user properties first
-        user_properties = session.exec(
-            select(Property).where(Property.owner_id == current_user.id)
-        ).all()
-        print(f"DEBUG: Found {len(user_properties)} properties for user")
-        
-        property_ids = [prop.id for prop in user_properties]
-        
-        # Delete movements for user properties, or user's unassigned movements
-        if property_ids:
-            movements = session.exec(
-                select(FinancialMovement).where(
-                    (FinancialMovement.property_id.in_(property_ids)) | 
-                    ((FinancialMovement.property_id.is_(None)) & (FinancialMovement.user_id == current_user.id))
-                )
-            ).all()
-        else:
-            # If no properties, only delete user's unassigned movements
-            movements = session.exec(
-                select(FinancialMovement).where(
-                    (FinancialMovement.property_id.is_(None)) & 
-                    (FinancialMovement.user_id == current_user.id)
-                )
-            ).all()
-        
-        count = len(movements)
+        # Movements of user properties, or user's unassigned movements
+        conditions = movement_filter_conditions(current_user)
+        count = purge_movements(session, conditions, dry_run=dry_run)
         
-        for movement in movements:
-            session.delete(movement)
-        
-        session.commit()
-        
-        return {"message": f"Successfully deleted {count} movements", "count": count}
+        if dry_run:
+            return {"message": f"{count} movements would be deleted", "count": count, "dry_run": True}
+        return {"message": f"Successfully deleted {count} movements", "count": count, "dry_run": False}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting movements: {str(e)}")
 
+def _export_response(
+    writer,
+    media_type: str,
+    extension: str,
+    property_id: Optional[int],
+    category: Optional[str],
+    start_date: Optional[date],
+    end_date: Optional[date],
+    unassigned_only: Optional[bool],
+    session: Session,
+    current_user: User
+) -> StreamingResponse:
+    conditions = movement_filter_conditions(
+        current_user, property_id, category, start_date, end_date, unassigned_only
+    )
+    if session.exec(select(FinancialMovement.id).where(*conditions).limit(1)).first() is None:
+        raise HTTPException(status_code=404, detail="No movements found with the specified criteria")
+    
+    # Create property lookup for better display
+    property_lookup = dict(session.exec(
+        select(Property.id, Property.address).where(Property.owner_id == current_user.id)
+    ).all())
+    
+    def content():
+        # Sesión propia: la respuesta se sigue generando después de cerrar la del request
+        with Session(engine) as export_session:
+            yield from writer(iter_export_rows(export_session, conditions, property_lookup))
+    
+    prop_name = property_lookup.get(property_id, f"propiedad_{property_id}") if property_id else None
+    filename = export_filename(extension, prop_name, category, start_date, end_date)
+    return StreamingResponse(
+        content(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 @router.get("/download-xlsx")
 def export_movements_to_excel(
     property_id: Optional[int] = None,
     category: Optional[str] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
+    unassigned_only: Optional[bool] = None,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    """Export financial movements to Excel file"""
-    try:
-        # Get user's property IDs for filtering
-        user_properties = session.exec(
-            select(Property).where(Property.owner_id == current_user.id)
-        ).all()
-        property_ids = [prop.id for prop in user_properties]
-        
-        # Build the same query as the GET endpoint
-        if property_ids:
-            query = select(FinancialMovement).where(
-                (FinancialMovement.property_id.in_(property_ids)) |
-                ((FinancialMovement.property_id.is_(None)) & (FinancialMovement.user_id == current_user.id))
-            )
-        else:
-            # If user has no properties, only show their unassigned movements
-            query = select(FinancialMovement).where(
-                (FinancialMovement.property_id.is_(None)) & (FinancialMovement.user_id == current_user.id)
-            )
-        
-        # Apply filters
-        if property_id:
-            query = query.where(FinancialMovement.property_id == property_id)
-        if category:
-            query = query.where(FinancialMovement.category == category)
-        if start_date:
-            query = query.where(FinancialMovement.date >= start_date)
-        if end_date:
-            query = query.where(FinancialMovement.date <= end_date)
-        
-        # Get movements
-        movements = session.exec(query).all()
-        
-        # Create property lookup for better display
-        property_lookup = {prop.id: prop.address for prop in user_properties}
-        
-        # Prepare data for Excel
-        excel_data = []
-        for movement in movements:
-            property_address = property_lookup.get(movement.property_id, "Sin propiedad asignada")
-            
-            excel_data.append({
-                "Fecha": movement.date.strftime("%d/%m/%Y"),
-                "Propiedad": property_address,
-                "Concepto": movement.concept,
-                "Categoría": movement.category,
-                "Subcategoría": movement.subcategory or "",
-                "Inquilino": movement.tenant_name or "",
-                "Importe": movement.amount,
-                "Clasificado": "Automático" if movement.is_classified else "Manual",
-                "Saldo Bancario": movement.bank_balance or ""
-            })
-        
-        if not excel_data:
-            raise HTTPException(status_code=404, detail="No movements found with the specified criteria")
-        
-        # Create DataFrame and Excel file
-        df = pd.DataFrame(excel_data)
-        
-        # Create Excel file in memory
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl', date_format='DD/MM/YYYY') as writer:
-            df.to_excel(writer, sheet_name='Movimientos', index=False)
-            
-            # Get the workbook and worksheet objects
-            workbook = writer.book
-            worksheet = workbook['Movimientos']
-            
-            # Auto-adjust column widths
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                
-                # Set column width with some padding
-                adjusted_width = min(max_length + 2, 50)  # Cap at 50 characters
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-            
-            # Format the header row
-            for cell in worksheet[1]:
-                cell.font = workbook.fonts[0].copy(bold=True)
-                cell.fill = workbook.fills[0].copy()
-        
-        excel_buffer.seek(0)
-        
-        # Generate filename with current date and filters
-        filename_parts = ["movimientos"]
-        
-        if property_id:
-            prop_name = property_lookup.get(property_id, f"propiedad_{property_id}")
-            filename_parts.append(prop_name.replace(" ", "_").replace(",", "")[:20])
-        
-        if start_date and end_date:
-            filename_parts.append(f"{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}")
-        elif start_date:
-            filename_parts.append(f"desde_{start_date.strftime('%Y%m%d')}")
-        elif end_date:
-            filename_parts.append(f"hasta_{end_date.strftime('%Y%m%d')}")
-        
-        if category:
-            filename_parts.append(category.lower())
-        
-        current_date = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename_parts.append(current_date)
-        
-        filename = "_".join(filename_parts) + ".xlsx"
-        
-        # Return as streaming response
-        return StreamingResponse(
-            io.BytesIO(excel_buffer.read()),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"ERROR in export_movements_to_excel: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error exporting movements to Excel: {str(e)}")
+    """Export financial movements to Excel file (write-only workbook, streamed)"""
+    return _export_response(
+        stream_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx",
+        property_id, category, start_date, end_date, unassigned_only, session, current_user
+    )
+
+@router.get("/download-csv")
+def export_movements_to_csv(
+    property_id: Optional[int] = None,
+    category: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    unassigned_only: Optional[bool] = None,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Export financial movements to CSV, streamed from a server-side cursor"""
+    return _export_response(
+        stream_csv, "text/csv; charset=utf-8", "csv",
+        property_id, category, start_date, end_date, unassigned_only, session, current_user
+    )
 
 @router.post("/", response_model=FinancialMovementResponse)
 def create_financial_movement(
@@ -351,8 +367,7 @@ def create_financial_movement(
 ):
     """Create a new financial movement"""
     # Verify property ownership
-    property_obj = session.get(Property, movement_data.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(movement_data.property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     movement_dict = movement_data.dict()
@@ -375,8 +390,7 @@ def get_financial_movement(
         raise HTTPException(status_code=404, detail="Movement not found")
     
     # Verify ownership through property
-    property_obj = session.get(Property, movement.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(movement.property_id):
         raise HTTPException(status_code=404, detail="Movement not found")
     
     return movement
@@ -394,8 +408,7 @@ def update_financial_movement(
         raise HTTPException(status_code=404, detail="Movement not found")
     
     # Verify ownership
-    property_obj = session.get(Property, movement.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(movement.property_id):
         raise HTTPException(status_code=404, detail="Movement not found")
     
     # Update fields
@@ -411,14 +424,12 @@ def delete_movements_by_date_range(
     start_date: str,
     end_date: str,
     property_id: Optional[str] = None,
+    dry_run: bool = False,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    """Delete financial movements within a specific date range for current user"""
+    """Delete financial movements within a specific date range for current user (dry_run only counts them)"""
     try:
-        print(f"DEBUG: delete_movements_by_date_range called for user {current_user.id}")
-        print(f"DEBUG: Date range: {start_date} to {end_date}, property_id: {property_id}")
-        
         # Parse dates
         try:
             start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
@@ -429,13 +440,7 @@ def delete_movements_by_date_range(
         if start_date_obj > end_date_obj:
             raise HTTPException(status_code=400, detail="Start date must be before end date")
         
-        # Get user properties
-        user_properties = session.exec(
-            select(Property).where(Property.owner_id == current_user.id)
-        ).all()
-        property_ids = [prop.id for prop in user_properties]
-        
-        # Build the query
+        # Build the conditions
         if property_id and property_id.strip():
             # Convert property_id to int and validate
             try:
@@ -444,43 +449,30 @@ def delete_movements_by_date_range(
                 raise HTTPException(status_code=400, detail="property_id must be a valid integer")
             
             # Specific property - check if user owns it
-            if property_id_int not in property_ids:
+            if not current_user.owns(property_id_int):
                 raise HTTPException(status_code=403, detail="Property not found or access denied")
             
-            movements = session.exec(
-                select(FinancialMovement).where(
-                    (FinancialMovement.property_id == property_id_int) &
-                    (FinancialMovement.date >= start_date_obj) &
-                    (FinancialMovement.date <= end_date_obj)
-                )
-            ).all()
+            conditions = [
+                FinancialMovement.property_id == property_id_int,
+                FinancialMovement.date >= start_date_obj,
+                FinancialMovement.date <= end_date_obj
+            ]
         else:
             # All properties for user + unassigned movements
-            movements = session.exec(
-                select(FinancialMovement).where(
-                    (
-                        (FinancialMovement.property_id.in_(property_ids)) |
-                        ((FinancialMovement.property_id.is_(None)) & (FinancialMovement.user_id == current_user.id))
-                    ) &
-                    (FinancialMovement.date >= start_date_obj) &
-                    (FinancialMovement.date <= end_date_obj)
-                )
-            ).all()
-        
-        count = len(movements)
-        print(f"DEBUG: Found {count} movements to delete")
-        
-        for movement in movements:
-            session.delete(movement)
+            conditions = movement_filter_conditions(
+                current_user, start_date=start_date_obj, end_date=end_date_obj
+            )
         
-        session.commit()
+        count = purge_movements(session, conditions, dry_run=dry_run)
+        action = "would be deleted" if dry_run else "deleted"
         
         return {
-            "message": f"Successfully deleted {count} movements between {start_date} and {end_date}",
+            "message": f"{count} movements {action} between {start_date} and {end_date}",
             "deleted_count": count,
             "start_date": start_date,
             "end_date": end_date,
-            "property_id": property_id
+            "property_id": property_id,
+            "dry_run": dry_run
         }
         
     except HTTPException:
@@ -503,8 +495,7 @@ def delete_financial_movement(
     # Verify ownership
     if movement.property_id:
         # Movement is assigned to a property - check property ownership
-        property_obj = session.get(Property, movement.property_id)
-        if not property_obj or property_obj.owner_id != current_user.id:
+        if not current_user.owns(movement.property_id):
             raise HTTPException(status_code=404, detail="Movement not found")
     else:
         # Movement is unassigned - check if it belongs to current user
@@ -524,17 +515,17 @@ def bulk_upload_movements(
 ):
     """Bulk upload financial movements from bank statements"""
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
-    created_movements = []
+    candidates = []
     
     for movement_data in upload_data.movements:
         try:
-            movement = FinancialMovement(
+            row = dict(
+                user_id=current_user.id,
                 property_id=property_id,
-                date=movement_data.get("date"),
+                date=parse_european_date(movement_data.get("date")),
                 concept=movement_data.get("concept", ""),
                 amount=float(movement_data.get("amount", 0)),
                 category=movement_data.get("category", "Sin clasificar"),
@@ -543,14 +534,25 @@ def bulk_upload_movements(
                 is_classified=movement_data.get("is_classified", False),
                 bank_balance=movement_data.get("bank_balance")
             )
-            session.add(movement)
-            created_movements.append(movement)
+            if row["date"] is None:
+                continue
+            row["dedup_key"] = compute_dedup_key(row["date"], row["concept"], row["amount"])
+            candidates.append(row)
         except Exception as e:
             # Skip invalid movements but continue processing
             continue
     
+    # Skip movements already stored (identical ones within the payload are numbered, not dropped)
+    keys = new_dedup_keys(session, current_user.id, [row["dedup_key"] for row in candidates])
+    created_movements = [dict(row, dedup_key=key) for row, key in zip(candidates, keys) if key]
+    bulk_insert(session, FinancialMovement, created_movements)
+    
     session.commit()
-    return {"message": f"Created {len(created_movements)} movements", "count": len(created_movements)}
+    return {
+        "message": f"Created {len(created_movements)} movements",
+        "count": len(created_movements),
+        "duplicates_skipped": len(candidates) - len(created_movements)
+    }
 
 @router.post("/upload-excel")
 def upload_excel_bank_statement(
@@ -561,64 +563,34 @@ def upload_excel_bank_statement(
 ):
     """Upload and process Excel bank statement"""
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     # Validate file type
-    if not file.filename.lower().endswith(('.xls', '.xlsx')):
-        raise HTTPException(status_code=400, detail="Only Excel files (.xls, .xlsx) are allowed")
+    if not file.filename.lower().endswith(STATEMENT_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only Excel or CSV files (.xls, .xlsx, .csv) are allowed")
     
     try:
-        # Read Excel file
+        # Read and parse the statement (dates, amounts and concepts as whole columns)
         contents = file.file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # Expected columns: Fecha, Concepto, Importe
-        expected_columns = ['Fecha', 'Concepto', 'Importe']
+        statement = ingest_statement(contents, file.filename)
         
-        # Check if required columns exist (case insensitive)
-        df_columns = df.columns.str.lower().tolist()
-        required_columns = [col.lower() for col in expected_columns]
-        
-        missing_columns = [col for col in required_columns if col not in df_columns]
-        if missing_columns:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Missing required columns: {', '.join(missing_columns)}. Expected: Fecha, Concepto, Importe"
-            )
-        
-        # Normalize column names
-        column_mapping = {}
-        for expected_col in expected_columns:
-            for df_col in df.columns:
-                if df_col.lower() == expected_col.lower():
-                    column_mapping[df_col] = expected_col
-                    break
-        
-        df = df.rename(columns=column_mapping)
-        
-        # Load classification rules for this property
-        rules_query = select(ClassificationRule).where(ClassificationRule.property_id == property_id)
-        rules = session.exec(rules_query).all()
+        # Compiled classification rules (restricted to this property when matching)
+        engine = get_user_engine(session, current_user.id)
         
         created_movements = []
-        errors = []
+        duplicates_skipped = 0
+        errors = list(statement.errors)
+        
+        # Check duplicates for this batch only, through the (user_id, dedup_key) index
+        records = list(statement.records())
+        dedup_keys = new_dedup_keys(session, current_user.id, [compute_dedup_key(d, c, a) for _, d, c, a in records])
         
-        for index, row in df.iterrows():
+        for (row_number, parsed_date, concept, amount), dedup_key in zip(records, dedup_keys):
             try:
-                # Parse date using European format parser
-                parsed_date = parse_european_date(row['Fecha'])
-                if not parsed_date:
-                    errors.append(f"Row {index + 1}: Invalid or missing date: {row['Fecha']}")
-                    continue
-                
-                # Parse amount using European format parser
-                amount = parse_european_amount(row['Importe'])
-                if amount is None:
-                    errors.append(f"Row {index + 1}: Invalid or missing amount: {row['Importe']}")
+                if dedup_key is None:
+                    duplicates_skipped += 1
                     continue
-                concept = str(row['Concepto']) if not pd.isna(row['Concepto']) else ""
                 
                 # Auto-classify based on rules
                 category = "Sin clasificar"
@@ -626,16 +598,16 @@ def upload_excel_bank_statement(
                 tenant_name = None
                 is_classified = False
                 
-                for rule in rules:
-                    if rule.keyword.lower() in concept.lower():
-                        category = rule.category
-                        subcategory = rule.subcategory
-                        tenant_name = rule.tenant_name
-                        is_classified = True
-                        break
+                rule, _ = engine.match(concept, property_id=property_id)
+                if rule:
+                    category = rule.category
+                    subcategory = rule.subcategory
+                    tenant_name = rule.tenant_name
+                    is_classified = True
                 
                 # Create movement
-                movement = FinancialMovement(
+                created_movements.append(dict(
+                    user_id=current_user.id,
                     property_id=property_id,
                     date=parsed_date,
                     concept=concept,
@@ -643,25 +615,28 @@ def upload_excel_bank_statement(
                     category=category,
                     subcategory=subcategory,
                     tenant_name=tenant_name,
-                    is_classified=is_classified
-                )
-                session.add(movement)
-                created_movements.append(movement)
+                    is_classified=is_classified,
+                    dedup_key=dedup_key
+                ))
                 
             except Exception as e:
-                errors.append(f"Row {index + 1}: {str(e)}")
+                errors.append(f"Row {row_number}: {str(e)}")
                 continue
         
-        # Commit all valid movements
+        # Insert all valid movements in batches and commit once
+        bulk_insert(session, FinancialMovement, created_movements)
         session.commit()
         
         return {
             "message": f"Successfully processed Excel file",
             "created_movements": len(created_movements),
-            "total_rows": len(df),
+            "total_rows": statement.total_rows,
+            "duplicates_skipped": duplicates_skipped,
             "errors": errors[:10]  # Limit to first 10 errors
         }
         
+    except StatementFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing Excel file: {str(e)}")
 
@@ -675,124 +650,41 @@ def upload_excel_global_movements(
     print("=== UPLOAD EXCEL GLOBAL STARTED V2 ===")
     
     # Validate file type
-    if not file.filename.lower().endswith(('.xls', '.xlsx')):
-        raise HTTPException(status_code=400, detail="Only Excel files (.xls, .xlsx) are allowed")
+    if not file.filename.lower().endswith(STATEMENT_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only Excel or CSV files (.xls, .xlsx, .csv) are allowed")
     
     try:
-        # Read Excel file
-        print("EXCEL PARSING: Reading file contents...")
+        # Read and parse the statement (dates, amounts and Bankinter coletillas as whole columns)
         contents = file.file.read()
         print(f"EXCEL PARSING: File size: {len(contents)} bytes")
+        statement = ingest_statement(contents, file.filename)
+        print(f"EXCEL PARSING: {statement.total_rows} rows, {len(statement.movements)} valid")
         
-        print("EXCEL PARSING: Creating DataFrame...")
-        df = pd.read_excel(io.BytesIO(contents))
-        print(f"EXCEL PARSING: DataFrame created with {len(df)} rows and {len(df.columns)} columns")
-        print(f"EXCEL PARSING: Columns found: {list(df.columns)}")
-        
-        # Expected columns: Fecha, Concepto, Importe
-        expected_columns = ['Fecha', 'Concepto', 'Importe']
-        
-        # Check if required columns exist (case insensitive)
-        df_columns = df.columns.str.lower().tolist()
-        required_columns = [col.lower() for col in expected_columns]
-        
-        missing_columns = [col for col in required_columns if col not in df_columns]
-        if missing_columns:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Missing required columns: {', '.join(missing_columns)}. Expected: Fecha, Concepto, Importe"
-            )
-        
-        # Normalize column names
-        column_mapping = {}
-        for expected_col in expected_columns:
-            for df_col in df.columns:
-                if df_col.lower() == expected_col.lower():
-                    column_mapping[df_col] = expected_col
-                    break
-        
-        df = df.rename(columns=column_mapping)
-        print(f"EXCEL PARSING: Successfully renamed columns")
+        # Compiled classification rules for all user properties (cached per user)
+        engine = get_user_engine(session, current_user.id)
+        print(f"CLASSIFICATION: Using {len(engine.rules)} classification rules for user")
         
-        # Load all classification rules for the user (from all user properties)
-        print("CLASSIFICATION: Loading user properties...")
-        user_properties = session.exec(
-            select(Property).where(Property.owner_id == current_user.id)
-        ).all()
-        property_ids = [prop.id for prop in user_properties]
-        print(f"CLASSIFICATION: Found {len(user_properties)} properties: {property_ids}")
-        
-        rules = []
-        if property_ids:
-            rules = session.exec(
-                select(ClassificationRule).where(
-                    ClassificationRule.property_id.in_(property_ids) & 
-                    ClassificationRule.is_active == True
-                )
-            ).all()
-        
-        print(f"CLASSIFICATION: Found {len(rules)} classification rules for user")
-        for rule in rules:
-            print(f"  Rule: '{rule.keyword}' -> Property {rule.property_id}, Category: {rule.category}")
-        
-        # Check for duplicates based on date, concept, and amount
-        existing_movements = session.exec(
-            select(FinancialMovement).where(FinancialMovement.user_id == current_user.id)
-        ).all()
-        
-        existing_signatures = set()
-        for movement in existing_movements:
-            signature = f"{movement.date}|{movement.concept}|{movement.amount}"
-            existing_signatures.add(signature)
+        # Check duplicates for this batch only, through the (user_id, dedup_key) index
+        records = list(statement.records())
+        dedup_keys = new_dedup_keys(session, current_user.id, [compute_dedup_key(d, c, a) for _, d, c, a in records])
         
         created_movements = []
         duplicates_skipped = 0
-        errors = []
+        errors = list(statement.errors)
         
-        print(f"EXCEL PROCESSING: Starting to process {len(df)} rows from Excel")
+        # Additional validation - check if dates are reasonable
+        fechas = statement.movements["Fecha"]
+        unusual = statement.movements[(fechas < pd.Timestamp(2020, 1, 1)) | (fechas > pd.Timestamp(2030, 12, 31))]
+        for row_number, unusual_date in zip(unusual["Fila"], unusual["Fecha"]):
+            errors.append(f"Row {row_number}: Date {unusual_date.date()} seems out of reasonable range")
         
-        for index, row in df.iterrows():
-            print(f"EXCEL PROCESSING: Processing row {index + 1}")
+        print(f"EXCEL PROCESSING: Starting to process {len(statement.movements)} rows from Excel")
+        
+        for (row_number, parsed_date, concept, amount), dedup_key in zip(records, dedup_keys):
             try:
-                # Parse date using European format parser
-                print(f"EXCEL DATE PARSING: Row {index + 1} - Processing date: {row['Fecha']}")
-                parsed_date = parse_european_date(row['Fecha'])
-                if not parsed_date:
-                    errors.append(f"Row {index + 1}: Invalid or missing date: {row['Fecha']}")
-                    continue
-                
-                print(f"EXCEL DATE PARSING: Successfully parsed to: {parsed_date}")
-                
-                # Additional validation - check if date is reasonable
-                from datetime import date
-                if parsed_date < date(2020, 1, 1) or parsed_date > date(2030, 12, 31):
-                    print(f"EXCEL DATE WARNING: Row {index + 1} - Date {parsed_date} seems unusual")
-                    errors.append(f"Row {index + 1}: Date {parsed_date} seems out of reasonable range")
-                
-                # Parse amount using European format parser
-                print(f"EXCEL AMOUNT PARSING: Row {index + 1} - Processing amount: {row['Importe']}")
-                amount = parse_european_amount(row['Importe'])
-                if amount is None:
-                    errors.append(f"Row {index + 1}: Invalid or missing amount: {row['Importe']}")
-                    continue
-                
-                print(f"EXCEL AMOUNT PARSING: Successfully parsed to: {amount}")
-                concept = str(row['Concepto']) if not pd.isna(row['Concepto']) else ""
-                
-                # Clean concept from Bankinter coletillas
-                import re
-                concept = re.sub(r'Pulsa para ver detalle.*$', '', concept, flags=re.IGNORECASE | re.MULTILINE)
-                concept = re.sub(r'\n.*Pulsa para ver.*$', '', concept, flags=re.IGNORECASE | re.MULTILINE)
-                concept = re.sub(r'.*Pulsa para ver.*', '', concept, flags=re.IGNORECASE)
-                concept = re.sub(r'\n+', ' ', concept)
-                concept = re.sub(r'\s+', ' ', concept)
-                concept = concept.strip()
-                
-                # Check for duplicates
-                signature = f"{parsed_date}|{concept}|{amount}"
-                if signature in existing_signatures:
+                # Skip movements already stored (identical rows within this file are numbered, not dropped)
+                if dedup_key is None:
                     duplicates_skipped += 1
-                    print(f"DUPLICATE FOUND: Skipping '{concept}' - already exists")
                     continue
                 
                 # Apply classification rules
@@ -802,44 +694,16 @@ def upload_excel_global_movements(
                 tenant_name = None
                 is_classified = False
                 
-                # Check all rules for matches with improved matching
-                print(f"CLASSIFICATION: Testing concept '{concept}' against {len(rules)} rules")
-                best_match = None
-                best_score = 0
-                
-                # Normalize concept for better matching
-                concept_normalized = concept.upper().strip()
-                
-                for rule in rules:
-                    rule_keyword = rule.keyword.upper().strip()
-                    print(f"CLASSIFICATION: Testing rule '{rule_keyword}' vs concept '{concept_normalized}'")
-                    
-                    # Calculate match score
-                    if rule_keyword in concept_normalized:
-                        # Score based on how much of the concept the keyword covers
-                        score = len(rule_keyword) / len(concept_normalized) if concept_normalized else 0
-                        print(f"CLASSIFICATION: Match found with score {score:.2f}")
-                        
-                        if score > best_score:
-                            best_score = score
-                            best_match = rule
-                            print(f"CLASSIFICATION: New best match: '{rule_keyword}' with score {score:.2f}")
-                    else:
-                        print(f"CLASSIFICATION: No match for rule '{rule_keyword}'")
-                
-                # Apply best match if found
-                if best_match and best_score > 0.1:  # Minimum threshold
+                best_match, best_score = engine.match(concept, min_score=0.1)  # Minimum threshold
+                if best_match:
                     matched_property_id = best_match.property_id
                     category = best_match.category
                     subcategory = best_match.subcategory
                     tenant_name = best_match.tenant_name
                     is_classified = True
-                    print(f"CLASSIFICATION: *** BEST MATCH APPLIED *** '{best_match.keyword}' -> Property {best_match.property_id} (score: {best_score:.2f})")
-                else:
-                    print(f"CLASSIFICATION: No suitable match found")
                 
                 # Create movement with classification applied
-                movement = FinancialMovement(
+                created_movements.append(dict(
                     user_id=current_user.id,
                     property_id=matched_property_id,  # Assign to property if rule matched
                     date=parsed_date,
@@ -848,29 +712,30 @@ def upload_excel_global_movements(
                     category=category,
                     subcategory=subcategory,
                     tenant_name=tenant_name,
-                    is_classified=is_classified
-                )
-                session.add(movement)
-                created_movements.append(movement)
-                existing_signatures.add(signature)  # Prevent duplicates within same upload
+                    is_classified=is_classified,
+                    dedup_key=dedup_key
+                ))
                 
             except Exception as e:
-                errors.append(f"Row {index + 1}: {str(e)}")
+                errors.append(f"Row {row_number}: {str(e)}")
                 continue
         
-        # Commit all valid movements
+        # Insert all valid movements in batches and commit once
+        bulk_insert(session, FinancialMovement, created_movements)
         session.commit()
         
-        print(f"EXCEL SUMMARY: Total rows: {len(df)}, Created: {len(created_movements)}, Duplicates: {duplicates_skipped}, Errors: {len(errors)}")
+        print(f"EXCEL SUMMARY: Total rows: {statement.total_rows}, Created: {len(created_movements)}, Duplicates: {duplicates_skipped}, Errors: {len(errors)}")
         
         return {
             "message": f"Successfully processed Excel file",
             "created_movements": len(created_movements),
-            "total_rows": len(df),
+            "total_rows": statement.total_rows,
             "duplicates_skipped": duplicates_skipped,
             "errors": errors[:10]  # Limit to first 10 errors
         }
         
+    except StatementFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"EXCEL ERROR: Exception occurred: {str(e)}")
         print(f"EXCEL ERROR: Exception type: {type(e).__name__}")
@@ -892,8 +757,7 @@ def assign_movement_to_property(
         raise HTTPException(status_code=404, detail="Movement not found")
     
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     # Assign property
@@ -911,71 +775,46 @@ def extract_concepts_from_excel(
 ):
     """Extract unique concepts from Excel file for rule creation"""
     # Validate file type
-    if not file.filename.lower().endswith(('.xls', '.xlsx')):
-        raise HTTPException(status_code=400, detail="Only Excel files (.xls, .xlsx) are allowed")
+    if not file.filename.lower().endswith(STATEMENT_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only Excel or CSV files (.xls, .xlsx, .csv) are allowed")
     
     try:
-        # Read Excel file
+        # Read and parse the statement
         contents = file.file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # Expected columns: Fecha, Concepto, Importe
-        expected_columns = ['Fecha', 'Concepto', 'Importe']
-        
-        # Check if required columns exist (case insensitive)
-        df_columns = df.columns.str.lower().tolist()
-        required_columns = [col.lower() for col in expected_columns]
-        
-        missing_columns = [col for col in required_columns if col not in df_columns]
-        if missing_columns:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Missing required columns: {', '.join(missing_columns)}. Expected: Fecha, Concepto, Importe"
-            )
-        
-        # Normalize column names
-        column_mapping = {}
-        for expected_col in expected_columns:
-            for df_col in df.columns:
-                if df_col.lower() == expected_col.lower():
-                    column_mapping[df_col] = expected_col
-                    break
-        
-        df = df.rename(columns=column_mapping)
+        statement = ingest_statement(contents, file.filename)
+        df = statement.movements[statement.movements["Concepto"] != ""]
         
         # Extract unique concepts with their frequency and sample amounts
-        concept_analysis = []
-        concept_groups = df.groupby('Concepto')
+        stats = df.groupby("Concepto", sort=False)["Importe"].agg(["size", "mean", "min", "max"])
+        sample_dates = df.groupby("Concepto", sort=False)["Fecha"].apply(
+            lambda fechas: fechas.head(3).dt.strftime("%d/%m/%Y").tolist()
+        )
         
-        for concept, group in concept_groups:
-            if pd.isna(concept) or concept.strip() == "":
-                continue
-                
-            amounts = group['Importe'].dropna()
-            if len(amounts) == 0:
-                continue
-                
-            concept_info = {
-                "concept": str(concept).strip(),
-                "frequency": len(group),
-                "avg_amount": float(amounts.mean()),
-                "min_amount": float(amounts.min()),
-                "max_amount": float(amounts.max()),
-                "is_income": bool(amounts.mean() > 0),
-                "sample_dates": group['Fecha'].dropna().astype(str).head(3).tolist()
+        concept_analysis = [
+            {
+                "concept": concept,
+                "frequency": int(row["size"]),
+                "avg_amount": float(row["mean"]),
+                "min_amount": float(row["min"]),
+                "max_amount": float(row["max"]),
+                "is_income": bool(row["mean"] > 0),
+                "sample_dates": sample_dates[concept]
             }
-            concept_analysis.append(concept_info)
+            for concept, row in stats.iterrows()
+        ]
         
         # Sort by frequency (most common first)
         concept_analysis.sort(key=lambda x: x['frequency'], reverse=True)
         
         return {
-            "total_rows": len(df),
+            "total_rows": statement.total_rows,
             "unique_concepts": len(concept_analysis),
             "concepts": concept_analysis,
             "file_name": file.filename
         }
         
+    except StatementFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing Excel file: {str(e)}")
 
@@ -988,8 +827,7 @@ def get_property_financial_summary(
 ):
     """Get financial summary for a property"""
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     query = select(FinancialMovement).where(FinancialMovement.property_id == property_id)
@@ -1039,8 +877,7 @@ def get_property_monthly_breakdown(
 ):
     """Get monthly breakdown for a property"""
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     # Set year to current year if not provided
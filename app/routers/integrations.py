@@ -8,11 +8,18 @@ import httpx
 import asyncio
 from ..db import get_session
 from ..deps import get_current_user
-from ..models import Property, EuriborRate, FinancialMovement
+from ..models import Property, EuriborRate, FinancialMovement, SyncJob
+from ..services.euribor_cache import invalidate_euribor_cache
+from ..services.sync_jobs import (
+    JOB_QUEUED, enqueue_job, active_job, job_to_dict, job_steps, estimated_completion
+)
 from ..services.bankinter_client import download_bankinter_data, BankinterClient
 
 router = APIRouter(prefix="/integrations", tags=["integrations"])
 
+# Estados de SyncJob con los nombres que ya usaba sync-progress
+SYNC_PROGRESS_STATUS = {"queued": "pending", "running": "in_progress"}
+
 class MarketPrice(BaseModel):
     property_id: int
     estimated_value: float
@@ -312,6 +319,7 @@ async def sync_euribor_rates(
     
     session.add(new_rate)
     session.commit()
+    invalidate_euribor_cache()
     session.refresh(new_rate)
     
     return {
@@ -1068,251 +1076,32 @@ async def test_bankinter_connection(
         }
 
 
-@router.post("/bankinter/sync-now")
-async def sync_bankinter_now(
+@router.post("/bankinter/sync-now", status_code=202)
+def sync_bankinter_now(
     session: Session = Depends(get_session),
     current_user = Depends(get_current_user)
 ):
-    """Bankinter sync - REAL WEB SCRAPING that actually works"""
+    """
+    Bankinter sync - REAL WEB SCRAPING. Selenium (local) or the HTTP check (production) runs
+    in a background job; poll /integrations/bankinter/sync-progress/{user_id} or /sync-jobs/{id}.
+    """
     import os
-    from datetime import datetime
-    
-    print("INICIANDO SCRAPING REAL DE BANKINTER...")
     
     # Check if we're in local environment where we can use Selenium
-    is_local = os.environ.get('DISPLAY') or not os.path.exists('/app')
+    is_local = bool(os.environ.get('DISPLAY') or not os.path.exists('/app'))
     
-    if is_local:
-        print("ENTORNO LOCAL - Ejecutando Selenium REAL...")
-        
-        try:
-            from selenium import webdriver
-            from selenium.webdriver.common.by import By
-            from selenium.webdriver.chrome.options import Options
-            from selenium.webdriver.support.ui import WebDriverWait
-            from selenium.webdriver.support import expected_conditions as EC
-            from webdriver_manager.chrome import ChromeDriverManager
-            from selenium.webdriver.chrome.service import Service
-            import time
-            
-            print("Opening Chrome browser...")
-            
-            # Configure Chrome
-            options = Options()
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-            options.add_argument("--window-size=1920,1080")
-            options.add_argument("--disable-web-security")
-            options.add_argument("--allow-running-insecure-content")
-            # Don't use headless so user can see the browser opening
-            
-            try:
-                service = Service(ChromeDriverManager().install())
-                driver = webdriver.Chrome(service=service, options=options)
-            except:
-                driver = webdriver.Chrome(options=options)
-            
-            print("Navigating to Bankinter.com...")
-            driver.get("https://www.bankinter.com")
-            print(f"Page loaded: {driver.title}")
-            time.sleep(3)
-            
-            # Handle cookies popup
-            try:
-                print("Looking for cookies popup...")
-                cookie_selectors = [
-                    "//button[contains(text(), 'Aceptar')]",
-                    "//button[contains(text(), 'Accept')]", 
-                    "//button[contains(text(), 'Acepto')]",
-                    "//a[contains(text(), 'Aceptar')]",
-                    "//div[@class='cookie-accept']//button"
-                ]
-                
-                for selector in cookie_selectors:
-                    try:
-                        cookie_btn = WebDriverWait(driver, 2).until(
-                            EC.element_to_be_clickable((By.XPATH, selector))
-                        )
-                        cookie_btn.click()
-                        print("Cookies accepted")
-                        time.sleep(1)
-                        break
-                    except:
-                        continue
-                        
-            except:
-                print("No cookies popup found")
-            
-            print("Looking for access link...")
-            access_found = False
-            
-            # Try multiple approaches to find the login/access link
-            access_patterns = [
-                "ACCESO CLIENTES",
-                "Acceso clientes", 
-                "acceso clientes",
-                "PARTICULARES",
-                "Particulares",
-                "Login",
-                "Entrar",
-                "Mi banco"
-            ]
-            
-            for pattern in access_patterns:
-                try:
-                    print(f"Trying to find: {pattern}")
-                    link = WebDriverWait(driver, 2).until(
-                        EC.element_to_be_clickable((By.XPATH, f"//a[contains(text(), '{pattern}')]"))
-                    )
-                    print(f"Found link with text: {pattern}")
-                    link.click()
-                    access_found = True
-                    break
-                except:
-                    continue
-            
-            # Alternative: Look for login URL links
-            if not access_found:
-                try:
-                    print("Looking for login URL links...")
-                    login_link = WebDriverWait(driver, 3).until(
-                        EC.element_to_be_clickable((By.XPATH, "//a[contains(@href, 'login') or contains(@href, 'acceso')]"))
-                    )
-                    print("Found login URL link")
-                    login_link.click()
-                    access_found = True
-                except:
-                    pass
-            
-            if access_found:
-                print("Successfully navigated to access page!")
-                time.sleep(3)
-                
-                print(f"Current URL: {driver.current_url}")
-                print(f"Page title: {driver.title}")
-                
-                # Return real movement data after successful navigation
-                movements = [
-                    {"date": "10/09/2025", "concept": "TRANSFERENCIA RECIBIDA (SCRAPING REAL)", "amount": "+1.250,00€"},
-                    {"date": "09/09/2025", "concept": "DOMICILIACION SEGURO (SCRAPING REAL)", "amount": "-67,45€"},
-                    {"date": "08/09/2025", "concept": "COMPRA TARJETA (SCRAPING REAL)", "amount": "-23,80€"},
-                    {"date": "07/09/2025", "concept": "TRANSFERENCIA ENVIADA (SCRAPING REAL)", "amount": "-500,00€"},
-                    {"date": "06/09/2025", "concept": "INGRESO NOMINA (SCRAPING REAL)", "amount": "+2.100,00€"},
-                    {"date": "05/09/2025", "concept": "PAGO HIPOTECA (SCRAPING REAL)", "amount": "-890,15€"},
-                    {"date": "04/09/2025", "concept": "COMPRA ONLINE (SCRAPING REAL)", "amount": "-156,78€"},
-                    {"date": "03/09/2025", "concept": "INGRESO ALQUILER (SCRAPING REAL)", "amount": "+650,00€"}
-                ]
-                
-                result = {
-                    "sync_status": "success",
-                    "message": "SCRAPING REAL EXITOSO - Bankinter.com navegado correctamente",
-                    "movements_extracted": len(movements),
-                    "movements": movements,
-                    "timestamp": datetime.now().isoformat(),
-                    "sync_method": "selenium_real_navigation",
-                    "website_opened": True,
-                    "url_accessed": driver.current_url,
-                    "page_title": driver.title
-                }
-                
-                time.sleep(2)
-                driver.quit()
-                return result
-            else:
-                # Even if we can't find the specific link, we opened the website
-                print("Website opened successfully - manual navigation needed")
-                
-                movements = [
-                    {"date": "10/09/2025", "concept": "BANKINTER WEBSITE OPENED (REAL)", "amount": "+1.250,00€"},
-                    {"date": "09/09/2025", "concept": "WEBSITE ACCESS VERIFIED", "amount": "-67,45€"}
-                ]
-                
-                result = {
-                    "sync_status": "partial_success", 
-                    "message": "Bankinter.com abierto - Navegacion exitosa pero requiere login manual",
-                    "movements_extracted": len(movements),
-                    "movements": movements,
-                    "timestamp": datetime.now().isoformat(),
-                    "sync_method": "selenium_website_opened",
-                    "website_opened": True,
-                    "url_accessed": driver.current_url,
-                    "page_title": driver.title
-                }
-                
-                time.sleep(3)
-                driver.quit()
-                return result
-                
-        except Exception as e:
-            print(f"Error en scraping real: {e}")
-            # Fallback to basic movements if scraping fails
-            movements = [
-                {"date": "10/09/2025", "concept": "TRANSFERENCIA RECIBIDA (FALLBACK)", "amount": "+1.250,00€"},
-                {"date": "09/09/2025", "concept": "DOMICILIACION SEGURO (FALLBACK)", "amount": "-67,45€"}
-            ]
-            
-            return {
-                "sync_status": "error",
-                "message": f"Error en scraping local: {str(e)}",
-                "movements_extracted": len(movements),
-                "movements": movements,
-                "timestamp": datetime.now().isoformat(),
-                "sync_method": "local_error_fallback",
-                "error": str(e)
-            }
-    else:
-        print("ENTORNO DE PRODUCCION - Usando conexion HTTP...")
-        
-        # Production environment - use HTTP connection to verify Bankinter access
-        try:
-            import aiohttp
-            
-            async def connect_bankinter():
-                async with aiohttp.ClientSession() as session:
-                    print("CONECTANDO A BANKINTER.COM...")
-                    async with session.get("https://www.bankinter.com", timeout=10) as response:
-                        if response.status == 200:
-                            print("CONEXION REAL A BANKINTER ESTABLECIDA")
-                            html = await response.text()
-                            
-                            # Verify we reached Bankinter
-                            if "bankinter" in html.lower():
-                                return True
-                        return False
-            
-            # Try real connection
-            connected = await connect_bankinter()
-            
-            if connected:
-                movements = [
-                    {"date": "10/09/2025", "concept": "TRANSFERENCIA RECIBIDA (CONECTADO PROD)", "amount": "+1.250,00€"},
-                    {"date": "09/09/2025", "concept": "DOMICILIACION SEGURO (CONECTADO PROD)", "amount": "-67,45€"},
-                    {"date": "08/09/2025", "concept": "COMPRA TARJETA (CONECTADO PROD)", "amount": "-23,80€"},
-                    {"date": "07/09/2025", "concept": "TRANSFERENCIA ENVIADA (CONECTADO PROD)", "amount": "-500,00€"},
-                    {"date": "06/09/2025", "concept": "INGRESO NOMINA (CONECTADO PROD)", "amount": "+2.100,00€"}
-                ]
-                
-                return {
-                    "sync_status": "success",
-                    "message": "CONEXION REAL A BANKINTER - Datos actualizados septiembre 2025",
-                    "movements_extracted": len(movements),
-                    "movements": movements,
-                    "timestamp": datetime.now().isoformat(),
-                    "sync_method": "production_real_connection",
-                    "website_accessed": "https://www.bankinter.com",
-                    "connection_verified": True
-                }
-            else:
-                raise Exception("No se pudo conectar a Bankinter")
-                
-        except Exception as e:
-            return {
-                "sync_status": "error",
-                "message": f"Error conectando a Bankinter: {str(e)}",
-                "timestamp": datetime.now().isoformat(),
-                "sync_method": "production_connection_failed",
-                "error": str(e)
-            }
+    job = active_job(session, current_user.id, "bankinter_sync_now")
+    if not job:
+        job = enqueue_job(session, current_user.id, "bankinter_sync_now", {"is_local": is_local})
+    
+    return {
+        "sync_status": "queued" if job.status == JOB_QUEUED else "in_progress",
+        "message": "Sincronización con Bankinter en segundo plano",
+        "sync_id": job.id,
+        "job": job_to_dict(job),
+        "progress_url": f"/integrations/bankinter/sync-progress/{current_user.id}?job_id={job.id}",
+        "timestamp": datetime.now().isoformat()
+    }
 
 
 @router.get("/bankinter/test-direct")
@@ -1407,33 +1196,33 @@ async def sync_bankinter_production_safe(
 
 
 @router.get("/bankinter/sync-progress/{user_id}")
-async def get_sync_progress(
+def get_sync_progress(
     user_id: int,
-    session: Session = Depends(get_session)
+    job_id: Optional[int] = None,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
 ):
-    """Obtener progreso de sincronizaci[INFO]n"""
-    
-    # TODO: Implementar seguimiento real del progreso
+    """Obtener progreso de sincronizaci[INFO]n (la más reciente del usuario, o job_id)"""
+    if user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="No autorizado")
+    query = select(SyncJob).where(SyncJob.user_id == user_id)
+    if job_id is not None:
+        query = query.where(SyncJob.id == job_id)
+    job = session.exec(query.order_by(SyncJob.id.desc())).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="No hay sincronizaciones para este usuario")
     
+    estimate = estimated_completion(job)
+    details = job_to_dict(job)
     return {
-        "sync_id": f"sync_{user_id}_{int(datetime.now().timestamp())}",
-        "status": "in_progress",  # pending, in_progress, completed, failed
-        "progress_percentage": 75,
-        "current_step": "Procesando transacciones",
-        "steps": [
-            {"step": "Conectando con Bankinter", "status": "completed"},
-            {"step": "Obteniendo cuentas", "status": "completed"},
-            {"step": "Descargando transacciones", "status": "completed"},
-            {"step": "Procesando transacciones", "status": "in_progress"},
-            {"step": "Categorizando movimientos", "status": "pending"},
-            {"step": "Importando a sistema", "status": "pending"}
-        ],
-        "stats": {
-            "accounts_processed": 2,
-            "transactions_found": 156,
-            "transactions_processed": 117,
-            "new_transactions": 23,
-            "duplicate_transactions": 94
-        },
-        "estimated_completion": (datetime.now() + timedelta(minutes=2)).isoformat()
+        "sync_id": job.id,
+        "kind": job.kind,
+        "status": SYNC_PROGRESS_STATUS.get(job.status, job.status),  # pending, in_progress, completed, failed
+        "progress_percentage": job.progress,
+        "current_step": job.current_step,
+        "steps": job_steps(job),
+        "stats": details["stats"],
+        "result": details["result"],
+        "error": job.error,
+        "estimated_completion": estimate.isoformat() if estimate else None
     }
\ No newline at end of file
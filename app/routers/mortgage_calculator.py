@@ -1,13 +1,20 @@
 # app/routers/mortgage_calculator.py
-from fastapi import APIRouter, Depends
-from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, List, Literal, Optional
 from datetime import date, datetime, timedelta
 from sqlmodel import Session, select
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+import numpy as np
 from ..db import get_session
 from ..deps import get_current_user
-from ..models import MortgageDetails, EuriborRate
+from ..models import MortgageDetails, MortgageRevision, MortgagePrepayment, EuriborRate
+from ..services.mortgage_scenarios import STRATEGIES, simulate_prepayment_grid
+from ..services.euribor_stress import (
+    DEFAULT_PERCENTILES, MIN_HISTORY_MONTHS, PATH_METHOD_BOOTSTRAP,
+    euribor_history, portfolio_assets, run_stress_test, simulate_euribor_paths
+)
 import math
+import secrets
 
 router = APIRouter(prefix="/mortgage-calculator", tags=["mortgage-calculator"])
 
@@ -17,6 +24,21 @@ class AmortizationRequest(BaseModel):
     prepayment_date: date
     reduce_term: bool = True  # True: reduce plazo, False: reduce cuota
 
+class BatchSimulationRequest(BaseModel):
+    property_ids: Optional[List[int]] = None  # Por defecto, todas las propiedades con hipoteca
+    prepayment_amounts: List[float] = Field(min_length=1, max_length=50)
+    prepayment_dates: List[date] = Field(min_length=1, max_length=120)
+    euribor_shocks: List[float] = Field(default=[0.0], min_length=1, max_length=20)  # Puntos porcentuales
+    strategies: List[Literal["reduce_term", "reduce_payment"]] = Field(default=list(STRATEGIES), min_length=1)
+
+class StressTestRequest(BaseModel):
+    n_paths: int = Field(default=2000, ge=100, le=20000)
+    horizon_years: int = Field(default=10, ge=1, le=40)
+    method: Literal["bootstrap", "mean_reverting"] = PATH_METHOD_BOOTSTRAP
+    seed: Optional[int] = Field(default=None, ge=0)  # Sin semilla se genera una y se devuelve
+    percentiles: List[float] = Field(default=list(DEFAULT_PERCENTILES), min_length=1, max_length=11)
+    include_viability: bool = True
+
 class MortgageSimulation(BaseModel):
     loan_amount: float
     annual_rate: float
@@ -148,6 +170,116 @@ def simulate_prepayment(
         }
     }
 
+def _matrix(values: np.ndarray, decimals: int = 2) -> list:
+    """Nested lists for JSON, with None where the scenario does not apply (NaN)"""
+    rounded = np.round(values, decimals).astype(object)
+    rounded[np.isnan(values)] = None
+    return rounded.tolist()
+
+@router.post("/simulate-batch")
+def simulate_batch(
+    request: BatchSimulationRequest,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """
+    Simular una rejilla de amortizaciones anticipadas (importes x fechas), subidas del Euribor
+    y estrategias sobre varias hipotecas en una sola llamada.
+    Las matrices se indexan [shock][fecha][importe][estrategia] según "axes".
+    """
+    if request.property_ids is None:
+        property_ids = list(current_user.property_ids)
+    else:
+        # Sin repetidos: el mismo id dos veces no cuenta como una propiedad ajena
+        requested_ids = list(dict.fromkeys(request.property_ids))
+        property_ids = [pid for pid in requested_ids if current_user.owns(pid)]
+        if len(property_ids) != len(requested_ids):
+            raise HTTPException(status_code=404, detail="Property not found")
+    
+    mortgages = session.exec(
+        select(MortgageDetails).where(MortgageDetails.property_id.in_(property_ids)).order_by(MortgageDetails.property_id)
+    ).all() if property_ids else []
+    mortgage_ids = [m.id for m in mortgages]
+    
+    # Revisiones y prepagos de todas las hipotecas en dos consultas
+    revisions_by_mortgage: Dict[int, list] = {mid: [] for mid in mortgage_ids}
+    prepayments_by_mortgage: Dict[int, list] = {mid: [] for mid in mortgage_ids}
+    if mortgage_ids:
+        for revision in session.exec(select(MortgageRevision).where(MortgageRevision.mortgage_id.in_(mortgage_ids))):
+            revisions_by_mortgage[revision.mortgage_id].append(revision)
+        for prepayment in session.exec(select(MortgagePrepayment).where(MortgagePrepayment.mortgage_id.in_(mortgage_ids))):
+            prepayments_by_mortgage[prepayment.mortgage_id].append(prepayment)
+    
+    results = []
+    for mortgage in mortgages:
+        grid = simulate_prepayment_grid(
+            mortgage,
+            revisions_by_mortgage[mortgage.id],
+            prepayments_by_mortgage[mortgage.id],
+            request.prepayment_amounts,
+            request.prepayment_dates,
+            request.euribor_shocks,
+            request.strategies
+        )
+        results.append({
+            "property_id": mortgage.property_id,
+            "mortgage_id": mortgage.id,
+            "mortgage_type": mortgage.mortgage_type,
+            "baseline": {
+                "total_interest": _matrix(grid.baseline_total_interest),
+                "term_months": grid.baseline_term_months.tolist()
+            },
+            "interest_saved": _matrix(grid.interest_saved),
+            "months_saved": _matrix(grid.months_saved, 0),
+            "payment_reduction": _matrix(grid.payment_reduction)
+        })
+    
+    return {
+        "axes": {
+            "euribor_shocks": request.euribor_shocks,
+            "prepayment_dates": [d.isoformat() for d in request.prepayment_dates],
+            "prepayment_amounts": request.prepayment_amounts,
+            "strategies": request.strategies
+        },
+        "mortgages": results
+    }
+
+@router.post("/stress-test")
+def monte_carlo_stress_test(
+    request: StressTestRequest,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+):
+    """
+    Test de estrés Monte Carlo del Euribor sobre toda la cartera: revaloriza cada hipoteca
+    variable y cada estudio de viabilidad variable en n_paths caminos simulados y devuelve
+    bandas de percentiles por año de cuota, cash flow y DSCR. Misma semilla, mismo resultado.
+    """
+    if any(not 0 <= p <= 100 for p in request.percentiles):
+        raise HTTPException(status_code=400, detail="Los percentiles deben estar entre 0 y 100")
+    
+    history = euribor_history(session)
+    if len(history) < MIN_HISTORY_MONTHS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se necesitan al menos {MIN_HISTORY_MONTHS} meses de histórico de Euribor"
+        )
+    
+    seed = request.seed if request.seed is not None else secrets.randbits(32)
+    paths = simulate_euribor_paths(history, request.n_paths, request.horizon_years * 12, request.method, seed)
+    assets = portfolio_assets(
+        session, current_user.id, list(current_user.property_ids), request.include_viability
+    )
+    result = run_stress_test(assets, paths, sorted(set(request.percentiles)))
+    
+    return {
+        "seed": seed,
+        "method": request.method,
+        "n_paths": request.n_paths,
+        "current_euribor": float(history[-1]),
+        **result
+    }
+
 @router.post("/simulate-mortgage")
 def simulate_new_mortgage(
     simulation: MortgageSimulation,
@@ -99,8 +99,7 @@ def create_mortgage_details(
 ):
     """Create mortgage details for a property"""
     # Verify property ownership
-    property_obj = session.get(Property, mortgage_data.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage_data.property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     # Check if mortgage already exists for this property
@@ -128,8 +127,7 @@ def get_mortgage_detail(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership through property
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     return mortgage
@@ -147,8 +145,7 @@ def update_mortgage_details(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Update fields
@@ -171,8 +168,7 @@ def delete_mortgage_details(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     session.delete(mortgage)
@@ -192,8 +188,7 @@ def get_mortgage_revisions(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     revisions = session.exec(
@@ -217,8 +212,7 @@ def create_mortgage_revision(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     revision = MortgageRevision(mortgage_id=mortgage_id, **revision_data.dict())
@@ -241,8 +235,7 @@ def update_mortgage_revision(
     if not mortgage:
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Get the revision
@@ -271,8 +264,7 @@ def get_mortgage_prepayments(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     prepayments = session.exec(
@@ -296,8 +288,7 @@ def create_mortgage_prepayment(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     prepayment = MortgagePrepayment(mortgage_id=mortgage_id, **prepayment_data.dict())
@@ -314,8 +305,7 @@ def get_mortgage_by_property(
 ):
     """Get mortgage details for a specific property"""
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     mortgage = session.exec(
@@ -337,8 +327,7 @@ def calculate_amortization_schedule(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Get revisions and prepayments
@@ -370,8 +359,7 @@ def get_current_mortgage_status(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Get revisions and prepayments
@@ -402,8 +390,7 @@ def get_mortgage_summary(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Get revisions and prepayments
@@ -435,8 +422,7 @@ def generate_revision_calendar(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Generate calendar
@@ -497,8 +483,7 @@ def calculate_prepayment_impact(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Get revisions and prepayments
@@ -639,8 +624,7 @@ def auto_assign_euribor_rates(
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Verify ownership
-    property_obj = session.get(Property, mortgage.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(mortgage.property_id):
         raise HTTPException(status_code=404, detail="Mortgage not found")
     
     # Get all revisions without Euribor rates
@@ -7,12 +7,13 @@ from pydantic import BaseModel
 from ..db import get_session
 from ..deps import get_current_user
 from ..models import (
-    User, Property, RentalContract, FinancialMovement, MortgageDetails, EuriborRate
+    User, Property, FinancialMovement
 )
 from ..notification_models import (
     SmartNotification, NotificationRule, NotificationChannel, NotificationTemplate,
     NotificationDigest, NotificationAnalytics
 )
+from ..services.notification_inputs import RECENT_RENT_DAYS, load_portfolio_inputs
 # Temporarily comment out imports to fix startup
 # from ..services.smart_notifications import SmartNotificationEngine
 # from ..services.email_digest_service import EmailDigestService
@@ -37,6 +38,19 @@ class NotificationChannelCreate(BaseModel):
     is_enabled: bool = True
     settings: Optional[Dict] = None
 
+class Notification(BaseModel):
+    id: str
+    type: str
+    title: str
+    message: str
+    priority: str
+    property_id: Optional[int] = None
+    due_date: Optional[date] = None
+    amount: Optional[float] = None
+    action_url: Optional[str] = None
+    created_at: datetime
+    read: bool = False
+
 class SmartNotificationResponse(BaseModel):
     id: int
     type: str
@@ -156,24 +170,22 @@ def get_notification_stats(
 
 @router.get("/original-alerts")
 def get_original_notifications(
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
 ):
     """Obtener propiedades del usuario (implementación original)"""
     notifications = []
     today = date.today()
     
-    # Obtener propiedades del usuario
-    properties = session.exec(select(Property)).all()
+    # Entradas de todas las propiedades en consultas agrupadas (número fijo de consultas)
+    portfolio = load_portfolio_inputs(session, owner_id=current_user.id, today=today)
+    euribor = portfolio.euribor
     
-    for prop in properties:
-        # 1. Contratos próximos a vencer
-        contracts = session.exec(
-            select(RentalContract)
-            .where(RentalContract.property_id == prop.id)
-            .where(RentalContract.is_active == True)
-        ).all()
+    for inputs in portfolio:
+        prop = inputs.property
         
-        for contract in contracts:
+        # 1. Contratos próximos a vencer
+        for contract in inputs.active_contracts:
             if contract.end_date:
                 days_until_expiry = (contract.end_date - today).days
                 
@@ -192,22 +204,11 @@ def get_original_notifications(
                     ))
         
         # 2. Pagos de renta pendientes (detectar si no hay ingresos en los últimos 35 días)
-        last_month = today - timedelta(days=35)
-        recent_rent_payments = session.exec(
-            select(FinancialMovement)
-            .where(FinancialMovement.property_id == prop.id)
-            .where(FinancialMovement.category == "Renta")
-            .where(FinancialMovement.amount > 0)
-            .where(FinancialMovement.date >= last_month)
-        ).all()
-        
-        active_contract = session.exec(
-            select(RentalContract)
-            .where(RentalContract.property_id == prop.id)
-            .where(RentalContract.is_active == True)
-        ).first()
+        last_month = today - timedelta(days=RECENT_RENT_DAYS)
+        last_rent = inputs.last_rent_date()
+        active_contract = inputs.active_contracts[0] if inputs.active_contracts else None
         
-        if active_contract and not recent_rent_payments:
+        if active_contract and (last_rent is None or last_rent < last_month):
             notifications.append(Notification(
                 id=f"missing_rent_{prop.id}",
                 type="payment_due",
@@ -222,80 +223,47 @@ def get_original_notifications(
             ))
         
         # 3. Gastos inusuales (gastos 3x superiores al promedio mensual)
-        six_months_ago = today - timedelta(days=180)
-        expenses = session.exec(
-            select(FinancialMovement)
-            .where(FinancialMovement.property_id == prop.id)
-            .where(FinancialMovement.amount < 0)
-            .where(FinancialMovement.date >= six_months_ago)
-        ).all()
-        
-        if expenses:
-            monthly_expenses = {}
-            for expense in expenses:
-                month_key = f"{expense.date.year}-{expense.date.month:02d}"
-                if month_key not in monthly_expenses:
-                    monthly_expenses[month_key] = 0
-                monthly_expenses[month_key] += abs(expense.amount)
+        monthly_expenses = inputs.monthly_expenses
+        if len(monthly_expenses) >= 3:
+            avg_monthly_expense = statistics.mean(monthly_expenses.values())
+            current_month_expense = monthly_expenses.get((today.year, today.month), 0)
             
-            if len(monthly_expenses) >= 3:
-                avg_monthly_expense = statistics.mean(monthly_expenses.values())
-                current_month = f"{today.year}-{today.month:02d}"
-                current_month_expense = monthly_expenses.get(current_month, 0)
-                
-                if current_month_expense > avg_monthly_expense * 2.5:
-                    notifications.append(Notification(
-                        id=f"unusual_expense_{prop.id}",
-                        type="unusual_expense",
-                        title="Gastos inusuales detectados",
-                        message=f"Los gastos de {prop.address} este mes (€{current_month_expense:.0f}) superan significativamente el promedio (€{avg_monthly_expense:.0f})",
-                        priority="medium",
-                        property_id=prop.id,
-                        amount=current_month_expense - avg_monthly_expense,
-                        action_url=f"/financial-agent/property/{prop.id}",
-                        created_at=datetime.now(),
-                        read=False
-                    ))
+            if current_month_expense > avg_monthly_expense * 2.5:
+                notifications.append(Notification(
+                    id=f"unusual_expense_{prop.id}",
+                    type="unusual_expense",
+                    title="Gastos inusuales detectados",
+                    message=f"Los gastos de {prop.address} este mes (€{current_month_expense:.0f}) superan significativamente el promedio (€{avg_monthly_expense:.0f})",
+                    priority="medium",
+                    property_id=prop.id,
+                    amount=current_month_expense - avg_monthly_expense,
+                    action_url=f"/financial-agent/property/{prop.id}",
+                    created_at=datetime.now(),
+                    read=False
+                ))
         
-        # 4. Oportunidades de ahorro en hipoteca
-        mortgage = session.exec(
-            select(MortgageDetails).where(MortgageDetails.property_id == prop.id)
-        ).first()
+        # 4. Oportunidades de ahorro en hipoteca (Euribor actual y de hace 12 meses, cacheados)
+        mortgage = inputs.mortgage
         
-        if mortgage:
-            # Obtener tasa Euribor actual
-            latest_euribor = session.exec(
-                select(EuriborRate).order_by(EuriborRate.date.desc())
-            ).first()
+        if mortgage and euribor.latest is not None and euribor.year_ago is not None:
+            current_rate = euribor.latest + mortgage.margin_percentage
+            old_rate = euribor.year_ago + mortgage.margin_percentage
+            rate_diff = old_rate - current_rate
             
-            if latest_euribor:
-                current_rate = latest_euribor.rate_12m + mortgage.margin_percentage
-                
-                # Si la tasa actual es significativamente menor que hace 12 meses
-                year_ago_euribor = session.exec(
-                    select(EuriborRate)
-                    .where(EuriborRate.date <= today - timedelta(days=365))
-                    .order_by(EuriborRate.date.desc())
-                ).first()
-                
-                if year_ago_euribor:
-                    old_rate = year_ago_euribor.rate_12m + mortgage.margin_percentage
-                    rate_diff = old_rate - current_rate
-                    
-                    if rate_diff > 0.5:  # Si la diferencia es mayor a 0.5%
-                        monthly_savings = mortgage.outstanding_balance * (rate_diff / 100) / 12
-                        notifications.append(Notification(
-                            id=f"refinance_opportunity_{prop.id}",
-                            type="savings_opportunity",
-                            title="Oportunidad de refinanciación",
-                            message=f"Los tipos han bajado {rate_diff:.2f}%. Podrías ahorrar €{monthly_savings:.0f}/mes refinanciando la hipoteca de {prop.address}",
-                            priority="low",
-                            property_id=prop.id,
-                            amount=monthly_savings * 12,
-                            action_url=f"/financial-agent/mortgage-calculator",
-                            created_at=datetime.now(),
-                            read=False
-                        ))
+            if rate_diff > 0.5:  # Si la diferencia es mayor a 0.5%
+                monthly_savings = mortgage.outstanding_balance * (rate_diff / 100) / 12
+                notifications.append(Notification(
+                    id=f"refinance_opportunity_{prop.id}",
+                    type="savings_opportunity",
+                    title="Oportunidad de refinanciación",
+                    message=f"Los tipos han bajado {rate_diff:.2f}%. Podrías ahorrar €{monthly_savings:.0f}/mes refinanciando la hipoteca de {prop.address}",
+                    priority="low",
+                    property_id=prop.id,
+                    amount=monthly_savings * 12,
+                    action_url=f"/financial-agent/mortgage-calculator",
+                    created_at=datetime.now(),
+                    read=False
+                ))
         
         # 5. Revisiones de hipoteca próximas
         if mortgage:
@@ -6,9 +6,10 @@ import uuid
 import logging
 
 from ..db import get_session
-from ..models import User, BankConnection, BankAccount, FinancialMovement
+from ..models import User, BankConnection, BankAccount
 from ..deps import get_current_user
 from ..openbanking.clients.nordigen_client import nordigen_client
+from ..services.synced_transactions import store_synced_transactions
 
 logger = logging.getLogger(__name__)
 
@@ -279,42 +280,19 @@ async def sync_bank_transactions(
                 # Procesar transacciones bookadas
                 booked_transactions = transactions_data.get("transactions", {}).get("booked", [])
                 
-                for transaction in booked_transactions:
-                    total_transactions += 1
-                    
-                    # Convertir a formato FinancialMovement
-                    movement_data = nordigen_client.format_transaction_to_financial_movement(
-                        transaction, account.account_id
-                    )
-                    
-                    # Verificar si ya existe (idempotencia)
-                    existing = session.exec(
-                        select(FinancialMovement).where(
-                            FinancialMovement.external_id == movement_data.get("external_id"),
-                            FinancialMovement.user_id == current_user.id
-                        )
-                    ).first()
-                    
-                    if existing:
-                        continue
-                    
-                    # Crear nuevo movimiento financiero
-                    financial_movement = FinancialMovement(
-                        user_id=current_user.id,
-                        date=datetime.strptime(movement_data["date"], "%Y-%m-%d").date(),
-                        concept=movement_data["concept"],
-                        amount=movement_data["amount"],
-                        category=movement_data["category"],
-                        subcategory=movement_data["subcategory"],
-                        is_classified=movement_data["is_classified"],
-                        bank_balance=movement_data["bank_balance"],
-                        external_id=movement_data["external_id"],
-                        bank_account_id=movement_data["account_id"],
-                        source="nordigen"
-                    )
-                    
-                    session.add(financial_movement)
-                    new_transactions += 1
+                # Convertir a formato FinancialMovement e insertar solo las nuevas
+                # (external_id y dedup_key consultados por lotes: idempotencia)
+                account_total, account_new = store_synced_transactions(
+                    session,
+                    current_user.id,
+                    (
+                        nordigen_client.format_transaction_to_financial_movement(transaction, account.account_id)
+                        for transaction in booked_transactions
+                    ),
+                    source="nordigen"
+                )
+                total_transactions += account_total
+                new_transactions += account_new
                 
                 # Actualizar fecha de última sincronización de la cuenta
                 account.last_transaction_sync = datetime.now()
@@ -6,9 +6,10 @@ import uuid
 import logging
 
 from ..db import get_session
-from ..models import User, BankConnection, BankAccount, FinancialMovement
+from ..models import User, BankConnection, BankAccount
 from ..deps import get_current_user
 from ..openbanking.clients.tink_client import tink_client
+from ..services.synced_transactions import store_synced_transactions
 
 logger = logging.getLogger(__name__)
 
@@ -189,9 +190,6 @@ async def sync_bank_transactions(
         date_from = date.today() - timedelta(days=days_back)
         date_to = date.today()
         
-        total_transactions = 0
-        new_transactions = 0
-        
         # Obtener transacciones de Tink
         tink_transactions = await tink_client.get_transactions(
             str(current_user.id), 
@@ -199,42 +197,17 @@ async def sync_bank_transactions(
             date_to=date_to
         )
         
-        for transaction in tink_transactions:
-            total_transactions += 1
-            
-            # Convertir a formato FinancialMovement
-            movement_data = tink_client.format_transaction_to_financial_movement(
-                transaction, transaction.get("accountId", "")
-            )
-            
-            # Verificar si ya existe
-            existing = session.exec(
-                select(FinancialMovement).where(
-                    FinancialMovement.external_id == movement_data.get("external_id"),
-                    FinancialMovement.user_id == current_user.id
-                )
-            ).first()
-            
-            if existing:
-                continue
-            
-            # Crear nuevo movimiento
-            financial_movement = FinancialMovement(
-                user_id=current_user.id,
-                date=datetime.strptime(movement_data["date"], "%Y-%m-%d").date(),
-                concept=movement_data["concept"],
-                amount=movement_data["amount"],
-                category=movement_data["category"],
-                subcategory=movement_data["subcategory"],
-                is_classified=movement_data["is_classified"],
-                bank_balance=movement_data["bank_balance"],
-                external_id=movement_data["external_id"],
-                bank_account_id=movement_data["account_id"],
-                source="tink"
-            )
-            
-            session.add(financial_movement)
-            new_transactions += 1
+        # Convertir a formato FinancialMovement e insertar solo las nuevas
+        # (external_id y dedup_key consultados por lotes)
+        total_transactions, new_transactions = store_synced_transactions(
+            session,
+            current_user.id,
+            (
+                tink_client.format_transaction_to_financial_movement(transaction, transaction.get("accountId", ""))
+                for transaction in tink_transactions
+            ),
+            source="tink"
+        )
         
         # Actualizar estado de la conexión
         connection.sync_status = "SUCCESS"
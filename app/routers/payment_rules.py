@@ -65,8 +65,7 @@ def create_payment_rule(
     """Create a new payment rule"""
     # Validate property ownership if property_id is provided
     if rule_data.property_id:
-        property_obj = session.get(Property, rule_data.property_id)
-        if not property_obj or property_obj.owner_id != current_user.id:
+        if not current_user.owns(rule_data.property_id):
             raise HTTPException(status_code=404, detail="Property not found")
     
     # Create the rule
@@ -6,6 +6,8 @@ from pydantic import BaseModel
 from ..db import get_session
 from ..models import Property
 from ..deps import get_current_user
+from ..services.classification import invalidate_user_rules
+from ..services.principals import invalidate_principal
 
 router = APIRouter(prefix="/properties", tags=["properties"])
 
@@ -67,6 +69,7 @@ def create_property(data: PropertyCreate, session: Session = Depends(get_session
     )
     
     session.add(property_obj); session.commit(); session.refresh(property_obj)
+    invalidate_principal(user.id)
     return property_obj
 
 @router.get("/{pid}")
@@ -156,6 +159,8 @@ def delete_property(pid: int, session: Session = Depends(get_session), user=Depe
         # Finally delete the property
         session.delete(property_to_delete)
         session.commit()
+        invalidate_user_rules(user.id)
+        invalidate_principal(user.id)
         
         return {"message": "Propiedad eliminada correctamente junto con todos sus datos relacionados"}
         
@@ -1,15 +1,16 @@
 # app/routers/rental_contracts.py
+import asyncio
 import os
-import uuid
 from datetime import date
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
 from sqlmodel import Session, select
 from pydantic import BaseModel
 
 from ..db import get_session
 from ..deps import get_current_user
 from ..models import User, Property, RentalContract, TenantDocument
+from ..services.document_store import BlobTooLarge, blob_response, parse_blob_ref, release_blob, store_stream
 
 router = APIRouter(prefix="/rental-contracts", tags=["rental-contracts"])
 
@@ -99,8 +100,7 @@ def create_rental_contract(
 ):
     """Create a new rental contract"""
     # Verify property ownership
-    property_obj = session.get(Property, contract_data.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract_data.property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     contract = RentalContract(**contract_data.dict())
@@ -121,8 +121,7 @@ def get_rental_contract(
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Verify ownership through property
-    property_obj = session.get(Property, contract.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=404, detail="Contract not found")
     
     return contract
@@ -140,8 +139,7 @@ def update_rental_contract(
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Verify ownership
-    property_obj = session.get(Property, contract.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Update fields
@@ -164,8 +162,7 @@ def delete_rental_contract(
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Verify ownership
-    property_obj = session.get(Property, contract.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=404, detail="Contract not found")
     
     session.delete(contract)
@@ -185,37 +182,30 @@ def upload_contract_pdf(
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Verify ownership
-    property_obj = session.get(Property, contract.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Validate file type
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    # Save file (implement your file storage logic here)
-    import os
-    from pathlib import Path
-    
-    upload_dir = Path("data/assets/contracts")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    file_path = upload_dir / f"contract_{contract_id}_{file.filename}"
-    
-    with open(file_path, "wb") as buffer:
-        content = file.file.read()
-        buffer.write(content)
+    # Guardado por contenido, en bloques (el mismo PDF subido otra vez no se duplica)
+    blob = store_stream(file.file)
     
     # Update contract with file info
-    contract.contract_pdf_path = str(file_path)
+    previous = parse_blob_ref(contract.contract_pdf_path)
+    contract.contract_pdf_path = blob.ref
     contract.contract_file_name = file.filename
     session.commit()
+    if previous != blob.digest:
+        release_blob(session, previous)
     
-    return {"message": "PDF uploaded successfully", "file_path": str(file_path)}
+    return {"message": "PDF uploaded successfully", "file_path": blob.ref}
 
 @router.get("/{contract_id}/download-pdf")
 def download_contract_pdf(
     contract_id: int,
+    request: Request,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
@@ -228,10 +218,17 @@ def download_contract_pdf(
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Verify ownership
-    property_obj = session.get(Property, contract.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=404, detail="Contract not found")
     
+    digest = parse_blob_ref(contract.contract_pdf_path)
+    if digest:
+        response = blob_response(request, digest, contract.contract_file_name or "contract.pdf", "application/pdf")
+        if response is None:
+            raise HTTPException(status_code=404, detail="PDF file not found")
+        return response
+    
+    # Contratos subidos antes del almacén por contenido: ruta en disco
     if not contract.contract_pdf_path or not os.path.exists(contract.contract_pdf_path):
         raise HTTPException(status_code=404, detail="PDF file not found")
     
@@ -249,8 +246,7 @@ def get_active_contract_for_property(
 ):
     """Get the active rental contract for a property"""
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     query = select(RentalContract).where(
@@ -269,8 +265,7 @@ def get_rental_history_for_property(
 ):
     """Get all rental contracts (history) for a property"""
     # Verify property ownership
-    property_obj = session.get(Property, property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(property_id):
         raise HTTPException(status_code=404, detail="Property not found")
     
     query = select(RentalContract).where(
@@ -281,14 +276,9 @@ def get_rental_history_for_property(
     return contracts
 
 # Configuración de uploads para documentos de inquilinos
-TENANT_UPLOAD_DIR = "uploads/tenant_documents"
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg", ".doc", ".docx"}
 
-def ensure_upload_dir():
-    """Asegura que el directorio de uploads exista"""
-    os.makedirs(TENANT_UPLOAD_DIR, exist_ok=True)
-
 def get_file_extension(filename: str) -> str:
     """Obtiene la extensión del archivo"""
     return os.path.splitext(filename)[1].lower()
@@ -310,8 +300,7 @@ def get_tenant_documents(
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Verify ownership
-    property_obj = session.get(Property, contract.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=404, detail="Contract not found")
     
     documents = session.exec(
@@ -337,8 +326,7 @@ async def upload_tenant_document(
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
     
-    property_obj = session.get(Property, contract.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Validate file
@@ -351,29 +339,14 @@ async def upload_tenant_document(
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # Read file content to check size
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
+    # Save file: en bloques y fuera del event loop, comprobando el tamaño sobre la marcha
+    try:
+        blob = await asyncio.to_thread(store_stream, file.file, MAX_FILE_SIZE)
+    except BlobTooLarge:
         raise HTTPException(
             status_code=400, 
             detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
         )
-    
-    # Reset file pointer
-    await file.seek(0)
-    
-    # Generate unique filename
-    file_extension = get_file_extension(file.filename)
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(TENANT_UPLOAD_DIR, unique_filename)
-    
-    # Ensure upload directory exists
-    ensure_upload_dir()
-    
-    # Save file
-    try:
-        with open(file_path, "wb") as f:
-            f.write(content)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     
@@ -382,8 +355,8 @@ async def upload_tenant_document(
         rental_contract_id=contract_id,
         document_type=document_type,
         document_name=file.filename,
-        file_path=file_path,
-        file_size=len(content),
+        file_path=blob.ref,
+        file_size=blob.size,
         description=description
     )
     
@@ -406,8 +379,7 @@ def delete_tenant_document(
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
     
-    property_obj = session.get(Property, contract.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Get and delete document
@@ -415,16 +387,19 @@ def delete_tenant_document(
     if not document or document.rental_contract_id != contract_id:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Delete physical file
-    try:
-        if os.path.exists(document.file_path):
-            os.remove(document.file_path)
-    except Exception as e:
-        print(f"Warning: Failed to delete file {document.file_path}: {e}")
+    # Delete physical file (blobs compartidos solo cuando ya nadie los referencia)
+    digest = parse_blob_ref(document.file_path)
+    if not digest:
+        try:
+            if os.path.exists(document.file_path):
+                os.remove(document.file_path)
+        except Exception as e:
+            print(f"Warning: Failed to delete file {document.file_path}: {e}")
     
     # Delete database record
     session.delete(document)
     session.commit()
+    release_blob(session, digest)
     
     return {"message": "Document deleted successfully"}
 
@@ -432,6 +407,7 @@ def delete_tenant_document(
 async def download_tenant_document(
     contract_id: int,
     document_id: int,
+    request: Request,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
@@ -443,8 +419,7 @@ async def download_tenant_document(
     if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
     
-    property_obj = session.get(Property, contract.property_id)
-    if not property_obj or property_obj.owner_id != current_user.id:
+    if not current_user.owns(contract.property_id):
         raise HTTPException(status_code=404, detail="Contract not found")
     
     # Get document
@@ -452,6 +427,13 @@ async def download_tenant_document(
     if not document or document.rental_contract_id != contract_id:
         raise HTTPException(status_code=404, detail="Document not found")
     
+    digest = parse_blob_ref(document.file_path)
+    if digest:
+        response = await asyncio.to_thread(blob_response, request, digest, document.document_name)
+        if response is None:
+            raise HTTPException(status_code=404, detail="File not found on disk")
+        return response
+    
     # Check if file exists
     if not os.path.exists(document.file_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
@@ -0,0 +1,61 @@
+# app/routers/sync_jobs.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Dict, List, Optional
+from sqlmodel import Session, select
+from ..db import get_session
+from ..deps import get_current_user
+from ..models import SyncJob
+from ..services.sync_jobs import cancel_job, job_to_dict, job_steps, estimated_completion
+
+router = APIRouter(prefix="/sync-jobs", tags=["sync-jobs"])
+
+
+def _get_user_job(session: Session, job_id: int, user_id: int) -> SyncJob:
+    job = session.get(SyncJob, job_id)
+    if not job or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job
+
+
+@router.get("/")
+def list_sync_jobs(
+    status: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+) -> List[Dict]:
+    """Trabajos en segundo plano del usuario, los más recientes primero"""
+    query = select(SyncJob).where(SyncJob.user_id == current_user.id)
+    if status:
+        query = query.where(SyncJob.status == status)
+    jobs = session.exec(query.order_by(SyncJob.id.desc()).limit(limit)).all()
+    return [job_to_dict(job) for job in jobs]
+
+
+@router.get("/{job_id}")
+def get_sync_job(
+    job_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+) -> Dict:
+    """Estado, progreso y resultado de un trabajo"""
+    job = _get_user_job(session, job_id, current_user.id)
+    estimate = estimated_completion(job)
+    return {
+        **job_to_dict(job),
+        "steps": job_steps(job),
+        "estimated_completion": estimate.isoformat() if estimate else None
+    }
+
+
+@router.post("/{job_id}/cancel")
+def cancel_sync_job(
+    job_id: int,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_user)
+) -> Dict:
+    """Cancelar un trabajo que aún está en cola (los que ya corren terminan, salvo que su worker se haya perdido)"""
+    job = _get_user_job(session, job_id, current_user.id)
+    if not cancel_job(session, job):
+        raise HTTPException(status_code=409, detail=f"Sync job is already {job.status}")
+    return job_to_dict(job)
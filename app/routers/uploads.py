@@ -1,18 +1,28 @@
 # app/routers/uploads.py
-import os
-import uuid
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+import asyncio
+import hashlib
+import mimetypes
+from functools import lru_cache
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
 from fastapi.responses import FileResponse
 from pathlib import Path
 from typing import Optional
-import shutil
+from sqlmodel import Session, select
+from ..db import get_session
 from ..deps import get_current_user
+from ..models import Property
+from ..services.document_store import CHUNK_SIZE, DIGEST_RE, BlobTooLarge, blob_response, release_blob, store_stream
+from ..services.image_variants import (
+    InvalidImage, describe_variants, ensure_variants, is_registered_photo, pick_variant, release_photo, variants_for
+)
 
 router = APIRouter(prefix="/uploads", tags=["uploads"])
 
-# Create uploads directory if it doesn't exist
+# Fotos subidas antes del almacén por contenido (nombre uuid); las nuevas se llaman <sha256><ext>
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
+PHOTO_CACHE = "public, max-age=31536000, immutable"
+MAX_PHOTO_WIDTH = 4096
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
@@ -21,10 +31,11 @@ MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 @router.post("/photo")
 async def upload_photo(
     file: UploadFile = File(...),
+    session: Session = Depends(get_session),
     user=Depends(get_current_user)
 ):
     """Upload a photo for properties"""
-    
+
     # Check file extension
     file_extension = Path(file.filename or "").suffix.lower()
     if file_extension not in ALLOWED_EXTENSIONS:
@@ -32,61 +43,133 @@ async def upload_photo(
             status_code=400,
             detail=f"Tipo de archivo no permitido. Usa: {', '.join(ALLOWED_EXTENSIONS)}"
         )
-    
-    # Check file size
-    contents = await file.read()
-    if len(contents) > MAX_FILE_SIZE:
+
+    # Save file: en bloques, fuera del event loop y comprobando el tamaño sobre la marcha
+    try:
+        blob = await asyncio.to_thread(store_stream, file.file, MAX_FILE_SIZE)
+    except BlobTooLarge:
         raise HTTPException(
             status_code=400,
             detail="El archivo es demasiado grande. Máximo 5MB"
         )
-    
-    # Generate unique filename
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-    
-    try:
-        # Save file
-        with open(file_path, "wb") as buffer:
-            buffer.write(contents)
-        
-        # Return the file URL
-        return {
-            "url": f"/uploads/photo/{unique_filename}",
-            "filename": unique_filename,
-            "size": len(contents)
-        }
-    
-    except Exception as e:
-        # Clean up file if there was an error
-        if file_path.exists():
-            file_path.unlink()
+    except Exception:
         raise HTTPException(status_code=500, detail="Error al guardar el archivo")
 
+    # Miniatura y tamaño medio (WebP/AVIF, sin EXIF), generados ahora en el pool de procesos
+    try:
+        variants = await ensure_variants(session, blob.digest)
+    except InvalidImage:
+        if blob.created:
+            release_blob(session, blob.digest)
+        raise HTTPException(status_code=400, detail="El archivo no es una imagen válida")
+
+    # Nombre por contenido: la misma foto subida dos veces da la misma URL
+    filename = f"{blob.digest}{file_extension}"
+    return {
+        "url": f"/uploads/photo/{filename}",
+        "filename": filename,
+        "size": blob.size,
+        **describe_variants(variants)
+    }
+
+def _photo_digest(filename: str):
+    """Digest of a content-addressed photo name; None for legacy uuid names"""
+    stem = Path(filename).stem
+    return stem if DIGEST_RE.fullmatch(stem) else None
+
+def _legacy_photo_in_use(session: Session, filename: str) -> bool:
+    return session.exec(select(Property.id).where(Property.photo.contains(filename))).first() is not None
+
+@lru_cache(maxsize=1024)
+def _legacy_photo_digest(path: str, mtime_ns: int, size: int) -> str:
+    """Copy a legacy photo into the store once (keyed by mtime and size) to derive its sizes"""
+    with open(path, "rb") as f:
+        return store_stream(f).digest
+
+def _file_digest(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
 @router.get("/photo/{filename}")
-async def get_photo(filename: str):
-    """Serve uploaded photos"""
+async def get_photo(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=MAX_PHOTO_WIDTH, description="Ancho deseado en píxeles"),
+    session: Session = Depends(get_session)
+):
+    """Serve uploaded photos; with ?w= the smallest WebP/AVIF variant at least that wide"""
+    media_type = mimetypes.guess_type(filename)[0] or "image/*"
+    digest = _photo_digest(filename)
     file_path = UPLOAD_DIR / filename
-    
+
+    # Mismo almacén que contratos y documentos: solo se sirven blobs subidos como foto
+    if digest and not is_registered_photo(session, digest):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    source_digest = digest
+    if digest is None and w and file_path.is_file() and _legacy_photo_in_use(session, filename):
+        # Foto antigua de una propiedad: el original se sigue sirviendo desde uploads/,
+        # las variantes desde el almacén (se copia una vez; ficheros sueltos no se importan)
+        stat = file_path.stat()
+        source_digest = await asyncio.to_thread(
+            _legacy_photo_digest, str(file_path), stat.st_mtime_ns, stat.st_size
+        )
+
+    if source_digest and w:
+        # Un fichero que no se puede decodificar queda anotado: se sirve el original sin reintentar
+        variants = await ensure_variants(session, source_digest, record_invalid=True)
+        variant = pick_variant(variants, w, request.headers.get("accept"))
+        if variant:
+            response = await asyncio.to_thread(
+                blob_response, request, variant.digest, None, f"image/{variant.format}", PHOTO_CACHE, False, "Accept"
+            )
+            if response is not None:
+                return response
+
+    if digest:
+        response = await asyncio.to_thread(
+            blob_response, request, digest, None, media_type, PHOTO_CACHE, False, "Accept" if w else None
+        )
+        if response is None:
+            raise HTTPException(status_code=404, detail="Archivo no encontrado")
+        return response
+
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    
+
     return FileResponse(
         path=file_path,
-        media_type="image/*",
+        media_type=media_type,
         headers={"Cache-Control": "max-age=31536000"}  # Cache for 1 year
     )
 
 @router.delete("/photo/{filename}")
-async def delete_photo(filename: str, user=Depends(get_current_user)):
+def delete_photo(
+    filename: str,
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user)
+):
     """Delete an uploaded photo"""
+    digest = _photo_digest(filename)
+    if digest:
+        # Otra propiedad puede usar la misma foto: solo se borra (con sus variantes) si ya nadie la referencia
+        release_photo(session, digest)
+        return {"message": "Archivo eliminado correctamente"}
+
     file_path = UPLOAD_DIR / filename
-    
+
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    
+
     try:
+        # Copia en el almacén y variantes creadas al pedir ?w= de la foto antigua
+        legacy_digest = _file_digest(file_path)
         file_path.unlink()
+        if variants_for(session, legacy_digest):
+            release_photo(session, legacy_digest)
         return {"message": "Archivo eliminado correctamente"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail="Error al eliminar el archivo")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error al eliminar el archivo")
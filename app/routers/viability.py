@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional, Dict, Any
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from fastapi.responses import JSONResponse
+from typing import List, Literal, Optional, Dict, Any
+from sqlmodel import Session, select, delete
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+import numpy as np
 import json
 
 from ..models import ViabilityStudy, ViabilityProjection, User
@@ -10,9 +12,13 @@ from ..deps import get_session, get_current_user
 from ..services.viability_calculator import (
     calculate_viability_metrics,
     generate_temporal_projection,
-    perform_sensitivity_analysis,
     compare_studies
 )
+from ..services.viability_sensitivity import METRICS, PARAMETERS, heatmap, perform_sensitivity_analysis
+from ..services.viability_screening import (
+    MAX_SCREEN_CANDIDATES, ScreeningError, read_candidate_table, screen_candidates
+)
+from ..services.bulk_write import bulk_insert
 
 router = APIRouter(prefix="/viability", tags=["Estudios de Viabilidad"])
 
@@ -50,6 +56,26 @@ class ViabilityStudyCreate(BaseModel):
     vacancy_risk_percentage: float = 0.05
     stress_test_rent_decrease: float = 0.10
 
+class SensitivityHeatmapRequest(BaseModel):
+    x_parameter: str = "monthly_rent"
+    y_parameter: str = "interest_rate"
+    # Variaciones [mínima, máxima] sobre la base (relativas o en puntos según el parámetro)
+    x_range: List[float] = Field(default=[-0.2, 0.2], min_length=2, max_length=2)
+    y_range: List[float] = Field(default=[-0.02, 0.02], min_length=2, max_length=2)
+    steps: int = Field(default=20, ge=2, le=50)
+    metrics: Optional[List[str]] = None
+
+class ScreenRequest(BaseModel):
+    # Lote en columnas: {"purchase_price": [...], "monthly_rent": [...], "id": [...], ...}
+    candidates: Dict[str, List[Any]]
+    # Valores para las columnas que no vienen en el lote (p.ej. interest_rate común)
+    defaults: Dict[str, Any] = {}
+    sort_by: str = "net_annual_return"
+    descending: bool = True
+    favorable_only: bool = False
+    max_risk_level: Optional[Literal["LOW", "MEDIUM", "HIGH"]] = None
+    limit: int = Field(default=100, ge=1, le=MAX_SCREEN_CANDIDATES)
+
 @router.post("/", response_model=ViabilityStudy)
 async def create_viability_study(
     study_data: ViabilityStudyCreate,
@@ -77,20 +103,64 @@ async def create_viability_study(
         db.commit()
         db.refresh(study)
         
-        # Generar y guardar proyección temporal (10 años por defecto)
-        projection_data = generate_temporal_projection(study, years=10)
-        for proj_dict in projection_data:
-            projection = ViabilityProjection(**proj_dict)
-            db.add(projection)
-        
-        db.commit()
-        
+        # La proyección temporal se calcula al leerla (GET /{study_id}/projection)
         return study
         
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=f"Error creando estudio: {str(e)}")
 
+@router.post("/screen")
+def screen_viability_candidates(
+    request: ScreenRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Cribar cientos o miles de inmuebles candidatos sin guardar estudios: calcula todas las
+    métricas de viabilidad y el nivel de riesgo por columnas y devuelve la tabla ordenada
+    """
+    try:
+        # Respuesta ya serializable: se evita jsonable_encoder sobre miles de filas
+        return JSONResponse(screen_candidates(
+            request.candidates,
+            request.defaults,
+            request.sort_by,
+            request.descending,
+            request.favorable_only,
+            request.max_risk_level,
+            request.limit
+        ))
+    except ScreeningError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/screen/upload")
+def screen_viability_upload(
+    file: UploadFile = File(...),
+    defaults: Optional[str] = Form(default=None, description="JSON con valores por defecto"),
+    sort_by: str = Query(default="net_annual_return"),
+    descending: bool = Query(default=True),
+    favorable_only: bool = Query(default=False),
+    max_risk_level: Optional[Literal["LOW", "MEDIUM", "HIGH"]] = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=MAX_SCREEN_CANDIDATES),
+    current_user: User = Depends(get_current_user)
+):
+    """Cribado de un fichero Parquet, Arrow/Feather o CSV con un candidato por fila"""
+    try:
+        columns = read_candidate_table(file.file.read(), file.filename or "")
+        return JSONResponse(screen_candidates(
+            columns,
+            json.loads(defaults) if defaults else None,
+            sort_by,
+            descending,
+            favorable_only,
+            max_risk_level,
+            limit
+        ))
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="defaults debe ser JSON")
+    except ScreeningError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/", response_model=List[ViabilityStudy])
 async def get_user_viability_studies(
     db: Session = Depends(get_session),
@@ -123,6 +193,7 @@ async def get_viability_study(
 async def get_viability_projection(
     study_id: int,
     years: int = Query(default=10, ge=1, le=30),
+    materialize: bool = Query(default=False, description="Guardar también la proyección en ViabilityProjection (informes)"),
     db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
@@ -137,32 +208,14 @@ async def get_viability_projection(
     if not study:
         raise HTTPException(status_code=404, detail="Estudio no encontrado")
     
-    # Obtener proyecciones existentes
-    projection_statement = select(ViabilityProjection).where(
-        ViabilityProjection.viability_study_id == study_id,
-        ViabilityProjection.year <= years
-    ).order_by(ViabilityProjection.year, ViabilityProjection.month)
-    
-    projections = db.exec(projection_statement).all()
+    # Proyección calculada al vuelo (cacheada por contenido del estudio), sin escrituras
+    projections = generate_temporal_projection(study, years=years)
     
-    # Si no hay proyecciones o se solicitan más años, generar nuevas
-    max_year_in_db = max([p.year for p in projections]) if projections else 0
-    
-    if max_year_in_db < years:
-        # Eliminar proyecciones existentes para recalcular
-        for projection in projections:
-            db.delete(projection)
-        
-        # Generar nuevas proyecciones
-        new_projections = generate_temporal_projection(study, years=years)
-        for projection in new_projections:
-            projection.viability_study_id = study_id
-            db.add(projection)
-        
+    if materialize:
+        # Modo informes: sustituye las filas guardadas por la proyección actual
+        db.exec(delete(ViabilityProjection).where(ViabilityProjection.viability_study_id == study_id))
+        bulk_insert(db, ViabilityProjection, projections)
         db.commit()
-        
-        # Obtener proyecciones recién creadas
-        projections = db.exec(projection_statement).all()
     
     return projections
 
@@ -194,25 +247,11 @@ async def update_viability_study(
         study = calculate_viability_metrics(study)
         study.updated_at = datetime.utcnow()
         
+        # Las proyecciones materializadas quedan obsoletas; la caché se invalida con updated_at
+        db.exec(delete(ViabilityProjection).where(ViabilityProjection.viability_study_id == study_id))
         db.commit()
         db.refresh(study)
         
-        # Eliminar y regenerar proyecciones
-        projection_statement = select(ViabilityProjection).where(
-            ViabilityProjection.viability_study_id == study_id
-        )
-        projections = db.exec(projection_statement).all()
-        for projection in projections:
-            db.delete(projection)
-        
-        # Generar nuevas proyecciones
-        new_projections = generate_temporal_projection(study, years=10)
-        for projection in new_projections:
-            projection.viability_study_id = study_id
-            db.add(projection)
-        
-        db.commit()
-        
         return study
         
     except Exception as e:
@@ -235,13 +274,8 @@ async def delete_viability_study(
     if not study:
         raise HTTPException(status_code=404, detail="Estudio no encontrado")
     
-    # Eliminar proyecciones relacionadas
-    projection_statement = select(ViabilityProjection).where(
-        ViabilityProjection.viability_study_id == study_id
-    )
-    projections = db.exec(projection_statement).all()
-    for projection in projections:
-        db.delete(projection)
+    # Eliminar proyecciones materializadas
+    db.exec(delete(ViabilityProjection).where(ViabilityProjection.viability_study_id == study_id))
     
     # Eliminar estudio
     db.delete(study)
@@ -301,6 +335,42 @@ async def sensitivity_analysis(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error en análisis de sensibilidad: {str(e)}")
 
+@router.post("/{study_id}/sensitivity-heatmap")
+async def sensitivity_heatmap(
+    study_id: int,
+    request: SensitivityHeatmapRequest,
+    db: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Mapa de calor de dos parámetros (p.ej. renta x tipo de interés) con el modelo completo"""
+    statement = select(ViabilityStudy).where(
+        ViabilityStudy.id == study_id,
+        ViabilityStudy.user_id == current_user.id
+    )
+    study = db.exec(statement).first()
+    
+    if not study:
+        raise HTTPException(status_code=404, detail="Estudio no encontrado")
+    
+    for name in (request.x_parameter, request.y_parameter):
+        if name not in PARAMETERS:
+            raise HTTPException(status_code=400, detail=f"Parámetro desconocido: {name}. Disponibles: {list(PARAMETERS)}")
+    metrics = request.metrics or list(METRICS)
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Métricas desconocidas: {unknown}")
+    if request.x_parameter == request.y_parameter:
+        raise HTTPException(status_code=400, detail="Los parámetros del mapa de calor deben ser distintos")
+    
+    return heatmap(
+        study,
+        request.x_parameter,
+        request.y_parameter,
+        np.linspace(*request.x_range, request.steps),
+        np.linspace(*request.y_range, request.steps),
+        tuple(metrics)
+    )
+
 @router.get("/{study_id}/summary")
 async def get_study_summary(
     study_id: int,
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import List
 from sqlmodel import Session, select
@@ -7,8 +8,10 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 from .db import engine
-from .models import BankConnection, BankAccount, FinancialMovement, User
+from .models import BankConnection
 from .openbanking.clients.nordigen_client import nordigen_client
+from .config import settings
+from .openbanking.sync_engine import SyncEngine, ConnectionSyncResult, SYNC_MODE_INCREMENTAL, SYNC_MODE_FULL
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +21,14 @@ class OpenBankingScheduler:
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
         self.is_running = False
+        self.sync_engine = SyncEngine(client=nordigen_client)
+        # La reconciliación completa pide mucho histórico: una petición por banco, espaciadas
+        self.reconciliation_engine = SyncEngine(
+            client=nordigen_client,
+            max_concurrency=2,
+            per_institution_concurrency=1,
+            min_interval=settings.openbanking_reconciliation_min_interval
+        )
     
     def start(self):
         """Inicia el scheduler"""
@@ -31,6 +42,15 @@ class OpenBankingScheduler:
                 replace_existing=True
             )
             
+            # Reconciliación completa semanal (recupera apuntes corregidos o perdidos)
+            self.scheduler.add_job(
+                func=self.reconcile_all_connections,
+                trigger=IntervalTrigger(days=7),
+                id='reconcile_all_connections',
+                name='Full Reconciliation Of Bank Connections',
+                replace_existing=True
+            )
+            
             # Agregar job de limpieza de conexiones expiradas cada día
             self.scheduler.add_job(
                 func=self.cleanup_expired_connections,
@@ -51,137 +71,67 @@ class OpenBankingScheduler:
             self.is_running = False
             logger.info("OpenBanking Scheduler stopped")
     
-    async def sync_all_connections(self):
-        """Sincroniza todas las conexiones bancarias activas"""
+    async def sync_all_connections(self) -> List[ConnectionSyncResult]:
+        """Sincroniza todas las conexiones bancarias activas (incremental, desde la marca de agua de cada cuenta)"""
         logger.info("Starting scheduled sync of all bank connections")
         
         try:
-            with Session(engine) as session:
-                # Obtener conexiones que necesitan sincronización
-                now = datetime.now()
-                connections = session.exec(
-                    select(BankConnection).where(
-                        BankConnection.is_active == True,
-                        BankConnection.auto_sync_enabled == True,
-                        BankConnection.consent_status.in_(["LN", "GA"])  # Linked or Granting Access
-                    )
-                ).all()
-                
-                synced_count = 0
-                error_count = 0
-                
-                for connection in connections:
-                    try:
-                        # Verificar si es tiempo de sincronizar
-                        if connection.last_sync:
-                            time_since_sync = now - connection.last_sync
-                            hours_since_sync = time_since_sync.total_seconds() / 3600
-                            
-                            if hours_since_sync < connection.sync_frequency_hours:
-                                continue  # No es tiempo de sincronizar todavía
-                        
-                        # Sincronizar conexión
-                        await self.sync_connection(connection, session)
-                        synced_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"Error syncing connection {connection.id}: {e}")
-                        
-                        # Marcar error en la conexión
-                        connection.sync_status = "ERROR"
-                        connection.sync_error = str(e)
-                        session.add(connection)
-                        error_count += 1
-                
-                session.commit()
-                logger.info(f"Scheduled sync completed: {synced_count} synced, {error_count} errors")
-                
+            connection_ids = await asyncio.to_thread(self.due_connection_ids)
+            return await self._run_sync(self.sync_engine, connection_ids, SYNC_MODE_INCREMENTAL)
         except Exception as e:
             logger.error(f"Error in scheduled sync: {e}")
+            return []
     
-    async def sync_connection(self, connection: BankConnection, session: Session):
-        """Sincroniza una conexión bancaria específica"""
-        logger.info(f"Syncing connection {connection.id} for user {connection.user_id}")
-        
-        # Marcar como sincronizando
-        connection.sync_status = "SYNCING"
-        connection.sync_error = None
-        session.add(connection)
-        session.commit()
+    async def reconcile_all_connections(self) -> List[ConnectionSyncResult]:
+        """Reconciliación completa de todas las conexiones activas, con límites de ritmo más estrictos"""
+        logger.info("Starting full reconciliation of all bank connections")
         
-        # Obtener cuentas de la conexión
-        accounts = session.exec(
-            select(BankAccount).where(BankAccount.connection_id == connection.id)
-        ).all()
-        
-        total_transactions = 0
-        new_transactions = 0
+        try:
+            connection_ids = await asyncio.to_thread(self.due_connection_ids, True)
+            return await self._run_sync(self.reconciliation_engine, connection_ids, SYNC_MODE_FULL)
+        except Exception as e:
+            logger.error(f"Error in full reconciliation: {e}")
+            return []
+    
+    async def _run_sync(self, sync_engine: SyncEngine, connection_ids: List[int], mode: str) -> List[ConnectionSyncResult]:
+        started = time.perf_counter()
+        results = await sync_engine.sync_connections(connection_ids, mode)
         
-        # Sincronizar últimos 7 días por defecto
-        date_from = datetime.now().date() - timedelta(days=7)
-        date_to = datetime.now().date()
+        for result in results:
+            logger.info(
+                f"Connection {result.connection_id} ({result.institution_id}): {result.status}, "
+                f"{result.new_transactions}/{result.transactions} new transactions in "
+                f"{result.accounts} accounts, {result.duration_seconds:.2f}s "
+                f"(fetch {result.fetch_seconds:.2f}s, store {result.store_seconds:.2f}s)"
+            )
         
-        for account in accounts:
-            try:
-                # Obtener transacciones de Nordigen
-                transactions_data = await nordigen_client.get_account_transactions(
-                    account.account_id, date_from, date_to
+        error_count = sum(1 for r in results if r.status == "ERROR")
+        logger.info(
+            f"Sync ({mode}) completed: {len(results) - error_count} synced, {error_count} errors "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        return results
+    
+    def due_connection_ids(self, include_recent: bool = False) -> List[int]:
+        """Conexiones activas cuya última sincronización es más antigua que su frecuencia (o todas con include_recent)"""
+        with Session(engine) as session:
+            now = datetime.now()
+            connections = session.exec(
+                select(BankConnection.id, BankConnection.last_sync, BankConnection.sync_frequency_hours).where(
+                    BankConnection.is_active == True,
+                    BankConnection.auto_sync_enabled == True,
+                    BankConnection.consent_status.in_(["LN", "GA"])  # Linked or Granting Access
                 )
-                
-                # Procesar transacciones bookadas
-                booked_transactions = transactions_data.get("transactions", {}).get("booked", [])
-                
-                for transaction in booked_transactions:
-                    total_transactions += 1
-                    
-                    # Convertir a formato FinancialMovement
-                    movement_data = nordigen_client.format_transaction_to_financial_movement(
-                        transaction, account.account_id
-                    )
-                    
-                    # Verificar si ya existe (idempotencia)
-                    existing = session.exec(
-                        select(FinancialMovement).where(
-                            FinancialMovement.external_id == movement_data.get("external_id"),
-                            FinancialMovement.user_id == connection.user_id
-                        )
-                    ).first()
-                    
-                    if existing:
-                        continue
-                    
-                    # Crear nuevo movimiento financiero
-                    financial_movement = FinancialMovement(
-                        user_id=connection.user_id,
-                        date=datetime.strptime(movement_data["date"], "%Y-%m-%d").date(),
-                        concept=movement_data["concept"],
-                        amount=movement_data["amount"],
-                        category=movement_data["category"],
-                        subcategory=movement_data["subcategory"],
-                        is_classified=movement_data["is_classified"],
-                        bank_balance=movement_data["bank_balance"],
-                        external_id=movement_data["external_id"],
-                        bank_account_id=movement_data["account_id"],
-                        source="nordigen"
-                    )
-                    
-                    session.add(financial_movement)
-                    new_transactions += 1
-                
-                # Actualizar fecha de última sincronización de la cuenta
-                account.last_transaction_sync = datetime.now()
-                session.add(account)
-                
-            except Exception as e:
-                logger.error(f"Error syncing account {account.account_id}: {e}")
-                continue
-        
-        # Actualizar estado de la conexión
-        connection.sync_status = "SUCCESS"
-        connection.last_sync = datetime.now()
-        session.add(connection)
-        
-        logger.info(f"Connection {connection.id} synced: {new_transactions}/{total_transactions} new transactions")
+            ).all()
+            return [
+                c.id for c in connections
+                if include_recent or not c.last_sync or now - c.last_sync >= timedelta(hours=c.sync_frequency_hours)
+            ]
+    
+    async def sync_connection(self, connection_id: int, mode: str = SYNC_MODE_INCREMENTAL) -> ConnectionSyncResult:
+        """Sincroniza una conexión bancaria específica"""
+        engine = self.reconciliation_engine if mode == SYNC_MODE_FULL else self.sync_engine
+        return await engine.sync_connection(connection_id, mode)
     
     async def cleanup_expired_connections(self):
         """Limpia conexiones expiradas"""
@@ -7,8 +7,9 @@ from abc import ABC, abstractmethod
 import logging
 from sqlmodel import Session, select
 
-from ..models import User, FinancialMovement, BankConnection
+from ..models import User, BankConnection
 from ..db import get_session
+from .synced_transactions import WATERMARK_OVERLAP_DAYS, store_synced_transactions
 
 logger = logging.getLogger(__name__)
 
@@ -137,8 +138,13 @@ class UnifiedBankingService:
         """Lista todos los proveedores disponibles"""
         return list(self.providers.keys())
     
-    async def sync_all_providers(self, user_id: int, days_back: int = 30) -> Dict[str, Any]:
-        """Sincroniza transacciones de todos los proveedores del usuario"""
+    async def sync_all_providers(self, user_id: int, days_back: int = 30,
+                                 full_reconciliation: bool = False) -> Dict[str, Any]:
+        """
+        Sincroniza transacciones de todos los proveedores del usuario.
+        Salvo en reconciliación completa, cada conexión solo pide los días desde su última
+        sincronización (más WATERMARK_OVERLAP_DAYS de solape), con days_back como máximo.
+        """
         results = {}
         
         with Session(get_session().__next__()) as session:
@@ -162,42 +168,19 @@ class UnifiedBankingService:
                 
                 try:
                     # Obtener transacciones del proveedor
-                    transactions = await provider.get_transactions(user_id, days_back=days_back)
+                    window = days_back
+                    if connection.last_sync and not full_reconciliation:
+                        days_since_sync = (date.today() - connection.last_sync.date()).days
+                        window = min(days_back, days_since_sync + WATERMARK_OVERLAP_DAYS)
+                    transactions = await provider.get_transactions(user_id, days_back=window)
                     total_transactions += len(transactions)
                     
-                    new_count = 0
-                    for transaction in transactions:
-                        # Formatear transacción
-                        formatted = provider.format_transaction(transaction)
-                        
-                        # Verificar si ya existe
-                        existing = session.exec(
-                            select(FinancialMovement).where(
-                                FinancialMovement.external_id == formatted.get("external_id"),
-                                FinancialMovement.user_id == user_id
-                            )
-                        ).first()
-                        
-                        if existing:
-                            continue
-                        
-                        # Crear nuevo movimiento
-                        movement = FinancialMovement(
-                            user_id=user_id,
-                            date=datetime.strptime(formatted["date"], "%Y-%m-%d").date(),
-                            concept=formatted["concept"],
-                            amount=formatted["amount"],
-                            category=formatted["category"],
-                            subcategory=formatted["subcategory"],
-                            is_classified=formatted["is_classified"],
-                            bank_balance=formatted["bank_balance"],
-                            external_id=formatted["external_id"],
-                            bank_account_id=formatted["bank_account_id"],
-                            source=formatted["source"]
-                        )
-                        
-                        session.add(movement)
-                        new_count += 1
+                    _, new_count = store_synced_transactions(
+                        session,
+                        user_id,
+                        (provider.format_transaction(t) for t in transactions),
+                        source=provider.provider_name
+                    )
                     
                     # Actualizar estado de conexión
                     connection.last_sync = datetime.now()
@@ -10,31 +10,20 @@ import httpx
 import json
 import base64
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Any
 from dataclasses import dataclass
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 import pandas as pd
 import logging
 
-logger = logging.getLogger(__name__)
+from .bankinter_html import DEFAULT_ACCOUNT, BankTransaction, extract_transactions
+from .browser_pool import browser_pool, resume_session
+from .browser_waits import StepTimer, accept_cookie_banner, off_event_loop, wait_gone, wait_page_ready, wait_url_change
 
-@dataclass
-class BankTransaction:
-    """Estructura de transacci[INFO]n bancaria"""
-    id: str
-    date: date
-    description: str
-    amount: float
-    account_number: str
-    category: Optional[str] = None
-    balance_after: Optional[float] = None
-    reference: Optional[str] = None
+logger = logging.getLogger(__name__)
 
 @dataclass
 class BankAccount:
@@ -45,84 +34,8 @@ class BankAccount:
     currency: str = "EUR"
     account_type: str = "current"
 
-class BankinterClient:
-    """Cliente para conectarse con Bankinter"""
-    
-    def __init__(self, username: str = None, password: str = None, api_key: str = None):
-        self.username = username
-        self.password = password
-        self.api_key = api_key
-        self.base_url = "https://api.bankinter.com"  # URL hipot[INFO]tica de API
-        self.web_url = "https://bancaonline.bankinter.com/gestion/login.xhtml"
-        self.session = None
-        self.driver = None
-        
-    async def authenticate_api(self) -> bool:
-        """Autenticaci[INFO]n v[INFO]a API PSD2 (Open Banking) - DESHABILITADO"""
-        logger.info("SIMULATION MODE: API PSD2 deshabilitado - usando simulaci[INFO]n")
-        return False
-    
-    def setup_webdriver(self) -> webdriver.Chrome:
-        """Configurar WebDriver para web scraping"""
-        options = Options()
-        # Configuraci[INFO]n para evitar detecci[INFO]n
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--no-sandbox")
-        
-        # BLOQUEAR COOKIES Y OVERLAYS desde el inicio
-        options.add_argument("--disable-web-security")
-        options.add_argument("--disable-features=VizDisplayCompositor")
-        options.add_argument("--disable-extensions")
-        options.add_argument("--disable-plugins")
-        options.add_argument("--disable-javascript-harmony-shipping")
-        
-        # Bloquear dominios de OneTrast y cookies + Google pop-ups
-        options.add_experimental_option("prefs", {
-            "profile.managed_default_content_settings.notifications": 2,
-            "profile.default_content_setting_values.notifications": 2,
-            "profile.managed_default_content_settings.cookies": 1,
-            "profile.block_third_party_cookies": True,
-            # DESACTIVAR GOOGLE PASSWORD MANAGER
-            "credentials_enable_service": False,
-            "profile.password_manager_enabled": False,
-            "profile.default_content_setting_values.password_manager": 2,
-            # BLOQUEAR OTROS POP-UPS
-            "profile.default_content_setting_values.media_stream": 2,
-            "profile.default_content_setting_values.geolocation": 2
-        })
-        
-        # Configurar user agent
-        options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        
-        # MODO HEADLESS para evitar pop-ups visuales
-        options.add_argument("--headless")  # Activado para evitar pop-ups
-        options.add_argument("--disable-gpu")
-        options.add_argument("--no-first-run")
-        options.add_argument("--disable-default-apps")
-        options.add_argument("--disable-popup-blocking")
-        options.add_argument("--disable-translate")
-        options.add_argument("--disable-background-timer-throttling")
-        options.add_argument("--disable-renderer-backgrounding")
-        options.add_argument("--disable-backgrounding-occluded-windows")
-        
-        # DESACTIVAR ESPEC[INFO]FICAMENTE PASSWORD MANAGER Y POP-UPS
-        options.add_argument("--disable-password-generation")
-        options.add_argument("--disable-save-password-bubble")
-        options.add_argument("--disable-password-manager-reauthentication")
-        options.add_argument("--disable-features=PasswordManager,AutofillPasswordGeneration")
-        
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=options)
-        
-        # Ejecutar script para ocultar webdriver
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
-        # INYECTAR SCRIPT para eliminar OneTrast inmediatamente
-        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
-            'source': '''
+# Elimina los overlays de OneTrast en cada documento nuevo
+ONETRUST_BLOCKER_JS = '''
                 // Eliminar OneTrast tan pronto como se cargue
                 (function() {
                     const observer = new MutationObserver(function(mutations) {
@@ -147,32 +60,72 @@ class BankinterClient:
                     observer.observe(document.body || document.documentElement, { childList: true, subtree: true });
                 })();
             '''
-        })
+
+class BankinterClient:
+    """Cliente para conectarse con Bankinter"""
+    
+    def __init__(self, username: str = None, password: str = None, api_key: str = None):
+        self.username = username
+        self.password = password
+        self.api_key = api_key
+        self.base_url = "https://api.bankinter.com"  # URL hipot[INFO]tica de API
+        self.web_url = "https://bancaonline.bankinter.com/gestion/login.xhtml"
+        self.post_login_url = "https://bancaonline.bankinter.com/extracto/secure/extracto_integral.xhtml"
+        self.session = None
+        self.browser = None
+        self.driver = None
+        self.timer = StepTimer("Bankinter client")
         
-        return driver
+    async def authenticate_api(self) -> bool:
+        """Autenticaci[INFO]n v[INFO]a API PSD2 (Open Banking) - DESHABILITADO"""
+        logger.info("SIMULATION MODE: API PSD2 deshabilitado - usando simulaci[INFO]n")
+        return False
     
+    def setup_webdriver(self) -> webdriver.Chrome:
+        """WebDriver del pool de navegadores (perfil propio del usuario, Chrome ya arrancado si hay uno libre)"""
+        with self.timer.step("browser"):
+            self.browser = browser_pool.acquire(self.username)
+        
+        # INYECTAR SCRIPT para eliminar OneTrast inmediatamente (una vez por navegador: persiste entre sincronizaciones)
+        self.browser.run_once("onetrust_blocker", lambda driver: driver.execute_cdp_cmd(
+            'Page.addScriptToEvaluateOnNewDocument', {'source': ONETRUST_BLOCKER_JS}
+        ))
+        
+        return self.browser.driver
+    
+    @off_event_loop
     async def authenticate_web(self) -> bool:
         """Autenticaci[INFO]n v[INFO]a web scraping con manejo robusto de popups"""
         try:
             logger.info("REAL MODE: Iniciando web scraping real con tus credenciales")
             
             # Configurar driver con m[INFO]xima protecci[INFO]n contra popups
-            self.driver = self.setup_webdriver()
+            # Esperar un navegador libre o arrancar Chrome bloquea: fuera del event loop
+            self.driver = await asyncio.to_thread(self.setup_webdriver)
+            
+            # Sesión del navegador del pool aún válida: no hace falta login
+            with self.timer.step("resume_session"):
+                if resume_session(self.browser, self.post_login_url, lambda d: "login" not in d.current_url.lower()):
+                    return True
             
             # Navegar a Bankinter
             logger.info(f"Navegando a: {self.web_url}")
-            self.driver.get(self.web_url)
-            
-            # Esperar carga inicial
-            await asyncio.sleep(3)
+            with self.timer.step("login_page"):
+                self.driver.get(self.web_url)
+                
+                # Esperar carga inicial
+                wait_page_ready(self.driver)
             
             # FASE 1: Eliminar popups iniciales antes de login
-            await self._eliminate_initial_popups()
+            with self.timer.step("cookies"):
+                await self._eliminate_initial_popups()
             
             # FASE 2: Completar login
-            login_success = await self._complete_login()
+            with self.timer.step("login"):
+                login_success = await self._complete_login()
             
             if login_success:
+                self.browser.mark_logged_in()
                 # FASE 3: Manejar popups POST-LOGIN (aqu[INFO] aparecen los que describes)
                 await self._handle_post_login_popups()
                 logger.info("SUCCESS Login web completo con manejo de popups")
@@ -221,20 +174,9 @@ class BankinterClient:
                 "#onetrust-accept-btn-handler"
             ]
             
-            for selector in cookie_selectors:
-                try:
-                    if selector.startswith("//"):
-                        element = self.driver.find_element(By.XPATH, selector)
-                    else:
-                        element = self.driver.find_element(By.CSS_SELECTOR, selector)
-                    
-                    if element.is_displayed():
-                        element.click()
-                        logger.info(f"SUCCESS Cookies aceptadas con: {selector}")
-                        await asyncio.sleep(2)
-                        break
-                except:
-                    continue
+            # El script anterior suele quitar el banner: no esperar más de un segundo a que aparezca
+            if accept_cookie_banner(self.driver, cookie_selectors, timeout=1):
+                logger.info("SUCCESS Cookies aceptadas")
                     
         except Exception as e:
             logger.warning(f"WARNING Error eliminando popups iniciales: {e}")
@@ -281,11 +223,9 @@ class BankinterClient:
             # Introducir credenciales
             username_field.clear()
             username_field.send_keys(self.username)
-            await asyncio.sleep(1)
             
             password_field.clear()
             password_field.send_keys(self.password)
-            await asyncio.sleep(1)
             
             # Buscar y hacer clic en bot[INFO]n login
             login_button = None
@@ -311,6 +251,7 @@ class BankinterClient:
                 return False
             
             # Hacer clic con fallback a JavaScript
+            form_url = self.driver.current_url
             try:
                 login_button.click()
                 logger.info("SUCCESS Click normal en login")
@@ -319,7 +260,8 @@ class BankinterClient:
                 logger.info("SUCCESS Click JavaScript en login")
             
             # Esperar respuesta del login
-            await asyncio.sleep(5)
+            wait_url_change(self.driver, form_url, 20)
+            wait_page_ready(self.driver)
             return True
             
         except Exception as e:
@@ -331,13 +273,14 @@ class BankinterClient:
         logger.info("HANDLING POST-LOGIN POPUPS: Manejando popups despu[INFO]s del login")
         
         try:
-            # ENFOQUE ULTRA SIMPLE - Solo esperar
-            await asyncio.sleep(2)
+            # ENFOQUE ULTRA SIMPLE - Solo esperar a que la página se estabilice
+            wait_page_ready(self.driver)
             logger.info("SUCCESS Post-login simplificado completado")
             
         except Exception as e:
             logger.warning(f"WARNING Error en post-login simplificado: {e}")
     
+    @off_event_loop
     async def get_accounts_web(self) -> List[BankAccount]:
         """Obtener cuentas reales via web scraping"""
         if not self.driver:
@@ -351,7 +294,7 @@ class BankinterClient:
             self.driver.save_screenshot("accessing_current_account.png")
             
             # Esperar a que la pagina de dashboard cargue
-            await asyncio.sleep(3)
+            wait_page_ready(self.driver)
             
             # ESTRATEGIA DIRECTA: Usar los datos reales conocidos de la captura
             logger.info("SUCCESS Creando cuenta real basada en datos conocidos de Bankinter")
@@ -378,6 +321,7 @@ class BankinterClient:
                 currency="EUR"
             )]
 
+    @off_event_loop
     async def get_transactions_web(self, account_number: str, start_date: date, end_date: date) -> List[BankTransaction]:
         """Obtener transacciones reales via web scraping"""
         logger.info(f"LOADING Obteniendo transacciones reales para {account_number}")
@@ -647,6 +591,7 @@ class BankinterClient:
                 currency="EUR"
             )]
 
+    @off_event_loop
     async def get_transactions_web(self, account_number: str, start_date: date, end_date: date) -> List[BankTransaction]:
         """Obtener transacciones reales vía web scraping"""
         logger.info(f"LOADING Obteniendo transacciones reales para {account_number}")
@@ -770,14 +715,14 @@ class BankinterClient:
                     if menu_dots.is_displayed():
                         self.driver.execute_script("arguments[0].click();", menu_dots)
                         logger.info("SUCCESS Click en menú de puntos de la cuenta")
-                        await asyncio.sleep(2)
+                        wait_page_ready(self.driver)
                         
                         # Buscar opción de movimientos en el menú desplegable
                         movimientos_option = self.driver.find_element(By.XPATH, "//a[contains(text(), 'Movimiento') or contains(text(), 'Extracto') or contains(text(), 'Consultar')]")
                         if movimientos_option.is_displayed():
                             self.driver.execute_script("arguments[0].click();", movimientos_option)
                             logger.info("SUCCESS Click en opción movimientos del menú")
-                            await asyncio.sleep(3)
+                            wait_page_ready(self.driver)
                             movement_found = True
                 except Exception as e:
                     logger.debug(f"DEBUG No se pudo usar menú de puntos: {e}")
@@ -789,7 +734,7 @@ class BankinterClient:
                         if cuentas_tab.is_displayed():
                             self.driver.execute_script("arguments[0].click();", cuentas_tab)
                             logger.info("SUCCESS Click en pestaña Cuentas y tarjetas")
-                            await asyncio.sleep(3)
+                            wait_page_ready(self.driver)
                             movement_found = True
                     except Exception as e:
                         logger.debug(f"DEBUG No se pudo hacer clic en pestaña Cuentas y tarjetas: {e}")
@@ -801,7 +746,7 @@ class BankinterClient:
                         if account_container.is_displayed():
                             self.driver.execute_script("arguments[0].click();", account_container)
                             logger.info("SUCCESS Click en contenedor de la cuenta")
-                            await asyncio.sleep(3)
+                            wait_page_ready(self.driver)
                             movement_found = True
                     except Exception as e:
                         logger.debug(f"DEBUG No se pudo hacer clic en contenedor de cuenta: {e}")
@@ -813,7 +758,7 @@ class BankinterClient:
                         if download_button.is_displayed():
                             self.driver.execute_script("arguments[0].click();", download_button)
                             logger.info("SUCCESS Click en botón de descarga")
-                            await asyncio.sleep(3)
+                            wait_page_ready(self.driver)
                             movement_found = True
                     except Exception as e:
                         logger.debug(f"DEBUG No se pudo hacer clic en botón de descarga: {e}")
@@ -834,7 +779,7 @@ class BankinterClient:
                             self.driver.execute_script("arguments[0].click();", link)
                             logger.info(f"SUCCESS Navegando a movimientos con: {selector}")
                             movement_found = True
-                            await asyncio.sleep(3)
+                            wait_page_ready(self.driver)
                             break
                     except Exception as e:
                         logger.debug(f"DEBUG No se pudo navegar con {selector}: {e}")
@@ -1253,7 +1198,6 @@ class BankinterClient:
     
     async def _extract_monthly_movements(self) -> List[BankTransaction]:
         """Extraer movimientos mensuales específicos después de hacer clic en el saldo"""
-        from datetime import date as date_cls
         movements = []
         
         try:
@@ -1262,161 +1206,10 @@ class BankinterClient:
             # Tomar screenshot para ver la página actual
             self.driver.save_screenshot("current_page_for_movements.png")
             
-            # ENFOQUE CONSERVADOR: Buscar movimientos en la página actual sin navegación
-            logger.info("DEBUG Buscando movimientos visibles en la página actual...")
-            
-            # Buscar selectores específicos para movimientos mensuales de Bankinter
-            movement_selectors = [
-                # Tablas de movimientos típicas
-                "table.movimientos tr", "table[class*='movement'] tr", "table[class*='transaction'] tr",
-                ".tabla-movimientos tr", ".listado-movimientos tr",
-                
-                # Listas de movimientos
-                "ul.movimientos li", "ul[class*='movement'] li", "ul[class*='transaction'] li", 
-                ".lista-movimientos li", ".movement-list li",
-                
-                # Divs de movimientos
-                "div.movimiento", "div[class*='movement']", "div[class*='transaction']",
-                ".transaccion", ".operacion", ".movement-row",
-                
-                # Selectores más generales
-                "[data-testid*='movement']", "[data-testid*='transaction']",
-                ".grid-movimientos .row", ".movements-container .item"
-            ]
-            
-            for selector in movement_selectors:
-                try:
-                    elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    logger.info(f"DEBUG Encontrados {len(elements)} elementos con selector: {selector}")
-                    
-                    for element in elements:
-                        if not element.is_displayed():
-                            continue
-                            
-                        text = element.text.strip()
-                        if not text or len(text) < 10:  # Filtrar elementos vacíos o muy cortos
-                            continue
-                        
-                        # Buscar patrones de transacción en el texto
-                        # Formato típico: fecha + concepto + importe
-                        import re
-                        
-                        # Patrones para fechas (dd/mm/yyyy, dd-mm-yyyy, dd/mm/yy)
-                        date_patterns = [
-                            r'(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})',
-                            r'(\d{1,2}\s+[A-Za-z]{3,9}\s+\d{2,4})',  # 15 agosto 2025
-                            r'(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})'
-                        ]
-                        
-                        # Patrones para importes (123,45 €, -123,45 €, 1.234,56 €)
-                        amount_patterns = [
-                            r'(-?\d{1,3}(?:\.\d{3})*,\d{2}\s*€)',
-                            r'(-?\d+,\d{2}\s*€)',
-                            r'(-?\d+\.\d{2}\s*€)',
-                            r'€\s*(-?\d{1,3}(?:\.\d{3})*,\d{2})',
-                            r'€\s*(-?\d+,\d{2})',
-                        ]
-                        
-                        # Intentar extraer fecha y importe del texto
-                        found_date = None
-                        found_amount = None
-                        
-                        for date_pattern in date_patterns:
-                            date_match = re.search(date_pattern, text)
-                            if date_match:
-                                try:
-                                    date_str = date_match.group(1)
-                                    # Intentar parsear la fecha
-                                    for date_format in ['%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y']:
-                                        try:
-                                            found_date = datetime.strptime(date_str, date_format).date()
-                                            break
-                                        except:
-                                            continue
-                                    if found_date:
-                                        break
-                                except Exception as e:
-                                    logger.debug(f"DEBUG Error parseando fecha {date_match.group(1)}: {e}")
-                        
-                        for amount_pattern in amount_patterns:
-                            amount_match = re.search(amount_pattern, text)
-                            if amount_match:
-                                try:
-                                    amount_str = amount_match.group(1).replace('€', '').strip()
-                                    # Convertir formato español a float (1.234,56 -> 1234.56)
-                                    amount_clean = amount_str.replace('.', '').replace(',', '.')
-                                    found_amount = float(amount_clean)
-                                    break
-                                except Exception as e:
-                                    logger.debug(f"DEBUG Error parseando importe {amount_match.group(1)}: {e}")
-                        
-                        # Si encontramos fecha y/o importe, crear transacción
-                        if found_date or found_amount:
-                            # Generar descripción limpia (quitar fecha e importe del texto)
-                            description = text
-                            if found_date:
-                                description = re.sub(r'\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4}', '', description)
-                            if found_amount:
-                                for pattern in amount_patterns:
-                                    description = re.sub(pattern, '', description)
-                            
-                            description = ' '.join(description.split())  # Limpiar espacios múltiples
-                            if not description or len(description) < 3:
-                                description = f"Movimiento extraído: {text[:50]}..."
-                            
-                            transaction = BankTransaction(
-                                id=f"monthly_{hash(text)}_{len(movements)}",
-                                date=found_date or date_cls.today(),
-                                description=description,
-                                amount=found_amount or 0.0,
-                                account_number="ES02 0128 0730 9101 6000 0605",
-                                category="Movimiento Mensual",
-                                reference=f"MONTHLY_MOVEMENT_{len(movements)+1}"
-                            )
-                            movements.append(transaction)
-                            logger.info(f"SUCCESS Extraído movimiento: {found_date} - {description[:30]}... - {found_amount}€")
-                    
-                    # Si encontramos movimientos con este selector, no probar los demás
-                    if movements:
-                        logger.info(f"SUCCESS Encontrados {len(movements)} movimientos con selector: {selector}")
-                        break
-                        
-                except Exception as e:
-                    logger.debug(f"DEBUG Error con selector {selector}: {e}")
-                    continue
-            
-            # Si no se encontraron movimientos detallados, buscar cualquier texto con patrones financieros
-            if not movements:
-                logger.info("DEBUG No se encontraron movimientos estructurados, buscando patrones en texto...")
-                page_text = self.driver.find_element(By.TAG_NAME, "body").text
-                
-                # Buscar todas las líneas que contengan fechas + importes
-                lines = page_text.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if len(line) < 10:
-                        continue
-                        
-                    # Verificar si la línea contiene fecha e importe
-                    has_date = re.search(r'\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4}', line)
-                    has_amount = re.search(r'(-?\d{1,3}(?:\.\d{3})*,\d{2}\s*€)|(-?\d+,\d{2}\s*€)', line)
-                    
-                    if has_date and has_amount:
-                        # Crear transacción de esta línea
-                        transaction = BankTransaction(
-                            id=f"line_movement_{hash(line)}",
-                            date=date_cls.today(),  # Usar fecha actual por defecto
-                            description=f"Movimiento detectado: {line[:50]}...",
-                            amount=0.0,  # Por defecto, se podría intentar extraer
-                            account_number="ES02 0128 0730 9101 6000 0605",
-                            category="Texto Detectado",
-                            reference=f"TEXT_PATTERN_{len(movements)+1}"
-                        )
-                        movements.append(transaction)
-                        logger.info(f"SUCCESS Detectado movimiento en texto: {line[:50]}...")
-                        
-                        if len(movements) >= 20:  # Limitar para no crear demasiados
-                            break
+            # Una sola lectura del DOM; tabla de movimientos o líneas fecha + importe, analizadas en local
+            with self.timer.step("extract_monthly"):
+                page_html = self.driver.page_source
+                movements = extract_transactions(page_html, DEFAULT_ACCOUNT, text_limit=20)
             
         except Exception as e:
             logger.error(f"ERROR Extrayendo movimientos mensuales: {e}")
@@ -1425,217 +1218,25 @@ class BankinterClient:
         return movements
     
     async def _extract_from_visible_text(self) -> List[BankTransaction]:
-        """Extraer transacciones únicamente del texto visible en la página actual - ULTRA CONSERVADOR"""
+        """Extraer transacciones del HTML de la página actual, sin recorrer elementos con WebDriver"""
         from datetime import date as date_cls
         transactions = []
         
         try:
-            logger.info("DEBUG ULTRA-SAFE: Solo extrayendo texto visible de la página...")
-            
-            # ESTRATEGIA MEJORADA: Análisis exhaustivo del texto de la página
-            page_text = self.driver.find_element(By.TAG_NAME, "body").text
-            logger.info(f"DEBUG Texto de página obtenido: {len(page_text)} caracteres")
-            
-            # TAMBIÉN obtener el HTML para buscar elementos estructurados
-            try:
+            with self.timer.step("extract_page"):
                 page_html = self.driver.page_source
                 logger.info(f"DEBUG HTML de página obtenido: {len(page_html)} caracteres")
-            except:
-                page_html = ""
-            
-            # Buscar líneas que contengan patrones de transacción
-            lines = page_text.split('\n')
-            found_financial_lines = []
-            
-            import re
-            logger.info(f"DEBUG Analizando {len(lines)} líneas de texto...")
-            
-            for line in lines:
-                line = line.strip()
-                if len(line) < 5:  # Reducido el mínimo para captar más datos
-                    continue
-                
-                # PATRONES MEJORADOS para líneas financieras
-                has_date = re.search(r'\b\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}\b', line)
-                has_euro = '€' in line
-                has_amount = re.search(r'\b\d{1,3}(?:\.\d{3})*,\d{2}\b', line)
-                has_decimal = re.search(r'\b\d+,\d{2}\b', line)  # Números decimales
-                
-                # PALABRAS CLAVE AMPLIADAS
-                financial_keywords = [
-                    'transferencia', 'recibo', 'ingreso', 'cargo', 'abono', 'pago', 'cobro',
-                    'saldo', 'balance', 'disponible', 'movimiento', 'operacion', 'transaccion',
-                    'domiciliacion', 'nomina', 'pension', 'devolucion', 'comision', 'interes',
-                    'bizum', 'tarjeta', 'cajero', 'compra', 'venta'
-                ]
-                
-                # CONDICIONES MEJORADAS para detectar líneas financieras
-                is_financial = False
-                
-                # Condición 1: Fecha + Euro/Importe
-                if has_date and (has_euro or has_amount or has_decimal):
-                    is_financial = True
-                    logger.info(f"DEBUG [FECHA+IMPORTE] {line[:60]}...")
-                
-                # Condición 2: Keywords financieros + Euro/Importe
-                elif (has_euro or has_amount or has_decimal) and any(keyword in line.lower() for keyword in financial_keywords):
-                    is_financial = True
-                    logger.info(f"DEBUG [KEYWORD+IMPORTE] {line[:60]}...")
-                
-                # Condición 3: Líneas que contengan el saldo específico conocido
-                elif '2.123,98' in line or '2123,98' in line or '2,123.98' in line:
-                    is_financial = True
-                    logger.info(f"DEBUG [SALDO CONOCIDO] {line[:60]}...")
-                
-                # Condición 4: Patrones de cuenta bancaria
-                elif re.search(r'ES\d{2}\s?\d{4}\s?\d{4}\s?\d{4}\s?\d{4}\s?\d{4}', line):
-                    is_financial = True
-                    logger.info(f"DEBUG [CUENTA BANCARIA] {line[:60]}...")
-                
-                # Condición 5: Cualquier línea con múltiples números que sugiera transacción
-                elif re.search(r'\d+.*€.*\d+|\d+.*,\d{2}.*\d+', line):
-                    is_financial = True
-                    logger.info(f"DEBUG [PATRÓN NUMÉRICO] {line[:60]}...")
-                
-                if is_financial:
-                    found_financial_lines.append(line)
-                    
-            # ANÁLISIS ADICIONAL: Buscar en el HTML elementos con clases financieras
-            if page_html:
-                logger.info("DEBUG Analizando estructura HTML...")
-                html_financial_patterns = [
-                    r'class="[^"]*(?:balance|saldo|amount|importe|transaction|movimiento)[^"]*"[^>]*>([^<]+)',
-                    r'<td[^>]*>([^<]*€[^<]*)</td>',
-                    r'<span[^>]*>([^<]*\d+,\d{2}[^<]*)</span>',
-                    r'<div[^>]*>([^<]*\d{1,2}/\d{1,2}/\d{4}[^<]*)</div>'
-                ]
-                
-                for pattern in html_financial_patterns:
-                    matches = re.findall(pattern, page_html, re.IGNORECASE)
-                    for match in matches:
-                        if match.strip() and len(match.strip()) > 3:
-                            found_financial_lines.append(f"HTML: {match.strip()}")
-                            logger.info(f"DEBUG [HTML] {match.strip()[:60]}...")
-            
-            logger.info(f"SUCCESS Encontradas {len(found_financial_lines)} líneas financieras totales")
-            
-            # PROCESAMIENTO MEJORADO de líneas financieras encontradas
-            logger.info(f"DEBUG Procesando {len(found_financial_lines)} líneas financieras...")
-            
-            for i, line in enumerate(found_financial_lines[:15]):  # Aumentado a 15
-                logger.info(f"DEBUG Procesando línea {i+1}: {line[:80]}...")
-                
-                # EXTRACCIÓN MEJORADA DE FECHA
-                transaction_date = date_cls.today()  # Default
-                date_patterns = [
-                    r'\b(\d{1,2})[\/\-\.](\d{1,2})[\/\-\.](\d{4})\b',  # dd/mm/yyyy
-                    r'\b(\d{1,2})[\/\-\.](\d{1,2})[\/\-\.](\d{2})\b',   # dd/mm/yy
-                    r'\b(\d{4})[\/\-\.](\d{1,2})[\/\-\.](\d{1,2})\b',   # yyyy/mm/dd
-                ]
-                
-                for date_pattern in date_patterns:
-                    date_match = re.search(date_pattern, line)
-                    if date_match:
-                        try:
-                            groups = date_match.groups()
-                            if len(groups[0]) == 4:  # yyyy/mm/dd
-                                year, month, day = groups
-                            else:  # dd/mm/yyyy or dd/mm/yy
-                                day, month, year = groups
-                                if len(year) == 2:
-                                    year = f"20{year}" if int(year) < 50 else f"19{year}"
-                            
-                            transaction_date = date_cls(int(year), int(month), int(day))
-                            logger.info(f"DEBUG Fecha extraída: {transaction_date}")
-                            break
-                        except Exception as e:
-                            logger.debug(f"DEBUG Error parseando fecha {groups}: {e}")
-                            continue
-                
-                # EXTRACCIÓN MEJORADA DE IMPORTE
-                amount = 0.0
-                amount_patterns = [
-                    r'(-?\d{1,3}(?:\.\d{3})*,\d{2})\s*€',  # 1.234,56 €
-                    r'€\s*(-?\d{1,3}(?:\.\d{3})*,\d{2})',  # € 1.234,56
-                    r'(-?\d{1,3}(?:\.\d{3})*,\d{2})',      # 1.234,56
-                    r'(-?\d+,\d{2})',                       # 123,45
-                    r'(-?\d+\.\d{2})',                      # 123.45 (formato inglés)
-                ]
-                
-                for amount_pattern in amount_patterns:
-                    amount_match = re.search(amount_pattern, line)
-                    if amount_match:
-                        try:
-                            amount_str = amount_match.group(1).replace('€', '').strip()
-                            # Detectar formato (español vs inglés)
-                            if ',' in amount_str and amount_str.count(',') == 1 and amount_str.split(',')[1].isdigit() and len(amount_str.split(',')[1]) == 2:
-                                # Formato español: 1.234,56
-                                amount = float(amount_str.replace('.', '').replace(',', '.'))
-                            else:
-                                # Formato inglés: 1234.56
-                                amount = float(amount_str.replace(',', ''))
-                            
-                            logger.info(f"DEBUG Importe extraído: {amount}€")
-                            break
-                        except Exception as e:
-                            logger.debug(f"DEBUG Error parseando importe {amount_match.group(1)}: {e}")
-                            continue
-                
-                # DESCRIPCIÓN MEJORADA
-                description = line[:100]  # Aumentado a 100 caracteres
-                
-                # Limpiar la descripción eliminando datos ya extraídos
-                if transaction_date != date_cls.today():
-                    # Eliminar la fecha de la descripción
-                    for pattern in date_patterns:
-                        description = re.sub(pattern, '', description)
-                
-                if amount != 0.0:
-                    # Eliminar el importe de la descripción
-                    for pattern in amount_patterns:
-                        description = re.sub(pattern, '', description)
-                
-                # Limpiar espacios múltiples y caracteres extraños
-                description = re.sub(r'\s+', ' ', description).strip()
-                if not description or len(description) < 5:
-                    description = f"Movimiento bancario detectado #{i+1}"
-                
-                # CATEGORIZACIÓN INTELIGENTE
-                category = "Movimiento"
-                if any(keyword in line.lower() for keyword in ['saldo', 'balance', 'disponible']):
-                    category = "Saldo"
-                elif any(keyword in line.lower() for keyword in ['transferencia', 'bizum']):
-                    category = "Transferencia"
-                elif any(keyword in line.lower() for keyword in ['recibo', 'domiciliacion']):
-                    category = "Recibo"
-                elif any(keyword in line.lower() for keyword in ['nomina', 'pension']):
-                    category = "Ingreso"
-                elif any(keyword in line.lower() for keyword in ['tarjeta', 'cajero', 'compra']):
-                    category = "Tarjeta"
-                elif '2.123,98' in line or '2123,98' in line:
-                    category = "Saldo Principal"
-                
-                transaction = BankTransaction(
-                    id=f"enhanced_{i}_{hash(line[:50])}",
-                    date=transaction_date,
-                    description=description,
-                    amount=amount,
-                    account_number="ES02 0128 0730 9101 6000 0605",
-                    category=category,
-                    reference=f"ENHANCED_EXTRACT_{i+1}"
-                )
-                transactions.append(transaction)
-                logger.info(f"SUCCESS Transacción mejorada: {transaction_date} - {description[:30]}... - {amount}€ [{category}]")
+                transactions = extract_transactions(page_html, DEFAULT_ACCOUNT, text_limit=15)
             
             # Si no encontramos transacciones específicas, crear al menos una con el saldo conocido
             if not transactions:
                 logger.info("DEBUG No se encontraron transacciones en texto, creando entrada de saldo...")
                 balance_transaction = BankTransaction(
-                    id=f"visible_balance_{hash('2123.98')}",
+                    id="visible_balance",
                     date=date_cls.today(),
                     description="Saldo visible extraído de página Bankinter",
                     amount=2123.98,
-                    account_number="ES02 0128 0730 9101 6000 0605",
+                    account_number=DEFAULT_ACCOUNT,
                     category="Saldo Visible",
                     reference="VISIBLE_BALANCE"
                 )
@@ -1644,32 +1245,31 @@ class BankinterClient:
         except Exception as e:
             logger.error(f"ERROR en extracción ultra-conservadora: {e}")
             # Como último recurso, crear transacción con saldo conocido
-            try:
-                fallback_transaction = BankTransaction(
-                    id="fallback_balance",
-                    date=date_cls.today(),
-                    description="Saldo Bankinter (fallback)",
-                    amount=2123.98,
-                    account_number="ES02 0128 0730 9101 6000 0605",
-                    category="Fallback",
-                    reference="FALLBACK_BALANCE"
-                )
-                transactions.append(fallback_transaction)
-            except Exception as e2:
-                logger.error(f"ERROR incluso en fallback: {e2}")
+            transactions.append(BankTransaction(
+                id="fallback_balance",
+                date=date_cls.today(),
+                description="Saldo Bankinter (fallback)",
+                amount=2123.98,
+                account_number=DEFAULT_ACCOUNT,
+                category="Fallback",
+                reference="FALLBACK_BALANCE"
+            ))
         
         logger.info(f"SUCCESS Ultra-conservador completado: {len(transactions)} transacciones")
         return transactions
     
     def cleanup(self):
-        """Limpiar recursos"""
-        if self.driver:
-            self.driver.quit()
-            logger.info("CLEANUP WebDriver cerrado")
+        """Devolver el navegador al pool (sigue abierto y con sesión para la próxima sincronización)"""
+        if self.browser:
+            browser_pool.release(self.browser)
+            self.browser = None
+            self.driver = None
+            logger.info("CLEANUP WebDriver devuelto al pool")
+        self.timer.log_summary()
 
+@off_event_loop
 async def handle_post_login_popups(driver):
     """Manejar pop-ups que aparecen DESPU[INFO]S del login exitoso"""
-    import asyncio
     from selenium.webdriver.common.by import By
     from selenium.webdriver.support.ui import WebDriverWait
     from selenium.webdriver.support import expected_conditions as EC
@@ -1681,8 +1281,8 @@ async def handle_post_login_popups(driver):
         logger.info("DEBUG Modo simulaci[INFO]n - no hay pop-ups que manejar")
         return
     
-    # Esperar un poco para que aparezcan los pop-ups
-    await asyncio.sleep(3)
+    # Esperar a que la página se estabilice antes de buscar pop-ups
+    wait_page_ready(driver)
     
     # Tomar screenshot para debug
     driver.save_screenshot("post_login_before_popup_handling.png")
@@ -1713,7 +1313,7 @@ async def handle_post_login_popups(driver):
                 
                 logger.info(f"DEBUG Cerrando Google Password Manager con: {selector}")
                 button.click()
-                await asyncio.sleep(1)
+                wait_gone(driver, button, 2)
                 break
             except:
                 continue
@@ -1723,9 +1323,7 @@ async def handle_post_login_popups(driver):
     
     # 2. MANEJAR SEGUNDO POP-UP DE BANKINTER COOKIES
     try:
-        # Esperar un poco m[INFO]s y buscar cookies de Bankinter otra vez
-        await asyncio.sleep(2)
-        
+        # Buscar cookies de Bankinter otra vez (cada selector espera hasta 2s a que sea clicable)
         bankinter_cookie_selectors = [
             "//button[contains(text(), 'ACEPTAR')]",
             "//button[contains(text(), 'Aceptar')]",
@@ -1748,7 +1346,7 @@ async def handle_post_login_popups(driver):
                 
                 logger.info(f"DEBUG Aceptando cookies Bankinter (segunda vez) con: {selector}")
                 button.click()
-                await asyncio.sleep(1)
+                wait_gone(driver, button, 2)
                 break
             except:
                 continue
@@ -1780,8 +1378,8 @@ async def handle_post_login_popups(driver):
     except Exception as e:
         logger.warning(f"WARNING Error eliminando overlays: {e}")
     
-    # Esperar un poco m[INFO]s para que se estabilice
-    await asyncio.sleep(2)
+    # Esperar a que se estabilice
+    wait_page_ready(driver)
     
     # Tomar screenshot final
     if driver:
@@ -1791,6 +1389,7 @@ async def handle_post_login_popups(driver):
 
 
 # Funci[INFO]n de utilidad para uso directo
+@off_event_loop
 async def connect_bankinter(username: str, password: str, api_key: str = None) -> BankinterClient:
     """Funci[INFO]n helper para conectar con Bankinter"""
     
@@ -1808,8 +1407,10 @@ async def connect_bankinter(username: str, password: str, api_key: str = None) -
         logger.info("SUCCESS Conexi[INFO]n web exitosa")
         return client
     
+    client.cleanup()
     raise Exception("ERROR No se pudo establecer conexi[INFO]n con Bankinter")
 
+@off_event_loop
 async def download_bankinter_data(username: str, password: str, days_back: int = 90) -> Dict[str, Any]:
     """Funci[INFO]n principal para descargar datos de Bankinter"""
     
@@ -1817,6 +1418,7 @@ async def download_bankinter_data(username: str, password: str, days_back: int =
     with open("download_debug.log", "a", encoding="utf-8") as f:
         f.write(f"{datetime.now()}: Iniciando descarga para {username}\n")
     
+    client = None
     try:
         # Conectar REAL
         print("DEBUG DOWNLOAD: Conectando REAL a Bankinter...")
@@ -1888,7 +1490,7 @@ async def download_bankinter_data(username: str, password: str, days_back: int =
                         if download_btn.is_displayed():
                             logger.info(f"DEBUG Encontrado botón de descarga: {selector}")
                             client.driver.execute_script("arguments[0].click();", download_btn)
-                            await asyncio.sleep(3)
+                            wait_page_ready(client.driver)
                             
                             # Buscar si apareció algún modal o formulario de exportación
                             export_forms = client.driver.find_elements(By.XPATH, "//form | //div[contains(@class, 'modal')] | //div[contains(@class, 'dialog')]")
@@ -1902,7 +1504,7 @@ async def download_bankinter_data(username: str, password: str, days_back: int =
                                 for btn in confirm_buttons:
                                     if btn.is_displayed():
                                         btn.click()
-                                        await asyncio.sleep(2)
+                                        wait_page_ready(client.driver)
                                         break
                             
                             download_successful = True
@@ -1913,7 +1515,7 @@ async def download_bankinter_data(username: str, password: str, days_back: int =
                 
                 if download_successful:
                     # Esperar y verificar si se descargó un archivo
-                    await asyncio.sleep(5)
+                    wait_page_ready(client.driver)
                     logger.info("SUCCESS Posible descarga iniciada")
                     # Aquí podríamos implementar verificación de archivos descargados
                 
@@ -1976,15 +1578,14 @@ async def download_bankinter_data(username: str, password: str, days_back: int =
                             
                             # Hacer scroll al elemento primero
                             client.driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                            await asyncio.sleep(1)
                             
                             # Hacer doble click para asegurar el acceso
                             client.driver.execute_script("arguments[0].click();", element)
                             logger.info(f"DEBUG Primer click realizado")
-                            await asyncio.sleep(2)
+                            wait_page_ready(client.driver)
                             client.driver.execute_script("arguments[0].click();", element)
                             logger.info(f"SUCCESS Doble click completado en: {selector}")
-                            await asyncio.sleep(5)  # Esperar más tiempo para carga
+                            wait_page_ready(client.driver, 30)
                             account_accessed = True
                             break
                     except Exception as e:
@@ -2198,6 +1799,8 @@ async def download_bankinter_data(username: str, password: str, days_back: int =
         
     except Exception as e:
         logger.error(f"ERROR Error descargando datos: {e}")
+        if client:
+            client.cleanup()
         return {
             "success": False,
             "error": str(e),
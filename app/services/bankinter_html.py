@@ -0,0 +1,198 @@
+# app/services/bankinter_html.py
+"""
+Offline extraction of Bankinter movements from the page HTML.
+
+The scrapers read driver.page_source once and everything else happens here with lxml
+and precompiled patterns, instead of walking elements over the WebDriver wire (one
+round trip per find_elements / is_displayed() / .text). Functions are pure on the HTML,
+so they are regression-tested against the pages saved in the repo
+(bankinter_page_source.html, debug_bankinter_table.html) without a browser.
+"""
+import hashlib
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import List, Optional, Sequence, Tuple
+
+import lxml.html
+
+DEFAULT_ACCOUNT = "ES02 0128 0730 9101 6000 0605"
+
+# dd/mm/yyyy, dd-mm-yy, dd.mm.yyyy
+DATE_RE = re.compile(r"\b(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{4}|\d{2})\b")
+# Formato español; la web separa los céntimos en otro <span>: "-434 ,24 €", "5.184 ,22 €"
+AMOUNT_RE = re.compile(r"([+-]?)\s*(\d{1,3}(?:\.\d{3})+|\d+)\s*,\s*(\d{2})(?!\d)(?:\s*€)?")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Filas de la tabla de movimientos (movimientos_cuenta.xhtml); las filas "oculto" son el detalle plegado
+MOVEMENT_ROWS_XPATH = "//tr[contains(concat(' ', normalize-space(@class), ' '), ' movilDetalleMovimiento ')]"
+NON_CONTENT_XPATH = "//script | //style | //noscript | //template"
+# Una fila de tabla es una línea (td/th no parten)
+BLOCK_TAGS = (
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "footer", "form",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "section",
+    "table", "tbody", "tfoot", "thead", "tr", "ul",
+)
+LINE_BREAK = "\ue000"  # Carácter de uso privado: el HTML ya trae saltos de línea dentro de las celdas
+
+# (categoría, palabras clave) en orden de prioridad, sobre la línea en minúsculas
+CATEGORY_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("Saldo", ("saldo", "balance", "disponible")),
+    ("Transferencia", ("transferencia", "trans inm", "bizum")),
+    ("Recibo", ("recibo", "recib ", "domiciliacion")),
+    ("Ingreso", ("nomina", "pension")),
+    ("Tarjeta", ("tarjeta", "cajero", "compra")),
+)
+
+
+@dataclass
+class BankTransaction:
+    """Estructura de transacción bancaria"""
+    id: str
+    date: date
+    description: str
+    amount: float
+    account_number: str
+    category: Optional[str] = None
+    balance_after: Optional[float] = None
+    reference: Optional[str] = None
+
+
+def clean_text(text: Optional[str]) -> str:
+    return WHITESPACE_RE.sub(" ", text or "").strip()
+
+
+def parse_date(text: Optional[str]) -> Optional[date]:
+    """First dd/mm/yyyy (or dd/mm/yy) date in the text"""
+    match = DATE_RE.search(text or "")
+    if not match:
+        return None
+    day, month, year = (int(g) for g in match.groups())
+    if year < 100:
+        year += 2000 if year < 50 else 1900
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_amount(text: Optional[str]) -> Optional[float]:
+    """First Spanish-format amount in the text ("-1.234,56 €" -> -1234.56)"""
+    match = AMOUNT_RE.search(text or "")
+    if not match:
+        return None
+    sign, integer, cents = match.groups()
+    value = float(f"{integer.replace('.', '')}.{cents}")
+    return -value if sign == "-" else value
+
+
+def categorize(text: str) -> Optional[str]:
+    lowered = text.lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return category
+    return None
+
+
+def transaction_id(movement_date: date, description: str, amount: float, balance: Optional[float]) -> str:
+    """Stable across runs and processes (hash() is salted per process)"""
+    key = f"{movement_date.isoformat()}|{description}|{amount:.2f}|{'' if balance is None else f'{balance:.2f}'}"
+    return "bkt_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_document(html: str):
+    return lxml.html.document_fromstring(html or "<html></html>")
+
+
+def _cell(row, id_prefix: str):
+    cells = row.xpath(f"./*[starts-with(@id, '{id_prefix}')]")
+    return cells[0] if cells else None
+
+
+def parse_movement_rows(doc, account_number: str = DEFAULT_ACCOUNT) -> List[BankTransaction]:
+    """Movements from the account movements table, one per row, in page order"""
+    transactions = []
+    accounting_date = None
+    for row in doc.xpath(MOVEMENT_ROWS_XPATH):
+        # La fecha contable solo aparece en el primer movimiento de cada día
+        accounting_cell = _cell(row, "FechaContable")
+        accounting_date = parse_date(accounting_cell.text_content() if accounting_cell is not None else "") or accounting_date
+        value_cell = _cell(row, "FechaValor")
+        movement_date = parse_date(value_cell.text_content() if value_cell is not None else "") or accounting_date
+
+        amount_cell = _cell(row, "Importe")
+        amount = parse_amount(amount_cell.text_content()) if amount_cell is not None else None
+        if movement_date is None or amount is None:
+            continue
+
+        concept_cell = _cell(row, "Concepto")
+        description = ""
+        if concept_cell is not None:
+            # El primer <span> es el concepto; el enlace sr-only es "Pulsa para ver detalle..."
+            spans = concept_cell.xpath("./span")
+            description = clean_text(spans[0].text_content() if spans else concept_cell.text_content())
+        balance_cell = _cell(row, "Saldo")
+        balance = parse_amount(balance_cell.text_content()) if balance_cell is not None else None
+
+        transactions.append(BankTransaction(
+            id=transaction_id(movement_date, description, amount, balance),
+            date=movement_date,
+            description=description or "MOVIMIENTO BANCARIO",
+            amount=amount,
+            account_number=account_number,
+            category=categorize(description),
+            balance_after=balance,
+            reference=f"ROW_{len(transactions) + 1}",
+        ))
+    return transactions
+
+
+def visible_lines(doc) -> List[str]:
+    """Text of the page split at block elements, without scripts and styles (modifies doc)"""
+    for element in doc.xpath(NON_CONTENT_XPATH):
+        element.drop_tree()
+    for element in doc.iter(*BLOCK_TAGS):
+        element.text = LINE_BREAK + (element.text or "")
+        element.tail = LINE_BREAK + (element.tail or "")
+    lines = (clean_text(line) for line in doc.text_content().split(LINE_BREAK))
+    return [line for line in lines if line]
+
+
+def parse_text_lines(
+    lines: Sequence[str],
+    account_number: str = DEFAULT_ACCOUNT,
+    limit: Optional[int] = None
+) -> List[BankTransaction]:
+    """Movements from free text: lines with both a date and an amount"""
+    transactions = []
+    for line in lines:
+        movement_date = parse_date(line)
+        amount = parse_amount(line)
+        if movement_date is None or amount is None:
+            continue
+        description = clean_text(AMOUNT_RE.sub(" ", DATE_RE.sub(" ", line)))
+        transactions.append(BankTransaction(
+            id=transaction_id(movement_date, description, amount, None),
+            date=movement_date,
+            description=description or f"Movimiento bancario detectado #{len(transactions) + 1}",
+            amount=amount,
+            account_number=account_number,
+            category=categorize(line) or "Movimiento",
+            reference=f"TEXT_{len(transactions) + 1}",
+        ))
+        if limit and len(transactions) >= limit:
+            break
+    return transactions
+
+
+def extract_transactions(
+    html: str,
+    account_number: str = DEFAULT_ACCOUNT,
+    text_limit: Optional[int] = None
+) -> List[BankTransaction]:
+    """Movements table when the page has one, otherwise date + amount lines of the visible text"""
+    doc = parse_document(html)
+    transactions = parse_movement_rows(doc, account_number)
+    if transactions:
+        return transactions
+    return parse_text_lines(visible_lines(doc), account_number, text_limit)
@@ -16,11 +16,11 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
+from .browser_pool import browser_pool, resume_session
+from .browser_waits import StepTimer, accept_cookie_banner, click_and_wait, off_event_loop, wait_page_ready, wait_url_change
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -37,62 +37,44 @@ class BankinterScraperV2:
     def __init__(self, username: str = None, password: str = None):
         self.username = username
         self.password = password
+        self.browser = None
         self.driver = None
         self.wait = None
+        self.timer = StepTimer("Bankinter V2")
         self.login_url = "https://bancaonline.bankinter.com/gestion/login.xhtml"
+        self.home_url = "https://bancaonline.bankinter.com/gestion/posicion.xhtml"
         
     def setup_driver(self) -> webdriver.Chrome:
-        """Configuración mínima pero efectiva del WebDriver"""
-        options = Options()
-        
-        # Configuración anti-detección básica
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        
-        # Configuración de privacidad
-        options.add_experimental_option("prefs", {
-            "profile.default_content_setting_values.notifications": 2,
-            "profile.default_content_setting_values.cookies": 1,
-            "credentials_enable_service": False,
-            "profile.password_manager_enabled": False,
-        })
-        
-        # User agent realista
-        options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
-        
-        # Headless opcional (comentar para ver la ejecución)
-        # options.add_argument("--headless")
-        
-        try:
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=options)
-            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            
-            self.driver = driver
-            self.wait = WebDriverWait(driver, 10)
-            return driver
-            
-        except Exception as e:
-            logger.error(f"Error configurando WebDriver: {e}")
-            raise
+        """Chrome caliente del pool, con el perfil (cookies, sesión) de este usuario"""
+        with self.timer.step("browser"):
+            self.browser = browser_pool.acquire(self.username)
+        self.driver = self.browser.driver
+        self.wait = WebDriverWait(self.driver, 15)
+        return self.driver
 
+    @off_event_loop
     async def login(self) -> bool:
         """Login simplificado con validación clara"""
         try:
             logger.info("Iniciando proceso de login en Bankinter")
             
             if not self.driver:
-                self.setup_driver()
+                # Esperar un navegador libre o arrancar Chrome bloquea: fuera del event loop
+                await asyncio.to_thread(self.setup_driver)
+            
+            # Sesión del navegador del pool aún válida: no hace falta login
+            with self.timer.step("resume_session"):
+                if resume_session(self.browser, self.home_url, lambda d: "login" not in d.current_url.lower()):
+                    return True
                 
             # Ir a la página de login
-            self.driver.get(self.login_url)
-            await asyncio.sleep(3)
+            with self.timer.step("login_page"):
+                self.driver.get(self.login_url)
+                wait_page_ready(self.driver)
             
             # Manejar cookies popup si aparece
-            cookie_handled = self._handle_cookie_popup()
-            if cookie_handled:
-                await asyncio.sleep(2)  # Dar tiempo después de cerrar cookies
+            with self.timer.step("cookies"):
+                self._handle_cookie_popup()
             
             # Buscar y completar formulario de login con selectores múltiples
             logger.info("Buscando campos del formulario de login...")
@@ -229,26 +211,30 @@ class BankinterScraperV2:
             logger.info("Completando credenciales...")
             username_field.clear()
             username_field.send_keys(self.username)
-            await asyncio.sleep(0.5)
             
             password_field.clear()
             password_field.send_keys(self.password)
-            await asyncio.sleep(0.5)
             
             # Hacer click en entrar
+            form_url = self.driver.current_url
             if login_button == "javascript_click":
                 logger.info("Ya se hizo click con JavaScript")
+                form_url = self.login_url
             else:
                 logger.info("Haciendo click en botón de login")
                 login_button.click()
             
             # Esperar a que la página cargue o aparezca error
-            await asyncio.sleep(3)
+            with self.timer.step("login"):
+                wait_url_change(self.driver, form_url, 20)
+                wait_page_ready(self.driver)
             
             # Verificar si el login fue exitoso
             if self._is_login_successful():
                 logger.info("Login exitoso")
-                await self._handle_post_login_popups()
+                self.browser.mark_logged_in()
+                with self.timer.step("post_login"):
+                    await self._handle_post_login_popups()
                 return True
             else:
                 logger.error("Login fallido - credenciales incorrectas o captcha")
@@ -263,9 +249,6 @@ class BankinterScraperV2:
         try:
             logger.info("Buscando popup de cookies...")
             
-            # Esperar un poco a que aparezca el popup
-            time.sleep(2)
-            
             # Selectores específicos para el popup de Bankinter
             cookie_selectors = [
                 # Botón ACEPTAR (más específico primero)
@@ -291,25 +274,10 @@ class BankinterScraperV2:
             except:
                 pass
             
-            # Intentar cada selector
-            for i, selector in enumerate(cookie_selectors):
-                try:
-                    if selector.startswith("//"):
-                        elements = self.driver.find_elements(By.XPATH, selector)
-                    else:
-                        elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    
-                    for element in elements:
-                        if element.is_displayed() and element.is_enabled():
-                            logger.info(f"Intentando hacer click en: {element.text}")
-                            element.click()
-                            time.sleep(1)
-                            logger.info("Cookie popup manejado exitosamente")
-                            return True
-                            
-                except Exception as e:
-                    logger.debug(f"Selector {i+1} falló: {e}")
-                    continue
+            # Esperar al popup y aceptar (se salta si el perfil ya guardó el consentimiento)
+            if accept_cookie_banner(self.driver, cookie_selectors):
+                logger.info("Cookie popup manejado exitosamente")
+                return True
             
             # Si no funcionó nada, intentar con JavaScript
             logger.info("Intentando cerrar popup con JavaScript...")
@@ -324,7 +292,6 @@ class BankinterScraperV2:
                 
                 for cmd in js_commands:
                     self.driver.execute_script(cmd)
-                    time.sleep(0.5)
                 
                 logger.info("Comandos JavaScript ejecutados")
                 return True
@@ -367,7 +334,7 @@ class BankinterScraperV2:
     async def _handle_post_login_popups(self):
         """Manejar popups post-login y navegar al área bancaria"""
         try:
-            await asyncio.sleep(3)
+            wait_page_ready(self.driver)
             
             # Primero cerrar popups si los hay
             popup_selectors = [
@@ -387,8 +354,7 @@ class BankinterScraperV2:
                     
                     for element in elements:
                         if element.is_displayed():
-                            element.click()
-                            await asyncio.sleep(1)
+                            click_and_wait(self.driver, element)
                             logger.info("Popup post-login cerrado")
                             
                 except Exception:
@@ -415,8 +381,7 @@ class BankinterScraperV2:
                     for element in elements:
                         if element.is_displayed() and element.is_enabled():
                             logger.info(f"Haciendo clic en área bancaria: {element.text}")
-                            element.click()
-                            await asyncio.sleep(3)
+                            click_and_wait(self.driver, element)
                             banking_clicked = True
                             break
                     
@@ -436,13 +401,14 @@ class BankinterScraperV2:
                     accounts_url = f"{base_url}/gestion/cuentas"
                     logger.info(f"Intentando navegar a: {accounts_url}")
                     self.driver.get(accounts_url)
-                    await asyncio.sleep(3)
+                    wait_page_ready(self.driver)
                 except Exception as e:
                     logger.debug(f"Error navegando directamente: {e}")
                     
         except Exception as e:
             logger.debug(f"Error manejando post-login: {e}")
 
+    @off_event_loop
     async def get_transactions(self, start_date: date = None, end_date: date = None) -> List[Transaction]:
         """Obtener transacciones con enfoque directo"""
         try:
@@ -454,12 +420,16 @@ class BankinterScraperV2:
             logger.info(f"Obteniendo transacciones desde {start_date} hasta {end_date}")
             
             # Buscar datos en la página principal primero
-            transactions = self._extract_transactions_from_current_page()
+            with self.timer.step("extract"):
+                transactions = self._extract_transactions_from_current_page()
             
             if not transactions:
                 # Si no hay datos, intentar navegar a movimientos
-                if await self._navigate_to_movements():
-                    transactions = self._extract_transactions_from_current_page()
+                with self.timer.step("navigate"):
+                    navigated = await self._navigate_to_movements()
+                if navigated:
+                    with self.timer.step("extract_movements"):
+                        transactions = self._extract_transactions_from_current_page()
             
             # Filtrar por fechas
             filtered_transactions = self._filter_by_date(transactions, start_date, end_date)
@@ -482,7 +452,7 @@ class BankinterScraperV2:
             logger.info(f"Screenshot de extracción: {screenshot_name}")
             
             # Esperar a que cargue el contenido
-            time.sleep(2)
+            wait_page_ready(self.driver)
             
             # Primero buscar saldos y cuentas visibles
             logger.info("Buscando información de cuentas y saldos...")
@@ -741,8 +711,7 @@ class BankinterScraperV2:
                     for element in elements:
                         if element.is_displayed() and element.is_enabled():
                             logger.info(f"Intentando clic en: {element.text} (selector: {selector})")
-                            element.click()
-                            await asyncio.sleep(3)
+                            click_and_wait(self.driver, element)
                             
                             # Verificar si cambió la página
                             current_url = self.driver.current_url
@@ -786,7 +755,7 @@ class BankinterScraperV2:
                         result = self.driver.execute_script(js_click)
                         if result:
                             logger.info(f"JavaScript click exitoso para: {pattern}")
-                            await asyncio.sleep(3)
+                            wait_page_ready(self.driver)
                             return True
                 
             except Exception as e:
@@ -834,10 +803,12 @@ class BankinterScraperV2:
             raise
 
     def close(self):
-        """Cerrar WebDriver"""
-        if self.driver:
-            self.driver.quit()
+        """Devolver el navegador al pool (queda abierto y con sesión para la próxima sincronización)"""
+        if self.browser:
+            browser_pool.release(self.browser)
+            self.browser = None
             self.driver = None
+        self.timer.log_summary()
 
     def __enter__(self):
         return self
@@ -11,15 +11,14 @@ from datetime import datetime, date, timedelta
 from typing import List, Optional
 from dataclasses import dataclass
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
+from .browser_pool import browser_pool, resume_session
+from .browser_waits import StepTimer, accept_cookie_banner, click_and_wait, off_event_loop, wait_page_ready, wait_url_change
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -36,68 +35,58 @@ class BankinterScraperV3:
     def __init__(self, username: str, password: str):
         self.username = username
         self.password = password
+        self.browser = None
         self.driver = None
         self.wait = None
+        self.timer = StepTimer("Bankinter V3")
         self.login_url = "https://bancaonline.bankinter.com/gestion/login.xhtml"
+        self.home_url = "https://bancaonline.bankinter.com/gestion/posicion.xhtml"
         
     def setup_driver(self):
-        """Configuración optimizada del WebDriver"""
-        options = Options()
-        
-        # Configuración anti-detección
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        
-        # Configuración de privacidad y rendimiento
-        options.add_experimental_option("prefs", {
-            "profile.default_content_setting_values.notifications": 2,
-            "profile.default_content_setting_values.cookies": 1,
-            "credentials_enable_service": False,
-            "profile.password_manager_enabled": False,
-        })
-        
-        options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
-        
-        try:
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=options)
-            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            
-            self.driver = driver
-            self.wait = WebDriverWait(driver, 15)
-            return driver
-            
-        except Exception as e:
-            logger.error(f"Error configurando WebDriver: {e}")
-            raise
+        """Chrome caliente del pool, con el perfil (cookies, sesión) de este usuario"""
+        with self.timer.step("browser"):
+            self.browser = browser_pool.acquire(self.username)
+        self.driver = self.browser.driver
+        self.wait = WebDriverWait(self.driver, 15)
+        return self.driver
 
+    @off_event_loop
     async def login(self) -> bool:
         """Login mejorado con verificación"""
         try:
             logger.info("=== INICIANDO LOGIN ===")
             
             if not self.driver:
-                self.setup_driver()
+                # Esperar un navegador libre o arrancar Chrome bloquea: fuera del event loop
+                await asyncio.to_thread(self.setup_driver)
+            
+            # Sesión del navegador del pool aún válida: no hace falta login
+            with self.timer.step("resume_session"):
+                if resume_session(self.browser, self.home_url, lambda d: "login" not in d.current_url.lower()):
+                    return True
                 
             # Ir a la página de login
             logger.info(f"Navegando a: {self.login_url}")
-            self.driver.get(self.login_url)
-            await asyncio.sleep(3)
+            with self.timer.step("login_page"):
+                self.driver.get(self.login_url)
+                wait_page_ready(self.driver)
             
             # Manejar cookies
             logger.info("Manejando popup de cookies...")
-            await self._handle_cookies()
+            with self.timer.step("cookies"):
+                await self._handle_cookies()
             
             # Completar formulario de login
             logger.info("Completando formulario de login...")
-            if not await self._fill_login_form():
-                return False
+            with self.timer.step("login"):
+                if not await self._fill_login_form():
+                    return False
             
             # Verificar login exitoso
             logger.info("Verificando login...")
             if await self._verify_login():
                 logger.info("✅ LOGIN EXITOSO")
+                self.browser.mark_logged_in()
                 return True
             else:
                 logger.error("❌ LOGIN FALLIDO")
@@ -110,26 +99,14 @@ class BankinterScraperV3:
     async def _handle_cookies(self):
         """Manejo mejorado de cookies"""
         try:
-            await asyncio.sleep(2)
-            
             # Buscar y hacer clic en ACEPTAR
             cookie_selectors = [
                 "//button[text()='ACEPTAR']",
                 "//button[contains(text(), 'ACEPTAR')]",
                 "//button[contains(text(), 'Aceptar')]"
             ]
-            
-            for selector in cookie_selectors:
-                try:
-                    elements = self.driver.find_elements(By.XPATH, selector)
-                    for element in elements:
-                        if element.is_displayed() and element.is_enabled():
-                            logger.info(f"Haciendo clic en cookies: {element.text}")
-                            element.click()
-                            await asyncio.sleep(1)
-                            return True
-                except:
-                    continue
+            if accept_cookie_banner(self.driver, cookie_selectors):
+                return True
                     
             # Fallback con JavaScript
             js_click = """
@@ -138,7 +115,6 @@ class BankinterScraperV3:
             })
             """
             self.driver.execute_script(js_click)
-            await asyncio.sleep(1)
             
         except Exception as e:
             logger.debug(f"Error manejando cookies: {e}")
@@ -195,11 +171,9 @@ class BankinterScraperV3:
             logger.info("Introduciendo credenciales...")
             username_field.clear()
             username_field.send_keys(self.username)
-            await asyncio.sleep(0.5)
             
             password_field.clear()
             password_field.send_keys(self.password)
-            await asyncio.sleep(0.5)
             
             # Buscar y hacer clic en botón
             login_button = None
@@ -225,9 +199,10 @@ class BankinterScraperV3:
                     continue
             
             if login_button:
+                form_url = self.driver.current_url
                 login_button.click()
                 logger.info("Click en botón de login realizado")
-                await asyncio.sleep(3)
+                wait_url_change(self.driver, form_url, 20)
                 return True
             else:
                 raise Exception("Botón de login no encontrado")
@@ -239,7 +214,7 @@ class BankinterScraperV3:
     async def _verify_login(self) -> bool:
         """Verificar que el login fue exitoso"""
         try:
-            await asyncio.sleep(3)
+            wait_page_ready(self.driver)
             
             # Indicadores de login exitoso
             success_indicators = [
@@ -268,6 +243,7 @@ class BankinterScraperV3:
             logger.error(f"Error verificando login: {e}")
             return False
 
+    @off_event_loop
     async def get_real_movements(self, start_date: date = None, end_date: date = None) -> List[Transaction]:
         """Obtener movimientos bancarios reales navegando por la interfaz"""
         try:
@@ -333,8 +309,7 @@ class BankinterScraperV3:
                     for element in elements:
                         if element.is_displayed() and element.is_enabled():
                             logger.info(f"Haciendo clic en: {element.text}")
-                            element.click()
-                            await asyncio.sleep(3)
+                            click_and_wait(self.driver, element)
                             
                             # Verificar si cambió la página
                             current_url = self.driver.current_url
@@ -379,8 +354,7 @@ class BankinterScraperV3:
                             text = element.text.lower()
                             if any(word in text for word in ['cuenta', 'movimiento', 'posición', 'balance']):
                                 logger.info(f"Encontrado enlace de menú: {element.text}")
-                                element.click()
-                                await asyncio.sleep(3)
+                                click_and_wait(self.driver, element)
                                 return True
                                 
                 except Exception as e:
@@ -585,10 +559,12 @@ class BankinterScraperV3:
             raise
 
     def close(self):
-        """Cerrar WebDriver"""
-        if self.driver:
-            self.driver.quit()
+        """Devolver el navegador al pool (queda abierto y con sesión para la próxima sincronización)"""
+        if self.browser:
+            browser_pool.release(self.browser)
+            self.browser = None
             self.driver = None
+        self.timer.log_summary()
 
     def __enter__(self):
         return self
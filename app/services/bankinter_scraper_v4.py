@@ -4,7 +4,6 @@ Bankinter Scraper v4 - Navegación secuencial mejorada
 Mantiene sesión activa y navega paso a paso
 """
 
-import asyncio
 import logging
 from datetime import datetime, date, timedelta
 from typing import List, Dict, Optional, Any
@@ -18,12 +17,12 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.common.action_chains import ActionChains
 
+from .browser_pool import browser_pool, resume_session
+from .browser_waits import StepTimer, accept_cookie_banner, click_and_wait, off_event_loop, wait_page_ready, wait_url_change
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -40,53 +39,38 @@ class BankinterScraperV4:
     def __init__(self, username: str = None, password: str = None):
         self.username = username
         self.password = password
+        self.browser = None
         self.driver = None
         self.wait = None
+        self.timer = StepTimer("Bankinter V4")
         self.login_url = "https://bancaonline.bankinter.com/gestion/login.xhtml"
+        self.home_url = "https://bancaonline.bankinter.com/gestion/posicion.xhtml"
         
     def setup_driver(self) -> webdriver.Chrome:
-        """Configuración robusta del WebDriver"""
-        options = Options()
-        
-        # Anti-detección mejorada
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        options.add_argument("--disable-extensions")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--remote-debugging-port=9222")
-        
-        # User agent realista
-        options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.7258.139 Safari/537.36")
-        
-        # Configurar ventana
-        options.add_argument("--window-size=1366,768")
-        options.add_argument("--start-maximized")
-        
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=options)
-        
-        # Script anti-detección
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
-        # Timeout generoso para páginas bancarias
+        """Chrome caliente del pool, con el perfil (cookies, sesión) de este usuario"""
+        with self.timer.step("browser"):
+            self.browser = browser_pool.acquire(self.username)
+        self.driver = self.browser.driver
         self.wait = WebDriverWait(self.driver, 15)
-        
         return self.driver
 
+    @off_event_loop
     async def login(self) -> bool:
         """Login mejorado con manejo de sesión"""
         try:
             logger.info("=== INICIANDO LOGIN V4 ===")
             
+            # 0. Sesión del navegador del pool aún válida: no hace falta login
+            with self.timer.step("resume_session"):
+                if resume_session(self.browser, self.home_url, lambda d: "login" not in d.current_url.lower()):
+                    return True
+            
             # 1. Navegar a la página de login
             logger.info(f"Navegando a: {self.login_url}")
             self.driver.get(self.login_url)
             
             # Esperar carga inicial
-            await asyncio.sleep(3)
+            wait_page_ready(self.driver)
             
             # 2. Manejar popup de cookies
             logger.info("Manejando popup de cookies...")
@@ -94,6 +78,7 @@ class BankinterScraperV4:
             
             # 3. Completar formulario de login
             logger.info("Completando formulario de login...")
+            form_url = self.driver.current_url
             login_success = await self._complete_login_form()
             
             if not login_success:
@@ -101,7 +86,8 @@ class BankinterScraperV4:
                 return False
             
             # 4. Verificar login exitoso
-            await asyncio.sleep(5)
+            wait_url_change(self.driver, form_url, 20)
+            wait_page_ready(self.driver)
             current_url = self.driver.current_url
             logger.info(f"URL post-login: {current_url}")
             
@@ -113,6 +99,7 @@ class BankinterScraperV4:
             self.driver.save_screenshot("login_success_v4.png")
             
             logger.info("Login completado exitosamente")
+            self.browser.mark_logged_in()
             return True
             
         except Exception as e:
@@ -122,9 +109,6 @@ class BankinterScraperV4:
     async def _handle_cookies(self):
         """Manejo robusto de cookies"""
         try:
-            # Esperar a que aparezca el popup
-            await asyncio.sleep(2)
-            
             cookie_selectors = [
                 "//button[contains(text(), 'ACEPTAR')]",
                 "//button[contains(text(), 'Aceptar')]",
@@ -133,26 +117,10 @@ class BankinterScraperV4:
                 ".ot-sdk-show-settings",
                 "[data-testid='uc-accept-all-button']"
             ]
-            
-            for selector in cookie_selectors:
-                try:
-                    if selector.startswith("//"):
-                        elements = self.driver.find_elements(By.XPATH, selector)
-                    else:
-                        elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    
-                    if elements:
-                        for element in elements:
-                            if element.is_displayed() and element.is_enabled():
-                                logger.info(f"Haciendo clic en cookies: {element.text}")
-                                element.click()
-                                await asyncio.sleep(1)
-                                return
-                                
-                except Exception as e:
-                    continue
-            
-            logger.info("No se encontró popup de cookies o ya fue manejado")
+            if accept_cookie_banner(self.driver, cookie_selectors):
+                logger.info("Cookies aceptadas")
+            else:
+                logger.info("No se encontró popup de cookies o ya fue manejado")
             
         except Exception as e:
             logger.warning(f"Error manejando cookies: {e}")
@@ -222,20 +190,13 @@ class BankinterScraperV4:
                 logger.error("No se encontró campo de contraseña")
                 return False
             
-            # Completar credenciales con pauses realistas
             logger.info("Introduciendo credenciales...")
             username_field.clear()
-            await asyncio.sleep(0.5)
             username_field.send_keys(self.username)
             
-            await asyncio.sleep(1)
-            
             password_field.clear()
-            await asyncio.sleep(0.5)
             password_field.send_keys(self.password)
             
-            await asyncio.sleep(1)
-            
             # Buscar y hacer clic en botón de login
             login_button = None
             for selector in button_selectors:
@@ -272,13 +233,14 @@ class BankinterScraperV4:
             logger.error(f"Error completando formulario: {e}")
             return False
 
+    @off_event_loop
     async def navigate_to_movements(self) -> bool:
         """Navegación secuencial al área de movimientos"""
         try:
             logger.info("=== NAVEGANDO A MOVIMIENTOS ===")
             
             # 1. Esperar a que la página cargue después del login
-            await asyncio.sleep(5)
+            wait_page_ready(self.driver)
             current_url = self.driver.current_url
             logger.info(f"URL inicial: {current_url}")
             
@@ -309,8 +271,7 @@ class BankinterScraperV4:
                             href = element.get_attribute('href') or ""
                             logger.info(f"Probando navegación: '{text}' -> {href}")
                             
-                            element.click()
-                            await asyncio.sleep(4)
+                            click_and_wait(self.driver, element)
                             
                             new_url = self.driver.current_url
                             logger.info(f"Nueva URL: {new_url}")
@@ -340,7 +301,7 @@ class BankinterScraperV4:
                 for url in sequential_urls:
                     logger.info(f"Intentando URL directa: {url}")
                     self.driver.get(url)
-                    await asyncio.sleep(4)
+                    wait_page_ready(self.driver)
                     
                     final_url = self.driver.current_url
                     if "bancaonline.bankinter.com/gestion/" in final_url and "login" not in final_url:
@@ -383,8 +344,7 @@ class BankinterScraperV4:
                             if text or href:
                                 logger.info(f"Probando enlace de movimientos: '{text}' -> {href[:50]}")
                                 
-                                element.click()
-                                await asyncio.sleep(5)
+                                click_and_wait(self.driver, element)
                                 
                                 new_url = self.driver.current_url
                                 logger.info(f"URL después de clic: {new_url}")
@@ -443,6 +403,7 @@ class BankinterScraperV4:
             logger.error(f"Error navegando a movimientos: {e}")
             return False
 
+    @off_event_loop
     async def extract_movements_from_current_page(self) -> List[Transaction]:
         """Extraer movimientos de la página actual con métodos múltiples"""
         try:
@@ -878,23 +839,29 @@ class BankinterScraperV4:
         
         return text[:100]  # Limitar longitud
 
+    @off_event_loop
     async def get_movements(self, start_date: date, end_date: date) -> List[Transaction]:
         """Obtener movimientos del período especificado"""
         try:
             logger.info(f"=== OBTENIENDO MOVIMIENTOS {start_date} - {end_date} ===")
             
             # 1. Realizar login
-            if not await self.login():
+            with self.timer.step("login"):
+                logged_in = await self.login()
+            if not logged_in:
                 logger.error("Login fallido")
                 return []
             
             # 2. Navegar a movimientos
-            if not await self.navigate_to_movements():
+            with self.timer.step("navigate"):
+                navigated = await self.navigate_to_movements()
+            if not navigated:
                 logger.error("No se pudo navegar a movimientos")
                 return []
             
             # 3. Extraer movimientos
-            all_transactions = await self.extract_movements_from_current_page()
+            with self.timer.step("extract"):
+                all_transactions = await self.extract_movements_from_current_page()
             
             # 4. Filtrar por período
             filtered_transactions = []
@@ -940,9 +907,9 @@ class BankinterScraperV4:
             raise
 
     def close(self):
-        """Cerrar navegador"""
-        if self.driver:
-            try:
-                self.driver.quit()
-            except:
-                pass
\ No newline at end of file
+        """Devolver el navegador al pool (queda abierto y con sesión para la próxima sincronización)"""
+        if self.browser:
+            browser_pool.release(self.browser)
+            self.browser = None
+            self.driver = None
+        self.timer.log_summary()
@@ -4,7 +4,6 @@ Bankinter Scraper v5 - Flujo exacto de navegación
 Sigue el flujo específico: login -> extracto_integral -> movimientos_cuenta
 """
 
-import asyncio
 import logging
 from datetime import datetime, date, timedelta
 from typing import List, Dict, Optional, Any
@@ -18,11 +17,11 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
+from .browser_pool import browser_pool, resume_session
+from .browser_waits import StepTimer, accept_cookie_banner, click_and_wait, off_event_loop, wait_page_ready, wait_url_contains
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -39,8 +38,10 @@ class BankinterScraperV5:
     def __init__(self, username: str = None, password: str = None):
         self.username = username
         self.password = password
+        self.browser = None
         self.driver = None
         self.wait = None
+        self.timer = StepTimer("Bankinter V5")
         # URLs exactas del flujo correcto
         self.login_url = "https://bancaonline.bankinter.com/gestion/login.xhtml"
         self.post_login_url = "https://bancaonline.bankinter.com/extracto/secure/extracto_integral.xhtml"
@@ -48,43 +49,28 @@ class BankinterScraperV5:
         self.account_number = "ES0201280730910160000605"
         
     def setup_driver(self) -> webdriver.Chrome:
-        """Configuración robusta del WebDriver"""
-        options = Options()
-        
-        # Anti-detección
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        options.add_argument("--disable-extensions")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        
-        # User agent realista
-        options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.7258.139 Safari/537.36")
-        
-        # Configurar ventana
-        options.add_argument("--window-size=1366,768")
-        options.add_argument("--start-maximized")
-        
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=options)
-        
-        # Script anti-detección
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
+        """Chrome caliente del pool, con el perfil (cookies, sesión) de este usuario"""
+        with self.timer.step("browser"):
+            self.browser = browser_pool.acquire(self.username)
+        self.driver = self.browser.driver
         self.wait = WebDriverWait(self.driver, 15)
         return self.driver
 
+    @off_event_loop
     async def login(self) -> bool:
         """Login con flujo específico"""
         try:
             logger.info("=== LOGIN FLUJO EXACTO ===")
             
+            # 0. Sesión del navegador del pool aún válida: no hace falta login
+            with self.timer.step("resume_session"):
+                if resume_session(self.browser, self.post_login_url, lambda d: "extracto/secure" in d.current_url):
+                    return True
+            
             # 1. Navegar a login
             logger.info(f"Paso 1: Navegando a {self.login_url}")
             self.driver.get(self.login_url)
-            await asyncio.sleep(3)
+            wait_page_ready(self.driver)
             
             # 2. Manejar cookies
             logger.info("Paso 2: Manejando cookies...")
@@ -96,7 +82,7 @@ class BankinterScraperV5:
                 return False
             
             # 4. Verificar llegada a extracto_integral
-            await asyncio.sleep(5)
+            wait_url_contains(self.driver, ["extracto/secure"], 20)
             current_url = self.driver.current_url
             logger.info(f"Paso 4: URL post-login: {current_url}")
             
@@ -104,17 +90,19 @@ class BankinterScraperV5:
             if "extracto/secure/extracto_integral" in current_url:
                 logger.info("✓ Login exitoso - En extracto_integral como esperado")
                 self.driver.save_screenshot("login_success_v5.png")
+                self.browser.mark_logged_in()
                 return True
             else:
                 logger.warning(f"URL inesperada post-login: {current_url}")
                 # Intentar navegar manualmente a extracto_integral
                 logger.info("Intentando navegar a extracto_integral...")
                 self.driver.get(self.post_login_url)
-                await asyncio.sleep(3)
+                wait_page_ready(self.driver)
                 
                 final_url = self.driver.current_url
                 if "extracto/secure" in final_url:
                     logger.info("✓ Navegación manual exitosa")
+                    self.browser.mark_logged_in()
                     return True
                 else:
                     logger.error("No se pudo llegar a extracto_integral")
@@ -127,34 +115,16 @@ class BankinterScraperV5:
     async def _handle_cookies(self):
         """Manejo de cookies"""
         try:
-            await asyncio.sleep(2)
-            
             cookie_selectors = [
                 "//button[contains(text(), 'ACEPTAR')]",
                 "//button[contains(text(), 'Aceptar')]",
                 "#onetrust-accept-btn-handler",
                 ".ot-sdk-show-settings"
             ]
-            
-            for selector in cookie_selectors:
-                try:
-                    if selector.startswith("//"):
-                        elements = self.driver.find_elements(By.XPATH, selector)
-                    else:
-                        elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    
-                    if elements:
-                        for element in elements:
-                            if element.is_displayed() and element.is_enabled():
-                                logger.info(f"Aceptando cookies: {element.text}")
-                                element.click()
-                                await asyncio.sleep(1)
-                                return
-                                
-                except Exception:
-                    continue
-            
-            logger.info("No se encontró popup de cookies")
+            if accept_cookie_banner(self.driver, cookie_selectors):
+                logger.info("Cookies aceptadas")
+            else:
+                logger.info("No se encontró popup de cookies")
             
         except Exception as e:
             logger.warning(f"Error manejando cookies: {e}")
@@ -194,11 +164,9 @@ class BankinterScraperV5:
             logger.info("Completando credenciales...")
             username_field.clear()
             username_field.send_keys(self.username)
-            await asyncio.sleep(0.5)
             
             password_field.clear()
             password_field.send_keys(self.password)
-            await asyncio.sleep(0.5)
             
             # Buscar botón de login
             button_selectors = [
@@ -233,6 +201,7 @@ class BankinterScraperV5:
             logger.error(f"Error completando login: {e}")
             return False
 
+    @off_event_loop
     async def navigate_to_movements(self) -> bool:
         """Navegación específica a movimientos_cuenta.xhtml"""
         try:
@@ -245,14 +214,14 @@ class BankinterScraperV5:
             if "extracto_integral" not in current_url:
                 logger.warning("No estamos en extracto_integral, navegando...")
                 self.driver.get(self.post_login_url)
-                await asyncio.sleep(4)
+                wait_page_ready(self.driver)
                 current_url = self.driver.current_url
                 logger.info(f"Nueva URL: {current_url}")
             
             # Método 1: Navegar directamente a movimientos_cuenta.xhtml
             logger.info(f"Método 1: Navegación directa a {self.movements_url}")
             self.driver.get(self.movements_url)
-            await asyncio.sleep(5)
+            wait_page_ready(self.driver)
             
             current_url = self.driver.current_url
             logger.info(f"URL después de navegación directa: {current_url}")
@@ -273,7 +242,7 @@ class BankinterScraperV5:
             
             # Navegar de vuelta a extracto_integral
             self.driver.get(self.post_login_url)
-            await asyncio.sleep(4)
+            wait_page_ready(self.driver)
             
             # Buscar el número de cuenta
             account_selectors = [
@@ -299,8 +268,7 @@ class BankinterScraperV5:
                                 # Si es un enlace, hacer clic
                                 if element.tag_name.lower() == 'a' or element.find_elements(By.XPATH, ".//ancestor::a"):
                                     logger.info("Haciendo clic en número de cuenta...")
-                                    element.click()
-                                    await asyncio.sleep(5)
+                                    click_and_wait(self.driver, element)
                                     
                                     new_url = self.driver.current_url
                                     logger.info(f"URL después del clic: {new_url}")
@@ -341,8 +309,7 @@ class BankinterScraperV5:
                             href = element.get_attribute('href') or ""
                             
                             logger.info(f"Probando enlace: '{text}' -> {href}")
-                            element.click()
-                            await asyncio.sleep(4)
+                            click_and_wait(self.driver, element)
                             
                             new_url = self.driver.current_url
                             if "movimientos" in new_url:
@@ -360,6 +327,7 @@ class BankinterScraperV5:
             logger.error(f"Error navegando a movimientos: {e}")
             return False
 
+    @off_event_loop
     async def extract_real_movements(self) -> List[Transaction]:
         """Extraer movimientos reales de la página específica de movimientos"""
         try:
@@ -732,23 +700,29 @@ class BankinterScraperV5:
         
         return unique_transactions
 
+    @off_event_loop
     async def get_august_movements(self) -> List[Transaction]:
         """Obtener movimientos específicos de agosto 2025"""
         try:
             logger.info("=== OBTENIENDO MOVIMIENTOS DE AGOSTO 2025 ===")
             
             # 1. Login
-            if not await self.login():
+            with self.timer.step("login"):
+                logged_in = await self.login()
+            if not logged_in:
                 logger.error("Login fallido")
                 return []
             
             # 2. Navegar a movimientos
-            if not await self.navigate_to_movements():
+            with self.timer.step("navigate"):
+                navigated = await self.navigate_to_movements()
+            if not navigated:
                 logger.error("Navegación a movimientos fallida")
                 return []
             
             # 3. Extraer movimientos
-            transactions = await self.extract_real_movements()
+            with self.timer.step("extract"):
+                transactions = await self.extract_real_movements()
             
             # 4. Filtrar solo agosto 2025
             august_transactions = [
@@ -794,9 +768,9 @@ class BankinterScraperV5:
             raise
 
     def close(self):
-        """Cerrar navegador"""
-        if self.driver:
-            try:
-                self.driver.quit()
-            except:
-                pass
\ No newline at end of file
+        """Devolver el navegador al pool (queda abierto y con sesión para la próxima sincronización)"""
+        if self.browser:
+            browser_pool.release(self.browser)
+            self.browser = None
+            self.driver = None
+        self.timer.log_summary()
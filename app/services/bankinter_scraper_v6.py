@@ -4,7 +4,6 @@ Bankinter Scraper v6 - Con extracción de saldo y formateo Excel
 Extrae datos en formato compatible con agente financiero
 """
 
-import asyncio
 import logging
 from datetime import datetime, date, timedelta
 from typing import List, Dict, Optional, Any
@@ -18,13 +17,12 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
 # Importar el formateador
 from .bankinter_excel_formatter import BankinterExcelFormatter, BankinterMovement, convert_scraper_to_bankinter_movements
+from .browser_pool import browser_pool, resume_session
+from .browser_waits import StepTimer, accept_cookie_banner, off_event_loop, wait_page_ready, wait_url_contains
 
 logger = logging.getLogger(__name__)
 
@@ -42,8 +40,10 @@ class BankinterScraperV6:
     def __init__(self, username: str = None, password: str = None):
         self.username = username
         self.password = password
+        self.browser = None
         self.driver = None
         self.wait = None
+        self.timer = StepTimer("Bankinter V6")
         # URLs exactas del flujo correcto
         self.login_url = "https://bancaonline.bankinter.com/gestion/login.xhtml"
         self.post_login_url = "https://bancaonline.bankinter.com/extracto/secure/extracto_integral.xhtml"
@@ -54,67 +54,58 @@ class BankinterScraperV6:
         self.formatter = BankinterExcelFormatter()
         
     def setup_driver(self) -> webdriver.Chrome:
-        """Configuración robusta del WebDriver"""
-        options = Options()
-        
-        # Anti-detección
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        options.add_argument("--disable-extensions")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        
-        # User agent realista
-        options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.7258.139 Safari/537.36")
-        
-        # Configurar ventana
-        options.add_argument("--window-size=1366,768")
-        options.add_argument("--start-maximized")
-        
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=options)
-        
-        # Script anti-detección
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
+        """Chrome caliente del pool, con el perfil (cookies, sesión) de este usuario"""
+        with self.timer.step("browser"):
+            self.browser = browser_pool.acquire(self.username)
+        self.driver = self.browser.driver
         self.wait = WebDriverWait(self.driver, 15)
         return self.driver
 
+    @off_event_loop
     async def login(self) -> bool:
         """Login con flujo específico"""
         try:
             logger.info("=== LOGIN FLUJO EXACTO V6 ===")
             
+            # 0. Sesión del navegador del pool aún válida: no hace falta login
+            with self.timer.step("resume_session"):
+                if resume_session(self.browser, self.post_login_url, lambda d: "extracto/secure" in d.current_url):
+                    return True
+            
             # 1. Navegar a login
             logger.info(f"Navegando a {self.login_url}")
-            self.driver.get(self.login_url)
-            await asyncio.sleep(3)
+            with self.timer.step("login_page"):
+                self.driver.get(self.login_url)
+                wait_page_ready(self.driver)
             
             # 2. Manejar cookies
-            await self._handle_cookies()
+            with self.timer.step("cookies"):
+                await self._handle_cookies()
             
             # 3. Completar login
-            if not await self._complete_login():
-                return False
-            
-            # 4. Verificar llegada a extracto_integral
-            await asyncio.sleep(5)
+            with self.timer.step("login"):
+                if not await self._complete_login():
+                    return False
+                
+                # 4. Verificar llegada a extracto_integral
+                wait_url_contains(self.driver, ["extracto/secure"], 20)
             current_url = self.driver.current_url
             logger.info(f"URL post-login: {current_url}")
             
             if "extracto/secure/extracto_integral" in current_url:
                 logger.info("Login exitoso - En extracto_integral")
+                self.browser.mark_logged_in()
                 return True
             else:
                 logger.warning(f"URL inesperada: {current_url}")
-                self.driver.get(self.post_login_url)
-                await asyncio.sleep(3)
+                with self.timer.step("post_login_page"):
+                    self.driver.get(self.post_login_url)
+                    wait_page_ready(self.driver)
                 
                 final_url = self.driver.current_url
                 if "extracto/secure" in final_url:
                     logger.info("Navegación manual exitosa")
+                    self.browser.mark_logged_in()
                     return True
                 else:
                     logger.error("No se pudo llegar a extracto_integral")
@@ -127,31 +118,13 @@ class BankinterScraperV6:
     async def _handle_cookies(self):
         """Manejo de cookies"""
         try:
-            await asyncio.sleep(2)
-            
             cookie_selectors = [
                 "//button[contains(text(), 'ACEPTAR')]",
                 "//button[contains(text(), 'Aceptar')]",
                 "#onetrust-accept-btn-handler"
             ]
-            
-            for selector in cookie_selectors:
-                try:
-                    if selector.startswith("//"):
-                        elements = self.driver.find_elements(By.XPATH, selector)
-                    else:
-                        elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    
-                    if elements:
-                        for element in elements:
-                            if element.is_displayed() and element.is_enabled():
-                                logger.info("Aceptando cookies")
-                                element.click()
-                                await asyncio.sleep(1)
-                                return
-                                
-                except Exception:
-                    continue
+            if accept_cookie_banner(self.driver, cookie_selectors):
+                logger.info("Cookies aceptadas")
             
         except Exception as e:
             logger.warning(f"Error manejando cookies: {e}")
@@ -171,11 +144,9 @@ class BankinterScraperV6:
             logger.info("Completando credenciales...")
             username_field.clear()
             username_field.send_keys(self.username)
-            await asyncio.sleep(0.5)
             
             password_field.clear()
             password_field.send_keys(self.password)
-            await asyncio.sleep(0.5)
             
             # Buscar botón de login
             login_buttons = self.driver.find_elements(By.XPATH, "//button[contains(text(), 'Entrar')] | //button[@type='submit'] | //input[@type='submit']")
@@ -193,6 +164,7 @@ class BankinterScraperV6:
             logger.error(f"Error completando login: {e}")
             return False
 
+    @off_event_loop
     async def navigate_to_movements(self) -> bool:
         """Navegación específica a movimientos_cuenta.xhtml"""
         try:
@@ -203,8 +175,9 @@ class BankinterScraperV6:
             
             # Navegar directamente a movimientos_cuenta.xhtml
             logger.info(f"Navegando a {self.movements_url}")
-            self.driver.get(self.movements_url)
-            await asyncio.sleep(5)
+            with self.timer.step("movements_page"):
+                self.driver.get(self.movements_url)
+                wait_page_ready(self.driver, 30)
             
             current_url = self.driver.current_url
             logger.info(f"URL después de navegación: {current_url}")
@@ -222,6 +195,7 @@ class BankinterScraperV6:
             logger.error(f"Error navegando a movimientos: {e}")
             return False
 
+    @off_event_loop
     async def extract_movements_with_balance(self) -> List[TransactionV6]:
         """Extraer movimientos con saldo de la tabla de Bankinter"""
         try:
@@ -423,6 +397,7 @@ class BankinterScraperV6:
         
         return None
 
+    @off_event_loop
     async def get_august_movements_formatted(self) -> tuple[List[TransactionV6], str, str]:
         """Obtener movimientos de agosto 2025 y exportar en ambos formatos"""
         try:
@@ -439,7 +414,8 @@ class BankinterScraperV6:
                 return [], "", ""
             
             # 3. Extraer movimientos con saldo
-            transactions = await self.extract_movements_with_balance()
+            with self.timer.step("extract"):
+                transactions = await self.extract_movements_with_balance()
             
             if not transactions:
                 logger.warning("No se encontraron movimientos")
@@ -481,9 +457,9 @@ class BankinterScraperV6:
             return [], "", ""
 
     def close(self):
-        """Cerrar navegador"""
-        if self.driver:
-            try:
-                self.driver.quit()
-            except:
-                pass
\ No newline at end of file
+        """Devolver el navegador al pool (queda abierto y con sesión para la próxima sincronización)"""
+        if self.browser:
+            browser_pool.release(self.browser)
+            self.browser = None
+            self.driver = None
+        self.timer.log_summary()
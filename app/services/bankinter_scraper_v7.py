@@ -4,12 +4,10 @@ Bankinter Scraper v7 - Con extracción correcta de importes
 Corrige la lógica de parsing basada en posiciones de tabla específicas
 """
 
-import asyncio
 import logging
 from datetime import datetime, date, timedelta
 from typing import List, Dict, Optional, Any
 from dataclasses import dataclass
-import re
 import time
 import csv
 import os
@@ -18,14 +16,14 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
 # Importar el formateador
 from .bankinter_excel_formatter import BankinterExcelFormatter, BankinterMovement
 from .financial_agent_uploader import upload_bankinter_excel
+from .bankinter_html import parse_document, parse_movement_rows
+from .browser_pool import browser_pool, resume_session
+from .browser_waits import StepTimer, accept_cookie_banner, off_event_loop, wait_page_ready, wait_url_contains, wait_visible
 
 logger = logging.getLogger(__name__)
 
@@ -48,8 +46,10 @@ class BankinterScraperV7:
         self.agent_username = agent_username
         self.agent_password = agent_password
         self.auto_upload = auto_upload
+        self.browser = None
         self.driver = None
         self.wait = None
+        self.timer = StepTimer("Bankinter V7")
         # URLs exactas del flujo correcto
         self.login_url = "https://bancaonline.bankinter.com/gestion/login.xhtml"
         self.post_login_url = "https://bancaonline.bankinter.com/extracto/secure/extracto_integral.xhtml"
@@ -60,67 +60,58 @@ class BankinterScraperV7:
         self.formatter = BankinterExcelFormatter()
         
     def setup_driver(self) -> webdriver.Chrome:
-        """Configuración robusta del WebDriver"""
-        options = Options()
-        
-        # Anti-detección
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        options.add_argument("--disable-extensions")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        
-        # User agent realista
-        options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.7258.139 Safari/537.36")
-        
-        # Configurar ventana
-        options.add_argument("--window-size=1366,768")
-        options.add_argument("--start-maximized")
-        
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=options)
-        
-        # Script anti-detección
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
+        """Chrome caliente del pool, con el perfil (cookies, sesión) de este usuario"""
+        with self.timer.step("browser"):
+            self.browser = browser_pool.acquire(self.username)
+        self.driver = self.browser.driver
         self.wait = WebDriverWait(self.driver, 15)
         return self.driver
 
+    @off_event_loop
     async def login(self) -> bool:
         """Login con flujo específico"""
         try:
             logger.info("=== LOGIN FLUJO EXACTO V7 ===")
             
+            # 0. Sesión del navegador del pool aún válida: no hace falta login
+            with self.timer.step("resume_session"):
+                if resume_session(self.browser, self.post_login_url, lambda d: "extracto/secure" in d.current_url):
+                    return True
+            
             # 1. Navegar a login
             logger.info(f"Navegando a {self.login_url}")
-            self.driver.get(self.login_url)
-            await asyncio.sleep(3)
+            with self.timer.step("login_page"):
+                self.driver.get(self.login_url)
+                wait_page_ready(self.driver)
             
             # 2. Manejar cookies
-            await self._handle_cookies()
+            with self.timer.step("cookies"):
+                await self._handle_cookies()
             
             # 3. Completar login
-            if not await self._complete_login():
-                return False
-            
-            # 4. Verificar llegada a extracto_integral
-            await asyncio.sleep(5)
+            with self.timer.step("login"):
+                if not await self._complete_login():
+                    return False
+                
+                # 4. Verificar llegada a extracto_integral
+                wait_url_contains(self.driver, ["extracto/secure"], 20)
             current_url = self.driver.current_url
             logger.info(f"URL post-login: {current_url}")
             
             if "extracto/secure/extracto_integral" in current_url:
                 logger.info("Login exitoso - En extracto_integral")
+                self.browser.mark_logged_in()
                 return True
             else:
                 logger.warning(f"URL inesperada: {current_url}")
-                self.driver.get(self.post_login_url)
-                await asyncio.sleep(3)
+                with self.timer.step("post_login_page"):
+                    self.driver.get(self.post_login_url)
+                    wait_page_ready(self.driver)
                 
                 final_url = self.driver.current_url
                 if "extracto/secure" in final_url:
                     logger.info("Navegación manual exitosa")
+                    self.browser.mark_logged_in()
                     return True
                 else:
                     logger.error("No se pudo llegar a extracto_integral")
@@ -133,31 +124,13 @@ class BankinterScraperV7:
     async def _handle_cookies(self):
         """Manejo de cookies"""
         try:
-            await asyncio.sleep(2)
-            
             cookie_selectors = [
                 "//button[contains(text(), 'ACEPTAR')]",
                 "//button[contains(text(), 'Aceptar')]",
                 "#onetrust-accept-btn-handler"
             ]
-            
-            for selector in cookie_selectors:
-                try:
-                    if selector.startswith("//"):
-                        elements = self.driver.find_elements(By.XPATH, selector)
-                    else:
-                        elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    
-                    if elements:
-                        for element in elements:
-                            if element.is_displayed() and element.is_enabled():
-                                logger.info("Aceptando cookies")
-                                element.click()
-                                await asyncio.sleep(1)
-                                return
-                                
-                except Exception:
-                    continue
+            if accept_cookie_banner(self.driver, cookie_selectors):
+                logger.info("Cookies aceptadas")
             
         except Exception as e:
             logger.warning(f"Error manejando cookies: {e}")
@@ -177,11 +150,9 @@ class BankinterScraperV7:
             logger.info("Completando credenciales...")
             username_field.clear()
             username_field.send_keys(self.username)
-            await asyncio.sleep(0.5)
             
             password_field.clear()
             password_field.send_keys(self.password)
-            await asyncio.sleep(0.5)
             
             # Buscar botón de login
             login_buttons = self.driver.find_elements(By.XPATH, "//button[contains(text(), 'Entrar')] | //button[@type='submit'] | //input[@type='submit']")
@@ -199,6 +170,7 @@ class BankinterScraperV7:
             logger.error(f"Error completando login: {e}")
             return False
 
+    @off_event_loop
     async def navigate_to_movements(self) -> bool:
         """Navegación específica a movimientos_cuenta.xhtml"""
         try:
@@ -209,13 +181,16 @@ class BankinterScraperV7:
             
             # Navegar directamente a movimientos_cuenta.xhtml con refresh para datos actuales
             logger.info(f"Navegando a {self.movements_url}")
-            self.driver.get(self.movements_url)
-            await asyncio.sleep(8)
+            with self.timer.step("movements_page"):
+                self.driver.get(self.movements_url)
+                wait_page_ready(self.driver, 30)
             
             # Forzar refresh para asegurar datos actualizados
             logger.info("Refrescando página para datos más recientes")
-            self.driver.refresh()
-            await asyncio.sleep(5)
+            with self.timer.step("movements_refresh"):
+                self.driver.refresh()
+                wait_page_ready(self.driver, 30)
+                wait_visible(self.driver, ["//table"], 15)
             
             current_url = self.driver.current_url
             logger.info(f"URL después de navegación: {current_url}")
@@ -233,6 +208,7 @@ class BankinterScraperV7:
             logger.error(f"Error navegando a movimientos: {e}")
             return False
 
+    @off_event_loop
     async def extract_movements_correct_amounts(self) -> List[TransactionV7]:
         """Extraer movimientos con importes correctos basados en estructura específica"""
         try:
@@ -244,108 +220,25 @@ class BankinterScraperV7:
             # Tomar screenshot
             self.driver.save_screenshot("extraction_v7.png")
             
-            transactions = []
+            # Una sola lectura del DOM; las filas se analizan en local (antes: find_elements/.text por celda)
+            parsed = parse_movement_rows(parse_document(self.driver.page_source))
+            logger.info(f"Filas de movimientos en la página: {len(parsed)}")
             
-            # Buscar la tabla principal de movimientos
-            tables = self.driver.find_elements(By.TAG_NAME, "table")
-            logger.info(f"Tablas encontradas: {len(tables)}")
-            
-            for i, table in enumerate(tables):
-                try:
-                    # Verificar si la tabla contiene datos bancarios
-                    table_text = table.text.lower()
-                    if not any(keyword in table_text for keyword in ['fecha', 'importe', 'concepto', 'saldo']):
-                        continue
-                    
-                    logger.info(f"Analizando tabla {i+1} con contenido bancario...")
-                    
-                    rows = table.find_elements(By.TAG_NAME, "tr")
-                    logger.info(f"Filas en tabla {i+1}: {len(rows)}")
-                    
-                    # Verificar header para confirmar estructura
-                    if len(rows) > 0:
-                        header_cells = rows[0].find_elements(By.TAG_NAME, "td")
-                        if not header_cells:
-                            header_cells = rows[0].find_elements(By.TAG_NAME, "th")
-                        
-                        if header_cells:
-                            header_texts = [cell.text.strip() for cell in header_cells]
-                            logger.info(f"Headers detectados: {header_texts}")
-                    
-                    for j, row in enumerate(rows[1:], 1):  # Saltar header
-                        try:
-                            # Buscar celdas
-                            cells = row.find_elements(By.TAG_NAME, "td")
-                            if len(cells) < 4:  # Necesita al menos 4 celdas para la estructura esperada
-                                continue
-                            
-                            # Extraer textos de celdas
-                            cell_texts = [cell.text.strip() for cell in cells]
-                            
-                            # Verificar estructura esperada basada en debug:
-                            # [0] = Vacía
-                            # [1] = Fecha (27/08/2025)
-                            # [2] = Concepto (Trans Inm/ Garcia Baena Jesus...)
-                            # [3] = IMPORTE (+750,00 €)
-                            # [4] = SALDO (2.092,81 €)
-                            
-                            # Extraer fecha (celda 1, índice 1)
-                            if len(cell_texts) < 2:
-                                continue
-                                
-                            date_text = cell_texts[1] if len(cell_texts) > 1 else ""
-                            transaction_date = self._parse_bankinter_date(date_text)
-                            
-                            if not transaction_date:
-                                continue
-                            
-                            # Filtrar solo transacciones recientes (últimos 3 meses para incluir septiembre)
-                            from datetime import datetime
-                            current_date = datetime.now()
-                            months_diff = (current_date.year - transaction_date.year) * 12 + (current_date.month - transaction_date.month)
-                            
-                            # Debug: Log all dates being processed
-                            # Debug: Log dates (removed for performance)
-                            # logger.info(f"Procesando fecha: {transaction_date.strftime('%d/%m/%Y')}, diff_meses: {months_diff}")
-                            
-                            if months_diff > 3:  # Expandido a 3 meses para asegurar septiembre
-                                logger.debug(f"Filtrando fecha antigua: {transaction_date.strftime('%d/%m/%Y')}")
-                                continue
-                            
-                            # Extraer concepto (celda 2, índice 2)
-                            concept = cell_texts[2] if len(cell_texts) > 2 else "MOVIMIENTO BANCARIO"
-                            
-                            # Extraer IMPORTE (celda 3, índice 3) - ESTE ES EL CAMBIO CLAVE
-                            amount_text = cell_texts[3] if len(cell_texts) > 3 else ""
-                            amount = self._parse_bankinter_amount_correct(amount_text)
-                            
-                            if amount is None:
-                                logger.debug(f"No se pudo parsear importe de: '{amount_text}'")
-                                continue
-                            
-                            # Extraer SALDO (celda 4, índice 4)
-                            balance_text = cell_texts[4] if len(cell_texts) > 4 else ""
-                            balance = self._parse_bankinter_amount_correct(balance_text)
-                            
-                            # Crear transacción
-                            transaction = TransactionV7(
-                                date=transaction_date,
-                                description=concept,
-                                amount=amount,
-                                balance=balance
-                            )
-                            
-                            transactions.append(transaction)
-                            # Simplified logging to avoid Unicode issues
-                            logger.info(f"Movimiento V7: {transaction_date.strftime('%d/%m/%Y')} - {amount:.2f}€")
-                            
-                        except Exception as e:
-                            logger.debug(f"Error procesando fila {j}: {e}")
-                            continue
-                            
-                except Exception as e:
-                    logger.error(f"Error procesando tabla {i}: {e}")
+            transactions = []
+            current_date = datetime.now()
+            for movement in parsed:
+                # Filtrar solo transacciones recientes (últimos 3 meses para incluir septiembre)
+                months_diff = (current_date.year - movement.date.year) * 12 + (current_date.month - movement.date.month)
+                if months_diff > 3:
+                    logger.debug(f"Filtrando fecha antigua: {movement.date.strftime('%d/%m/%Y')}")
                     continue
+                
+                transactions.append(TransactionV7(
+                    date=movement.date,
+                    description=movement.description,
+                    amount=movement.amount,
+                    balance=movement.balance_after
+                ))
             
             logger.info(f"Total movimientos extraídos V7: {len(transactions)}")
             
@@ -373,94 +266,7 @@ class BankinterScraperV7:
             logger.error(f"Error extrayendo movimientos V7: {e}")
             return []
 
-    def _parse_bankinter_date(self, date_text: str) -> Optional[date]:
-        """Parsear fecha específica de Bankinter"""
-        if not date_text:
-            return None
-        
-        # Buscar patrón dd/mm/yyyy en el texto
-        date_match = re.search(r'(\d{1,2})/(\d{1,2})/(\d{4})', date_text)
-        if date_match:
-            try:
-                day, month, year = map(int, date_match.groups())
-                return date(year, month, day)
-            except ValueError:
-                pass
-        
-        return None
-
-    def _parse_bankinter_amount_correct(self, amount_text: str) -> Optional[float]:
-        """Parsear importe específico de Bankinter con formato correcto"""
-        if not amount_text:
-            return None
-        
-        # Remover espacios extra y €
-        clean_text = amount_text.replace(' ', '').replace('€', '').strip()
-        
-        # Patrones específicos observados en debug:
-        # +750,00 → +750.00
-        # -770,67 → -770.67
-        # 2.092,81 → 2092.81 (saldo con separador de miles)
-        
-        # Patrón 1: +/-XXX,XX (importe simple)
-        simple_pattern = r'^([+-]?\d+),(\d{2})$'
-        match = re.match(simple_pattern, clean_text)
-        if match:
-            try:
-                integer_part = match.group(1)
-                decimal_part = match.group(2)
-                amount_str = f"{integer_part}.{decimal_part}"
-                return float(amount_str)
-            except ValueError:
-                pass
-        
-        # Patrón 2: +/-X.XXX,XX (con separador de miles)
-        thousands_pattern = r'^([+-]?)(\d{1,3})\.(\d{3}),(\d{2})$'
-        match = re.match(thousands_pattern, clean_text)
-        if match:
-            try:
-                sign = match.group(1)
-                thousands = match.group(2)
-                hundreds = match.group(3)
-                decimals = match.group(4)
-                
-                # Construir número sin separador de miles
-                integer_part = f"{thousands}{hundreds}"
-                amount_str = f"{sign}{integer_part}.{decimals}"
-                return float(amount_str)
-            except ValueError:
-                pass
-        
-        # Patrón 3: XXX,XX (sin signo)
-        unsigned_pattern = r'^(\d+),(\d{2})$'
-        match = re.match(unsigned_pattern, clean_text)
-        if match:
-            try:
-                integer_part = match.group(1)
-                decimal_part = match.group(2)
-                amount_str = f"{integer_part}.{decimal_part}"
-                return float(amount_str)
-            except ValueError:
-                pass
-        
-        # Patrón 4: X.XXX,XX (saldo con separador de miles sin signo)
-        balance_pattern = r'^(\d{1,3})\.(\d{3}),(\d{2})$'
-        match = re.match(balance_pattern, clean_text)
-        if match:
-            try:
-                thousands = match.group(1)
-                hundreds = match.group(2)
-                decimals = match.group(3)
-                
-                integer_part = f"{thousands}{hundreds}"
-                amount_str = f"{integer_part}.{decimals}"
-                return float(amount_str)
-            except ValueError:
-                pass
-        
-        logger.debug(f"No se pudo parsear importe: '{clean_text}' de texto original: '{amount_text}'")
-        return None
-
+    @off_event_loop
     async def get_august_movements_corrected(self) -> tuple[List[TransactionV7], str, str]:
         """Obtener movimientos de agosto 2025 con importes correctos"""
         try:
@@ -477,7 +283,8 @@ class BankinterScraperV7:
                 return [], "", ""
             
             # 3. Extraer movimientos con importes correctos
-            transactions = await self.extract_movements_correct_amounts()
+            with self.timer.step("extract"):
+                transactions = await self.extract_movements_correct_amounts()
             
             if not transactions:
                 logger.warning("No se encontraron movimientos")
@@ -565,9 +372,9 @@ class BankinterScraperV7:
             return [], "", "", "", None
 
     def close(self):
-        """Cerrar navegador"""
-        if self.driver:
-            try:
-                self.driver.quit()
-            except:
-                pass
\ No newline at end of file
+        """Devolver el navegador al pool (queda abierto y con sesión para la próxima sincronización)"""
+        if self.browser:
+            browser_pool.release(self.browser)
+            self.browser = None
+            self.driver = None
+        self.timer.log_summary()
\ No newline at end of file
@@ -0,0 +1,321 @@
+# app/services/browser_pool.py
+"""
+Pool of warm headless Chrome instances for the Bankinter scrapers.
+
+Each user gets an isolated Chrome profile (own cookies and storage) under
+APP_DATA_DIR/browser_profiles, and the browser is kept open between syncs, so the next
+sync skips Chrome start-up, the chromedriver download check and, while the bank session
+is still valid, the login itself. A profile can only be open in one Chrome at a time,
+so a second sync for the same user waits for the first one to release it; across API
+processes the profile is locked with flock, and a process that finds it taken uses a
+temporary per-process copy instead. A reaper thread closes browsers left idle.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+from ..config import settings
+from .browser_waits import wait_page_ready
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos (un solo proceso de la API en local)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/139.0.7258.139 Safari/537.36"
+)
+ACQUIRE_TIMEOUT_SECONDS = 300
+REAPER_INTERVAL_SECONDS = 30
+
+
+@lru_cache(maxsize=1)
+def chromedriver_path() -> Optional[str]:
+    """ChromeDriverManager().install() once per process (it checks versions over the network)"""
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+        return ChromeDriverManager().install()
+    except Exception as e:
+        # Sin webdriver_manager Selenium Manager localiza el driver
+        logger.warning(f"ChromeDriverManager unavailable, using Selenium Manager: {e}")
+        return None
+
+
+def profile_key(username: Optional[str]) -> str:
+    """Profile name for a bank user (hashed: usernames do not end up in paths)"""
+    if not username:
+        return "anonymous"
+    return hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+
+
+def profile_dir(key: str) -> str:
+    return os.path.abspath(os.path.join(settings.app_data_dir, "browser_profiles", key))
+
+
+def lock_profile(path: str) -> Tuple[Optional[int], bool]:
+    """(lock fd, acquired): exclusive flock on the profile so two API processes never open it at once"""
+    if fcntl is None:
+        return None, True
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(f"{path}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None, False
+    return fd, True
+
+
+def scraper_options(user_data_dir: str, headless: bool) -> Options:
+    """Chrome options shared by the scrapers (anti-detection, no password manager pop-ups)"""
+    options = Options()
+    options.add_argument(f"--user-data-dir={user_data_dir}")
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option("useAutomationExtension", False)
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--no-first-run")
+    options.add_argument("--disable-default-apps")
+    options.add_argument("--disable-features=PasswordManager,AutofillPasswordGeneration")
+    options.add_argument("--window-size=1366,768")
+    options.add_argument(f"--user-agent={USER_AGENT}")
+    options.add_experimental_option("prefs", {
+        "credentials_enable_service": False,
+        "profile.password_manager_enabled": False,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+    return options
+
+
+@dataclass
+class PooledBrowser:
+    key: str
+    driver: webdriver.Chrome
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    logged_in_at: Optional[float] = None
+    in_use: bool = False
+    profile_path: Optional[str] = None
+    lock_fd: Optional[int] = None
+    temporary_profile: bool = False  # Copia por proceso: el perfil del usuario lo tenía otro proceso
+    _setups: Set[str] = field(default_factory=set)
+
+    @property
+    def has_valid_session(self) -> bool:
+        """Logged in recently enough for the bank session cookies to still be valid"""
+        return (
+            self.logged_in_at is not None
+            and time.monotonic() - self.logged_in_at < settings.browser_session_seconds
+        )
+
+    def mark_logged_in(self) -> None:
+        self.logged_in_at = time.monotonic()
+
+    def mark_logged_out(self) -> None:
+        self.logged_in_at = None
+
+    def run_once(self, name: str, setup: Callable[[webdriver.Chrome], None]) -> None:
+        """Per-browser setup (e.g. CDP scripts) that survives between syncs: run it only once"""
+        if name not in self._setups:
+            setup(self.driver)
+            self._setups.add(name)
+
+
+def _alive(driver: webdriver.Chrome) -> bool:
+    try:
+        driver.current_url
+        return True
+    except WebDriverException:
+        return False
+
+
+def _release_profile(path: Optional[str], lock_fd: Optional[int], temporary: bool) -> None:
+    if lock_fd is not None:
+        os.close(lock_fd)  # Cerrar el descriptor libera el flock
+    if temporary and path:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _quit(browser: PooledBrowser) -> None:
+    try:
+        browser.driver.quit()
+    except Exception as e:
+        logger.debug(f"Error closing browser {browser.key}: {e}")
+    _release_profile(browser.profile_path, browser.lock_fd, browser.temporary_profile)
+
+
+class BrowserPool:
+    """At most `max_size` Chrome processes; idle ones are reused per profile and closed after `idle_seconds`"""
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        idle_seconds: Optional[float] = None,
+        headless: Optional[bool] = None,
+        driver_factory: Optional[Callable[[Service, Options], webdriver.Chrome]] = None
+    ):
+        self.max_size = max_size or settings.browser_pool_size
+        self.idle_seconds = idle_seconds if idle_seconds is not None else settings.browser_idle_seconds
+        self.headless = settings.browser_headless if headless is None else headless
+        self._driver_factory = driver_factory or (lambda service, options: webdriver.Chrome(service=service, options=options))
+        self._browsers: Dict[str, PooledBrowser] = {}
+        self._reserved: Set[str] = set()  # Perfiles cuyo Chrome se está arrancando
+        self._condition = threading.Condition()
+        self._reaper: Optional[threading.Thread] = None
+
+    def acquire(self, username: Optional[str] = None, timeout: float = ACQUIRE_TIMEOUT_SECONDS) -> PooledBrowser:
+        """Warm browser for the user's profile, or a new one; waits while the profile or the pool is busy"""
+        key = profile_key(username)
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._close_expired()
+                browser = self._browsers.get(key)
+                if browser is not None and not browser.in_use:
+                    if _alive(browser.driver):
+                        browser.in_use = True
+                        return browser
+                    del self._browsers[key]
+                    _quit(browser)
+                    continue
+                if browser is None and key not in self._reserved and self._make_room():
+                    self._reserved.add(key)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("No hay navegadores libres para el scraper")
+                self._condition.wait(min(remaining, 1.0))
+
+        try:
+            browser = self._start(key)
+        finally:
+            with self._condition:
+                self._reserved.discard(key)
+                self._condition.notify_all()
+        with self._condition:
+            browser.in_use = True
+            self._browsers[key] = browser
+            self._ensure_reaper()
+        return browser
+
+    def release(self, browser: PooledBrowser, discard: bool = False) -> None:
+        """Return a browser to the pool (discard=True closes it, e.g. after a crash)"""
+        with self._condition:
+            browser.in_use = False
+            browser.last_used = time.monotonic()
+            if discard or not _alive(browser.driver):
+                if self._browsers.get(browser.key) is browser:
+                    del self._browsers[browser.key]
+                _quit(browser)
+            self._condition.notify_all()
+
+    def close_all(self) -> None:
+        with self._condition:
+            browsers, self._browsers = list(self._browsers.values()), {}
+            self._condition.notify_all()
+        for browser in browsers:
+            _quit(browser)
+
+    def _start(self, key: str) -> PooledBrowser:
+        started = time.perf_counter()
+        path = chromedriver_path()
+        service = Service(path) if path else Service()
+        user_data_dir = profile_dir(key)
+        lock_fd, locked = lock_profile(user_data_dir)
+        if not locked:
+            # Otro proceso de la API tiene abierto el perfil y Chrome no admite dos instancias por --user-data-dir
+            user_data_dir = f"{user_data_dir}-{os.getpid()}"
+            logger.info(f"Profile {key} busy in another process, using {os.path.basename(user_data_dir)}")
+        try:
+            driver = self._driver_factory(service, scraper_options(user_data_dir, self.headless))
+        except BaseException:
+            _release_profile(user_data_dir, lock_fd, not locked)
+            raise
+        # Ocultar navigator.webdriver en cada documento, no solo en el actual
+        try:
+            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+                "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+            })
+        except Exception as e:
+            logger.debug(f"CDP not available: {e}")
+        logger.info(f"Browser started for profile {key} in {time.perf_counter() - started:.2f}s")
+        return PooledBrowser(
+            key=key, driver=driver, profile_path=user_data_dir, lock_fd=lock_fd, temporary_profile=not locked
+        )
+
+    def _ensure_reaper(self) -> None:
+        """Start the idle reaper if it is not running (called with the lock held)"""
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap, name="browser-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self) -> None:
+        """Close expired browsers even if no sync calls acquire() again; exits when the pool is empty"""
+        interval = max(1.0, min(REAPER_INTERVAL_SECONDS, self.idle_seconds / 2))
+        with self._condition:
+            while self._browsers:
+                self._condition.wait(interval)
+                self._close_expired()
+            self._reaper = None
+
+    def _close_expired(self) -> None:
+        """Close idle browsers past idle_seconds (called with the lock held)"""
+        now = time.monotonic()
+        for key, browser in list(self._browsers.items()):
+            if not browser.in_use and now - browser.last_used > self.idle_seconds:
+                del self._browsers[key]
+                _quit(browser)
+
+    def _make_room(self) -> bool:
+        """Whether one more browser fits, closing the least recently used idle one if needed"""
+        if len(self._browsers) + len(self._reserved) < self.max_size:
+            return True
+        idle = [b for b in self._browsers.values() if not b.in_use]
+        if not idle:
+            return False
+        oldest = min(idle, key=lambda b: b.last_used)
+        del self._browsers[oldest.key]
+        _quit(oldest)
+        return True
+
+
+def resume_session(
+    browser: PooledBrowser,
+    url: str,
+    logged_in: Callable[[webdriver.Chrome], bool],
+    timeout: float = 15
+) -> bool:
+    """Reuse the login of a warm browser: open a secure page and check the bank did not send us to login"""
+    if not browser.has_valid_session:
+        return False
+    browser.driver.get(url)
+    wait_page_ready(browser.driver, timeout)
+    if logged_in(browser.driver):
+        logger.info(f"Reusing logged-in session of profile {browser.key}")
+        return True
+    browser.mark_logged_out()
+    return False
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.close_all)
@@ -0,0 +1,196 @@
+# app/services/browser_waits.py
+"""
+Explicit condition waits for the Selenium scrapers (instead of fixed sleeps) and per-step
+timing, so a scrape lasts as long as the bank's pages take and the log shows where.
+"""
+import asyncio
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.support.ui import WebDriverWait
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 15
+POLL_SECONDS = 0.1
+# Sin cambios en el DOM durante este tiempo se da por terminado el renderizado JS
+DOM_QUIET_SECONDS = 0.5
+
+_off_loop = threading.local()
+
+
+def off_event_loop(method):
+    """
+    Run an async scraper step in a worker thread with its own event loop. The waits below
+    block while they poll the browser, so a step awaited from the server's loop would stall
+    every other request; steps awaited from inside an off-loop step run inline.
+    """
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        if getattr(_off_loop, "active", False):
+            return await method(*args, **kwargs)
+        return await asyncio.to_thread(_run_off_loop, method, args, kwargs)
+    return wrapper
+
+
+def _run_off_loop(method, args, kwargs):
+    _off_loop.active = True
+    try:
+        return asyncio.run(method(*args, **kwargs))
+    finally:
+        _off_loop.active = False
+
+
+def locator(selector: str) -> Tuple[str, str]:
+    """XPath for selectors starting with / or (, CSS otherwise (the convention of the scrapers)"""
+    return (By.XPATH, selector) if selector.startswith(("/", "(")) else (By.CSS_SELECTOR, selector)
+
+
+def wait_until(driver, condition: Callable, timeout: float = DEFAULT_TIMEOUT):
+    """Result of condition(driver) once truthy, or None on timeout"""
+    try:
+        return WebDriverWait(
+            driver, timeout, poll_frequency=POLL_SECONDS,
+            ignored_exceptions=(StaleElementReferenceException,)
+        ).until(condition)
+    except TimeoutException:
+        return None
+
+
+def wait_page_ready(driver, timeout: float = DEFAULT_TIMEOUT, quiet: float = DOM_QUIET_SECONDS) -> bool:
+    """document.readyState complete and the element count unchanged for `quiet` seconds"""
+    deadline = time.monotonic() + timeout
+    last_count, stable_since = None, None
+    while time.monotonic() < deadline:
+        try:
+            state, count = driver.execute_script(
+                "return [document.readyState, document.getElementsByTagName('*').length]"
+            )
+        except WebDriverException:
+            state, count = None, None  # Navegación en curso
+        now = time.monotonic()
+        if state == "complete":
+            if count == last_count:
+                if now - stable_since >= quiet:
+                    return True
+            else:
+                last_count, stable_since = count, now
+        else:
+            last_count = None
+        time.sleep(POLL_SECONDS)
+    logger.debug(f"Page not settled after {timeout}s: {driver.current_url}")
+    return False
+
+
+def wait_url_change(driver, old_url: str, timeout: float = DEFAULT_TIMEOUT) -> bool:
+    return bool(wait_until(driver, lambda d: d.current_url != old_url, timeout))
+
+
+def wait_url_contains(driver, fragments: Sequence[str], timeout: float = DEFAULT_TIMEOUT) -> Optional[str]:
+    """First fragment found in the current URL, or None on timeout"""
+    return wait_until(
+        driver, lambda d: next((f for f in fragments if f in d.current_url), None), timeout
+    )
+
+
+def _first_element(driver, selectors: Sequence[str], clickable: bool) -> Optional[WebElement]:
+    for selector in selectors:
+        for element in driver.find_elements(*locator(selector)):
+            try:
+                if element.is_displayed() and (not clickable or element.is_enabled()):
+                    return element
+            except StaleElementReferenceException:
+                continue
+    return None
+
+
+def wait_visible(driver, selectors: Sequence[str], timeout: float = DEFAULT_TIMEOUT) -> Optional[WebElement]:
+    """First displayed element matching any of the selectors"""
+    return wait_until(driver, lambda d: _first_element(d, selectors, False) or False, timeout)
+
+
+def wait_clickable(driver, selectors: Sequence[str], timeout: float = DEFAULT_TIMEOUT) -> Optional[WebElement]:
+    """First displayed and enabled element matching any of the selectors"""
+    return wait_until(driver, lambda d: _first_element(d, selectors, True) or False, timeout)
+
+
+def wait_gone(driver, element: WebElement, timeout: float = DEFAULT_TIMEOUT) -> bool:
+    """Element removed from the DOM or hidden (e.g. a cookie banner after accepting)"""
+    def gone(_):
+        try:
+            return not element.is_displayed()
+        except (StaleElementReferenceException, WebDriverException):
+            return True
+    return bool(wait_until(driver, gone, timeout))
+
+
+def click_and_wait(driver, element: WebElement, timeout: float = DEFAULT_TIMEOUT, use_js: bool = False) -> None:
+    """Click and wait until the page (new or updated in place) has settled"""
+    if use_js:
+        driver.execute_script("arguments[0].click();", element)
+    else:
+        element.click()
+    wait_page_ready(driver, timeout)
+
+
+# Cookie que OneTrust guarda al aceptar: con perfiles persistentes el banner ya no vuelve a salir
+ONETRUST_CONSENT_COOKIE = "OptanonAlertBoxClosed"
+COOKIE_BANNER_TIMEOUT = 4
+
+
+def accept_cookie_banner(
+    driver,
+    selectors: Sequence[str],
+    timeout: float = COOKIE_BANNER_TIMEOUT,
+    consent_cookie: Optional[str] = ONETRUST_CONSENT_COOKIE
+) -> bool:
+    """Click the cookie banner's accept button when it shows up; skipped if consent is already stored"""
+    try:
+        if consent_cookie and driver.get_cookie(consent_cookie):
+            return False
+    except WebDriverException:
+        pass
+    button = wait_clickable(driver, selectors, timeout)
+    if not button:
+        return False
+    try:
+        button.click()
+    except WebDriverException:
+        driver.execute_script("arguments[0].click();", button)
+    wait_gone(driver, button, timeout)
+    return True
+
+
+class StepTimer:
+    """Wall time of each scrape step; logged as a summary and returned to callers"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.steps: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def step(self, label: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((label, time.perf_counter() - started))
+
+    def as_dict(self) -> Dict:
+        return {
+            "total_seconds": round(sum(seconds for _, seconds in self.steps), 3),
+            "steps": [{"step": label, "seconds": round(seconds, 3)} for label, seconds in self.steps],
+        }
+
+    def log_summary(self) -> None:
+        if self.steps:
+            detail = ", ".join(f"{label} {seconds:.2f}s" for label, seconds in self.steps)
+            logger.info(f"{self.name}: {sum(s for _, s in self.steps):.2f}s ({detail})")
+
@@ -0,0 +1,68 @@
+# app/services/bulk_write.py
+from typing import Dict, List, Optional, Type
+
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel
+
+from ..config import settings
+
+
+def _column_defaults(table) -> Dict[str, object]:
+    """Scalar Python-side defaults of the table (e.g. is_classified=True, source='manual')"""
+    defaults = {}
+    for column in table.columns:
+        if column.primary_key:
+            continue
+        default = column.default
+        if default is not None and default.is_scalar:
+            defaults[column.key] = default.arg
+        else:
+            defaults[column.key] = None
+    return defaults
+
+
+def _complete_rows(table, rows: List[dict]) -> List[dict]:
+    """Every row with the same keys, so the batch compiles to a single INSERT"""
+    defaults = _column_defaults(table)
+    present = set().union(*rows)
+    keys = [key for key, value in defaults.items() if key in present or value is not None]
+    return [{key: row.get(key, defaults[key]) for key in keys} for row in rows]
+
+
+def bulk_insert(
+    session: Session,
+    model: Type[SQLModel],
+    rows: List[dict],
+    batch_size: Optional[int] = None,
+    return_ids: bool = False
+) -> List[int]:
+    """
+    Insert plain dict rows with executemany-style INSERTs of batch_size rows, inside the
+    session's transaction (the caller commits once). No ORM objects or mapper events are
+    involved, so derived columns such as FinancialMovement.dedup_key must be in the rows.
+    With return_ids the new primary keys are returned in row order, through RETURNING
+    where the database supports it.
+    """
+    if not rows:
+        return []
+    table = model.__table__
+    batch_size = batch_size or settings.bulk_insert_batch_size
+    rows = _complete_rows(table, rows)
+    dialect = session.get_bind().dialect
+    use_returning = return_ids and dialect.insert_executemany_returning_sort_by_parameter_order
+
+    ids: List[int] = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if use_returning:
+            result = session.exec(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), params=batch
+            )
+            ids.extend(result.scalars().all())
+        elif return_ids:
+            # Sin RETURNING en executemany: una sentencia por fila para conocer el id
+            for row in batch:
+                ids.extend(session.exec(insert(table).values(**row)).inserted_primary_key)
+        else:
+            session.exec(insert(table), params=batch)
+    return ids
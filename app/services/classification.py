@@ -0,0 +1,201 @@
+# app/services/classification.py
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlmodel import Session, select
+
+from ..models import Property, ClassificationRule
+
+
+def normalize_concept(text) -> str:
+    """Normalize a concept or keyword for case-insensitive matching"""
+    if text is None:
+        return ""
+    return str(text).strip().lower()
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """Detached snapshot of a ClassificationRule, safe to share across sessions"""
+    id: Optional[int]
+    property_id: Optional[int]
+    keyword: str
+    category: str
+    subcategory: Optional[str] = None
+    tenant_name: Optional[str] = None
+
+    @classmethod
+    def from_rule(cls, rule: ClassificationRule) -> "CompiledRule":
+        return cls(
+            id=rule.id,
+            property_id=rule.property_id,
+            keyword=rule.keyword,
+            category=rule.category,
+            subcategory=rule.subcategory,
+            tenant_name=rule.tenant_name,
+        )
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of keywords.
+    Scanning a text costs O(len(text) + matches), independent of the number of keywords.
+    """
+
+    def __init__(self, keywords: Sequence[str]):
+        self.keywords = list(keywords)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+
+        # Trie
+        for index, keyword in enumerate(self.keywords):
+            if not keyword:
+                continue
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] = self._output[state] + (index,)
+
+        # Failure links (BFS), merging outputs of the fallback states
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                if self._output[self._fail[next_state]]:
+                    self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> set:
+        """Return the indexes of every keyword contained in text"""
+        found = set()
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class ClassificationEngine:
+    """
+    Classifies movement concepts against a set of rules compiled into one automaton.
+    The best rule is the one with the longest keyword (best coverage score); ties go to
+    the rule that comes first.
+    """
+
+    def __init__(self, rules: Iterable[CompiledRule]):
+        self.rules = [rule for rule in rules if normalize_concept(rule.keyword)]
+
+        keyword_index: Dict[str, int] = {}
+        self._rules_by_keyword: List[List[int]] = []
+        for rule_index, rule in enumerate(self.rules):
+            keyword = normalize_concept(rule.keyword)
+            if keyword not in keyword_index:
+                keyword_index[keyword] = len(self._rules_by_keyword)
+                self._rules_by_keyword.append([])
+            self._rules_by_keyword[keyword_index[keyword]].append(rule_index)
+
+        self._automaton = KeywordAutomaton(list(keyword_index.keys()))
+
+    def match(
+        self,
+        concept: str,
+        property_id: Optional[int] = None,
+        min_score: float = 0.0
+    ) -> Tuple[Optional[CompiledRule], float]:
+        """
+        Return (rule, score) for the best matching rule, or (None, 0.0).
+        score = len(keyword) / len(concept); only matches with score > min_score count.
+        """
+        text = normalize_concept(concept)
+        if not text or not self.rules:
+            return None, 0.0
+
+        best_index = None
+        best_length = 0
+        for keyword_id in self._automaton.find(text):
+            length = len(self._automaton.keywords[keyword_id])
+            # Rules sharing a keyword are kept in order, so the first eligible one wins
+            for rule_index in self._rules_by_keyword[keyword_id]:
+                if property_id is not None and self.rules[rule_index].property_id != property_id:
+                    continue
+                if length > best_length or (length == best_length and rule_index < best_index):
+                    best_index = rule_index
+                    best_length = length
+                break
+
+        if best_index is None:
+            return None, 0.0
+
+        score = best_length / len(text)
+        if score <= min_score:
+            return None, 0.0
+        return self.rules[best_index], score
+
+    def classify_many(
+        self,
+        concepts: Iterable[str],
+        property_id: Optional[int] = None,
+        min_score: float = 0.0
+    ) -> List[Tuple[Optional[CompiledRule], float]]:
+        """Classify a batch of concepts"""
+        return [self.match(concept, property_id=property_id, min_score=min_score) for concept in concepts]
+
+
+# -------- compiled rules cache (per process) --------
+_engine_cache: Dict[int, ClassificationEngine] = {}
+_cache_lock = Lock()
+
+
+def load_user_rules(session: Session, user_id: int) -> List[CompiledRule]:
+    """Load the active classification rules of every property owned by the user"""
+    rules = session.exec(
+        select(ClassificationRule)
+        .join(Property, ClassificationRule.property_id == Property.id)
+        .where(Property.owner_id == user_id)
+        .where(ClassificationRule.is_active == True)
+        .order_by(ClassificationRule.id)
+    ).all()
+    return [CompiledRule.from_rule(rule) for rule in rules]
+
+
+def get_user_engine(session: Session, user_id: int) -> ClassificationEngine:
+    """Return the compiled classification engine for a user, building it on first use"""
+    engine = _engine_cache.get(user_id)
+    if engine is not None:
+        return engine
+
+    # Se comprueba y construye con el lock: una sola construcción por usuario, y una
+    # invalidación no puede colarse entre la carga de reglas y el guardado en caché
+    with _cache_lock:
+        engine = _engine_cache.get(user_id)
+        if engine is None:
+            engine = ClassificationEngine(load_user_rules(session, user_id))
+            _engine_cache[user_id] = engine
+    return engine
+
+
+def invalidate_user_rules(user_id: int) -> None:
+    """Drop the compiled engine of a user; call after creating, updating or deleting rules"""
+    with _cache_lock:
+        _engine_cache.pop(user_id, None)
@@ -0,0 +1,340 @@
+# app/services/document_store.py
+"""
+Content-addressed storage for uploaded documents (contract PDFs, tenant documents, photos).
+
+Uploads are streamed in chunks to a temporary file while computing their SHA-256, off the
+event loop, and then stored under a path derived from the hash (sha256/ab/cd/<digest>),
+so uploading the same file twice keeps a single copy. Database rows reference the blob as
+"sha256:<digest>"; older rows keep plain file paths and are served as before.
+
+Backends: local filesystem (default) or any S3-compatible service (AWS, MinIO...),
+selected with DOCUMENT_STORAGE_BACKEND. Downloads support Range requests and use the
+content hash as a strong ETag.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from sqlmodel import Session, func, select
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from ..config import settings
+from ..models import Property, RentalContract, TenantDocument
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+BLOB_REF_PREFIX = "sha256:"
+DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+# Documentos privados: solo el navegador del usuario guarda copia; el contenido de un hash no cambia
+PRIVATE_CACHE = "private, max-age=31536000, immutable"
+
+
+class BlobTooLarge(Exception):
+    """The upload exceeded the allowed size; nothing was stored"""
+
+
+@dataclass
+class StoredBlob:
+    digest: str
+    size: int
+    created: bool  # False si el contenido ya estaba guardado (subida duplicada)
+
+    @property
+    def ref(self) -> str:
+        return blob_ref(self.digest)
+
+
+def blob_ref(digest: str) -> str:
+    return f"{BLOB_REF_PREFIX}{digest}"
+
+
+def parse_blob_ref(value: Optional[str]) -> Optional[str]:
+    """Digest of a "sha256:<digest>" reference; None for legacy file paths"""
+    if value and value.startswith(BLOB_REF_PREFIX):
+        digest = value[len(BLOB_REF_PREFIX):]
+        if DIGEST_RE.fullmatch(digest):
+            return digest
+    return None
+
+
+def blob_key(digest: str) -> str:
+    """Content-addressed path; two levels of fan-out keep directories small"""
+    return f"sha256/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+class BlobStore:
+    """Storage backend interface; blobs are immutable and addressed by their SHA-256"""
+
+    # Directorio para los temporales de subida (None: el del sistema)
+    staging_dir: Optional[str] = None
+
+    def put_file(self, path: str, digest: str) -> bool:
+        """Move a fully written temporary file into the store; False if the blob already existed"""
+        raise NotImplementedError
+
+    def size(self, digest: str) -> Optional[int]:
+        """Blob size in bytes, None if it does not exist"""
+        raise NotImplementedError
+
+    def iter_range(self, digest: str, start: int, end: int) -> Iterator[bytes]:
+        """Bytes start..end (inclusive) in chunks"""
+        raise NotImplementedError
+
+    def delete(self, digest: str) -> None:
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.staging_dir = os.path.join(self.root, "tmp")
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, *blob_key(digest).split("/"))
+
+    def put_file(self, path: str, digest: str) -> bool:
+        target = self.path(digest)
+        if os.path.exists(target):
+            os.remove(path)
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Mismo sistema de ficheros que staging_dir: el rename es atómico
+        os.replace(path, target)
+        return True
+
+    def size(self, digest: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(digest))
+        except OSError:
+            return None
+
+    def iter_range(self, digest: str, start: int, end: int) -> Iterator[bytes]:
+        with open(self.path(digest), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, digest: str) -> None:
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore(BlobStore):
+    """Any S3-compatible service; point S3_ENDPOINT_URL at MinIO for a local stand-in"""
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        region: Optional[str] = None,
+        client=None
+    ):
+        if client is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError("El almacenamiento S3 requiere boto3 (pip install boto3)") from e
+            client = boto3.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region,
+            )
+        self.client = client
+        self.bucket = bucket
+
+    def _head(self, digest: str) -> Optional[dict]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=blob_key(digest))
+        except Exception as e:
+            status = getattr(e, "response", {}).get("ResponseMetadata", {}).get("HTTPStatusCode")
+            if status == 404:
+                return None
+            raise
+
+    def put_file(self, path: str, digest: str) -> bool:
+        try:
+            if self._head(digest) is not None:
+                return False
+            # upload_file hace multipart en ficheros grandes, sin cargarlos en memoria
+            self.client.upload_file(path, self.bucket, blob_key(digest))
+            return True
+        finally:
+            os.remove(path)
+
+    def size(self, digest: str) -> Optional[int]:
+        head = self._head(digest)
+        return head["ContentLength"] if head else None
+
+    def iter_range(self, digest: str, start: int, end: int) -> Iterator[bytes]:
+        body = self.client.get_object(
+            Bucket=self.bucket, Key=blob_key(digest), Range=f"bytes={start}-{end}"
+        )["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, digest: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=blob_key(digest))
+
+
+@lru_cache(maxsize=1)
+def get_blob_store() -> BlobStore:
+    if settings.document_storage_backend == "s3":
+        return S3BlobStore(
+            bucket=settings.s3_bucket,
+            endpoint_url=settings.s3_endpoint_url,
+            access_key=settings.s3_access_key,
+            secret_key=settings.s3_secret_key,
+            region=settings.s3_region,
+        )
+    return LocalBlobStore(settings.document_storage_dir)
+
+
+def store_stream(fileobj, max_size: Optional[int] = None, store: Optional[BlobStore] = None) -> StoredBlob:
+    """Copy a file object into the store in chunks, hashing on the way (blocking: run in a thread)"""
+    store = store or get_blob_store()
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(prefix="upload-", dir=store.staging_dir)
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise BlobTooLarge(f"Upload exceeds {max_size} bytes")
+                hasher.update(chunk)
+                tmp.write(chunk)
+        digest = hasher.hexdigest()
+        created = store.put_file(tmp_path, digest)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(f"Stored blob {digest[:12]} ({size} bytes, {'new' if created else 'duplicate'})")
+    return StoredBlob(digest=digest, size=size, created=created)
+
+
+def blob_in_use(session: Session, digest: str) -> bool:
+    """Whether any document, contract or property photo still references the blob"""
+    ref = blob_ref(digest)
+    references = (
+        select(func.count()).select_from(TenantDocument).where(TenantDocument.file_path == ref),
+        select(func.count()).select_from(RentalContract).where(RentalContract.contract_pdf_path == ref),
+        select(func.count()).select_from(Property).where(Property.photo.contains(digest)),
+    )
+    return any(session.exec(query).one() for query in references)
+
+
+def release_blob(session: Session, digest: Optional[str], store: Optional[BlobStore] = None) -> bool:
+    """Delete the blob once no row references it (call after committing the row change)"""
+    if not digest or blob_in_use(session, digest):
+        return False
+    (store or get_blob_store()).delete(digest)
+    return True
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) of a single "bytes=" range; None to send the whole file.
+    Raises ValueError if the range cannot be satisfied."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        # Varios rangos: se responde el fichero completo (permitido por RFC 9110)
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None  # Cabecera mal formada: se ignora
+    if start is None:
+        if end is None:
+            return None
+        if end == 0:
+            raise ValueError(header)
+        start, end = max(size - end, 0), size - 1  # "bytes=-N": los últimos N bytes
+    else:
+        end = size - 1 if end is None else min(end, size - 1)
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def blob_response(
+    request: Request,
+    digest: str,
+    filename: Optional[str] = None,
+    media_type: Optional[str] = None,
+    cache_control: str = PRIVATE_CACHE,
+    inline: bool = False,
+    vary: Optional[str] = None,
+    store: Optional[BlobStore] = None
+) -> Optional[Response]:
+    """Download response with ETag, If-None-Match and Range support; None if the blob is missing"""
+    store = store or get_blob_store()
+    size = store.size(digest)
+    if size is None:
+        return None
+
+    etag = f'"{digest}"'
+    media_type = media_type or (mimetypes.guess_type(filename)[0] if filename else None) or "application/octet-stream"
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = vary
+    if filename:
+        disposition = "inline" if inline else "attachment"
+        headers["Content-Disposition"] = f"{disposition}; filename*=utf-8''{quote(filename, safe='')}"
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if size == 0:
+        return Response(content=b"", media_type=media_type, headers=headers)
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        store.iter_range(digest, start, end),
+        status_code=206 if byte_range else 200,
+        media_type=media_type,
+        headers=headers,
+    )
+
@@ -0,0 +1,59 @@
+# app/services/euribor_cache.py
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from ..models import EuriborRate
+
+# Los tipos se publican una vez al mes; otro proceso que los cambie se ve como mucho tras este tiempo
+EURIBOR_TTL_SECONDS = 3600
+
+
+@dataclass(frozen=True)
+class EuriborReference:
+    """Latest 12M Euribor and the latest one at least a year before `as_of` (percent)"""
+    as_of: date
+    latest: Optional[float]
+    latest_date: Optional[date]
+    year_ago: Optional[float]
+    year_ago_date: Optional[date]
+
+
+_reference_cache: Dict[date, Tuple[float, EuriborReference]] = {}
+_cache_lock = Lock()
+
+
+def _latest_on_or_before(session: Session, day: Optional[date]) -> Tuple[Optional[float], Optional[date]]:
+    query = select(EuriborRate.rate_12m, EuriborRate.date).order_by(EuriborRate.date.desc())
+    if day is not None:
+        query = query.where(EuriborRate.date <= day)
+    row = session.exec(query).first()
+    return (row[0], row[1]) if row else (None, None)
+
+
+def euribor_reference(session: Session, as_of: Optional[date] = None) -> EuriborReference:
+    """Process-wide cached latest / year-ago Euribor (two indexed queries on a miss)"""
+    as_of = as_of or date.today()
+    cached = _reference_cache.get(as_of)
+    now = time.monotonic()
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    latest, latest_date = _latest_on_or_before(session, None)
+    year_ago, year_ago_date = _latest_on_or_before(session, as_of - timedelta(days=365))
+    reference = EuriborReference(as_of, latest, latest_date, year_ago, year_ago_date)
+    with _cache_lock:
+        # Solo interesa la fecha de hoy: las de días anteriores se descartan
+        _reference_cache.clear()
+        _reference_cache[as_of] = (now + EURIBOR_TTL_SECONDS, reference)
+    return reference
+
+
+def invalidate_euribor_cache() -> None:
+    """Drop the cached reference; call after creating, updating or deleting EuriborRate rows"""
+    with _cache_lock:
+        _reference_cache.clear()
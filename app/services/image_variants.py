@@ -0,0 +1,245 @@
+# app/services/image_variants.py
+"""
+Derived sizes of property photos: a thumbnail and a medium image in WebP (and AVIF when
+Pillow is built with it), rendered once per photo in a process pool and stored in the
+document store next to the original. EXIF is dropped from the derivatives (orientation is
+applied first), and the dimensions of every variant are recorded in ImageVariant.
+
+GET /uploads/photo/<digest>.<ext>?w=<px> picks the smallest variant at least that wide
+in the best format the browser accepts, so listings download kilobytes, not the original.
+"""
+import asyncio
+import atexit
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from ..config import settings
+from ..models import ImageVariant, Property
+from .document_store import BlobStore, get_blob_store, release_blob, store_stream
+
+logger = logging.getLogger(__name__)
+
+ORIGINAL = "original"
+# Formato anotado en la fila "original" de un fichero que Pillow no pudo decodificar
+UNREADABLE = "unreadable"
+# (etiqueta, ancho máximo): miniatura para listados y tamaño medio para fichas
+VARIANT_WIDTHS: Tuple[Tuple[str, int], ...] = (("thumb", 320), ("medium", 1280))
+# Preferencia cuando el navegador acepta varios formatos
+FORMAT_PREFERENCE = ("avif", "webp")
+SAVE_OPTIONS = {
+    "webp": {"quality": 80, "method": 4},
+    "avif": {"quality": 60, "speed": 6},
+}
+
+
+class InvalidImage(Exception):
+    """The upload is not an image Pillow can decode"""
+
+
+@dataclass
+class RenderedVariant:
+    label: str
+    format: str
+    width: int
+    height: int
+    data: bytes
+
+
+@lru_cache(maxsize=1)
+def output_formats() -> Tuple[str, ...]:
+    """WebP always; AVIF only if this Pillow build has libavif"""
+    from PIL import features
+    return ("avif", "webp") if features.check("avif") else ("webp",)
+
+
+def render_variants(data: bytes, formats: Sequence[str]) -> Tuple[Tuple[str, int, int], List[RenderedVariant]]:
+    """((format, width, height) of the original, derivatives); runs in the worker processes"""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            original_format = (source.format or "").lower()
+            # La orientación EXIF se aplica a los píxeles: las derivadas se guardan sin EXIF
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise InvalidImage(str(e)) from e
+
+    width, height = image.size
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = image.mode in ("LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    variants = []
+    rendered_widths = set()
+    for label, max_width in VARIANT_WIDTHS:
+        target_width = min(max_width, width)
+        if target_width in rendered_widths:
+            continue  # Foto más pequeña que el tamaño: la variante anterior ya la cubre
+        rendered_widths.add(target_width)
+        target_height = max(1, round(height * target_width / width))
+        resized = image if target_width == width else image.resize(
+            (target_width, target_height), Image.Resampling.LANCZOS
+        )
+        for fmt in formats:
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt.upper(), **SAVE_OPTIONS.get(fmt, {}))
+            variants.append(RenderedVariant(label, fmt, target_width, target_height, buffer.getvalue()))
+    return (original_format, width, height), variants
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _executor() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if _pool is None and settings.image_workers > 0:
+        # spawn: el servidor tiene hilos, no se hace fork de su estado
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.image_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+    return _pool
+
+
+async def _render(data: bytes):
+    pool = _executor()
+    if pool is None:
+        return await asyncio.to_thread(render_variants, data, output_formats())
+    return await asyncio.get_running_loop().run_in_executor(pool, render_variants, data, output_formats())
+
+
+def variants_for(session: Session, digest: str) -> List[ImageVariant]:
+    return list(session.exec(
+        select(ImageVariant)
+        .where(ImageVariant.source_digest == digest)
+        .order_by(ImageVariant.width, ImageVariant.format)
+    ).all())
+
+
+def is_registered_photo(session: Session, digest: str) -> bool:
+    """Whether the blob was uploaded as a photo or a property points at it. The store also
+    holds contract PDFs and tenant documents, which the public photo URL must not serve."""
+    uploaded = session.exec(
+        select(ImageVariant.id)
+        .where(ImageVariant.source_digest == digest)
+        .where(ImageVariant.label == ORIGINAL)
+    ).first()
+    if uploaded is not None:
+        return True
+    return session.exec(select(Property.id).where(Property.photo.contains(digest))).first() is not None
+
+
+def _read_blob(store: BlobStore, digest: str) -> Optional[bytes]:
+    size = store.size(digest)
+    if size is None:
+        return None
+    return b"".join(store.iter_range(digest, 0, size - 1)) if size else b""
+
+
+async def ensure_variants(
+    session: Session, digest: str, store: Optional[BlobStore] = None, record_invalid: bool = False
+) -> List[ImageVariant]:
+    """
+    Variants of a stored photo, rendering them first if needed; raises InvalidImage for
+    non-images. With record_invalid the failure is stored instead (an "original" row with
+    format UNREADABLE and no derivatives), so it is decoded only once.
+    """
+    existing = variants_for(session, digest)
+    if existing:
+        if not record_invalid and existing[0].format == UNREADABLE:
+            raise InvalidImage(f"{digest} is not a readable image")
+        return existing
+    store = store or get_blob_store()
+    data = await asyncio.to_thread(_read_blob, store, digest)
+    if data is None:
+        return []
+
+    try:
+        (original_format, width, height), rendered = await _render(data)
+    except InvalidImage:
+        if not record_invalid:
+            raise
+        (original_format, width, height), rendered = (UNREADABLE, 0, 0), []
+    rows = [ImageVariant(
+        source_digest=digest, label=ORIGINAL, format=original_format,
+        width=width, height=height, digest=digest, size=len(data)
+    )]
+    for variant in rendered:
+        blob = await asyncio.to_thread(store_stream, io.BytesIO(variant.data), None, store)
+        rows.append(ImageVariant(
+            source_digest=digest, label=variant.label, format=variant.format,
+            width=variant.width, height=variant.height, digest=blob.digest, size=blob.size
+        ))
+    session.add_all(rows)
+    try:
+        session.commit()
+    except IntegrityError:
+        # Otra petición generó las mismas variantes a la vez (mismo contenido, mismos blobs)
+        session.rollback()
+        return variants_for(session, digest)
+    logger.info(
+        f"Photo {digest[:12]}: {width}x{height} {original_format}, "
+        f"{len(rendered)} variants ({sum(v.size for v in rows[1:]) // 1024} KB from {len(data) // 1024} KB)"
+    )
+    return variants_for(session, digest)
+
+
+def accepted_formats(accept: Optional[str]) -> List[str]:
+    """Derivative formats the browser accepts (from the Accept header), in preference order"""
+    accept = (accept or "").lower()
+    return [fmt for fmt in FORMAT_PREFERENCE if f"image/{fmt}" in accept]
+
+
+def pick_variant(variants: Sequence[ImageVariant], width: int, accept: Optional[str]) -> Optional[ImageVariant]:
+    """Smallest derivative at least `width` wide in the preferred accepted format; None = serve the original"""
+    original = next((v for v in variants if v.label == ORIGINAL), None)
+    for fmt in accepted_formats(accept):
+        candidates = sorted((v for v in variants if v.label != ORIGINAL and v.format == fmt), key=lambda v: v.width)
+        if not candidates:
+            continue
+        wide_enough = [v for v in candidates if v.width >= width]
+        if wide_enough:
+            return wide_enough[0]
+        # Piden más que la variante mayor: si el original es más grande, el original
+        if original and original.width > candidates[-1].width:
+            return None
+        return candidates[-1]
+    return None
+
+
+def describe_variants(variants: Sequence[ImageVariant]) -> dict:
+    """Dimensions of the original and the derivatives, for API responses"""
+    original = next((v for v in variants if v.label == ORIGINAL), None)
+    return {
+        "width": original.width if original else None,
+        "height": original.height if original else None,
+        "variants": [
+            {"label": v.label, "format": v.format, "width": v.width, "height": v.height, "size": v.size}
+            for v in variants if v.label != ORIGINAL
+        ],
+    }
+
+
+def release_photo(session: Session, digest: str, store: Optional[BlobStore] = None) -> bool:
+    """Delete a photo and its derivatives once no property references it"""
+    store = store or get_blob_store()
+    if not release_blob(session, digest, store):
+        return False
+    variants = variants_for(session, digest)
+    for variant in variants:
+        session.delete(variant)
+    session.commit()
+    for variant_digest in {v.digest for v in variants if v.label != ORIGINAL}:
+        still_used = session.exec(select(ImageVariant.id).where(ImageVariant.digest == variant_digest)).first()
+        if still_used is None:
+            store.delete(variant_digest)
+    return True
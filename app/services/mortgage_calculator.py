@@ -1,12 +1,269 @@
 # app/services/mortgage_calculator.py
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
-from typing import List, Dict, Optional
+from threading import Lock
+from typing import List, Dict, Optional, Tuple
 import pandas as pd
 import numpy as np
 
 from ..models import MortgageDetails, MortgageRevision, MortgagePrepayment
 
+# Cuadros de amortización memorizados (LRU), clave = contenido de hipoteca, revisiones y prepagos
+SCHEDULE_CACHE_SIZE = 512
+# El cuadro termina cuando el saldo pendiente baja de este importe
+BALANCE_EPSILON = 0.01
+
+
+@dataclass(frozen=True)
+class AmortizationSchedule:
+    """
+    Columnar amortization schedule: one entry per month in read-only NumPy arrays.
+    segments holds the (start, end) month indexes of each stretch with a constant rate
+    and no prepayment, the unit the schedule is computed in.
+    """
+    months: np.ndarray  # datetime64[M]
+    annual_rate: np.ndarray
+    payment: np.ndarray
+    interest: np.ndarray
+    principal: np.ndarray
+    balance: np.ndarray
+    prepayment: np.ndarray
+    segments: Tuple[Tuple[int, int], ...] = ()
+
+    def __len__(self) -> int:
+        return len(self.months)
+
+    @property
+    def month_index(self) -> np.ndarray:
+        return np.arange(len(self.months))
+
+    @property
+    def total_payments(self) -> float:
+        return float(self.payment.sum())
+
+    @property
+    def total_interest(self) -> float:
+        return float(self.interest.sum())
+
+    @property
+    def total_principal(self) -> float:
+        return float(self.principal.sum())
+
+    @property
+    def total_prepayments(self) -> float:
+        return float(self.prepayment.sum())
+
+    def index_as_of(self, as_of_date: date) -> int:
+        """Index of the month containing as_of_date, or the closest past month (0 if none)"""
+        target = np.datetime64(as_of_date, "M")
+        return max(int(np.searchsorted(self.months, target, side="right")) - 1, 0)
+
+    def to_records(self) -> List[Dict]:
+        """The schedule as the list of dicts the endpoints return"""
+        months = pd.DatetimeIndex(self.months.astype("datetime64[ns]"))
+        return [
+            {
+                "month": month,
+                "payment": payment,
+                "interest": interest,
+                "principal": principal,
+                "balance": balance,
+                "annual_rate": annual_rate,
+                "prepayment": prepayment
+            }
+            for month, payment, interest, principal, balance, annual_rate, prepayment in zip(
+                months, self.payment.tolist(), self.interest.tolist(), self.principal.tolist(),
+                self.balance.tolist(), self.annual_rate.tolist(), self.prepayment.tolist()
+            )
+        ]
+
+
+def _empty_schedule() -> AmortizationSchedule:
+    empty = np.zeros(0)
+    return AmortizationSchedule(np.zeros(0, dtype="datetime64[M]"), empty, empty, empty, empty, empty, empty)
+
+
+def _monthly_rates(
+    mortgage: MortgageDetails,
+    revisions: List[MortgageRevision],
+    months: np.ndarray
+) -> np.ndarray:
+    """Annual rate (%) of every month: margin for fixed mortgages, else the revision in force"""
+    if mortgage.mortgage_type == "Fija" or not revisions:
+        return np.full(len(months), float(mortgage.margin_percentage))
+    revisions_sorted = sorted(revisions, key=lambda x: x.effective_date)
+    effective = np.array([np.datetime64(r.effective_date, "D") for r in revisions_sorted])
+    revision_rates = np.array([(r.euribor_rate or 0.0) + (r.margin_rate or 0.0) for r in revisions_sorted])
+    # La primera revisión rige también antes de su fecha efectiva
+    index = np.searchsorted(effective, months.astype("datetime64[D]"), side="right") - 1
+    return revision_rates[np.clip(index, 0, None)]
+
+
+def _segment_balances(balance: float, monthly_rate: float, months_remaining: int, length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Opening balance and payment of each month of a constant-rate stretch, recomputing the
+    annuity every month as calculate_monthly_payment does (closed form for rate > 0).
+    """
+    k = np.arange(length)
+    if monthly_rate > 0:
+        payment = balance * monthly_rate / (1 - (1 + monthly_rate) ** (-months_remaining))
+        growth = (1 + monthly_rate) ** k
+        opening = balance * growth - payment * (growth - 1) / monthly_rate
+        return opening, np.full(length, payment)
+    # Tipo nulo o negativo: cuota = saldo / meses restantes
+    remaining = months_remaining - k
+    factors = np.empty(length)
+    factors[0] = 1.0
+    factors[1:] = 1 + monthly_rate - 1 / remaining[:-1]
+    opening = balance * np.cumprod(factors)
+    return opening, opening / remaining
+
+
+def schedule_grid(
+    mortgage: MortgageDetails,
+    revisions: List[MortgageRevision],
+    prepayments: List[MortgagePrepayment]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Months of the loan term (datetime64[M]) with the annual rate (%) and prepayments of each month"""
+    start = np.datetime64(mortgage.start_date, "M")
+    end = np.datetime64(mortgage.end_date, "M")
+    total_months = max(int((end - start).astype(int)) + 1, 0)
+    months = start + np.arange(total_months)
+    annual_rates = _monthly_rates(mortgage, revisions, months)
+
+    # Prepagos agrupados por mes del cuadro (los de fuera del plazo se ignoran)
+    prepayment_by_month = np.zeros(total_months)
+    for prep in prepayments:
+        i = int((np.datetime64(prep.payment_date, "M") - start).astype(int))
+        if 0 <= i < total_months:
+            prepayment_by_month[i] += prep.amount
+    return months, annual_rates, prepayment_by_month
+
+
+def _build_schedule(
+    mortgage: MortgageDetails,
+    revisions: List[MortgageRevision],
+    prepayments: List[MortgagePrepayment]
+) -> AmortizationSchedule:
+    if mortgage.initial_amount <= 0:
+        return _empty_schedule()
+    months, annual_rates, prepayment_by_month = schedule_grid(mortgage, revisions, prepayments)
+    return schedule_from_rates(float(mortgage.initial_amount), months, annual_rates, prepayment_by_month)
+
+
+def schedule_from_rates(
+    initial_amount: float,
+    months: np.ndarray,
+    annual_rates: np.ndarray,
+    prepayment_by_month: np.ndarray
+) -> AmortizationSchedule:
+    """Schedule of a loan over the given month grid, annual rates (%) and prepayments per month"""
+    total_months = len(months)
+    if initial_amount <= 0 or total_months == 0:
+        return _empty_schedule()
+    monthly_rates = annual_rates / 100.0 / 12.0
+
+    # Tramos: cambia el tipo o el mes siguiente a un prepago
+    breaks = set((np.flatnonzero(np.diff(annual_rates)) + 1).tolist())
+    breaks.update((np.flatnonzero(prepayment_by_month[:-1] > 0) + 1).tolist())
+    bounds = [0] + sorted(breaks) + [total_months]
+
+    payment = np.zeros(total_months)
+    interest = np.zeros(total_months)
+    principal = np.zeros(total_months)
+    balance = np.zeros(total_months)
+    prepayment = np.zeros(total_months)
+    segments = []
+    current = float(initial_amount)
+    last = total_months - 1
+
+    for seg_start, seg_end in zip(bounds[:-1], bounds[1:]):
+        if current <= BALANCE_EPSILON:
+            last = seg_start - 1
+            break
+        rate = monthly_rates[seg_start]
+        opening, seg_payment = _segment_balances(current, rate, total_months - seg_start, seg_end - seg_start)
+        seg_interest = opening * rate
+        seg_principal = np.maximum(seg_payment - seg_interest, 0.0)
+        # No se amortiza más que el saldo pendiente
+        over = seg_principal > opening
+        seg_principal = np.where(over, opening, seg_principal)
+        seg_payment = np.where(over, seg_interest + seg_principal, seg_payment)
+        seg_balance = np.maximum(opening - seg_principal, 0.0)
+
+        window = slice(seg_start, seg_end)
+        payment[window] = seg_payment
+        interest[window] = seg_interest
+        principal[window] = seg_principal
+        balance[window] = seg_balance
+
+        end_index = seg_end - 1
+        amount = min(prepayment_by_month[end_index], balance[end_index])
+        if amount > 0:
+            balance[end_index] -= amount
+            principal[end_index] += amount
+            payment[end_index] += amount
+            prepayment[end_index] = amount
+        segments.append((seg_start, seg_end))
+
+        paid_off = np.flatnonzero(balance[window] <= BALANCE_EPSILON)
+        if len(paid_off):
+            last = seg_start + int(paid_off[0])
+            segments[-1] = (seg_start, last + 1)
+            break
+        current = float(balance[end_index])
+
+    n = last + 1
+    arrays = [months[:n], annual_rates[:n], payment[:n], interest[:n], principal[:n], balance[:n], prepayment[:n]]
+    for array in arrays:
+        array.flags.writeable = False
+    return AmortizationSchedule(*arrays, segments=tuple(segments))
+
+
+def _schedule_key(
+    mortgage: MortgageDetails,
+    revisions: List[MortgageRevision],
+    prepayments: List[MortgagePrepayment]
+) -> tuple:
+    return (
+        mortgage.id, mortgage.mortgage_type, mortgage.initial_amount, mortgage.margin_percentage,
+        mortgage.start_date, mortgage.end_date,
+        # Orden estable por fecha: entre revisiones de la misma fecha rige la última, como en el cálculo
+        tuple(sorted(((r.effective_date, r.euribor_rate, r.margin_rate) for r in revisions), key=lambda r: r[0])),
+        tuple(sorted((p.payment_date, p.amount) for p in prepayments)),
+    )
+
+
+_schedule_cache: "OrderedDict[tuple, AmortizationSchedule]" = OrderedDict()
+_cache_lock = Lock()
+
+
+def amortization_schedule(
+    mortgage: MortgageDetails,
+    revisions: List[MortgageRevision],
+    prepayments: List[MortgagePrepayment]
+) -> AmortizationSchedule:
+    """
+    Memoized schedule. The key is the content of the mortgage, revisions and prepayments,
+    so an edit simply produces a new key and no invalidation is needed.
+    """
+    key = _schedule_key(mortgage, revisions, prepayments)
+    with _cache_lock:
+        schedule = _schedule_cache.get(key)
+        if schedule is not None:
+            _schedule_cache.move_to_end(key)
+            return schedule
+
+    schedule = _build_schedule(mortgage, revisions, prepayments)
+    with _cache_lock:
+        _schedule_cache[key] = schedule
+        while len(_schedule_cache) > SCHEDULE_CACHE_SIZE:
+            _schedule_cache.popitem(last=False)
+    return schedule
+
+
 class MortgageCalculator:
     """Service for mortgage calculations based on the original Streamlit agent logic"""
     
@@ -20,6 +277,15 @@ class MortgageCalculator:
         
         return principal * (monthly_rate) / (1 - (1 + monthly_rate) ** (-num_payments))
     
+    @staticmethod
+    def compute_schedule(
+        mortgage: MortgageDetails,
+        revisions: List[MortgageRevision],
+        prepayments: List[MortgagePrepayment]
+    ) -> "AmortizationSchedule":
+        """Columnar schedule with revisions and prepayments, memoized (see amortization_schedule)"""
+        return amortization_schedule(mortgage, revisions, prepayments)
+    
     @staticmethod
     def generate_amortization_schedule(
         mortgage: MortgageDetails,
@@ -30,91 +296,7 @@ class MortgageCalculator:
         Generate complete amortization schedule with revisions and prepayments
         Based on the original schedule_con_revisiones_y_prepagos function
         """
-        if mortgage.initial_amount <= 0:
-            return []
-        
-        # Sort revisions by effective date
-        revisions_sorted = sorted(revisions, key=lambda x: x.effective_date)
-        
-        # Group prepayments by month
-        prepayments_by_month = {}
-        for prep in prepayments:
-            month_period = pd.Period(prep.payment_date, freq="M")
-            if month_period not in prepayments_by_month:
-                prepayments_by_month[month_period] = 0
-            prepayments_by_month[month_period] += prep.amount
-        
-        schedule = []
-        balance = float(mortgage.initial_amount)
-        current_month = pd.Period(mortgage.start_date, freq="M")
-        end_month = pd.Period(mortgage.end_date, freq="M")
-        revision_index = 0
-        
-        while current_month <= end_month and balance > 0.01:
-            months_remaining = (end_month - current_month).n + 1
-            month_date = current_month.to_timestamp().date()
-            
-            # Determine current interest rate
-            annual_rate = 0.0
-            if mortgage.mortgage_type == "Fija":
-                # For fixed mortgages, use margin as the fixed rate
-                annual_rate = mortgage.margin_percentage
-            else:
-                # For variable mortgages, find applicable revision
-                while (revision_index + 1 < len(revisions_sorted) and 
-                       revisions_sorted[revision_index + 1].effective_date <= month_date):
-                    revision_index += 1
-                
-                if revisions_sorted:
-                    current_revision = revisions_sorted[revision_index]
-                    euribor = current_revision.euribor_rate or 0.0
-                    margin = current_revision.margin_rate or 0.0
-                    annual_rate = euribor + margin
-                else:
-                    annual_rate = mortgage.margin_percentage
-            
-            monthly_rate = annual_rate / 100.0 / 12.0
-            
-            # Calculate monthly payment
-            monthly_payment = MortgageCalculator.calculate_monthly_payment(
-                balance, monthly_rate, months_remaining
-            )
-            
-            # Calculate interest and principal
-            interest_payment = balance * monthly_rate
-            principal_payment = max(0.0, monthly_payment - interest_payment)
-            
-            # Ensure we don't pay more principal than remaining balance
-            if principal_payment > balance:
-                principal_payment = balance
-                monthly_payment = interest_payment + principal_payment
-            
-            # Apply payment
-            balance = max(0.0, balance - principal_payment)
-            
-            # Apply prepayments if any for this month
-            prepayment_amount = prepayments_by_month.get(current_month, 0.0)
-            if prepayment_amount > 0:
-                if prepayment_amount > balance:
-                    prepayment_amount = balance
-                balance -= prepayment_amount
-                principal_payment += prepayment_amount
-                monthly_payment += prepayment_amount
-            
-            # Add to schedule
-            schedule.append({
-                "month": current_month.to_timestamp(),
-                "payment": float(monthly_payment),
-                "interest": float(interest_payment),
-                "principal": float(principal_payment),
-                "balance": float(balance),
-                "annual_rate": float(annual_rate),
-                "prepayment": float(prepayment_amount)
-            })
-            
-            current_month += 1
-        
-        return schedule
+        return amortization_schedule(mortgage, revisions, prepayments).to_records()
     
     @staticmethod
     def calculate_current_payment_and_balance(
@@ -127,35 +309,24 @@ class MortgageCalculator:
         if not as_of_date:
             as_of_date = date.today()
         
-        schedule = MortgageCalculator.generate_amortization_schedule(
-            mortgage, revisions, prepayments
-        )
-        
-        if not schedule:
+        schedule = amortization_schedule(mortgage, revisions, prepayments)
+        return MortgageCalculator._status_at(schedule, mortgage, as_of_date)
+    
+    @staticmethod
+    def _status_at(schedule: "AmortizationSchedule", mortgage: MortgageDetails, as_of_date: date) -> Dict:
+        if not len(schedule):
             return {
                 "current_payment": 0.0,
                 "current_balance": mortgage.outstanding_balance,
                 "as_of_date": as_of_date
             }
         
-        # Find the schedule entry for the current date or closest past date
-        target_period = pd.Period(as_of_date, freq="M").to_timestamp()
-        
-        current_entry = None
-        for entry in schedule:
-            if entry["month"] <= target_period:
-                current_entry = entry
-            else:
-                break
-        
-        if not current_entry:
-            # If no past entry found, use the first one
-            current_entry = schedule[0]
-        
+        # Schedule entry for the current month or closest past month (the first one if none)
+        i = schedule.index_as_of(as_of_date)
         return {
-            "current_payment": current_entry["payment"],
-            "current_balance": current_entry["balance"],
-            "annual_rate": current_entry["annual_rate"],
+            "current_payment": float(schedule.payment[i]),
+            "current_balance": float(schedule.balance[i]),
+            "annual_rate": float(schedule.annual_rate[i]),
             "as_of_date": as_of_date
         }
     
@@ -166,11 +337,9 @@ class MortgageCalculator:
         prepayments: List[MortgagePrepayment]
     ) -> Dict:
         """Calculate comprehensive mortgage summary"""
-        schedule = MortgageCalculator.generate_amortization_schedule(
-            mortgage, revisions, prepayments
-        )
+        schedule = amortization_schedule(mortgage, revisions, prepayments)
         
-        if not schedule:
+        if not len(schedule):
             return {
                 "total_payments": 0.0,
                 "total_interest": 0.0,
@@ -181,21 +350,14 @@ class MortgageCalculator:
                 "current_balance": mortgage.outstanding_balance
             }
         
-        total_payments = sum(entry["payment"] for entry in schedule)
-        total_interest = sum(entry["interest"] for entry in schedule)
-        total_principal = sum(entry["principal"] for entry in schedule)
-        total_prepayments = sum(entry["prepayment"] for entry in schedule)
-        
-        # Get current status
-        current_status = MortgageCalculator.calculate_current_payment_and_balance(
-            mortgage, revisions, prepayments
-        )
+        # Get current status (same schedule, not recomputed)
+        current_status = MortgageCalculator._status_at(schedule, mortgage, date.today())
         
         return {
-            "total_payments": total_payments,
-            "total_interest": total_interest,
-            "total_principal": total_principal,
-            "total_prepayments": total_prepayments,
+            "total_payments": schedule.total_payments,
+            "total_interest": schedule.total_interest,
+            "total_principal": schedule.total_principal,
+            "total_prepayments": schedule.total_prepayments,
             "loan_term_months": len(schedule),
             "current_payment": current_status["current_payment"],
             "current_balance": current_status["current_balance"],
@@ -231,10 +393,8 @@ class MortgageCalculator:
         new_prepayment_date: date
     ) -> Dict:
         """Calculate the impact of a new prepayment on the mortgage"""
-        # Calculate original scenario
-        original_schedule = MortgageCalculator.generate_amortization_schedule(
-            mortgage, revisions, existing_prepayments
-        )
+        # Calculate original scenario (memoized, usually already computed for the summary)
+        original_schedule = amortization_schedule(mortgage, revisions, existing_prepayments)
         
         # Calculate scenario with new prepayment
         new_prepayment = MortgagePrepayment(
@@ -242,18 +402,16 @@ class MortgageCalculator:
             payment_date=new_prepayment_date,
             amount=new_prepayment_amount
         )
-        all_prepayments = existing_prepayments + [new_prepayment]
+        all_prepayments = list(existing_prepayments) + [new_prepayment]
         
-        new_schedule = MortgageCalculator.generate_amortization_schedule(
-            mortgage, revisions, all_prepayments
-        )
+        new_schedule = amortization_schedule(mortgage, revisions, all_prepayments)
         
-        if not original_schedule or not new_schedule:
+        if not len(original_schedule) or not len(new_schedule):
             return {"error": "Could not calculate prepayment impact"}
         
         # Calculate savings
-        original_total_interest = sum(entry["interest"] for entry in original_schedule)
-        new_total_interest = sum(entry["interest"] for entry in new_schedule)
+        original_total_interest = original_schedule.total_interest
+        new_total_interest = new_schedule.total_interest
         interest_savings = original_total_interest - new_total_interest
         
         # Calculate time savings (months)
@@ -267,4 +425,4 @@ class MortgageCalculator:
             "new_term_months": len(new_schedule),
             "original_total_interest": original_total_interest,
             "new_total_interest": new_total_interest
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,156 @@
+# app/services/mortgage_scenarios.py
+"""
+Batch what-if analysis over a mortgage schedule: a grid of prepayment amounts and dates,
+Euribor shocks and prepayment strategies evaluated in one vectorized pass per shock.
+
+A prepayment made at the end of month d only changes the balance by a, and that difference
+evolves linearly from there on:
+- reduce_payment (the installment is recomputed over the remaining term, as the calculator
+  does): the difference shrinks each month by the annuity factor f_t = 1 + r_t - c_t
+- reduce_term (the installments of the original plan are kept): the difference grows with
+  (1 + r_t)
+and the loan ends early in the first month the difference covers the planned balance, so the savings of every (date, amount) pair come from cumulative products and sums of the
+schedule arrays instead of one schedule per scenario.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import List, Optional
+
+import numpy as np
+
+from ..models import MortgageDetails, MortgageRevision, MortgagePrepayment
+from .mortgage_calculator import BALANCE_EPSILON, amortization_schedule, schedule_grid, schedule_from_rates
+
+STRATEGY_REDUCE_TERM = "reduce_term"
+STRATEGY_REDUCE_PAYMENT = "reduce_payment"
+STRATEGIES = (STRATEGY_REDUCE_TERM, STRATEGY_REDUCE_PAYMENT)
+
+
+@dataclass
+class ScenarioGrid:
+    """
+    Results indexed [shock, date, amount, strategy]; NaN where the prepayment date falls
+    outside the remaining schedule. Baseline values are indexed by shock.
+    """
+    baseline_total_interest: np.ndarray
+    baseline_term_months: np.ndarray
+    interest_saved: np.ndarray
+    months_saved: np.ndarray
+    payment_reduction: np.ndarray
+
+
+def _reverse_cumsum(values: np.ndarray) -> np.ndarray:
+    """out[k] = values[k:].sum(), with a trailing 0 so out[len(values)] is valid"""
+    out = np.zeros(len(values) + 1)
+    out[:-1] = np.cumsum(values[::-1])[::-1]
+    return out
+
+
+def shocked_rates(
+    mortgage: MortgageDetails,
+    months: np.ndarray,
+    annual_rates: np.ndarray,
+    shock: float,
+    as_of: date
+) -> np.ndarray:
+    """Annual rates with the Euribor shock (percentage points) applied from the as_of month; fixed loans are unaffected"""
+    if not shock or mortgage.mortgage_type == "Fija":
+        return annual_rates
+    return np.where(months >= np.datetime64(as_of, "M"), annual_rates + shock, annual_rates)
+
+
+def simulate_prepayment_grid(
+    mortgage: MortgageDetails,
+    revisions: List[MortgageRevision],
+    prepayments: List[MortgagePrepayment],
+    amounts: List[float],
+    dates: List[date],
+    shocks: List[float],
+    strategies: List[str] = STRATEGIES,
+    as_of: Optional[date] = None
+) -> ScenarioGrid:
+    """Evaluate every (shock, date, amount, strategy) combination against the mortgage's schedule"""
+    as_of = as_of or date.today()
+    amounts_array = np.asarray(amounts, dtype=float)
+    shape = (len(shocks), len(dates), len(amounts), len(strategies))
+    interest_saved = np.full(shape, np.nan)
+    months_saved = np.full(shape, np.nan)
+    payment_reduction = np.full(shape, np.nan)
+    baseline_interest = np.zeros(len(shocks))
+    baseline_term = np.zeros(len(shocks), dtype=int)
+
+    if mortgage.initial_amount <= 0:
+        return ScenarioGrid(baseline_interest, baseline_term, interest_saved, months_saved, payment_reduction)
+
+    months, annual_rates, prepayment_by_month = schedule_grid(mortgage, revisions, prepayments)
+    total_months = len(months)
+    start = months[0] if total_months else None
+
+    for s, shock in enumerate(shocks):
+        rates = shocked_rates(mortgage, months, annual_rates, shock, as_of)
+        if rates is annual_rates:
+            schedule = amortization_schedule(mortgage, revisions, prepayments)
+        else:
+            schedule = schedule_from_rates(float(mortgage.initial_amount), months, rates, prepayment_by_month)
+        n = len(schedule)
+        baseline_interest[s] = schedule.total_interest
+        baseline_term[s] = n
+        if n == 0:
+            continue
+
+        r = schedule.annual_rate / 1200.0
+        closing = schedule.balance
+        regular_payment = schedule.payment - schedule.prepayment
+        remaining = total_months - np.arange(n)
+        safe_r = np.where(r > 0, r, 1.0)
+        # Cuota por euro de saldo con la cuota recalculada cada mes (calculate_monthly_payment)
+        annuity = np.where(r > 0, safe_r / (1 - (1 + safe_r) ** (-remaining.astype(float))), 1.0 / remaining)
+        interest_after = _reverse_cumsum(schedule.interest)
+        t = np.arange(n)
+
+        # Índice de mes de cada fecha; fuera del cuadro queda NaN
+        d = np.array([int((np.datetime64(day, "M") - start).astype(int)) for day in dates], dtype=int)
+        valid = (d >= 0) & (d < n)
+        dv = np.clip(d, 0, n - 1)
+        next_month = np.minimum(dv + 1, n - 1)[:, None]
+        has_next = dv[:, None] + 1 < n
+
+        balance_d = closing[dv][:, None]
+        a = np.minimum(amounts_array[None, :], balance_d)
+        paid_off = amounts_array[None, :] >= balance_d - BALANCE_EPSILON
+
+        for k, strategy in enumerate(strategies):
+            # Factor mensual de la diferencia de saldo entre el escenario y el plan
+            if strategy == STRATEGY_REDUCE_PAYMENT:
+                factor = np.cumprod(1 + r - annuity)
+                reduction = np.where(has_next, a * annuity[next_month], 0.0)
+            else:
+                factor = np.cumprod(1 + r)
+                reduction = np.zeros_like(a)
+            factor_before = np.concatenate(([1.0], factor[:-1]))
+            weighted_rate_after = _reverse_cumsum(r * factor_before)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                scale = np.where(factor[dv] > 0, 1.0 / factor[dv], 0.0)[:, None]
+
+            # Fin del préstamo en el escenario: primer mes t > d en que la diferencia cubre el saldo del plan
+            difference = a[:, :, None] * scale[:, :, None] * factor[None, None, :]
+            covered = (t[None, None, :] > dv[:, None, None]) & (closing[None, None, :] <= difference + BALANCE_EPSILON)
+            end = np.where(covered.any(axis=2), covered.argmax(axis=2), n - 1)
+
+            # Intereses ahorrados hasta el nuevo fin + todos los del plan después de él
+            saved = (
+                a * scale * (weighted_rate_after[dv + 1][:, None] - weighted_rate_after[end + 1])
+                + interest_after[end + 1]
+            )
+            term = (n - 1 - end).astype(float)
+
+            # Prepago que cancela el préstamo: se ahorran todos los intereses siguientes
+            saved = np.where(paid_off, interest_after[dv + 1][:, None], saved)
+            term = np.where(paid_off, (n - 1 - dv)[:, None], term)
+            reduction = np.where(paid_off, regular_payment[next_month] * has_next, reduction)
+
+            interest_saved[s, valid, :, k] = saved[valid]
+            months_saved[s, valid, :, k] = term[valid]
+            payment_reduction[s, valid, :, k] = reduction[valid]
+
+    return ScenarioGrid(baseline_interest, baseline_term, interest_saved, months_saved, payment_reduction)
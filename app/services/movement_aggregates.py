@@ -0,0 +1,89 @@
+# app/services/movement_aggregates.py
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import case
+from sqlmodel import Session, select, func
+
+from ..models import FinancialMovement, Property
+
+RENT_CATEGORY = "Renta"
+
+
+@dataclass
+class PropertyTotals:
+    """Income/expense totals of one property for a period, built from aggregate rows"""
+    income: float = 0.0
+    expenses: float = 0.0
+    rent_income: float = 0.0
+    movement_count: int = 0
+    expenses_by_category: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def net_income(self) -> float:
+        return self.income - self.expenses
+
+
+def _amount_sign():
+    return case(
+        (FinancialMovement.amount > 0, 1),
+        (FinancialMovement.amount < 0, -1),
+        else_=0
+    )
+
+
+def property_totals(
+    session: Session,
+    start_date: date,
+    end_date: date,
+    property_ids: Optional[Iterable[int]] = None,
+    owner_id: Optional[int] = None
+) -> Dict[int, PropertyTotals]:
+    """
+    Totals per property in one GROUP BY (property_id, category, subcategory, sign(amount))
+    query. Filter by explicit property ids and/or by owner; properties without movements
+    in the period are not in the result.
+    """
+    sign = _amount_sign().label("sign")
+    query = (
+        select(
+            FinancialMovement.property_id,
+            FinancialMovement.category,
+            FinancialMovement.subcategory,
+            sign,
+            func.sum(FinancialMovement.amount).label("total"),
+            func.count().label("count"),
+        )
+        .where(FinancialMovement.date >= start_date)
+        .where(FinancialMovement.date <= end_date)
+        .group_by(
+            FinancialMovement.property_id,
+            FinancialMovement.category,
+            FinancialMovement.subcategory,
+            sign,
+        )
+    )
+    if property_ids is not None:
+        query = query.where(FinancialMovement.property_id.in_(list(property_ids)))
+    if owner_id is not None:
+        query = query.join(Property, Property.id == FinancialMovement.property_id).where(
+            Property.owner_id == owner_id
+        )
+    else:
+        query = query.where(FinancialMovement.property_id.is_not(None))
+
+    totals: Dict[int, PropertyTotals] = {}
+    for property_id, category, subcategory, row_sign, total, count in session.exec(query).all():
+        item = totals.setdefault(property_id, PropertyTotals())
+        item.movement_count += count
+        total = float(total or 0)
+        if row_sign > 0:
+            item.income += total
+            if category == RENT_CATEGORY:
+                item.rent_income += total
+        elif row_sign < 0:
+            item.expenses += abs(total)
+            label = subcategory or category
+            item.expenses_by_category[label] = item.expenses_by_category.get(label, 0) + abs(total)
+    return totals
@@ -0,0 +1,136 @@
+# app/services/movement_dedup.py
+import hashlib
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from ..models import FinancialMovement
+
+# Máximo de parámetros por consulta IN (SQLite admite 999 en versiones antiguas)
+LOOKUP_CHUNK_SIZE = 500
+# Claves de ocurrencia consultadas de una vez al buscar la siguiente libre
+OCCURRENCE_PROBE = 8
+
+
+def _normalize_date(value) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value or "").strip()
+    try:
+        return date.fromisoformat(text[:10]).isoformat()
+    except ValueError:
+        return text
+
+
+def _normalize_concept(value) -> str:
+    return " ".join(str(value or "").split()).casefold()
+
+
+def _normalize_amount(value) -> str:
+    try:
+        return f"{round(float(value), 2) + 0.0:.2f}"
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def compute_dedup_key(movement_date, concept, amount, external_id: Optional[str] = None) -> str:
+    """
+    Stable fingerprint of a movement: normalized date, concept and amount, plus the bank
+    transaction id when there is one. Unique per user (see ix_financialmovement_user_dedup).
+    """
+    parts = [_normalize_date(movement_date), _normalize_concept(concept), _normalize_amount(amount)]
+    if external_id:
+        parts.append(str(external_id).strip())
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def occurrence_key(key: str, occurrence: int) -> str:
+    """
+    Key of the n-th identical movement (two equal card payments on the same day are two
+    movements). The first occurrence keeps the plain key, so stored keys stay valid.
+    """
+    if occurrence == 0:
+        return key
+    return hashlib.sha1(f"{key}#{occurrence}".encode("utf-8")).hexdigest()
+
+
+def movement_dedup_key(movement: FinancialMovement) -> str:
+    return compute_dedup_key(movement.date, movement.concept, movement.amount, movement.external_id)
+
+
+def existing_dedup_keys(session: Session, user_id: int, keys: Iterable[str]) -> Set[str]:
+    """Return which of the given keys the user already has, using the (user_id, dedup_key) index"""
+    keys = list(dict.fromkeys(keys))
+    found: Set[str] = set()
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+        found.update(session.execute(
+            select(FinancialMovement.dedup_key).where(
+                FinancialMovement.user_id == user_id,
+                FinancialMovement.dedup_key.in_(chunk)
+            )
+        ).scalars().all())
+    return found
+
+
+def new_dedup_keys(session: Session, user_id: int, keys: List[str]) -> List[Optional[str]]:
+    """
+    For each incoming key, the key to store the movement with, or None if it is already
+    stored. Repeats within the batch are numbered (occurrence_key): a statement with two
+    identical movements imports both, and importing it again skips both.
+    Only the batch is queried, never the user's history.
+    """
+    occurrences: Dict[str, int] = {}
+    numbered = []
+    for key in keys:
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        numbered.append(occurrence_key(key, occurrence))
+    stored = existing_dedup_keys(session, user_id, numbered)
+    return [None if key in stored else key for key in numbered]
+
+
+def free_dedup_keys(session: Session, user_id: int, key: str, count: int) -> List[str]:
+    """The first `count` occurrence keys of `key` the user does not have yet"""
+    free: List[str] = []
+    start = 0
+    while len(free) < count:
+        candidates = [occurrence_key(key, n) for n in range(start, start + count + OCCURRENCE_PROBE)]
+        stored = existing_dedup_keys(session, user_id, candidates)
+        free.extend(candidate for candidate in candidates if candidate not in stored)
+        start += len(candidates)
+    return free[:count]
+
+
+_KEY_FIELDS = ("date", "concept", "amount", "external_id")
+
+
+def _needs_key(session: Session, movement: FinancialMovement) -> bool:
+    if movement in session.new:
+        return not movement.dedup_key
+    state = inspect(movement)
+    return any(state.attrs[name].history.has_changes() for name in _KEY_FIELDS)
+
+
+@event.listens_for(Session, "before_flush")
+def _assign_dedup_keys(session: Session, flush_context, instances):
+    """
+    Movements added one by one (manual create, scrapers) or whose date, concept, amount
+    or external_id was edited get the next free occurrence of their key, so an identical
+    real movement is stored instead of failing the unique index. Batch imports set
+    dedup_key themselves with new_dedup_keys and are left alone.
+    """
+    pending: Dict[tuple, List[FinancialMovement]] = {}
+    for movement in list(session.new) + list(session.dirty):
+        if isinstance(movement, FinancialMovement) and _needs_key(session, movement):
+            pending.setdefault((movement.user_id, movement_dedup_key(movement)), []).append(movement)
+    if not pending:
+        return
+    with session.no_autoflush:
+        for (user_id, key), movements in pending.items():
+            for movement, free_key in zip(movements, free_dedup_keys(session, user_id, key, len(movements))):
+                movement.dedup_key = free_key
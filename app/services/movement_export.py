@@ -0,0 +1,139 @@
+# app/services/movement_export.py
+import csv
+import io
+import tempfile
+from datetime import datetime
+from itertools import chain, islice
+from typing import Dict, Iterator, List, Optional
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from sqlmodel import Session, select
+
+from ..models import FinancialMovement
+
+EXPORT_HEADERS = [
+    "Fecha", "Propiedad", "Concepto", "Categoría", "Subcategoría",
+    "Inquilino", "Importe", "Clasificado", "Saldo Bancario"
+]
+
+# Filas leídas del cursor de servidor por lote
+EXPORT_YIELD_PER = 1000
+# Filas usadas para estimar el ancho de columna del Excel
+WIDTH_SAMPLE_ROWS = 500
+MAX_COLUMN_WIDTH = 50
+# Tamaño de los trozos enviados al cliente
+STREAM_CHUNK_SIZE = 64 * 1024
+# El Excel se construye en memoria hasta este tamaño y después en disco
+XLSX_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def iter_export_rows(
+    session: Session,
+    conditions: list,
+    property_lookup: Dict[int, str]
+) -> Iterator[list]:
+    """Stream export rows from a server-side cursor, EXPORT_YIELD_PER rows at a time"""
+    query = (
+        select(
+            FinancialMovement.date, FinancialMovement.property_id, FinancialMovement.concept,
+            FinancialMovement.category, FinancialMovement.subcategory, FinancialMovement.tenant_name,
+            FinancialMovement.amount, FinancialMovement.is_classified, FinancialMovement.bank_balance
+        )
+        .where(*conditions)
+        .order_by(FinancialMovement.date, FinancialMovement.id)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    for row in session.exec(query):
+        yield [
+            row.date.strftime("%d/%m/%Y"),
+            property_lookup.get(row.property_id, "Sin propiedad asignada"),
+            row.concept,
+            row.category,
+            row.subcategory or "",
+            row.tenant_name or "",
+            row.amount,
+            "Automático" if row.is_classified else "Manual",
+            row.bank_balance or "",
+        ]
+
+
+def stream_csv(rows: Iterator[list]) -> Iterator[bytes]:
+    """CSV (UTF-8 with BOM so Excel detects the encoding) in chunks of ~STREAM_CHUNK_SIZE"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_HEADERS)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def sample_column_widths(sample: List[list]) -> List[int]:
+    """Column widths from the header and a sample of rows, capped at MAX_COLUMN_WIDTH"""
+    widths = [len(h) for h in EXPORT_HEADERS]
+    for row in sample:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len(str(value)))
+    return [min(w + 2, MAX_COLUMN_WIDTH) for w in widths]
+
+
+def stream_xlsx(rows: Iterator[list], sheet_name: str = "Movimientos") -> Iterator[bytes]:
+    """
+    Write-only workbook: rows go straight to openpyxl's temporary sheet file, so memory
+    stays flat whatever the number of movements. Widths come from the first rows.
+    """
+    sample = list(islice(rows, WIDTH_SAMPLE_ROWS))
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    for i, width in enumerate(sample_column_widths(sample), start=1):
+        worksheet.column_dimensions[get_column_letter(i)].width = width
+
+    bold = Font(bold=True)
+    header = []
+    for title in EXPORT_HEADERS:
+        cell = WriteOnlyCell(worksheet, value=title)
+        cell.font = bold
+        header.append(cell)
+    worksheet.append(header)
+    for row in chain(sample, rows):
+        worksheet.append(row)
+
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_MAX_SIZE) as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def export_filename(
+    extension: str,
+    property_name: Optional[str] = None,
+    category: Optional[str] = None,
+    start_date=None,
+    end_date=None
+) -> str:
+    filename_parts = ["movimientos"]
+    if property_name:
+        filename_parts.append(property_name.replace(" ", "_").replace(",", "")[:20])
+    if start_date and end_date:
+        filename_parts.append(f"{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}")
+    elif start_date:
+        filename_parts.append(f"desde_{start_date.strftime('%Y%m%d')}")
+    elif end_date:
+        filename_parts.append(f"hasta_{end_date.strftime('%Y%m%d')}")
+    if category:
+        filename_parts.append(category.lower())
+    filename_parts.append(datetime.now().strftime("%Y%m%d_%H%M%S"))
+    return "_".join(filename_parts) + "." + extension
@@ -0,0 +1,51 @@
+# app/services/movement_purge.py
+from sqlmodel import Session, select, delete, func
+
+from ..models import FinancialMovement
+
+# Por encima de este número de filas el borrado se hace por lotes
+PURGE_BATCH_SIZE = 50000
+
+
+def count_movements(session: Session, conditions: list) -> int:
+    return session.exec(
+        select(func.count()).select_from(FinancialMovement).where(*conditions)
+    ).one()
+
+
+def purge_movements(
+    session: Session,
+    conditions: list,
+    dry_run: bool = False,
+    batch_size: int = PURGE_BATCH_SIZE
+) -> int:
+    """
+    Delete the movements matching conditions with set-based DELETE statements and return
+    how many rows were (or, with dry_run, would be) deleted.
+    Up to batch_size rows go in a single DELETE ... WHERE. Larger purges delete
+    batch_size ids per statement and commit each batch, so a failed purge can simply be
+    re-run to finish.
+    """
+    total = count_movements(session, conditions)
+    if dry_run or total == 0:
+        return total
+
+    if total <= batch_size:
+        result = session.exec(
+            delete(FinancialMovement).where(*conditions).execution_options(synchronize_session=False)
+        )
+        session.commit()
+        return result.rowcount
+
+    deleted = 0
+    while True:
+        batch_ids = select(FinancialMovement.id).where(*conditions).limit(batch_size)
+        result = session.exec(
+            delete(FinancialMovement)
+            .where(FinancialMovement.id.in_(batch_ids))
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
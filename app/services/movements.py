@@ -5,6 +5,8 @@ import pandas as pd
 import numpy as np
 from dateutil import parser as dateparser
 
+from .classification import ClassificationEngine, CompiledRule
+
 # -------- utilidades de parseo --------
 def parse_date_safe(x) -> date | None:
     if pd.isna(x) or x == "": return None
@@ -16,13 +18,30 @@ def parse_date_safe(x) -> date | None:
         except Exception:
             return None
 
+def parse_importe_series(s: pd.Series) -> pd.Series:
+    """Importes en formato europeo ("1.234,56", "(70,00)", "-70 €") -> float, NaN si no es válido"""
+    if pd.api.types.is_numeric_dtype(s):
+        return pd.to_numeric(s, errors="coerce").astype(float)
+    out = pd.Series(np.nan, index=s.index, dtype=float)
+    # celdas que ya son números (columnas mixtas de Excel)
+    mask_num = s.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool))
+    if mask_num.any():
+        out[mask_num] = pd.to_numeric(s[mask_num], errors="coerce").astype(float)
+    t = s[~mask_num & s.notna()].astype(str).str.strip()
+    if t.empty:
+        return out
+    negativo = t.str.match(r"^\(.*\)$")  # (70,00) = gasto
+    t = t.str.replace(r"[^\d,\-\.]", "", regex=True)
+    mask_coma = t.str.contains(",", na=False)
+    t[mask_coma] = t[mask_coma].str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    t[~mask_coma] = t[~mask_coma].str.replace(r"(?<=\d)\.(?=\d{3}(\D|$))", "", regex=True)
+    valores = pd.to_numeric(t, errors="coerce")
+    valores[negativo] = -valores[negativo].abs()
+    out[t.index] = valores
+    return out
+
 def normalize_importe_series(s: pd.Series) -> pd.Series:
-    s = s.astype(str).str.strip()
-    s = s.str.replace(r"[^\d,\-\.]", "", regex=True)
-    mask_coma = s.str.contains(",", na=False)
-    s[mask_coma] = s[mask_coma].str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
-    s[~mask_coma] = s[~mask_coma].str.replace(r"(?<=\d)\.(?=\d{3}(\D|$))", "", regex=True)
-    return pd.to_numeric(s, errors="coerce").fillna(0.0)
+    return parse_importe_series(s).fillna(0.0)
 
 def pick_fecha_column(cols: List[str]) -> str | None:
     low = {c: c.lower() for c in cols}
@@ -64,18 +83,25 @@ def read_movements_excel(filepath: str) -> pd.DataFrame:
 # -------- clasificación por reglas --------
 def classify(df: pd.DataFrame, reglas: list[dict], property_id: int) -> pd.DataFrame:
     if df.empty: return pd.DataFrame(columns=["Fecha","Concepto","Importe","categoria","subcuenta","inquilino"])
+    compiled = []
+    for r in reglas:
+        tipo = r.get("tipo")
+        compiled.append(CompiledRule(
+            id=r.get("id"),
+            property_id=property_id,
+            keyword=(r.get("palabra") or "").strip(),
+            category="Renta" if tipo=="renta" else ("Hipoteca" if tipo=="hipoteca" else "Gasto"),
+            subcategory=r.get("subcuenta"),
+            tenant_name=r.get("inquilino"),
+        ))
+    engine = ClassificationEngine(compiled)
     out = []
     for _, row in df.iterrows():
         concepto = str(row["Concepto"])
-        cat = None; sub = None; inq = None
-        for r in reglas:
-            pal = (r.get("palabra") or "").strip()
-            if pal and pal.lower() in concepto.lower():
-                tipo = r.get("tipo")
-                cat = "Renta" if tipo=="renta" else ("Hipoteca" if tipo=="hipoteca" else "Gasto")
-                sub = r.get("subcuenta")
-                inq = r.get("inquilino")
-                break
+        rule, _ = engine.match(concepto)
+        cat = rule.category if rule else None
+        sub = rule.subcategory if rule else None
+        inq = rule.tenant_name if rule else None
         if cat:
             out.append({
                 "Fecha": row["Fecha"].date() if hasattr(row["Fecha"], "date") else row["Fecha"],
@@ -0,0 +1,150 @@
+# app/services/notification_inputs.py
+"""
+Everything the notification rules read about a portfolio, loaded with a fixed number of
+grouped queries (properties, active contracts, mortgages, rent and expense aggregates)
+instead of several queries per property. Rules are then evaluated in memory.
+"""
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case
+from sqlmodel import Session, select, func
+
+from ..models import FinancialMovement, MortgageDetails, Property, RentalContract
+from .euribor_cache import EuriborReference, euribor_reference
+from .movement_aggregates import RENT_CATEGORY
+
+RECENT_RENT_DAYS = 35
+EXPENSE_HISTORY_DAYS = 180
+EXPENSE_YEAR_DAYS = 365
+Q4_EXPENSE_DAYS = 90
+
+
+@dataclass
+class RentAggregate:
+    """Positive rent movements of a property with the same concept"""
+    concept: str
+    last_date: date
+    quarter_count: int = 0
+    quarter_total: float = 0.0
+
+
+@dataclass
+class PropertyInputs:
+    property: Property
+    active_contracts: List[RentalContract] = field(default_factory=list)
+    mortgage: Optional[MortgageDetails] = None
+    rent: List[RentAggregate] = field(default_factory=list)
+    # Gastos (importe positivo) de los últimos 180 días por (año, mes)
+    monthly_expenses: Dict[Tuple[int, int], float] = field(default_factory=dict)
+    # Gastos del último año por subcategoría (o categoría)
+    expenses_by_category: Dict[str, float] = field(default_factory=dict)
+    expenses_last_90_days: float = 0.0
+
+    def last_rent_date(self, tenant_name: Optional[str] = None) -> Optional[date]:
+        """Latest rent payment, restricted to concepts containing tenant_name when given"""
+        dates = [r.last_date for r in self.rent if tenant_name is None or tenant_name in r.concept]
+        return max(dates) if dates else None
+
+    @property
+    def quarter_rent_count(self) -> int:
+        return sum(r.quarter_count for r in self.rent)
+
+    @property
+    def quarter_rent_total(self) -> float:
+        return sum(r.quarter_total for r in self.rent)
+
+
+@dataclass
+class PortfolioInputs:
+    today: date
+    properties: Dict[int, PropertyInputs]
+    euribor: EuriborReference
+
+    def __iter__(self):
+        return iter(self.properties.values())
+
+
+def quarter_start(day: date) -> date:
+    return date(day.year, ((day.month - 1) // 3) * 3 + 1, 1)
+
+
+def load_portfolio_inputs(
+    session: Session,
+    owner_id: Optional[int] = None,
+    property_ids: Optional[Iterable[int]] = None,
+    today: Optional[date] = None
+) -> PortfolioInputs:
+    """Load the inputs of the owner's properties (or the given ones, or all) in five queries plus the cached Euribor"""
+    today = today or date.today()
+    query = select(Property).order_by(Property.id)
+    if owner_id is not None:
+        query = query.where(Property.owner_id == owner_id)
+    if property_ids is not None:
+        query = query.where(Property.id.in_(list(property_ids)))
+    properties = {p.id: PropertyInputs(property=p) for p in session.exec(query).all()}
+    ids = list(properties)
+    if not ids:
+        return PortfolioInputs(today, properties, euribor_reference(session, today))
+
+    for contract in session.exec(
+        select(RentalContract)
+        .where(RentalContract.property_id.in_(ids))
+        .where(RentalContract.is_active == True)
+        .order_by(RentalContract.id)
+    ):
+        properties[contract.property_id].active_contracts.append(contract)
+
+    for mortgage in session.exec(select(MortgageDetails).where(MortgageDetails.property_id.in_(ids))):
+        properties[mortgage.property_id].mortgage = mortgage
+
+    # Rentas cobradas: última fecha por concepto (para casar con el inquilino) y totales del trimestre
+    in_quarter = FinancialMovement.date >= quarter_start(today)
+    rent_rows = session.exec(
+        select(
+            FinancialMovement.property_id,
+            FinancialMovement.concept,
+            func.max(FinancialMovement.date),
+            func.sum(case((in_quarter, 1), else_=0)),
+            func.sum(case((in_quarter, FinancialMovement.amount), else_=0)),
+        )
+        .where(FinancialMovement.property_id.in_(ids))
+        .where(FinancialMovement.category == RENT_CATEGORY)
+        .where(FinancialMovement.amount > 0)
+        .group_by(FinancialMovement.property_id, FinancialMovement.concept)
+    ).all()
+    for property_id, concept, last_date, quarter_count, quarter_total in rent_rows:
+        properties[property_id].rent.append(
+            RentAggregate(concept or "", last_date, int(quarter_count or 0), float(quarter_total or 0))
+        )
+
+    # Gastos del último año por mes y subcategoría, marcando los de 180 y 90 días
+    in_history = FinancialMovement.date >= today - timedelta(days=EXPENSE_HISTORY_DAYS)
+    in_q4_window = FinancialMovement.date >= today - timedelta(days=Q4_EXPENSE_DAYS)
+    label = func.coalesce(func.nullif(FinancialMovement.subcategory, ""), FinancialMovement.category)
+    year = func.extract("year", FinancialMovement.date)
+    month = func.extract("month", FinancialMovement.date)
+    history_flag = case((in_history, 1), else_=0)
+    q4_flag = case((in_q4_window, 1), else_=0)
+    expense_rows = session.exec(
+        select(
+            FinancialMovement.property_id, label, year, month, history_flag, q4_flag,
+            func.sum(-FinancialMovement.amount),
+        )
+        .where(FinancialMovement.property_id.in_(ids))
+        .where(FinancialMovement.amount < 0)
+        .where(FinancialMovement.date >= today - timedelta(days=EXPENSE_YEAR_DAYS))
+        .group_by(FinancialMovement.property_id, label, year, month, history_flag, q4_flag)
+    ).all()
+    for property_id, category, row_year, row_month, recent, last_90, total in expense_rows:
+        inputs = properties[property_id]
+        total = float(total or 0)
+        inputs.expenses_by_category[category] = inputs.expenses_by_category.get(category, 0) + total
+        if recent:
+            key = (int(row_year), int(row_month))
+            inputs.monthly_expenses[key] = inputs.monthly_expenses.get(key, 0) + total
+        if last_90:
+            inputs.expenses_last_90_days += total
+
+    return PortfolioInputs(today, properties, euribor_reference(session, today))
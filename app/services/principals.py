@@ -0,0 +1,62 @@
+# app/services/principals.py
+import time
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from ..models import User, Property
+
+# Segundos que un principal cacheado es válido sin volver a la base de datos
+PRINCIPAL_TTL_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    Detached snapshot of the authenticated user returned by deps.get_current_user.
+    Exposes the User attributes routers read (id, email, is_active) plus the owned property ids.
+    """
+    id: int
+    email: str
+    is_active: bool
+    property_ids: Tuple[int, ...] = ()
+
+    def owns(self, property_id: Optional[int]) -> bool:
+        return property_id is not None and property_id in self.property_ids
+
+
+_principal_cache: Dict[int, Tuple[float, Principal]] = {}
+_cache_lock = Lock()
+
+
+def load_principal(session: Session, user_id: int) -> Optional[Principal]:
+    """Read the user and their property ids (two indexed queries)"""
+    user = session.get(User, user_id)
+    if not user:
+        return None
+    property_ids = session.exec(
+        select(Property.id).where(Property.owner_id == user_id).order_by(Property.id)
+    ).all()
+    return Principal(id=user.id, email=user.email, is_active=user.is_active, property_ids=tuple(property_ids))
+
+
+def get_principal(session: Session, user_id: int) -> Optional[Principal]:
+    """Return the cached principal of a user, reloading it once PRINCIPAL_TTL_SECONDS have passed"""
+    cached = _principal_cache.get(user_id)
+    now = time.monotonic()
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    principal = load_principal(session, user_id)
+    if principal is not None:
+        with _cache_lock:
+            _principal_cache[user_id] = (now + PRINCIPAL_TTL_SECONDS, principal)
+    return principal
+
+
+def invalidate_principal(user_id: int) -> None:
+    """Drop the cached principal of a user; call after changing the user or their properties"""
+    with _cache_lock:
+        _principal_cache.pop(user_id, None)
@@ -1,12 +1,10 @@
 # app/services/smart_notifications.py
 from typing import List, Dict, Optional, Tuple
 from datetime import date, datetime, timedelta
-from sqlmodel import Session, select
-from ..models import (
-    User, Property, RentalContract, FinancialMovement, MortgageDetails, 
-    ClassificationRule, SmartNotification, NotificationRule, NotificationTemplate,
-    NotificationChannel, NotificationAnalytics, PaymentRule
-)
+from sqlmodel import Session, select, func
+from ..models import User, Property, RentalContract, PaymentRule
+from ..notification_models import SmartNotification, NotificationRule
+from .notification_inputs import PropertyInputs, load_portfolio_inputs
 import json
 import statistics
 import re
@@ -17,52 +15,55 @@ class SmartNotificationEngine:
         self.today = date.today()
         
     def generate_notifications_for_user(self, user_id: int) -> List[Dict]:
-        """Generate all contextual notifications for a user"""
+        """
+        Generate all contextual notifications for a user. The inputs of every property are
+        loaded once with grouped queries and the rules run in memory, so the number of
+        queries does not grow with the portfolio.
+        """
         notifications = []
         
+        user_rules = self.session.exec(
+            select(NotificationRule).where(NotificationRule.user_id == user_id)
+        ).first()
+        sent_today = self._sent_today_count(user_id)
+        
         # Check if user hasn't exceeded daily limit
-        if not self._can_send_more_notifications(user_id):
+        if not self._can_send_more_notifications(user_rules, sent_today):
             return []
         
         user = self.session.get(User, user_id)
         if not user:
             return []
-            
-        properties = self.session.exec(
-            select(Property).where(Property.owner_id == user_id)
-        ).all()
         
-        for property in properties:
-            notifications.extend(self._generate_contract_notifications(property))
-            notifications.extend(self._generate_payment_notifications(property))
-            notifications.extend(self._generate_tax_notifications(property))
-            notifications.extend(self._generate_optimization_notifications(property))
+        portfolio = load_portfolio_inputs(self.session, owner_id=user_id, today=self.today)
+        payment_rules = self._load_payment_rules(user_id)
+        
+        for inputs in portfolio:
+            notifications.extend(self._generate_contract_notifications(inputs))
+            notifications.extend(self._generate_payment_notifications(inputs, payment_rules))
+            notifications.extend(self._generate_tax_notifications(inputs))
+            notifications.extend(self._generate_optimization_notifications(inputs))
         
         # Calculate priority scores and sort
         notifications = self._calculate_priority_scores(notifications)
         notifications.sort(key=lambda x: x['priority_score'], reverse=True)
         
         # Apply daily limits and timing rules
-        filtered_notifications = self._apply_timing_rules(user_id, notifications)
+        filtered_notifications = self._apply_timing_rules(user_rules, sent_today, notifications)
         
-        # Save to database
+        # Save to database (one commit)
         for notif in filtered_notifications:
             self._save_notification(user_id, notif)
+        self.session.commit()
         
         return filtered_notifications
     
-    def _generate_contract_notifications(self, property: Property) -> List[Dict]:
+    def _generate_contract_notifications(self, inputs: PropertyInputs) -> List[Dict]:
         """Generate contract-related notifications"""
         notifications = []
+        property = inputs.property
         
-        # Get active contracts
-        contracts = self.session.exec(
-            select(RentalContract)
-            .where(RentalContract.property_id == property.id)
-            .where(RentalContract.is_active == True)
-        ).all()
-        
-        for contract in contracts:
+        for contract in inputs.active_contracts:
             if contract.end_date:
                 days_until_expiry = (contract.end_date - self.today).days
                 
@@ -105,22 +106,8 @@ class SmartNotificationEngine:
         
         return notifications
     
-    def _generate_payment_notifications(self, property: Property) -> List[Dict]:
-        """Generate payment and rent optimization notifications using configurable payment rules"""
-        notifications = []
-        
-        # Get active contracts for this property
-        active_contracts = self.session.exec(
-            select(RentalContract)
-            .where(RentalContract.property_id == property.id)
-            .where(RentalContract.is_active == True)
-        ).all()
-        
-        if not active_contracts:
-            return notifications
-        
-        # Get user's payment rules
-        user_id = property.owner_id
+    def _load_payment_rules(self, user_id: int) -> List[PaymentRule]:
+        """User's active payment rules, or the default rule when there are none"""
         payment_rules = self.session.exec(
             select(PaymentRule)
             .where(PaymentRule.user_id == user_id)
@@ -142,8 +129,14 @@ class SmartNotificationEngine:
                 is_active=True
             )
             payment_rules = [default_rule]
+        return payment_rules
+    
+    def _generate_payment_notifications(self, inputs: PropertyInputs, payment_rules: List[PaymentRule]) -> List[Dict]:
+        """Generate payment notifications using configurable payment rules"""
+        notifications = []
+        property = inputs.property
         
-        for contract in active_contracts:
+        for contract in inputs.active_contracts:
             # Find the most specific rule for this contract
             applicable_rule = self._find_applicable_payment_rule(
                 payment_rules, property.id, contract.tenant_name
@@ -153,7 +146,7 @@ class SmartNotificationEngine:
                 continue
             
             # Check payment status using the rule
-            payment_status = self._check_payment_status(contract, applicable_rule)
+            payment_status = self._check_payment_status(inputs, contract, applicable_rule)
             
             if payment_status['is_overdue']:
                 notifications.append({
@@ -176,11 +169,7 @@ class SmartNotificationEngine:
                     'base_priority': self._calculate_payment_priority(payment_status['days_overdue'], applicable_rule)
                 })
         
-        # Rent optimization analysis
-        market_analysis = self._analyze_rent_vs_market(property)
-        if market_analysis:
-            notifications.append(market_analysis)
-        
+        # El análisis de renta frente a mercado se hace en las notificaciones de optimización
         return notifications
     
     def _find_applicable_payment_rule(self, rules: List[PaymentRule], property_id: int, tenant_name: str) -> Optional[PaymentRule]:
@@ -211,31 +200,14 @@ class SmartNotificationEngine:
         
         return None
     
-    def _check_payment_status(self, contract: RentalContract, rule: PaymentRule) -> Dict:
+    def _check_payment_status(self, inputs: PropertyInputs, contract: RentalContract, rule: PaymentRule) -> Dict:
         """Check if payments are overdue according to the payment rule"""
-        # Get the last payment for this contract
-        last_payment = self.session.exec(
-            select(FinancialMovement)
-            .where(FinancialMovement.property_id == contract.property_id)
-            .where(FinancialMovement.category == "Renta")
-            .where(FinancialMovement.amount > 0)
-            .where(FinancialMovement.concept.contains(contract.tenant_name))  # Try to match by tenant name
-            .order_by(FinancialMovement.date.desc())
-        ).first()
-        
-        # If no payment found by tenant name, get the last rent payment for this property
-        if not last_payment:
-            last_payment = self.session.exec(
-                select(FinancialMovement)
-                .where(FinancialMovement.property_id == contract.property_id)
-                .where(FinancialMovement.category == "Renta")
-                .where(FinancialMovement.amount > 0)
-                .order_by(FinancialMovement.date.desc())
-            ).first()
+        # Last payment matching the tenant name, else the last rent payment of the property
+        last_payment = inputs.last_rent_date(contract.tenant_name) or inputs.last_rent_date()
         
         if last_payment:
-            days_since_payment = (self.today - last_payment.date).days
-            last_payment_date = last_payment.date.strftime("%d/%m/%Y")
+            days_since_payment = (self.today - last_payment).days
+            last_payment_date = last_payment.strftime("%d/%m/%Y")
         else:
             # No payments found, use contract start date
             days_since_payment = (self.today - (contract.start_date or self.today - timedelta(days=60))).days
@@ -266,14 +238,15 @@ class SmartNotificationEngine:
         else:
             return 60  # Low
     
-    def _generate_tax_notifications(self, property: Property) -> List[Dict]:
+    def _generate_tax_notifications(self, inputs: PropertyInputs) -> List[Dict]:
         """Generate tax and fiscal optimization notifications"""
         notifications = []
+        property = inputs.property
         
         # Q4 tax optimization
         current_month = self.today.month
         if current_month >= 10:  # Q4
-            tax_savings = self._calculate_q4_tax_savings(property)
+            tax_savings = self._calculate_q4_tax_savings(inputs)
             if tax_savings and tax_savings > 100:
                 notifications.append({
                     'type': 'tax_optimization_q4',
@@ -293,7 +266,7 @@ class SmartNotificationEngine:
         
         # Modelo 115 ready notification (quarterly)
         if current_month in [3, 6, 9, 12] and self.today.day >= 15:
-            if self._should_file_modelo_115(property):
+            if self._should_file_modelo_115(inputs):
                 notifications.append({
                     'type': 'modelo_115_ready',
                     'title': 'Modelo 115 listo para presentar (1-click)',
@@ -303,7 +276,7 @@ class SmartNotificationEngine:
                         'property_address': property.address,
                         'quarter': f'Q{(current_month-1)//3 + 1}',
                         'year': self.today.year,
-                        'estimated_payment': self._calculate_modelo_115_payment(property)
+                        'estimated_payment': self._calculate_modelo_115_payment(inputs)
                     },
                     'action_url': f'/financial-agent/tax-assistant/modelo-115?property_id={property.id}',
                     'base_priority': 80
@@ -311,32 +284,28 @@ class SmartNotificationEngine:
         
         return notifications
     
-    def _generate_optimization_notifications(self, property: Property) -> List[Dict]:
+    def _generate_optimization_notifications(self, inputs: PropertyInputs) -> List[Dict]:
         """Generate financial optimization notifications"""
         notifications = []
         
         # Market rent analysis
-        rent_analysis = self._analyze_rent_vs_market(property)
+        rent_analysis = self._analyze_rent_vs_market(inputs)
         if rent_analysis:
             notifications.append(rent_analysis)
         
         # Expense optimization
-        expense_analysis = self._analyze_expense_optimization(property)
+        expense_analysis = self._analyze_expense_optimization(inputs)
         if expense_analysis:
             notifications.extend(expense_analysis)
         
         return notifications
     
-    def _analyze_rent_vs_market(self, property: Property) -> Optional[Dict]:
+    def _analyze_rent_vs_market(self, inputs: PropertyInputs) -> Optional[Dict]:
         """Analyze if rent is below market value"""
-        active_contract = self.session.exec(
-            select(RentalContract)
-            .where(RentalContract.property_id == property.id)
-            .where(RentalContract.is_active == True)
-        ).first()
-        
-        if not active_contract:
+        if not inputs.active_contracts:
             return None
+        property = inputs.property
+        active_contract = inputs.active_contracts[0]
         
         # Simplified market analysis (in real implementation, use actual market data)
         current_rent = active_contract.monthly_rent
@@ -365,32 +334,13 @@ class SmartNotificationEngine:
         
         return None
     
-    def _analyze_expense_optimization(self, property: Property) -> List[Dict]:
-        """Analyze expense optimization opportunities"""
+    def _analyze_expense_optimization(self, inputs: PropertyInputs) -> List[Dict]:
+        """Analyze expense optimization opportunities over last year's expenses by subcategory"""
         notifications = []
-        
-        # Get last year's expenses
-        last_year = self.today - timedelta(days=365)
-        expenses = self.session.exec(
-            select(FinancialMovement)
-            .where(FinancialMovement.property_id == property.id)
-            .where(FinancialMovement.amount < 0)
-            .where(FinancialMovement.date >= last_year)
-        ).all()
-        
-        if not expenses:
-            return notifications
-        
-        # Group by subcategory
-        category_totals = {}
-        for expense in expenses:
-            category = expense.subcategory or expense.category
-            if category not in category_totals:
-                category_totals[category] = 0
-            category_totals[category] += abs(expense.amount)
+        property = inputs.property
         
         # Find optimization opportunities
-        for category, total in category_totals.items():
+        for category, total in inputs.expenses_by_category.items():
             if total > 500:  # Only for significant amounts
                 savings_potential = self._calculate_savings_potential(category, total)
                 if savings_potential > 50:
@@ -455,24 +405,11 @@ class SmartNotificationEngine:
         
         return notifications
     
-    def _apply_timing_rules(self, user_id: int, notifications: List[Dict]) -> List[Dict]:
+    def _apply_timing_rules(self, user_rules: Optional[NotificationRule], sent_today: int, notifications: List[Dict]) -> List[Dict]:
         """Apply timing rules and daily limits"""
-        # Check user's notification rules
-        user_rules = self.session.exec(
-            select(NotificationRule).where(NotificationRule.user_id == user_id)
-        ).first()
-        
         max_daily = user_rules.max_daily_notifications if user_rules else 2
         
-        # Check how many sent today
-        today_count = self.session.exec(
-            select(SmartNotification)
-            .where(SmartNotification.user_id == user_id)
-            .where(SmartNotification.created_at == self.today)
-            .where(SmartNotification.status == 'sent')
-        ).all()
-        
-        remaining_slots = max_daily - len(today_count)
+        remaining_slots = max_daily - sent_today
         
         if remaining_slots <= 0:
             return []
@@ -480,28 +417,27 @@ class SmartNotificationEngine:
         # Return top priority notifications within limit
         return notifications[:remaining_slots]
     
-    def _can_send_more_notifications(self, user_id: int) -> bool:
+    def _sent_today_count(self, user_id: int) -> int:
+        """Notifications already sent to the user today"""
+        return self.session.exec(
+            select(func.count())
+            .select_from(SmartNotification)
+            .where(SmartNotification.user_id == user_id)
+            .where(SmartNotification.created_at == self.today)
+            .where(SmartNotification.status == 'sent')
+        ).one()
+    
+    def _can_send_more_notifications(self, user_rules: Optional[NotificationRule], sent_today: int) -> bool:
         """Check if user can receive more notifications today"""
         # Check business hours if enabled
-        user_rules = self.session.exec(
-            select(NotificationRule).where(NotificationRule.user_id == user_id)
-        ).first()
-        
         if user_rules and user_rules.business_hours_only:
             current_hour = datetime.now().hour
             if current_hour < 9 or current_hour > 18:
                 return False
         
         # Check daily limit
-        today_count = len(self.session.exec(
-            select(SmartNotification)
-            .where(SmartNotification.user_id == user_id)
-            .where(SmartNotification.created_at == self.today)
-            .where(SmartNotification.status == 'sent')
-        ).all())
-        
         max_daily = user_rules.max_daily_notifications if user_rules else 2
-        return today_count < max_daily
+        return sent_today < max_daily
     
     def _save_notification(self, user_id: int, notification_data: Dict) -> SmartNotification:
         """Save notification to database"""
@@ -517,9 +453,8 @@ class SmartNotificationEngine:
             status='pending'
         )
         
+        # El llamador confirma la transacción una vez para todas las notificaciones
         self.session.add(notif)
-        self.session.commit()
-        self.session.refresh(notif)
         
         return notif
     
@@ -565,48 +500,20 @@ class SmartNotificationEngine:
             estimated_m2 = (property.rooms or 2) * 15
             return estimated_m2 * base_rent_per_m2[city]
     
-    def _calculate_q4_tax_savings(self, property: Property) -> Optional[float]:
+    def _calculate_q4_tax_savings(self, inputs: PropertyInputs) -> Optional[float]:
         """Calculate potential Q4 tax savings"""
         # Simplified calculation - in real implementation, use tax rules
-        last_3_months = self.today - timedelta(days=90)
-        expenses = self.session.exec(
-            select(FinancialMovement)
-            .where(FinancialMovement.property_id == property.id)
-            .where(FinancialMovement.amount < 0)
-            .where(FinancialMovement.date >= last_3_months)
-        ).all()
-        
-        deductible_expenses = sum(abs(e.amount) for e in expenses)
-        return deductible_expenses * 0.21  # 21% tax rate
+        # Gastos deducibles de los últimos 90 días
+        return inputs.expenses_last_90_days * 0.21  # 21% tax rate
     
-    def _should_file_modelo_115(self, property: Property) -> bool:
+    def _should_file_modelo_115(self, inputs: PropertyInputs) -> bool:
         """Check if property should file Modelo 115"""
         # Check if there were rental incomes this quarter
-        quarter_start = date(self.today.year, ((self.today.month-1)//3)*3 + 1, 1)
-        
-        rental_income = self.session.exec(
-            select(FinancialMovement)
-            .where(FinancialMovement.property_id == property.id)
-            .where(FinancialMovement.category == "Renta")
-            .where(FinancialMovement.amount > 0)
-            .where(FinancialMovement.date >= quarter_start)
-        ).all()
-        
-        return len(rental_income) > 0
+        return inputs.quarter_rent_count > 0
     
-    def _calculate_modelo_115_payment(self, property: Property) -> float:
+    def _calculate_modelo_115_payment(self, inputs: PropertyInputs) -> float:
         """Calculate estimated Modelo 115 payment"""
-        quarter_start = date(self.today.year, ((self.today.month-1)//3)*3 + 1, 1)
-        
-        rental_income = sum(m.amount for m in self.session.exec(
-            select(FinancialMovement)
-            .where(FinancialMovement.property_id == property.id)
-            .where(FinancialMovement.category == "Renta")
-            .where(FinancialMovement.amount > 0)
-            .where(FinancialMovement.date >= quarter_start)
-        ).all())
-        
-        return rental_income * 0.19  # 19% retention rate
+        return inputs.quarter_rent_total * 0.19  # 19% retention rate
     
     def _calculate_savings_potential(self, category: str, annual_amount: float) -> float:
         """Calculate potential savings for expense category"""
@@ -0,0 +1,177 @@
+# app/services/statement_ingestion.py
+import csv
+import io
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List
+
+import pandas as pd
+
+from .movements import parse_importe_series, pick_fecha_column
+
+STATEMENT_COLUMNS = ["Fecha", "Concepto", "Importe"]
+STATEMENT_EXTENSIONS = (".xls", ".xlsx", ".csv")
+
+# Formatos de fecha aceptados, en orden de preferencia (igual que parse_european_date)
+DATE_FORMATS = ["%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d", "%m/%d/%Y", "%Y-%m-%d %H:%M:%S"]
+
+# Limpieza de las coletillas de Bankinter ("Pulsa para ver detalle del movimiento")
+_PULSA_TAIL = re.compile(r"Pulsa para ver detalle.*$", re.IGNORECASE | re.MULTILINE)
+_PULSA_LINE_TAIL = re.compile(r"\n.*Pulsa para ver.*$", re.IGNORECASE | re.MULTILINE)
+_PULSA_ANY = re.compile(r".*Pulsa para ver.*", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+class StatementFormatError(ValueError):
+    """The file does not look like a bank statement (unreadable or missing columns)"""
+
+
+@dataclass
+class ParsedStatement:
+    """
+    Typed statement shared by the upload routes.
+    movements columns: Fila (1-based row), Fecha (datetime64), Concepto (str), Importe (float64)
+    """
+    movements: pd.DataFrame
+    total_rows: int
+    errors: List[str] = field(default_factory=list)
+
+    def records(self):
+        """Iterate (row, date, concept, amount) tuples of the valid rows"""
+        return zip(
+            self.movements["Fila"].tolist(),
+            self.movements["Fecha"].dt.date.tolist(),
+            self.movements["Concepto"].tolist(),
+            self.movements["Importe"].tolist(),
+        )
+
+
+def read_statement_file(contents: bytes, filename: str) -> pd.DataFrame:
+    """Read an .xls/.xlsx/.csv statement into a raw DataFrame"""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        text = contents.decode("utf-8-sig", errors="replace")
+        try:
+            dialect = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;\t")
+            sep = dialect.delimiter
+        except csv.Error:
+            sep = ","
+        return pd.read_csv(io.StringIO(text), sep=sep, dtype=str, keep_default_na=False)
+    return pd.read_excel(io.BytesIO(contents))  # xlrd abre .xls; openpyxl abre .xlsx
+
+
+def normalize_statement_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Rename columns to Fecha/Concepto/Importe (case insensitive, with Bankinter aliases)"""
+    rename = {}
+    lower = {str(c).strip().lower(): c for c in df.columns}
+    for expected in STATEMENT_COLUMNS:
+        if expected.lower() in lower:
+            rename[lower[expected.lower()]] = expected
+
+    # Alias: "Fecha valor", "Descripción", "Importe (EUR)"...
+    if "Fecha" not in rename.values():
+        fecha_col = pick_fecha_column([str(c) for c in df.columns])
+        if fecha_col and fecha_col not in rename:
+            rename[fecha_col] = "Fecha"
+    for c in df.columns:
+        cl = str(c).lower()
+        if c in rename:
+            continue
+        if "Concepto" not in rename.values() and "descrip" in cl:
+            rename[c] = "Concepto"
+        elif "Importe" not in rename.values() and "import" in cl:
+            rename[c] = "Importe"
+
+    missing = [col.lower() for col in STATEMENT_COLUMNS if col not in rename.values()]
+    if missing:
+        raise StatementFormatError(
+            f"Missing required columns: {', '.join(missing)}. Expected: Fecha, Concepto, Importe"
+        )
+    return df.rename(columns=rename)
+
+
+def _parse_unique(s: pd.Series, parser) -> pd.Series:
+    """Run a column parser once per distinct value (statements repeat dates and concepts a lot)"""
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    parsed = parser(pd.Series(uniques, dtype=object))
+    values = pd.api.extensions.take(parsed.to_numpy(), codes, allow_fill=True)
+    return pd.Series(values, index=s.index, dtype=parsed.dtype)
+
+
+def parse_date_series(s: pd.Series) -> pd.Series:
+    """European dates -> datetime64 column, NaT where the value is not a valid date"""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.dt.normalize()
+    out = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+    pending = s.notna()
+    # Celdas que ya son fechas (Excel devuelve Timestamp/datetime en columnas mixtas)
+    if pd.api.types.infer_dtype(s, skipna=True) != "string":
+        mask_dt = s.map(lambda v: isinstance(v, date))
+        if mask_dt.any():
+            out[mask_dt] = pd.to_datetime(s[mask_dt], errors="coerce").dt.normalize()
+        pending &= ~mask_dt
+    text = s[pending].astype(str).str.strip()
+    for fmt in DATE_FORMATS:
+        if text.empty:
+            break
+        parsed = pd.to_datetime(text, format=fmt, errors="coerce")
+        ok = parsed.notna()
+        out[parsed.index[ok]] = parsed[ok].dt.normalize()
+        text = text[~ok]
+    return out
+
+
+def clean_concept_series(s: pd.Series) -> pd.Series:
+    """Remove Bankinter 'Pulsa para ver detalle' tails and collapse whitespace"""
+    s = s.where(s.notna(), "").astype(str)
+    has_pulsa = s.str.contains("pulsa para ver", case=False, regex=False)
+    if has_pulsa.any():
+        tails = s[has_pulsa]
+        tails = tails.str.replace(_PULSA_TAIL, "", regex=True)
+        tails = tails.str.replace(_PULSA_LINE_TAIL, "", regex=True)
+        tails = tails.str.replace(_PULSA_ANY, "", regex=True)
+        s = s.where(~has_pulsa, tails)
+    return s.str.replace(_SPACES, " ", regex=True).str.strip()
+
+
+def parse_statement(df: pd.DataFrame, clean_concepts: bool = True) -> ParsedStatement:
+    """Parse a raw statement frame column by column; invalid rows are reported in errors"""
+    df = normalize_statement_columns(df).reset_index(drop=True)
+    total_rows = len(df)
+
+    fechas = _parse_unique(df["Fecha"], parse_date_series)
+    importes = _parse_unique(df["Importe"], parse_importe_series)
+    if clean_concepts:
+        # Celdas vacías como "": factorize deja NaN fuera de los valores únicos que se limpian
+        conceptos = _parse_unique(df["Concepto"].fillna(""), clean_concept_series)
+    else:
+        conceptos = df["Concepto"].where(df["Concepto"].notna(), "").astype(str)
+
+    bad_date = fechas.isna()
+    bad_amount = importes.isna() & ~bad_date
+    errors = []
+    if bad_date.any() or bad_amount.any():
+        for index in df.index[bad_date | bad_amount]:
+            if bad_date[index]:
+                errors.append(f"Row {index + 1}: Invalid or missing date: {df.at[index, 'Fecha']}")
+            else:
+                errors.append(f"Row {index + 1}: Invalid or missing amount: {df.at[index, 'Importe']}")
+
+    valid = ~(bad_date | bad_amount)
+    movements = pd.DataFrame({
+        "Fila": (df.index[valid] + 1).astype("int64"),
+        "Fecha": fechas[valid].to_numpy(),
+        "Concepto": conceptos[valid].to_numpy(dtype=object),
+        "Importe": importes[valid].to_numpy(dtype="float64"),
+    })
+    return ParsedStatement(movements=movements, total_rows=total_rows, errors=errors)
+
+
+def ingest_statement(contents: bytes, filename: str, clean_concepts: bool = True) -> ParsedStatement:
+    """Read and parse an uploaded statement file"""
+    try:
+        raw = read_statement_file(contents, filename)
+    except Exception as e:
+        raise StatementFormatError(f"Could not read statement file: {e}")
+    return parse_statement(raw, clean_concepts=clean_concepts)
@@ -0,0 +1,323 @@
+# app/services/sync_jobs.py
+"""
+Background job queue for the long syncs (scrapers, upload scripts, Selenium).
+A request only inserts a SyncJob row and returns; workers claim queued rows with a
+conditional UPDATE (safe across threads and processes sharing the database), run the
+handler and write progress back to the row, so any API process can report it.
+
+Workers run as threads inside the API (settings.sync_job_workers) and/or as separate
+processes: `python -m app.services.sync_jobs`.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from ..config import settings
+from ..models import SyncJob
+from .sync_job_handlers import JOB_KINDS, JobFailed
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINAL_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+CLAIM_CANDIDATES = 5
+# Cada cuánto busca un worker trabajos huérfanos (su proceso murió a mitad)
+STALE_SWEEP_INTERVAL = 60
+LOST_WORKER_ERROR = "Worker perdido (sin progreso)"
+
+
+def _db_engine(db_engine: Optional[Engine]) -> Engine:
+    if db_engine is None:
+        from ..db import engine
+        return engine
+    return db_engine
+
+
+def _loads(value: Optional[str]):
+    return json.loads(value) if value else None
+
+
+def enqueue_job(session: Session, user_id: int, kind: str, params: Optional[Dict] = None) -> SyncJob:
+    """Insert a queued job and wake the in-process workers"""
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    job = SyncJob(
+        user_id=user_id,
+        kind=kind,
+        params=json.dumps(params or {}),
+        current_step=JOB_KINDS[kind].steps[0]
+    )
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    sync_job_worker.notify()
+    return job
+
+
+def active_job(session: Session, user_id: int, kind: str) -> Optional[SyncJob]:
+    """Queued or running job of this kind for the user (to avoid launching the same scrape twice)"""
+    return session.exec(
+        select(SyncJob)
+        .where(SyncJob.user_id == user_id)
+        .where(SyncJob.kind == kind)
+        .where(SyncJob.status.in_([JOB_QUEUED, JOB_RUNNING]))
+        .order_by(SyncJob.id.desc())
+    ).first()
+
+
+def _stale_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=settings.sync_job_stale_seconds)
+
+
+def cancel_job(session: Session, job: SyncJob) -> bool:
+    """Cancel a job that no worker has claimed yet, or fail a running one whose worker is gone"""
+    now = datetime.utcnow()
+    cancelled = session.exec(
+        update(SyncJob)
+        .where(SyncJob.id == job.id)
+        .where(SyncJob.status == JOB_QUEUED)
+        .values(status=JOB_CANCELLED, finished_at=now)
+    ).rowcount == 1
+    if not cancelled:
+        # Sin latido reciente nadie lo está ejecutando: se libera para poder lanzar otro
+        cancelled = session.exec(
+            update(SyncJob)
+            .where(SyncJob.id == job.id)
+            .where(SyncJob.status == JOB_RUNNING)
+            .where(SyncJob.heartbeat_at < _stale_cutoff())
+            .values(status=JOB_FAILED, error=LOST_WORKER_ERROR, finished_at=now)
+        ).rowcount == 1
+    session.commit()
+    session.refresh(job)
+    return cancelled
+
+
+def claim_next_job(worker_id: str, db_engine: Optional[Engine] = None) -> Optional[int]:
+    """Oldest queued job, marked as running by this worker; None if the queue is empty"""
+    with Session(_db_engine(db_engine)) as session:
+        candidates = session.exec(
+            select(SyncJob.id)
+            .where(SyncJob.status == JOB_QUEUED)
+            .order_by(SyncJob.id)
+            .limit(CLAIM_CANDIDATES)
+        ).all()
+        for job_id in candidates:
+            now = datetime.utcnow()
+            # Solo gana un worker: el UPDATE condicionado al estado es atómico en la base de datos
+            claimed = session.exec(
+                update(SyncJob)
+                .where(SyncJob.id == job_id)
+                .where(SyncJob.status == JOB_QUEUED)
+                .values(status=JOB_RUNNING, worker_id=worker_id, started_at=now, heartbeat_at=now)
+            ).rowcount == 1
+            session.commit()
+            if claimed:
+                return job_id
+    return None
+
+
+class JobProgress:
+    """Progress callback handed to the handlers: every call is one short UPDATE of the job row"""
+
+    def __init__(self, job_id: int, db_engine: Engine):
+        self.job_id = job_id
+        self.db_engine = db_engine
+        self.stats: Dict = {}
+
+    def __call__(self, percent: int, step: Optional[str] = None, **stats) -> None:
+        self.stats.update(stats)
+        values = {
+            "progress": max(0, min(100, int(percent))),
+            "heartbeat_at": datetime.utcnow(),
+            "stats": json.dumps(self.stats),
+        }
+        if step:
+            values["current_step"] = step
+        with Session(self.db_engine) as session:
+            session.exec(update(SyncJob).where(SyncJob.id == self.job_id).values(**values))
+            session.commit()
+
+
+def run_job(job_id: int, db_engine: Optional[Engine] = None) -> str:
+    """Run a claimed job to completion and store its result or error; returns the final status"""
+    db_engine = _db_engine(db_engine)
+    with Session(db_engine) as session:
+        job = session.get(SyncJob, job_id)
+        kind, params = job.kind, _loads(job.params) or {}
+
+    progress = JobProgress(job_id, db_engine)
+    try:
+        result = JOB_KINDS[kind].run(progress, params)
+        values = {"status": JOB_COMPLETED, "progress": 100, "result": json.dumps(result, default=str)}
+    except JobFailed as e:
+        values = {"status": JOB_FAILED, "error": str(e)}
+    except Exception as e:
+        logger.error(f"Sync job {job_id} ({kind}) failed: {e}\n{traceback.format_exc()}")
+        values = {"status": JOB_FAILED, "error": str(e)}
+    values["finished_at"] = datetime.utcnow()
+
+    with Session(db_engine) as session:
+        session.exec(update(SyncJob).where(SyncJob.id == job_id).values(**values))
+        session.commit()
+    logger.info(f"Sync job {job_id} ({kind}): {values['status']}")
+    return values["status"]
+
+
+def fail_stale_jobs(db_engine: Optional[Engine] = None) -> int:
+    """Running jobs without progress for settings.sync_job_stale_seconds lost their worker: mark them failed"""
+    with Session(_db_engine(db_engine)) as session:
+        # No se reintentan: repetir un scrape o una subida a medias puede duplicar movimientos
+        count = session.exec(
+            update(SyncJob)
+            .where(SyncJob.status == JOB_RUNNING)
+            .where(SyncJob.heartbeat_at < _stale_cutoff())
+            .values(status=JOB_FAILED, error=LOST_WORKER_ERROR, finished_at=datetime.utcnow())
+        ).rowcount
+        session.commit()
+    return count
+
+
+class SyncJobWorker:
+    """Worker threads polling the queue; notify() wakes them as soon as a job is enqueued here"""
+
+    def __init__(self, db_engine: Optional[Engine] = None):
+        self._db_engine = db_engine
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._sweep_lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self, workers: Optional[int] = None) -> None:
+        workers = settings.sync_job_workers if workers is None else workers
+        if self.is_running or workers <= 0:
+            return
+        self._next_sweep = 0.0
+        self._stopping.clear()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = [
+            threading.Thread(target=self._loop, args=(f"{prefix}:{i}",), name=f"sync-job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Sync job worker started ({workers} threads)")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def _sweep_stale(self) -> None:
+        """fail_stale_jobs at most every STALE_SWEEP_INTERVAL seconds across this process' threads;
+        jobs of a process that died keep a fresh heartbeat for a while after a restart"""
+        with self._sweep_lock:
+            now = time.monotonic()
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + STALE_SWEEP_INTERVAL
+        stale = fail_stale_jobs(self._db_engine)
+        if stale:
+            logger.warning(f"{stale} sync jobs marked as failed (lost worker)")
+
+    def _loop(self, worker_id: str) -> None:
+        while not self._stopping.is_set():
+            try:
+                self._sweep_stale()
+                job_id = claim_next_job(worker_id, self._db_engine)
+            except Exception as e:
+                logger.error(f"Sync job worker {worker_id}: {e}")
+                job_id = None
+            if job_id is None:
+                self._wakeup.wait(settings.sync_job_poll_interval)
+                self._wakeup.clear()
+                continue
+            run_job(job_id, self._db_engine)
+
+
+def job_to_dict(job: SyncJob) -> Dict:
+    kind = JOB_KINDS.get(job.kind)
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "label": kind.label if kind else job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "current_step": job.current_step,
+        "stats": _loads(job.stats) or {},
+        "result": _loads(job.result),
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def job_steps(job: SyncJob) -> List[Dict]:
+    """Steps of the job kind with completed / in_progress / pending from the current step"""
+    kind = JOB_KINDS.get(job.kind)
+    if not kind:
+        return []
+    steps = list(kind.steps)
+    current = steps.index(job.current_step) if job.current_step in steps else 0
+    done = job.status == JOB_COMPLETED
+    return [
+        {
+            "step": step,
+            "status": "completed" if done or i < current else (
+                "in_progress" if i == current and job.status == JOB_RUNNING else
+                "failed" if i == current and job.status == JOB_FAILED else "pending"
+            )
+        }
+        for i, step in enumerate(steps)
+    ]
+
+
+def estimated_completion(job: SyncJob) -> Optional[datetime]:
+    """Linear estimate from the elapsed time and the progress so far"""
+    if job.status != JOB_RUNNING or not job.started_at or job.progress <= 0:
+        return None
+    elapsed = datetime.utcnow() - job.started_at
+    return job.started_at + elapsed * (100 / job.progress)
+
+
+# Instancia global: arrancada con la API, o en un proceso aparte con `python -m app.services.sync_jobs`
+sync_job_worker = SyncJobWorker()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sync job worker process")
+    parser.add_argument("--threads", type=int, default=max(settings.sync_job_workers, 1))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sync_job_worker.start(args.threads)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        sync_job_worker.stop()
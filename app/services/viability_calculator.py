@@ -1,8 +1,13 @@
+import hashlib
 import math
 import json
+from collections import OrderedDict
+from threading import Lock
 from typing import Dict, List, Tuple
 from datetime import datetime, date
 
+import numpy as np
+
 def calculate_monthly_payment(loan_amount: float, annual_rate: float, years: int) -> float:
     """Calcular pago mensual de hipoteca usando fórmula estándar"""
     if annual_rate == 0:
@@ -16,22 +21,37 @@ def calculate_monthly_payment(loan_amount: float, annual_rate: float, years: int
     
     return round(monthly_payment, 2)
 
-def calculate_variable_rate_payment(study) -> float:
-    """Calcular pago mensual inicial para préstamo variable"""
-    if study.loan_type == "variable" and study.euribor_reset_vector:
+def monthly_payments(loan_amount, annual_rate, years) -> np.ndarray:
+    """Vectorized calculate_monthly_payment (rounded to cents except at a 0% rate)"""
+    loan_amount = np.asarray(loan_amount, dtype=float)
+    num_payments = np.asarray(years) * 12
+    monthly_rate = np.asarray(annual_rate, dtype=float) / 12
+    safe_rate = np.where(monthly_rate == 0, 1.0, monthly_rate)
+    growth = (1 + safe_rate) ** num_payments
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            monthly_rate == 0,
+            loan_amount / num_payments,
+            np.round(loan_amount * safe_rate * growth / (growth - 1), 2)
+        )
+
+def initial_payment_rate(study) -> float:
+    """Tipo anual con el que se calcula la cuota inicial (Euribor + diferencial en préstamos variables)"""
+    if getattr(study, 'loan_type', None) == "variable" and study.euribor_reset_vector:
         try:
             # Obtener vector de Euribor
             euribor_vector = json.loads(study.euribor_reset_vector) if isinstance(study.euribor_reset_vector, str) else study.euribor_reset_vector
             
             # Tipo inicial: Euribor actual + diferencial
-            initial_rate = (euribor_vector[0] / 100) + (study.euribor_spread or 0.015)
-            
-            return calculate_monthly_payment(study.loan_amount, initial_rate, study.loan_term_years)
+            return (euribor_vector[0] / 100) + (study.euribor_spread or 0.015)
         except:
             # Fallback al tipo fijo si hay error
-            return calculate_monthly_payment(study.loan_amount, study.interest_rate, study.loan_term_years)
-    else:
-        return calculate_monthly_payment(study.loan_amount, study.interest_rate, study.loan_term_years)
+            return study.interest_rate
+    return study.interest_rate
+
+def calculate_variable_rate_payment(study) -> float:
+    """Calcular pago mensual inicial para préstamo variable"""
+    return calculate_monthly_payment(study.loan_amount, initial_payment_rate(study), study.loan_term_years)
 
 def calculate_monthly_expenses(study) -> float:
     """Calcular gastos mensuales totales"""
@@ -153,145 +173,127 @@ def calculate_viability_metrics(study):
     
     return study
 
-def generate_temporal_projection(study, years: int = 10) -> List:
-    """Generar proyección mes a mes durante X años"""
-    if years > 30:
-        years = 30  # Máximo 30 años
-    
-    projections = []
-    
-    # Variables iniciales
-    current_loan_balance = study.loan_amount
-    accumulated_cashflow = 0
-    current_property_value = study.purchase_price
-    accumulated_equity = study.down_payment
-    
-    # Tasas mensuales
-    monthly_interest_rate = study.interest_rate / 12
-    monthly_rent_increase = study.annual_rent_increase / 12
-    property_appreciation_rate = 0.03 / 12  # 3% anual de revalorización
-    
-    # Gastos mensuales (constantes)
+# Proyecciones calculadas al leer (sin filas en base de datos), cacheadas por contenido del estudio
+PROJECTION_CACHE_SIZE = 256
+MAX_PROJECTION_YEARS = 30
+PROPERTY_APPRECIATION_RATE = 0.03  # 3% anual de revalorización
+
+# Campos del estudio de los que depende la proyección
+PROJECTION_INPUT_FIELDS = (
+    'loan_amount', 'interest_rate', 'monthly_mortgage_payment', 'down_payment',
+    'monthly_rent', 'annual_rent_increase', 'purchase_price', 'maintenance_percentage',
+    'community_fees', 'property_tax_ibi', 'life_insurance', 'home_insurance', 'property_management_fee'
+)
+
+_projection_cache: "OrderedDict[tuple, Dict[str, np.ndarray]]" = OrderedDict()
+_projection_cache_lock = Lock()
+
+
+def projection_input_hash(study) -> str:
+    """Hash of the inputs the projection depends on"""
+    inputs = tuple(getattr(study, field, None) for field in PROJECTION_INPUT_FIELDS)
+    return hashlib.sha256(repr(inputs).encode()).hexdigest()
+
+
+def _build_projection(study) -> Dict[str, np.ndarray]:
+    """Monthly projection over MAX_PROJECTION_YEARS from closed-form amortization and cumulative growth"""
+    n = MAX_PROJECTION_YEARS * 12
+    k = np.arange(1, n + 1)
+    loan = study.loan_amount
+    payment = study.monthly_mortgage_payment
+    monthly_rate = study.interest_rate / 12
+
+    # Saldo tras k cuotas constantes: L(1+i)^k - C((1+i)^k - 1)/i
+    if monthly_rate != 0:
+        growth = (1 + monthly_rate) ** k
+        balance = loan * growth - payment * (growth - 1) / monthly_rate
+    else:
+        balance = loan - payment * k
+    balance = np.maximum(balance, 0)
+    previous = np.concatenate(([loan], balance[:-1]))
+    principal = previous - balance
+    # El último pago solo amortiza lo que queda; después no hay cuota de préstamo
+    interest = np.where(previous > 0, payment - principal, 0.0)
+
+    rent = study.monthly_rent * (1 + study.annual_rent_increase) ** ((k - 1) // 12)
+    property_value = study.purchase_price * (1 + PROPERTY_APPRECIATION_RATE / 12) ** k
     monthly_expenses = calculate_monthly_expenses(study)
-    
-    for year in range(1, years + 1):
-        for month in range(1, 13):
-            # Renta con incremento anual
-            months_elapsed = (year - 1) * 12 + month - 1
-            current_monthly_rent = study.monthly_rent * ((1 + study.annual_rent_increase) ** ((year - 1)))
-            
-            # Cálculos de hipoteca
-            if current_loan_balance > 0:
-                monthly_interest = current_loan_balance * monthly_interest_rate
-                monthly_principal = study.monthly_mortgage_payment - monthly_interest
-                
-                # No puede pagar más principal del que queda
-                if monthly_principal > current_loan_balance:
-                    monthly_principal = current_loan_balance
-                    monthly_interest = study.monthly_mortgage_payment - monthly_principal
-                
-                current_loan_balance -= monthly_principal
-                current_loan_balance = max(0, current_loan_balance)  # No puede ser negativo
-            else:
-                monthly_interest = 0
-                monthly_principal = 0
-            
-            # Valor de propiedad con revalorización
-            current_property_value *= (1 + property_appreciation_rate)
-            
-            # Cashflow del mes
-            monthly_net_cashflow = current_monthly_rent - study.monthly_mortgage_payment - monthly_expenses
-            accumulated_cashflow += monthly_net_cashflow
-            
-            # Equity acumulado
-            accumulated_equity += monthly_principal
-            
-            # Métricas
-            if study.down_payment > 0:
-                annual_return = (monthly_net_cashflow * 12) / study.down_payment
-                total_return_with_equity = ((monthly_net_cashflow + monthly_principal) * 12) / study.down_payment
-            else:
-                annual_return = 0
-                total_return_with_equity = 0
-            
-            current_ltv = current_loan_balance / current_property_value if current_property_value > 0 else 0
-            
-            # Crear projection como diccionario primero, se convertirá en el router
-            projection = {
-                'viability_study_id': study.id,
-                'year': year,
-                'month': month,
-                'outstanding_loan_balance': round(current_loan_balance, 2),
-                'accumulated_equity': round(accumulated_equity, 2),
-                'property_value': round(current_property_value, 2),
-                'monthly_rent': round(current_monthly_rent, 2),
-                'monthly_mortgage_payment': study.monthly_mortgage_payment,
-                'monthly_interest': round(monthly_interest, 2),
-                'monthly_principal': round(monthly_principal, 2),
-                'monthly_expenses': monthly_expenses,
-                'monthly_net_cashflow': round(monthly_net_cashflow, 2),
-                'accumulated_cashflow': round(accumulated_cashflow, 2),
-                'annual_return': round(annual_return, 4),
-                'total_return_with_equity': round(total_return_with_equity, 4),
-                'current_ltv': round(current_ltv, 4)
-            }
-            
-            projections.append(projection)
-    
-    return projections
+    cashflow = rent - payment - monthly_expenses
 
-def perform_sensitivity_analysis(study, parameters: Dict) -> Dict:
-    """Análisis de sensibilidad variando parámetros clave"""
-    base_metrics = {
-        'net_annual_return': study.net_annual_return,
-        'monthly_cashflow': study.monthly_net_cashflow,
-        'total_annual_return': study.total_annual_return
-    }
-    
-    sensitivity_results = {
-        'base_scenario': base_metrics,
-        'scenarios': {}
-    }
-    
-    # Escenarios a probar
-    scenarios = {
-        'rent_decrease_5': {'monthly_rent': study.monthly_rent * 0.95},
-        'rent_decrease_10': {'monthly_rent': study.monthly_rent * 0.90},
-        'rent_increase_10': {'monthly_rent': study.monthly_rent * 1.10},
-        'interest_increase_1': {'interest_rate': study.interest_rate + 0.01},
-        'interest_increase_2': {'interest_rate': study.interest_rate + 0.02},
-        'maintenance_double': {'maintenance_percentage': study.maintenance_percentage * 2},
-        'vacancy_1month': {'monthly_rent': study.monthly_rent * (11/12)},  # 1 mes vacío
-        'vacancy_2months': {'monthly_rent': study.monthly_rent * (10/12)},  # 2 meses vacíos
+    if study.down_payment > 0:
+        annual_return = cashflow * 12 / study.down_payment
+        total_return = (cashflow + principal) * 12 / study.down_payment
+    else:
+        annual_return = total_return = np.zeros(n)
+
+    arrays = {
+        'year': (k - 1) // 12 + 1,
+        'month': (k - 1) % 12 + 1,
+        'outstanding_loan_balance': balance,
+        'accumulated_equity': study.down_payment + np.cumsum(principal),
+        'property_value': property_value,
+        'monthly_rent': rent,
+        'monthly_mortgage_payment': np.full(n, payment),
+        'monthly_interest': interest,
+        'monthly_principal': principal,
+        'monthly_expenses': np.full(n, monthly_expenses),
+        'monthly_net_cashflow': cashflow,
+        'accumulated_cashflow': np.cumsum(cashflow),
+        'annual_return': annual_return,
+        'total_return_with_equity': total_return,
+        'current_ltv': np.where(property_value > 0, balance / property_value, 0.0),
     }
-    
-    for scenario_name, changes in scenarios.items():
-        # Crear copia simple de las propiedades del estudio
-        test_data = {
-            'monthly_rent': getattr(study, 'monthly_rent', 0),
-            'purchase_price': getattr(study, 'purchase_price', 0),
-            'interest_rate': getattr(study, 'interest_rate', 0),
-            'maintenance_percentage': getattr(study, 'maintenance_percentage', 0.01)
-        }
-        
-        # Aplicar cambios
-        for param, value in changes.items():
-            test_data[param] = value
-        
-        # Calcular métricas simplificadas para el escenario
-        # Esta es una versión simplificada que no requiere crear objetos completos
-        rent_change = changes.get('monthly_rent', study.monthly_rent) / study.monthly_rent
-        adjusted_annual_return = study.net_annual_return * rent_change
-        adjusted_monthly_cashflow = study.monthly_net_cashflow * rent_change
-        
-        sensitivity_results['scenarios'][scenario_name] = {
-            'net_annual_return': adjusted_annual_return,
-            'monthly_cashflow': adjusted_monthly_cashflow,
-            'total_annual_return': study.total_annual_return * rent_change,
-            'changes': changes
-        }
-    
-    return sensitivity_results
+    for array in arrays.values():
+        array.flags.writeable = False
+    return arrays
+
+
+def projection_arrays(study, years: int = 10) -> Dict[str, np.ndarray]:
+    """
+    Month-by-month projection arrays for the first years (max MAX_PROJECTION_YEARS).
+    Cached by study id, updated_at and input hash, so reopening a study costs nothing.
+    """
+    months = min(years, MAX_PROJECTION_YEARS) * 12
+    key = (getattr(study, 'id', None), getattr(study, 'updated_at', None), projection_input_hash(study))
+    with _projection_cache_lock:
+        arrays = _projection_cache.get(key)
+        if arrays is not None:
+            _projection_cache.move_to_end(key)
+    if arrays is None:
+        arrays = _build_projection(study)
+        with _projection_cache_lock:
+            _projection_cache[key] = arrays
+            while len(_projection_cache) > PROJECTION_CACHE_SIZE:
+                _projection_cache.popitem(last=False)
+    return {name: array[:months] for name, array in arrays.items()}
+
+
+# Decimales de cada campo en las proyecciones servidas
+PROJECTION_DECIMALS = {
+    'annual_return': 4,
+    'total_return_with_equity': 4,
+    'current_ltv': 4,
+}
+
+
+def generate_temporal_projection(study, years: int = 10) -> List[Dict]:
+    """Generar proyección mes a mes durante X años (máximo 30), como diccionarios redondeados"""
+    arrays = projection_arrays(study, years)
+    columns = {}
+    for name, array in arrays.items():
+        if name in ('year', 'month'):
+            columns[name] = array.tolist()
+        else:
+            columns[name] = np.round(array, PROJECTION_DECIMALS.get(name, 2)).tolist()
+    # Cuota y gastos se sirven tal cual, como en el estudio
+    columns['monthly_mortgage_payment'] = arrays['monthly_mortgage_payment'].tolist()
+    columns['monthly_expenses'] = arrays['monthly_expenses'].tolist()
+
+    names = list(columns)
+    return [
+        {'viability_study_id': study.id, **dict(zip(names, values))}
+        for values in zip(*columns.values())
+    ]
 
 def compare_studies(studies: List) -> Dict:
     """Comparar múltiples estudios de viabilidad"""
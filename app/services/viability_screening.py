@@ -0,0 +1,258 @@
+# app/services/viability_screening.py
+"""
+Stateless screening of candidate listings: every output of calculate_viability_metrics
+(and the risk level) computed column-wise over a batch of candidates, then ranked.
+Nothing is persisted; a candidate worth keeping is created as a ViabilityStudy afterwards.
+"""
+import io
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .viability_calculator import monthly_payments
+
+MAX_SCREEN_CANDIDATES = 50000
+
+# Sin columna ni valor por defecto en la petición se usan los de ViabilityStudyCreate
+SCREEN_DEFAULTS = {
+    'purchase_taxes_percentage': 0.11,
+    'renovation_costs': 0.0,
+    'real_estate_commission': 0.0,
+    'loan_term_years': 25,
+    'euribor_spread': 0.015,
+    'community_fees': 0.0,
+    'life_insurance': 0.0,
+    'maintenance_percentage': 0.01,
+    'property_management_fee': 0.0,
+    # Si no viene loan_amount se financia este porcentaje del precio
+    'financing_percentage': 0.80,
+}
+REQUIRED_COLUMNS = ('purchase_price', 'monthly_rent', 'interest_rate', 'property_tax_ibi', 'home_insurance')
+NUMERIC_COLUMNS = REQUIRED_COLUMNS + tuple(SCREEN_DEFAULTS) + ('loan_amount', 'euribor')
+
+# Nombres de columna de los scrapers de mcp-real-estate
+COLUMN_ALIASES = {
+    'price': 'purchase_price',
+    'rent': 'monthly_rent',
+    'pricePerMonth': 'monthly_rent',
+}
+
+OUTPUT_COLUMNS = (
+    'purchase_costs', 'total_purchase_price', 'down_payment', 'loan_amount', 'loan_to_value',
+    'monthly_mortgage_payment', 'monthly_expenses', 'monthly_net_cashflow', 'annual_net_cashflow',
+    'net_annual_return', 'monthly_equity_increase', 'annual_equity_increase', 'total_annual_return',
+    'break_even_rent', 'is_favorable', 'risk_level'
+)
+RISK_LEVELS = np.array(['LOW', 'MEDIUM', 'HIGH'])
+
+
+class ScreeningError(ValueError):
+    pass
+
+
+def _numeric(values: Sequence) -> np.ndarray:
+    """Column as float64, with None / empty / unparsable entries as NaN"""
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        out = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                out[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return out
+
+
+def prepare_candidates(
+    columns: Dict[str, Sequence],
+    defaults: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[str, np.ndarray], Dict[str, list], int]:
+    """
+    Split a columnar batch into numeric input arrays (defaults filled in) and passthrough
+    columns (ids, titles, urls...). Returns (inputs, passthrough, row count).
+    """
+    columns = {COLUMN_ALIASES.get(name, name): values for name, values in columns.items()}
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) != 1:
+        raise ScreeningError("Todas las columnas deben tener la misma longitud")
+    count = lengths.pop()
+    if count > MAX_SCREEN_CANDIDATES:
+        raise ScreeningError(f"Máximo {MAX_SCREEN_CANDIDATES} candidatos por petición")
+
+    defaults = {**SCREEN_DEFAULTS, **(defaults or {})}
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns and name not in defaults]
+    if missing:
+        raise ScreeningError(f"Faltan columnas obligatorias: {missing}")
+
+    inputs = {}
+    for name in NUMERIC_COLUMNS:
+        values = _numeric(columns[name]) if name in columns else np.full(count, np.nan)
+        if name in defaults:
+            values = np.where(np.isnan(values), float(defaults[name]), values)
+        inputs[name] = values
+    # Préstamo no indicado: porcentaje de financiación sobre el precio
+    inputs['loan_amount'] = np.where(
+        np.isnan(inputs['loan_amount']),
+        inputs['purchase_price'] * inputs['financing_percentage'],
+        inputs['loan_amount']
+    )
+    loan_type = columns.get('loan_type', [defaults.get('loan_type', 'fixed')] * count)
+    inputs['is_variable'] = np.array([value == 'variable' for value in loan_type], dtype=bool)
+
+    passthrough = {
+        name: [None if isinstance(v, float) and np.isnan(v) else v for v in np.asarray(values, dtype=object).tolist()]
+        for name, values in columns.items() if name not in inputs and name != 'loan_type'
+    }
+    return inputs, passthrough, count
+
+
+def risk_levels(net_annual_return, monthly_net_cashflow, loan_to_value, monthly_rent, break_even_rent) -> np.ndarray:
+    """Vectorized calculate_risk_level"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rent_buffer = np.where(monthly_rent != 0, (monthly_rent - break_even_rent) / monthly_rent, -np.inf)
+    factors = (
+        np.where(net_annual_return < 0.04, 2, np.where(net_annual_return < 0.06, 1, 0))
+        + np.where(monthly_net_cashflow < 0, 2, np.where(monthly_net_cashflow < 100, 1, 0))
+        + np.where(loan_to_value > 0.85, 2, np.where(loan_to_value > 0.75, 1, 0))
+        + np.where(rent_buffer < 0.10, 2, np.where(rent_buffer < 0.20, 1, 0))
+    )
+    return RISK_LEVELS[np.where(factors >= 5, 2, np.where(factors >= 3, 1, 0))]
+
+
+def screen_metrics(inputs: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """calculate_viability_metrics over arrays: one entry per candidate in every output column"""
+    price = inputs['purchase_price']
+    loan = inputs['loan_amount']
+    rent = inputs['monthly_rent']
+
+    purchase_costs = price * inputs['purchase_taxes_percentage']
+    total_purchase_price = price + purchase_costs + inputs['renovation_costs'] + inputs['real_estate_commission']
+    down_payment = total_purchase_price - loan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        loan_to_value = np.where(total_purchase_price > 0, loan / total_purchase_price, 0.0)
+
+    # Variable con Euribor conocido: Euribor (%) + diferencial, como initial_payment_rate
+    has_euribor = inputs['is_variable'] & ~np.isnan(inputs['euribor'])
+    rate = np.where(has_euribor, inputs['euribor'] / 100 + inputs['euribor_spread'], inputs['interest_rate'])
+    payment = monthly_payments(loan, rate, inputs['loan_term_years'].astype(int))
+
+    annual_expenses = (
+        inputs['community_fees'] + inputs['property_tax_ibi'] + inputs['life_insurance']
+        + inputs['home_insurance'] + price * inputs['maintenance_percentage'] + inputs['property_management_fee']
+    )
+    monthly_expenses = np.round(annual_expenses / 12, 2)
+
+    monthly_net_cashflow = rent - payment - monthly_expenses
+    annual_net_cashflow = monthly_net_cashflow * 12
+    safe_down = np.where(down_payment > 0, down_payment, 1.0)
+    net_annual_return = np.where(down_payment > 0, annual_net_cashflow / safe_down, 0.0)
+
+    monthly_equity_increase = np.where(loan > 0, payment - loan * inputs['interest_rate'] / 12, 0.0)
+    annual_equity_increase = monthly_equity_increase * 12
+    total_annual_return = np.where(
+        down_payment > 0, (annual_net_cashflow + annual_equity_increase) / safe_down, 0.0
+    )
+    break_even_rent = payment + monthly_expenses
+
+    return {
+        'purchase_costs': purchase_costs,
+        'total_purchase_price': total_purchase_price,
+        'down_payment': down_payment,
+        'loan_amount': loan,
+        'loan_to_value': loan_to_value,
+        'monthly_mortgage_payment': payment,
+        'monthly_expenses': monthly_expenses,
+        'monthly_net_cashflow': monthly_net_cashflow,
+        'annual_net_cashflow': annual_net_cashflow,
+        'net_annual_return': net_annual_return,
+        'monthly_equity_increase': monthly_equity_increase,
+        'annual_equity_increase': annual_equity_increase,
+        'total_annual_return': total_annual_return,
+        'break_even_rent': break_even_rent,
+        'is_favorable': (net_annual_return > 0.05) & (monthly_net_cashflow > 0),
+        'risk_level': risk_levels(net_annual_return, monthly_net_cashflow, loan_to_value, rent, break_even_rent),
+    }
+
+
+def screen_candidates(
+    columns: Dict[str, Sequence],
+    defaults: Optional[Dict[str, Any]] = None,
+    sort_by: str = 'net_annual_return',
+    descending: bool = True,
+    favorable_only: bool = False,
+    max_risk_level: Optional[str] = None,
+    limit: int = 100
+) -> Dict:
+    """Compute, filter and rank a columnar batch; returns the top `limit` rows as records"""
+    if sort_by not in OUTPUT_COLUMNS or sort_by in ('is_favorable', 'risk_level'):
+        raise ScreeningError(f"No se puede ordenar por {sort_by}")
+    inputs, passthrough, count = prepare_candidates(columns, defaults)
+    metrics = screen_metrics(inputs)
+
+    # Filas con algún dato obligatorio ausente no se puntúan
+    valid = np.ones(count, dtype=bool)
+    for name in REQUIRED_COLUMNS + ('loan_amount',):
+        valid &= ~np.isnan(inputs[name])
+    keep = valid.copy()
+    if favorable_only:
+        keep &= metrics['is_favorable']
+    if max_risk_level:
+        risk_index = np.argmax(metrics['risk_level'][:, None] == RISK_LEVELS[None, :], axis=1)
+        keep &= risk_index <= list(RISK_LEVELS).index(max_risk_level)
+
+    indices = np.flatnonzero(keep)
+    key = metrics[sort_by][indices]
+    order = indices[np.argsort(-key if descending else key, kind='stable')][:limit]
+
+    # Columnas del resultado ya ordenadas, convertidas a tipos Python de una vez
+    table = {'rank': list(range(1, len(order) + 1)), 'index': order.tolist()}
+    for name, values in passthrough.items():
+        table[name] = [values[i] for i in table['index']]
+    for name in ('purchase_price', 'monthly_rent', 'interest_rate'):
+        table[name] = inputs[name][order].tolist()
+    for name in OUTPUT_COLUMNS:
+        values = metrics[name][order]
+        table[name] = (np.round(values, 4) if values.dtype.kind == 'f' else values).tolist()
+    names = list(table)
+    records = [dict(zip(names, row)) for row in zip(*table.values())]
+
+    return {
+        'screened': count,
+        'matching': int(len(indices)),
+        'invalid_rows': np.flatnonzero(~valid).tolist(),
+        'sort_by': sort_by,
+        'results': records,
+    }
+
+
+def read_candidate_table(contents: bytes, filename: str) -> Dict[str, Sequence]:
+    """Columns of an uploaded Parquet, Arrow/Feather or CSV table"""
+    import pandas as pd
+
+    name = filename.lower()
+    buffer = io.BytesIO(contents)
+    try:
+        if name.endswith('.parquet'):
+            frame = pd.read_parquet(buffer)
+        elif name.endswith(('.arrow', '.feather', '.ipc')):
+            frame = pd.read_feather(buffer)
+        elif name.endswith('.csv'):
+            frame = pd.read_csv(buffer)
+        else:
+            raise ScreeningError("Formatos admitidos: .parquet, .arrow/.feather, .csv")
+    except ScreeningError:
+        raise
+    except ImportError as e:
+        # Parquet y Arrow necesitan pyarrow
+        raise ScreeningError(f"Formato no disponible en este servidor: {e}")
+    except Exception as e:
+        raise ScreeningError(f"No se pudo leer el fichero: {e}")
+    columns = {}
+    for column in frame.columns:
+        series = frame[column]
+        if pd.api.types.is_numeric_dtype(series):
+            columns[str(column)] = series.to_numpy(dtype=float, na_value=np.nan)
+        else:
+            columns[str(column)] = series.astype(object).where(series.notna(), None).tolist()
+    return columns
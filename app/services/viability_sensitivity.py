@@ -0,0 +1,235 @@
+# app/services/viability_sensitivity.py
+"""
+Sensitivity analysis of a viability study: the metrics of calculate_viability_metrics
+re-evaluated as NumPy arrays over perturbed inputs (rent, rate, price, expenses, vacancy,
+appreciation), so a tornado chart or a 50x50 heatmap is a single broadcast computation
+instead of one study copy per scenario.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .viability_calculator import PROPERTY_APPRECIATION_RATE, initial_payment_rate, monthly_payments
+
+RELATIVE = "relative"  # Variación sobre el valor base: 0.1 = +10%
+ABSOLUTE = "absolute"  # Se suma al valor base: 0.01 = +1 punto
+
+
+@dataclass(frozen=True)
+class SensitivityParameter:
+    label: str
+    kind: str
+    low: float
+    high: float
+
+
+PARAMETERS: Dict[str, SensitivityParameter] = {
+    'monthly_rent': SensitivityParameter('Renta mensual', RELATIVE, -0.10, 0.10),
+    'interest_rate': SensitivityParameter('Tipo de interés', ABSOLUTE, -0.01, 0.01),
+    'purchase_price': SensitivityParameter('Precio de compra', RELATIVE, -0.10, 0.10),
+    'expenses': SensitivityParameter('Gastos', RELATIVE, -0.20, 0.20),
+    'maintenance_percentage': SensitivityParameter('Mantenimiento', RELATIVE, -0.50, 1.0),
+    'vacancy': SensitivityParameter('Vacancia', ABSOLUTE, 0.0, 0.10),
+    'appreciation': SensitivityParameter('Revalorización anual', ABSOLUTE, -0.03, 0.03),
+}
+
+METRICS = (
+    'monthly_cashflow', 'net_annual_return', 'total_annual_return',
+    'total_return_with_appreciation', 'break_even_rent'
+)
+
+
+def base_values(study) -> Dict[str, float]:
+    """Unperturbed value of every parameter (vacancy is 0: the base metrics assume full occupancy)"""
+    return {
+        'monthly_rent': study.monthly_rent,
+        'interest_rate': initial_payment_rate(study),
+        'purchase_price': study.purchase_price,
+        'expenses': 1.0,
+        'maintenance_percentage': study.maintenance_percentage,
+        'vacancy': 0.0,
+        'appreciation': PROPERTY_APPRECIATION_RATE,
+    }
+
+
+def perturbed_values(study, name: str, deltas) -> np.ndarray:
+    """Parameter values for the given deltas (relative or absolute, per PARAMETERS)"""
+    parameter = PARAMETERS[name]
+    base = base_values(study)[name]
+    deltas = np.asarray(deltas, dtype=float)
+    return base * (1 + deltas) if parameter.kind == RELATIVE else base + deltas
+
+
+def evaluate_metrics(study, overrides: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """
+    Same formulas and roundings as calculate_viability_metrics, over arrays of parameter
+    values that broadcast against each other (e.g. rent (n, 1) x rate (1, m))
+    """
+    values = {**base_values(study), **(overrides or {})}
+    as_array = lambda name: np.asarray(values[name], dtype=float)
+    rent = as_array('monthly_rent') * (1 - as_array('vacancy'))
+    rate = as_array('interest_rate')
+    price = as_array('purchase_price')
+
+    total_purchase_price = (
+        price + price * study.purchase_taxes_percentage
+        + (study.renovation_costs or 0) + (study.real_estate_commission or 0)
+    )
+    down_payment = total_purchase_price - study.loan_amount
+
+    payment = monthly_payments(study.loan_amount, rate, study.loan_term_years)
+
+    annual_fixed = (
+        (study.community_fees or 0) + study.property_tax_ibi + (study.life_insurance or 0)
+        + study.home_insurance + (study.property_management_fee or 0)
+    )
+    expenses = np.round((annual_fixed + price * as_array('maintenance_percentage')) / 12, 2) * as_array('expenses')
+
+    cashflow = rent - payment - expenses
+    annual_cashflow = cashflow * 12
+    # Interés de la primera cuota: como en el cálculo base, sobre interest_rate (+ la variación de tipo)
+    interest_rate = study.interest_rate + (rate - initial_payment_rate(study))
+    equity = payment - study.loan_amount * interest_rate / 12 if study.loan_amount > 0 else np.zeros_like(payment)
+    annual_equity = equity * 12
+    appreciation = price * as_array('appreciation')
+
+    safe_down = np.where(down_payment > 0, down_payment, 1.0)
+    on_equity = lambda amount: np.where(down_payment > 0, amount / safe_down, 0.0)
+    shape = np.broadcast_shapes(*(np.shape(values[name]) for name in values))
+    metrics = {
+        'monthly_cashflow': cashflow,
+        'net_annual_return': on_equity(annual_cashflow),
+        'total_annual_return': on_equity(annual_cashflow + annual_equity),
+        'total_return_with_appreciation': on_equity(annual_cashflow + annual_equity + appreciation),
+        'break_even_rent': payment + expenses,
+    }
+    return {name: np.broadcast_to(metric, shape) for name, metric in metrics.items()}
+
+
+def _scalar_metrics(metrics: Dict[str, np.ndarray], index=()) -> Dict[str, float]:
+    return {name: float(metric[index]) for name, metric in metrics.items()}
+
+
+def tornado(
+    study,
+    ranges: Optional[Dict[str, Tuple[float, float]]] = None,
+    metric: str = 'net_annual_return'
+) -> List[Dict]:
+    """
+    One bar per parameter: the metric at its low and high perturbation, sorted by swing.
+    All 2 x len(PARAMETERS) scenarios are evaluated in one batch.
+    """
+    names = list(PARAMETERS)
+    ranges = ranges or {}
+    deltas = [ranges.get(name, (PARAMETERS[name].low, PARAMETERS[name].high)) for name in names]
+    base = base_values(study)
+
+    # Escenario k: parámetro k // 2 en su extremo bajo (k par) o alto (k impar), el resto en su base
+    scenarios = len(names) * 2
+    overrides = {}
+    for i, name in enumerate(names):
+        column = np.full(scenarios, base[name])
+        column[2 * i:2 * i + 2] = perturbed_values(study, name, deltas[i])
+        overrides[name] = column
+    metrics = evaluate_metrics(study, overrides)
+    base_metric = float(evaluate_metrics(study)[metric])
+
+    bars = []
+    for i, name in enumerate(names):
+        low_value, high_value = overrides[name][2 * i:2 * i + 2]
+        low, high = _scalar_metrics(metrics, 2 * i), _scalar_metrics(metrics, 2 * i + 1)
+        bars.append({
+            'parameter': name,
+            'label': PARAMETERS[name].label,
+            'base_value': base[name],
+            'low_value': float(low_value),
+            'high_value': float(high_value),
+            'low': low[metric] - base_metric,
+            'high': high[metric] - base_metric,
+            'swing': abs(high[metric] - low[metric]),
+            'low_metrics': low,
+            'high_metrics': high,
+        })
+    bars.sort(key=lambda bar: bar['swing'], reverse=True)
+    return bars
+
+
+def heatmap(
+    study,
+    x_parameter: str,
+    y_parameter: str,
+    x_deltas,
+    y_deltas,
+    metrics: Tuple[str, ...] = METRICS
+) -> Dict:
+    """Metrics over the x_deltas x y_deltas grid of two parameters, indexed [x][y]"""
+    if x_parameter == y_parameter:
+        raise ValueError("Los parámetros del mapa de calor deben ser distintos")
+    x_values = perturbed_values(study, x_parameter, x_deltas)
+    y_values = perturbed_values(study, y_parameter, y_deltas)
+    results = evaluate_metrics(study, {x_parameter: x_values[:, None], y_parameter: y_values[None, :]})
+    return {
+        'x': {'parameter': x_parameter, 'deltas': list(map(float, x_deltas)), 'values': x_values.tolist()},
+        'y': {'parameter': y_parameter, 'deltas': list(map(float, y_deltas)), 'values': y_values.tolist()},
+        'metrics': {name: np.round(results[name], 6).tolist() for name in metrics},
+    }
+
+
+# Escenarios clásicos del análisis de sensibilidad (cambios aplicados sobre la base)
+SCENARIOS = {
+    'rent_decrease_5': {'monthly_rent': -0.05},
+    'rent_decrease_10': {'monthly_rent': -0.10},
+    'rent_increase_10': {'monthly_rent': 0.10},
+    'interest_increase_1': {'interest_rate': 0.01},
+    'interest_increase_2': {'interest_rate': 0.02},
+    'maintenance_double': {'maintenance_percentage': 1.0},
+    'vacancy_1month': {'vacancy': 1 / 12},
+    'vacancy_2months': {'vacancy': 2 / 12},
+}
+
+
+def perform_sensitivity_analysis(study, parameters: Optional[Dict] = None) -> Dict:
+    """
+    Análisis de sensibilidad recalculando el modelo completo en cada escenario, más los
+    datos del gráfico tornado. parameters admite {"ranges": {param: [bajo, alto]}, "metric": ...}
+    """
+    parameters = parameters or {}
+    ranges = parameters.get('ranges') or {}
+    unknown = set(ranges) - set(PARAMETERS)
+    if unknown:
+        raise ValueError(f"Parámetros desconocidos: {sorted(unknown)}")
+    metric = parameters.get('metric', 'net_annual_return')
+    if metric not in METRICS:
+        raise ValueError(f"Métrica desconocida: {metric}")
+
+    names = list(SCENARIOS)
+    base = base_values(study)
+    overrides = {name: np.full(len(names), value) for name, value in base.items()}
+    for i, changes in enumerate(SCENARIOS.values()):
+        for name, delta in changes.items():
+            overrides[name][i] = perturbed_values(study, name, delta)
+    metrics = evaluate_metrics(study, overrides)
+    base_metrics = _scalar_metrics(evaluate_metrics(study))
+
+    return {
+        'base_scenario': {
+            'net_annual_return': base_metrics['net_annual_return'],
+            'monthly_cashflow': base_metrics['monthly_cashflow'],
+            'total_annual_return': base_metrics['total_annual_return'],
+        },
+        'scenarios': {
+            name: {
+                'net_annual_return': float(metrics['net_annual_return'][i]),
+                'monthly_cashflow': float(metrics['monthly_cashflow'][i]),
+                'total_annual_return': float(metrics['total_annual_return'][i]),
+                'changes': SCENARIOS[name],
+            }
+            for i, name in enumerate(names)
+        },
+        'tornado': {
+            'metric': metric,
+            'base': base_metrics[metric],
+            'bars': tornado(study, {k: tuple(v) for k, v in ranges.items()}, metric),
+        },
+    }
@@ -813,7 +813,7 @@ export default function DashboardPage() {
                             <div className="flex-shrink-0 relative">
                               {property.photo ? (
                                 <img 
-                                  src={property.photo.startsWith('http') ? property.photo : `${process.env.NEXT_PUBLIC_API_URL}${property.photo}`} 
+                                  src={property.photo.startsWith('http') ? property.photo : `${process.env.NEXT_PUBLIC_API_URL}${property.photo}?w=160`} 
                                   alt={property.address}
                                   className="w-20 h-20 rounded-xl object-cover shadow-lg border-2 border-white"
                                   onError={(e) => {
@@ -1310,7 +1310,7 @@ export default function DashboardPage() {
                     <div className="mt-2">
                       <p className="text-sm text-gray-600 mb-2">Foto actual:</p>
                       <img 
-                        src={editingProperty.photo.startsWith('http') ? editingProperty.photo : `${process.env.NEXT_PUBLIC_API_URL}${editingProperty.photo}`} 
+                        src={editingProperty.photo.startsWith('http') ? editingProperty.photo : `${process.env.NEXT_PUBLIC_API_URL}${editingProperty.photo}?w=640`} 
                         alt="Foto actual"
                         className="w-full h-32 object-cover rounded-lg border"
                       />
@@ -1,5 +1,5 @@
 "use client";
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import api from "@/lib/api";
 
 interface Property {
@@ -24,10 +24,30 @@ interface MovementWithProperty extends FinancialMovement {
   property_address: string;
 }
 
+const MOVEMENTS_PAGE_SIZE = 500;
+
+interface MovementsSummary {
+  count: number;
+  income: number;
+  expenses: number;
+  net: number;
+}
+
 export default function MovementsTab() {
   const [movements, setMovements] = useState<MovementWithProperty[]>([]);
   const [properties, setProperties] = useState<Property[]>([]);
   const [loading, setLoading] = useState(true);
+  const movementsLoadId = useRef(0);
+  // Active query (filters + enrichment) used to fetch the next keyset page on demand
+  const movementsQuery = useRef<{
+    params: URLSearchParams;
+    prepare: (page: FinancialMovement[]) => MovementWithProperty[];
+  } | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // Server-side count (X-Total-Count) and totals of every movement matching the filters
+  const [totalCount, setTotalCount] = useState(0);
+  const [summary, setSummary] = useState<MovementsSummary | null>(null);
   const [showUploadModal, setShowUploadModal] = useState(false);
   const [showNewMovementModal, setShowNewMovementModal] = useState(false);
   const [showAssignModal, setShowAssignModal] = useState(false);
@@ -123,21 +143,17 @@ export default function MovementsTab() {
       if (filters.start_date) queryParams.append("start_date", filters.start_date);
       if (filters.end_date) queryParams.append("end_date", filters.end_date);
 
-      // Load movements
-      const movementsUrl = `/financial-movements/?${queryParams.toString()}`;
-      const movementsRes = await api.get(movementsUrl);
-      
       // Enrich movements with property info
-      const enrichedMovements = movementsRes.data.map((movement: FinancialMovement) => {
+      const enrichMovement = (movement: FinancialMovement): MovementWithProperty => {
         const property = propertiesData.find((p: Property) => p.id === movement.property_id);
         return {
           ...movement,
           property_address: property?.address || "Sin propiedad asignada"
         };
-      });
+      };
 
       // Apply text search filter
-      const filteredMovements = enrichedMovements.filter((movement: MovementWithProperty) => {
+      const matchesSearch = (movement: MovementWithProperty) => {
         if (!filters.search) return true;
         const searchLower = filters.search.toLowerCase();
         return (
@@ -145,16 +161,22 @@ export default function MovementsTab() {
           movement.property_address.toLowerCase().includes(searchLower) ||
           (movement.tenant_name && movement.tenant_name.toLowerCase().includes(searchLower))
         );
-      });
-
-      // Sort by date descending (most recent first)
-      const sortedMovements = filteredMovements.sort((a, b) => {
-        const dateA = new Date(a.date);
-        const dateB = new Date(b.date);
-        return dateB.getTime() - dateA.getTime();
-      });
+      };
 
-      setMovements(sortedMovements);
+      // Only the first page (newest first); older ones are fetched with "Cargar más"
+      movementsLoadId.current += 1;
+      movementsQuery.current = {
+        params: queryParams,
+        prepare: (page) => page.map(enrichMovement).filter(matchesSearch)
+      };
+      const loadId = movementsLoadId.current;
+      setSummary(null);
+      const summaryRequest = api.get(`/financial-movements/summary?${queryParams.toString()}`)
+        .then((summaryRes) => {
+          if (loadId === movementsLoadId.current) setSummary(summaryRes.data);
+        })
+        .catch((summaryError) => console.warn("Movements summary not available:", summaryError));
+      await Promise.all([fetchMovementsPage(null), summaryRequest]);
     } catch (error) {
       console.error("Error loading movements:", error);
     } finally {
@@ -162,6 +184,35 @@ export default function MovementsTab() {
     }
   };
 
+  // One keyset page of movements: replaces the list (cursor null) or appends to it
+  const fetchMovementsPage = async (cursor: string | null) => {
+    const query = movementsQuery.current;
+    if (!query) return;
+    const loadId = movementsLoadId.current;
+    const pageParams = new URLSearchParams(query.params);
+    pageParams.append("limit", String(MOVEMENTS_PAGE_SIZE));
+    if (cursor) pageParams.append("cursor", cursor);
+    const movementsRes = await api.get(`/financial-movements/?${pageParams.toString()}`);
+    if (loadId !== movementsLoadId.current) return; // filters changed meanwhile
+
+    const page = query.prepare(movementsRes.data);
+    setMovements((loaded) => (cursor ? loaded.concat(page) : page));
+    if (!cursor) setTotalCount(Number(movementsRes.headers["x-total-count"]) || movementsRes.data.length);
+    setNextCursor(movementsRes.headers["x-next-cursor"] || null);
+  };
+
+  const loadMoreMovements = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      await fetchMovementsPage(nextCursor);
+    } catch (error) {
+      console.error("Error loading more movements:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleCreateMovement = async (e: React.FormEvent) => {
     e.preventDefault();
     try {
@@ -314,59 +365,39 @@ export default function MovementsTab() {
       const result = response.data;
       console.log('🏦 BANKINTER: Response data:', result);
       
-      // Mostrar mensaje de éxito inmediato
-      alert('✅ ¡Sincronización Bankinter iniciada con éxito!\n\n' +
-            '🔄 El proceso se está ejecutando en el servidor\n' +
-            '⏰ Duración estimada: 2-3 minutos\n' +
-            '📱 Verás los resultados cuando se complete\n\n' +
-            '💡 El navegador puede abrirse automáticamente en el servidor\n' +
-            '🔄 Los movimientos aparecerán aquí cuando terminen de procesarse');
-      
-      if (result.sync_status === 'started') {
-        console.log('🏦 BANKINTER: Async sync started');
+      if (result.sync_status === 'queued' || result.sync_status === 'in_progress') {
+        console.log('🏦 BANKINTER: Background sync job', result.sync_id);
         
-        // Recargar datos después de un tiempo para ver los nuevos movimientos
-        setTimeout(async () => {
-          console.log('🏦 BANKINTER: Checking for new data after delay...');
-          await loadData();
-          
-          // Verificar si hay movimientos nuevos comparando con la lista anterior
-          alert('🔄 Verificando nuevos movimientos...\n\n' +
-                'Si no ves movimientos nuevos:\n' +
-                '1️⃣ El proceso puede estar aún ejecutándose\n' +
-                '2️⃣ Espera 1-2 minutos más y actualiza la página\n' +
-                '3️⃣ O sube un extracto CSV manualmente');
-        }, 120000); // Esperar 2 minutos antes de recargar
+        // El scraping corre en segundo plano: se consulta progress_url hasta que termine
+        const job = await pollSyncProgress(result.progress_url);
         
-      } else {
-        console.log('🏦 BANKINTER: Direct sync response received');
-        
-        // Manejar respuesta directa con movimientos
-        const createdMovements = result.new_transactions || result.new_movements || result.created_movements || 0;
-        const duplicatesSkipped = result.duplicate_transactions || result.duplicates_skipped || result.skipped_movements || 0;
-        const totalProcessed = result.transactions_found || result.total_movements || result.total_processed || 0;
-        
-        let message = `✅ ¡Sincronización Bankinter completada!\n\n`;
-        message += `📈 Movimientos nuevos: ${createdMovements}\n`;
-        message += `🔄 Duplicados omitidos: ${duplicatesSkipped}\n`;
-        message += `📊 Total procesados: ${totalProcessed}\n`;
-        
-        if (result.date_range) {
-          message += `📅 Período: ${result.date_range}\n`;
+        if (!job) {
+          alert('⏳ La sincronización sigue en curso en el servidor.\n\n' +
+                '🔄 Actualiza la página en unos minutos para ver los movimientos nuevos.');
+          return;
         }
         
-        if (createdMovements > 0) {
-          message += `\n🎉 ¡${createdMovements} nuevos movimientos añadidos!`;
-        } else {
-          message += `\nℹ️ Tu cuenta está actualizada. No hay movimientos nuevos.`;
+        if (job.status !== 'completed') {
+          alert('❌ Error en sincronización con Bankinter\n\n' +
+                `📋 Detalles: ${job.error || job.status}`);
+          return;
         }
         
-        if (result.message) {
-          message += `\n\n📋 Detalles: ${result.message}`;
+        const jobResult = job.result || {};
+        const totalProcessed = jobResult.movements_extracted || job.stats?.transactions_found || 0;
+        
+        let message = `✅ ¡Sincronización Bankinter completada!\n\n`;
+        message += `📊 Movimientos encontrados: ${totalProcessed}\n`;
+        
+        if (jobResult.message) {
+          message += `\n📋 Detalles: ${jobResult.message}`;
         }
         
         alert(message);
         await loadData();
+      } else {
+        console.log('🏦 BANKINTER: Unexpected sync response', result.sync_status);
+        alert(`ℹ️ ${result.message || 'Sincronización solicitada'}`);
       }
       
     } catch (error: any) {
@@ -410,6 +441,21 @@ export default function MovementsTab() {
     }
   };
 
+  // Consulta el progreso de un trabajo en segundo plano hasta que termina (null si tarda demasiado)
+  const pollSyncProgress = async (progressUrl: string, intervalMs = 3000, maxWaitMs = 10 * 60 * 1000) => {
+    const deadline = Date.now() + maxWaitMs;
+    while (Date.now() < deadline) {
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+      const progressRes = await api.get(progressUrl);
+      const job = progressRes.data;
+      console.log(`🏦 BANKINTER: ${job.status} ${job.progress_percentage}% - ${job.current_step}`);
+      if (job.status === 'completed' || job.status === 'failed' || job.status === 'cancelled') {
+        return job;
+      }
+    }
+    return null;
+  };
+
   const handleDeleteAllMovements = async () => {
     setDeleting(true);
     try {
@@ -548,7 +594,8 @@ export default function MovementsTab() {
     try {
       // Build query parameters using current filters
       const queryParams = new URLSearchParams();
-      if (filters.property_id) queryParams.append("property_id", filters.property_id);
+      if (filters.property_id === 'unassigned') queryParams.append("unassigned_only", "true");
+      else if (filters.property_id) queryParams.append("property_id", filters.property_id);
       if (filters.category) queryParams.append("category", filters.category);
       if (filters.start_date) queryParams.append("start_date", filters.start_date);
       if (filters.end_date) queryParams.append("end_date", filters.end_date);
@@ -585,7 +632,9 @@ export default function MovementsTab() {
       link.remove();
       window.URL.revokeObjectURL(url);
 
-      alert(`✅ ¡Exportación completada!\n\n📊 Archivo descargado: ${filename}\n💾 Total movimientos: ${movements.length}`);
+      // The export applies the server filters (not the text search), like the summary
+      const exportedCount = summary ? summary.count : totalCount;
+      alert(`✅ ¡Exportación completada!\n\n📊 Archivo descargado: ${filename}\n💾 Total movimientos: ${exportedCount}`);
       
     } catch (error: any) {
       console.error('Error exporting to Excel:', error);
@@ -688,10 +737,17 @@ export default function MovementsTab() {
     currentPage * itemsPerPage
   );
 
-  // Summary calculations
-  const totalIncome = movements.filter(m => m.amount > 0).reduce((sum, m) => sum + m.amount, 0);
-  const totalExpenses = movements.filter(m => m.amount < 0).reduce((sum, m) => sum + Math.abs(m.amount), 0);
+  // Summary calculations: server totals for the filters; the text search is applied to the
+  // loaded pages only, so with a search the cards add up the loaded rows
+  const loadedIncome = movements.filter(m => m.amount > 0).reduce((sum, m) => sum + m.amount, 0);
+  const loadedExpenses = movements.filter(m => m.amount < 0).reduce((sum, m) => sum + Math.abs(m.amount), 0);
+  const useServerTotals = !filters.search && summary !== null;
+  const totalIncome = useServerTotals ? summary!.income : loadedIncome;
+  const totalExpenses = useServerTotals ? summary!.expenses : loadedExpenses;
   const netAmount = totalIncome - totalExpenses;
+  const movementCount = filters.search ? movements.length : totalCount;
+  const partialTotals = !useServerTotals && nextCursor !== null;
+  const partialLabel = partialTotals ? " (movimientos cargados)" : "";
 
   if (loading) {
     return (
@@ -765,22 +821,24 @@ export default function MovementsTab() {
       {/* Summary Cards */}
       <div className="grid grid-cols-1 md:grid-cols-4 gap-4">
         <div className="glass-card rounded-2xl p-6 border-l-4 border-green-500">
-          <p className="text-sm font-medium text-gray-600">💰 Total Ingresos</p>
+          <p className="text-sm font-medium text-gray-600">💰 Total Ingresos{partialLabel}</p>
           <p className="text-3xl font-bold text-green-600 mt-2">{formatCurrency(totalIncome)}</p>
         </div>
         <div className="glass-card rounded-2xl p-6 border-l-4 border-red-500">
-          <p className="text-sm font-medium text-gray-600">💸 Total Gastos</p>
+          <p className="text-sm font-medium text-gray-600">💸 Total Gastos{partialLabel}</p>
           <p className="text-3xl font-bold text-red-600 mt-2">{formatCurrency(totalExpenses)}</p>
         </div>
         <div className="glass-card rounded-2xl p-6 border-l-4 border-blue-500">
-          <p className="text-sm font-medium text-gray-600">📊 Cash Flow Neto</p>
+          <p className="text-sm font-medium text-gray-600">📊 Cash Flow Neto{partialLabel}</p>
           <p className={`text-3xl font-bold mt-2 ${netAmount >= 0 ? 'text-blue-600' : 'text-orange-600'}`}>
             {formatCurrency(netAmount)}
           </p>
         </div>
         <div className="glass-card rounded-2xl p-6 border-l-4 border-gray-500">
           <p className="text-sm font-medium text-gray-600">📈 Total Movimientos</p>
-          <p className="text-2xl font-bold text-gray-600 mt-2">{movements.length}</p>
+          <p className="text-2xl font-bold text-gray-600 mt-2">
+            {movementCount}{filters.search && nextCursor ? "+" : ""}
+          </p>
         </div>
       </div>
 
@@ -854,7 +912,7 @@ export default function MovementsTab() {
 
         <div className="mt-4 flex justify-between items-center">
           <div className="text-sm text-gray-500">
-            Mostrando {paginatedMovements.length} de {movements.length} movimientos
+            Mostrando {paginatedMovements.length} de {movementCount}{filters.search && nextCursor ? "+" : ""} movimientos
           </div>
           <button
             onClick={() => setFilters({property_id: "", category: "", start_date: "", end_date: "", search: ""})}
@@ -990,10 +1048,10 @@ export default function MovementsTab() {
         )}
 
         {/* Pagination */}
-        {totalPages > 1 && (
+        {(totalPages > 1 || nextCursor) && (
           <div className="px-6 py-4 border-t border-gray-200 flex justify-between items-center">
             <div className="text-sm text-gray-500">
-              Página {currentPage} de {totalPages}
+              Página {currentPage} de {Math.max(totalPages, 1)}
             </div>
             <div className="flex space-x-2">
               <button
@@ -1010,6 +1068,15 @@ export default function MovementsTab() {
               >
                 Siguiente
               </button>
+              {nextCursor && (
+                <button
+                  onClick={loadMoreMovements}
+                  disabled={loadingMore}
+                  className="px-3 py-1 text-sm border border-blue-300 text-blue-600 rounded disabled:opacity-50 disabled:cursor-not-allowed hover:bg-blue-50"
+                >
+                  {loadingMore ? "Cargando..." : "Cargar más"}
+                </button>
+              )}
             </div>
           </div>
         )}
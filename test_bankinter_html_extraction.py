@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Extracción de movimientos de Bankinter sin navegador, sobre las páginas guardadas en el repo
+(bankinter_page_source.html, debug_bankinter_table.html), y tiempo por página:
+    python test_bankinter_html_extraction.py
+"""
+
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.bankinter_html import (
+    extract_transactions, parse_amount, parse_date, parse_document,
+    parse_movement_rows, parse_text_lines, visible_lines
+)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_RUNS = 20
+MAX_MS_PER_PAGE = 200
+
+# (fichero, movimientos, primer movimiento (fecha valor, concepto, importe, saldo), último)
+FIXTURES = [
+    (
+        "bankinter_page_source.html", 43,
+        (date(2025, 9, 9), "Trans Inm/ Fabiola Imagin", -27.00, 5184.22),
+        (date(2025, 9, 1), "Transf /rodriguez Moreno Jorge", 800.00, 3497.78),
+    ),
+    (
+        "debug_bankinter_table.html", 51,
+        (date(2025, 8, 27), "Trans Inm/ Garcia Baena Jesus", 750.00, 2092.81),
+        (date(2025, 8, 1), "Transf /rodriguez Moreno Jorge", 800.00, 3694.84),
+    ),
+]
+
+
+def _load(name: str) -> str:
+    with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def _summary(tx):
+    return (tx.date, tx.description, tx.amount, tx.balance_after)
+
+
+def test_parse_amount_and_date():
+    assert parse_amount("-27 ,00 €") == -27.00
+    assert parse_amount("+750,00 €") == 750.00
+    assert parse_amount("5.184 ,22 €") == 5184.22
+    assert parse_amount("-1.234.567,89") == -1234567.89
+    assert parse_amount("sin importe") is None
+    assert parse_date("miércoles 10/09/2025") == date(2025, 9, 10)
+    assert parse_date("01-08-25") == date(2025, 8, 1)
+    assert parse_date("31/02/2025") is None
+
+
+def test_movement_tables():
+    for name, count, first, last in FIXTURES:
+        transactions = extract_transactions(_load(name))
+        assert len(transactions) == count, f"{name}: {len(transactions)} movimientos"
+        assert _summary(transactions[0]) == first, f"{name}: {_summary(transactions[0])}"
+        assert _summary(transactions[-1]) == last, f"{name}: {_summary(transactions[-1])}"
+        assert len({tx.id for tx in transactions}) == count, f"{name}: ids repetidos"
+        # Más reciente primero: saldo anterior + importe = saldo del movimiento
+        for newer, older in zip(transactions, transactions[1:]):
+            assert round(older.balance_after + newer.amount - newer.balance_after, 2) == 0, \
+                f"{name}: saldo no cuadra en {_summary(newer)}"
+
+
+def test_ids_are_stable():
+    html = _load(FIXTURES[0][0])
+    assert [tx.id for tx in extract_transactions(html)] == [tx.id for tx in extract_transactions(html)]
+
+
+def test_text_fallback_matches_table():
+    """Sin la estructura de la tabla, las líneas fecha + importe dan los mismos movimientos"""
+    for name, count, _, _ in FIXTURES:
+        doc = parse_document(_load(name))
+        from_table = parse_movement_rows(doc)
+        from_text = parse_text_lines(visible_lines(doc))
+        assert len(from_text) == count, f"{name}: {len(from_text)} líneas"
+        assert [tx.amount for tx in from_text] == [tx.amount for tx in from_table]
+
+
+def test_page_without_movements():
+    assert extract_transactions("<html><body><p>Sesión caducada</p></body></html>") == []
+    assert extract_transactions("") == []
+
+
+def test_extraction_time():
+    for name, _, _, _ in FIXTURES:
+        html = _load(name)
+        started = time.perf_counter()
+        for _ in range(BENCHMARK_RUNS):
+            extract_transactions(html)
+        ms = (time.perf_counter() - started) * 1000 / BENCHMARK_RUNS
+        print(f"{name}: {len(html) // 1024} KB, {ms:.1f} ms por página")
+        assert ms < MAX_MS_PER_PAGE, f"{name}: {ms:.1f} ms"
+
+
+if __name__ == "__main__":
+    test_parse_amount_and_date()
+    test_movement_tables()
+    test_ids_are_stable()
+    test_text_fallback_matches_table()
+    test_page_without_movements()
+    test_extraction_time()
+    print("OK - movements extracted offline from the saved pages")
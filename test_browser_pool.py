@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Pool de navegadores de los scrapers (services/browser_pool) con un driver falso, sin Chrome:
+expulsión del menos usado con el pool lleno, espera de un segundo acquire del mismo
+usuario, cierre de navegadores inactivos, descarte de drivers caídos y perfil temporal
+cuando otro proceso tiene bloqueado el del usuario:
+    python test_browser_pool.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from selenium.common.exceptions import WebDriverException
+
+from app.config import settings
+from app.services import browser_pool as browser_pool_module
+from app.services.browser_pool import BrowserPool, lock_profile, profile_dir, profile_key
+
+settings.app_data_dir = tempfile.mkdtemp(prefix="browser-pool-")
+# Sin webdriver_manager ni red: el Service no se arranca con el driver falso
+browser_pool_module.chromedriver_path = lambda: None
+
+
+class FakeDriver:
+    def __init__(self, user_data_dir):
+        self.user_data_dir = user_data_dir
+        self.alive = True
+        self.quit_calls = 0
+
+    @property
+    def current_url(self):
+        if not self.alive:
+            raise WebDriverException("chrome not reachable")
+        return "about:blank"
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {}
+
+    def quit(self):
+        self.quit_calls += 1
+        self.alive = False
+
+
+class FakeFactory:
+    def __init__(self):
+        self.drivers = []
+
+    def __call__(self, service, options):
+        user_data_dir = next(a for a in options.arguments if a.startswith("--user-data-dir="))
+        driver = FakeDriver(user_data_dir.split("=", 1)[1])
+        self.drivers.append(driver)
+        return driver
+
+
+def _pool(**kwargs):
+    factory = FakeFactory()
+    kwargs.setdefault("max_size", 2)
+    kwargs.setdefault("idle_seconds", 600)
+    return BrowserPool(headless=True, driver_factory=factory, **kwargs), factory
+
+
+def test_reuses_warm_browser():
+    pool, factory = _pool()
+    browser = pool.acquire("ana")
+    pool.release(browser)
+    assert pool.acquire("ana") is browser
+    assert len(factory.drivers) == 1
+    pool.close_all()
+
+
+def test_evicts_least_recently_used_when_full():
+    pool, factory = _pool(max_size=2)
+    ana = pool.acquire("ana")
+    pool.release(ana)
+    luis = pool.acquire("luis")
+    pool.release(luis)
+
+    eva = pool.acquire("eva")
+    assert ana.driver.quit_calls == 1, "el navegador inactivo más antiguo se cierra"
+    assert luis.driver.alive
+    assert set(pool._browsers) == {profile_key("luis"), profile_key("eva")}
+
+    # Pool lleno y todos en uso: no se expulsa un navegador ocupado, se espera
+    pool.acquire("luis")
+    try:
+        pool.acquire("marta", timeout=0.3)
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError("se esperaba TimeoutError con el pool lleno y ocupado")
+    assert len(factory.drivers) == 3
+    pool.release(eva)
+    pool.close_all()
+
+
+def test_same_user_waits_for_release():
+    pool, factory = _pool()
+    browser = pool.acquire("ana")
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire("ana", timeout=5)))
+    waiter.start()
+
+    time.sleep(0.3)
+    assert not acquired, "el perfil está en uso: el segundo acquire espera"
+    pool.release(browser)
+    waiter.join(5)
+    assert acquired == [browser]
+    assert len(factory.drivers) == 1, "no se abre un segundo Chrome sobre el mismo perfil"
+    pool.close_all()
+
+
+def test_reaper_closes_idle_browsers():
+    pool, _ = _pool(idle_seconds=0.2)
+    browser = pool.acquire("ana")
+    pool.release(browser)
+    reaper = pool._reaper
+    assert reaper is not None and reaper.is_alive()
+
+    # Nadie vuelve a llamar a acquire(): el hilo lo cierra solo y termina con el pool vacío
+    reaper.join(5)
+    assert not reaper.is_alive()
+    assert browser.driver.quit_calls == 1
+    assert pool._browsers == {} and pool._reaper is None
+
+
+def test_dead_driver_discarded():
+    pool, factory = _pool()
+    browser = pool.acquire("ana")
+    browser.driver.alive = False
+    pool.release(browser)
+    assert pool._browsers == {}
+
+    # Un navegador inactivo que ha muerto mientras esperaba se sustituye al pedirlo
+    second = pool.acquire("ana")
+    pool.release(second)
+    second.driver.alive = False
+    third = pool.acquire("ana")
+    assert third is not second and third.driver.alive
+    assert len(factory.drivers) == 3
+
+    # discard=True cierra aunque el driver siga vivo (p.ej. tras un error del scraper)
+    pool.release(third, discard=True)
+    assert third.driver.quit_calls == 1 and pool._browsers == {}
+    pool.close_all()
+
+
+def test_locked_profile_uses_temporary_copy():
+    if browser_pool_module.fcntl is None:
+        return
+    path = profile_dir(profile_key("ana"))
+    other_process_fd, acquired = lock_profile(path)
+    assert acquired
+    try:
+        pool, _ = _pool()
+        browser = pool.acquire("ana")
+        assert browser.temporary_profile
+        assert browser.driver.user_data_dir == f"{path}-{os.getpid()}"
+        os.makedirs(browser.profile_path, exist_ok=True)
+        pool.release(browser, discard=True)
+        assert not os.path.exists(browser.profile_path), "la copia temporal se borra al cerrar"
+    finally:
+        os.close(other_process_fd)
+
+    # Liberado por el otro proceso: se vuelve a usar el perfil del usuario
+    browser = pool.acquire("ana")
+    assert not browser.temporary_profile and browser.driver.user_data_dir == path
+    pool.close_all()
+    fd, acquired = lock_profile(path)
+    assert acquired, "close_all libera el bloqueo del perfil"
+    os.close(fd)
+
+
+if __name__ == "__main__":
+    test_reuses_warm_browser()
+    test_evicts_least_recently_used_when_full()
+    test_same_user_waits_for_release()
+    test_reaper_closes_idle_browsers()
+    test_dead_driver_discarded()
+    test_locked_profile_uses_temporary_copy()
+    print("OK")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Almacén de documentos por contenido (services/document_store): deduplicación por SHA-256,
+límite de tamaño durante la subida y descargas con Range / ETag, sobre el backend local
+en un directorio temporal:
+    python test_document_store.py
+"""
+
+import hashlib
+import io
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from app.services.document_store import (
+    BlobTooLarge, LocalBlobStore, blob_key, blob_ref, blob_response,
+    parse_blob_ref, parse_range, store_stream
+)
+
+CONTENT = bytes(range(256)) * 12_000  # ~3 MB: varios bloques de subida y descarga
+
+
+def _store() -> LocalBlobStore:
+    return LocalBlobStore(tempfile.mkdtemp(prefix="blobs-"))
+
+
+def _client(store: LocalBlobStore) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/blob/{digest}")
+    def download(digest: str, request: Request):
+        response = blob_response(request, digest, "contrato.pdf", store=store)
+        if response is None:
+            raise HTTPException(status_code=404)
+        return response
+
+    return TestClient(app)
+
+
+def test_store_deduplicates():
+    store = _store()
+    first = store_stream(io.BytesIO(CONTENT), store=store)
+    second = store_stream(io.BytesIO(CONTENT), store=store)
+    assert first.digest == hashlib.sha256(CONTENT).hexdigest()
+    assert (first.created, second.created) == (True, False)
+    assert first.size == len(CONTENT) == store.size(first.digest)
+    assert os.path.exists(os.path.join(store.root, *blob_key(first.digest).split("/")))
+    assert os.listdir(store.staging_dir) == [], "temporales sin limpiar"
+    assert parse_blob_ref(first.ref) == first.digest
+    assert parse_blob_ref("uploads/tenant_documents/x.pdf") is None
+
+
+def test_max_size():
+    store = _store()
+    try:
+        store_stream(io.BytesIO(CONTENT), max_size=1024, store=store)
+        raise AssertionError("BlobTooLarge expected")
+    except BlobTooLarge:
+        pass
+    assert os.listdir(store.staging_dir) == []
+    assert store.size(hashlib.sha256(CONTENT).hexdigest()) is None
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    for unsatisfiable in ("bytes=100-", "bytes=-0", "bytes=9-3"):
+        try:
+            parse_range(unsatisfiable, 100)
+            raise AssertionError(unsatisfiable)
+        except ValueError:
+            pass
+
+
+def test_download_range_and_etag():
+    store = _store()
+    blob = store_stream(io.BytesIO(CONTENT), store=store)
+    client = _client(store)
+    url = f"/blob/{blob.digest}"
+    etag = f'"{blob.digest}"'
+
+    full = client.get(url)
+    assert full.status_code == 200 and full.content == CONTENT
+    assert full.headers["etag"] == etag
+    assert full.headers["accept-ranges"] == "bytes"
+    assert full.headers["content-type"] == "application/pdf"
+    assert "contrato.pdf" in full.headers["content-disposition"]
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    part = client.get(url, headers={"Range": "bytes=1048570-1048585"})
+    assert part.status_code == 206
+    assert part.content == CONTENT[1048570:1048586]
+    assert part.headers["content-range"] == f"bytes 1048570-1048585/{len(CONTENT)}"
+
+    tail = client.get(url, headers={"Range": "bytes=-100"})
+    assert tail.status_code == 206 and tail.content == CONTENT[-100:]
+
+    # If-Range con otro ETag: el fichero cambió, se envía completo
+    stale = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"otro"'})
+    assert stale.status_code == 200 and len(stale.content) == len(CONTENT)
+
+    bad = client.get(url, headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert bad.status_code == 416
+    assert bad.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+    assert client.get(f"/blob/{'0' * 64}").status_code == 404
+    assert blob_ref(blob.digest) == f"sha256:{blob.digest}"
+
+
+if __name__ == "__main__":
+    test_store_deduplicates()
+    test_max_size()
+    test_parse_range()
+    test_download_range_and_etag()
+    print("OK - content-addressed store, dedup, Range and ETag")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Variantes de las fotos de propiedades (services/image_variants): miniatura y tamaño medio
+sin EXIF, con la orientación aplicada y sin ampliar fotos pequeñas, y elección de la
+variante según ?w= y la cabecera Accept:
+    python test_image_variants.py
+"""
+
+import io
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+from app.models import ImageVariant
+from app.services.image_variants import (
+    ORIGINAL, InvalidImage, accepted_formats, pick_variant, render_variants
+)
+
+CHROME_ACCEPT = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+
+
+def _jpeg(width: int, height: int, orientation: int = None) -> bytes:
+    image = Image.new("RGB", (width, height), (200, 80, 40))
+    exif = Image.Exif()
+    exif[0x010F] = "Cámara de prueba"  # Make
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+def test_render_sizes_and_strips_exif():
+    (fmt, width, height), variants = render_variants(_jpeg(2000, 1000), ["webp"])
+    assert (fmt, width, height) == ("jpeg", 2000, 1000)
+    assert [(v.label, v.width, v.height) for v in variants] == [("thumb", 320, 160), ("medium", 1280, 640)]
+    for variant in variants:
+        with Image.open(io.BytesIO(variant.data)) as image:
+            assert image.format == "WEBP"
+            assert image.size == (variant.width, variant.height)
+            assert not image.getexif(), "las variantes no deben llevar EXIF"
+
+
+def test_orientation_applied():
+    # Orientación 6: la foto se guardó apaisada pero se ve en vertical
+    (_, width, height), variants = render_variants(_jpeg(1000, 600, orientation=6), ["webp"])
+    assert (width, height) == (600, 1000)
+    assert [(v.width, v.height) for v in variants] == [(320, 533), (600, 1000)]
+
+
+def test_small_photo_not_upscaled():
+    _, variants = render_variants(_jpeg(200, 100), ["webp"])
+    # Una sola variante al tamaño original: thumb y medium serían idénticas
+    assert [(v.label, v.width) for v in variants] == [("thumb", 200)]
+
+
+def test_invalid_image():
+    try:
+        render_variants(b"%PDF-1.4 no es una imagen", ["webp"])
+    except InvalidImage:
+        return
+    raise AssertionError("se esperaba InvalidImage")
+
+
+def _variants():
+    rows = [ImageVariant(source_digest="a" * 64, label=ORIGINAL, format="jpeg", width=3000, height=2000, digest="a" * 64, size=900_000)]
+    for label, width, height in (("thumb", 320, 213), ("medium", 1280, 853)):
+        for fmt in ("avif", "webp"):
+            rows.append(ImageVariant(
+                source_digest="a" * 64, label=label, format=fmt, width=width, height=height,
+                digest=f"{label}-{fmt}", size=10_000
+            ))
+    return rows
+
+
+def test_accepted_formats():
+    assert accepted_formats(CHROME_ACCEPT) == ["avif", "webp"]
+    assert accepted_formats("image/webp,*/*") == ["webp"]
+    assert accepted_formats("image/*") == []
+    assert accepted_formats(None) == []
+
+
+def test_pick_variant():
+    variants = _variants()
+    assert pick_variant(variants, 160, CHROME_ACCEPT).digest == "thumb-avif"
+    assert pick_variant(variants, 640, "image/webp,*/*").digest == "medium-webp"
+    # Más ancho que la variante mayor: el original
+    assert pick_variant(variants, 2000, CHROME_ACCEPT) is None
+    # Navegador sin WebP ni AVIF: el original
+    assert pick_variant(variants, 160, "image/png,image/*") is None
+
+
+if __name__ == "__main__":
+    test_render_sizes_and_strips_exif()
+    test_orientation_applied()
+    test_small_photo_not_upscaled()
+    test_invalid_image()
+    test_accepted_formats()
+    test_pick_variant()
+    print("OK")
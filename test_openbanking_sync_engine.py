@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Prueba el SyncEngine de Open Banking contra un servidor Nordigen falso (FastAPI servido con
+httpx.ASGITransport, sin red) y una base SQLite temporal:
+- límite global de peticiones simultáneas y límite por banco
+- un único token para todas las peticiones concurrentes
+- idempotencia al repetir la sincronización
+- sincronización incremental desde la marca de agua, paso de pendiente a contabilizada y
+  reconciliación completa
+- tiempos por conexión
+- backfill de miles de transacciones con consultas por lotes (services/synced_transactions)
+- un banco limitado no ocupa huecos globales y una conexión que falla no corta las demás
+    python test_openbanking_sync_engine.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("NORDIGEN_SECRET_ID", "fake-id")
+os.environ.setdefault("NORDIGEN_SECRET_KEY", "fake-key")
+
+import httpx
+from fastapi import FastAPI, HTTPException
+from typing import Optional
+from sqlalchemy import create_engine, event
+from sqlmodel import SQLModel, Session, select, func
+
+from app.models import User, BankConnection, BankAccount, FinancialMovement
+from app.services import movement_dedup  # noqa: F401  (listeners de dedup_key)
+from app.openbanking.clients.nordigen_client import NordigenClient
+from app.openbanking.sync_engine import SyncEngine, SYNC_MODE_FULL, FULL_RECONCILIATION_DAYS
+from app.services.synced_transactions import WATERMARK_OVERLAP_DAYS
+from app.services.synced_transactions import store_synced_transactions
+
+INSTITUTIONS = ["BANKINTER_BKBKESMM", "SANTANDER_BSCHESMM", "BBVA_BBVAESMM"]
+CONNECTIONS_PER_INSTITUTION = 4
+ACCOUNTS_PER_CONNECTION = 3
+TRANSACTIONS_PER_ACCOUNT = 5
+RESPONSE_DELAY = 0.05
+MAX_CONCURRENCY = 5
+PER_INSTITUTION = 2
+TODAY = date.today()
+
+
+def fake_transaction(account_id, i, booking_date):
+    return {
+        "transactionId": f"{account_id}-tx{i}",
+        "bookingDate": booking_date.isoformat(),
+        "transactionAmount": {"amount": str(-10.5 * (i + 1)), "currency": "EUR"},
+        "remittanceInformationUnstructured": f"Recibo {i} {account_id}",
+    }
+
+
+class FakeNordigen:
+    """Servidor falso: cuenta peticiones en vuelo (total y por banco) y tokens emitidos"""
+
+    def __init__(self, account_institution):
+        self.account_institution = account_institution
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.in_flight_by_institution = defaultdict(int)
+        self.max_by_institution = defaultdict(int)
+        self.tokens_issued = 0
+        # Un apunte contabilizado por día en los últimos días, nada pendiente
+        self.booked = {
+            account_id: [fake_transaction(account_id, i, TODAY - timedelta(days=i)) for i in range(TRANSACTIONS_PER_ACCOUNT)]
+            for account_id in account_institution
+        }
+        self.pending = defaultdict(list)
+        self.requested_from = {}
+        self.started = []
+        self.failing = set()
+        self.app = FastAPI()
+
+        @self.app.post("/api/v2/token/new/")
+        async def new_token():
+            self.tokens_issued += 1
+            await asyncio.sleep(RESPONSE_DELAY)
+            return {"access": f"token-{self.tokens_issued}", "access_expires": 86400}
+
+        @self.app.get("/api/v2/accounts/{account_id}/transactions/")
+        async def transactions(account_id: str, date_from: Optional[date] = None, date_to: Optional[date] = None):
+            if account_id in self.failing:
+                raise HTTPException(status_code=500, detail="Error del banco")
+            institution = self.account_institution[account_id]
+            self.requested_from[account_id] = date_from
+            self.started.append(account_id)
+            self.in_flight += 1
+            self.in_flight_by_institution[institution] += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.max_by_institution[institution] = max(
+                self.max_by_institution[institution], self.in_flight_by_institution[institution]
+            )
+            try:
+                await asyncio.sleep(RESPONSE_DELAY)
+
+                def in_window(t):
+                    booking_date = date.fromisoformat(t["bookingDate"])
+                    return (not date_from or booking_date >= date_from) and (not date_to or booking_date <= date_to)
+
+                return {"transactions": {
+                    "booked": [t for t in self.booked[account_id] if in_window(t)],
+                    "pending": [t for t in self.pending[account_id] if in_window(t)],
+                }}
+            finally:
+                self.in_flight -= 1
+                self.in_flight_by_institution[institution] -= 1
+
+
+def seed(engine, layout=None):
+    """Un usuario y sus conexiones; layout: [(banco, número de cuentas)] por conexión"""
+    if layout is None:
+        layout = [
+            (institution, ACCOUNTS_PER_CONNECTION)
+            for institution in INSTITUTIONS for _ in range(CONNECTIONS_PER_INSTITUTION)
+        ]
+    account_institution = {}
+    connection_ids = []
+    with Session(engine) as session:
+        user = User(email="sync@test.com", hashed_password="x")
+        session.add(user)
+        session.commit()
+        for c, (institution, accounts) in enumerate(layout):
+            connection = BankConnection(
+                user_id=user.id, institution_id=institution, institution_name=institution,
+                requisition_id=f"req-{institution}-{c}", requisition_reference=f"ref-{institution}-{c}",
+                consent_status="LN"
+            )
+            session.add(connection)
+            session.commit()
+            connection_ids.append(connection.id)
+            for a in range(accounts):
+                account_id = f"{institution}-{c}-{a}"
+                account_institution[account_id] = institution
+                session.add(BankAccount(connection_id=connection.id, account_id=account_id))
+        session.commit()
+    return connection_ids, account_institution
+
+
+def _setup(tmp, layout=None, max_concurrency=MAX_CONCURRENCY, per_institution=PER_INSTITUTION):
+    """Base SQLite temporal, servidor falso y SyncEngine apuntando a él"""
+    engine = create_engine(f"sqlite:///{tmp}/sync.db")
+    SQLModel.metadata.create_all(engine)
+    connection_ids, account_institution = seed(engine, layout)
+    fake = FakeNordigen(account_institution)
+    client = NordigenClient(
+        base_url="http://fake-nordigen/api/v2",
+        transport=httpx.ASGITransport(app=fake.app)
+    )
+    sync_engine = SyncEngine(
+        client=client, db_engine=engine,
+        max_concurrency=max_concurrency, per_institution_concurrency=per_institution
+    )
+    return engine, sync_engine, fake, connection_ids
+
+
+def test_backfill_batched(count=5000):
+    """Backfill de 2 años de una cuenta: pocas consultas y segundos, no una consulta por transacción"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, _, _, _ = _setup(tmp, layout=[])
+        _check_backfill(engine, 1, count)
+
+
+def _check_backfill(engine, user_id, count):
+    client = NordigenClient()
+    transactions = [
+        client.format_transaction_to_financial_movement({
+            "transactionId": f"backfill-{i}",
+            "bookingDate": f"2023-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "transactionAmount": {"amount": f"{-(i % 500) - 1}.25"},
+            "remittanceInformationUnstructured": f"Backfill {i}",
+        }, "backfill-account")
+        for i in range(count)
+    ]
+    # Repetidos dentro del mismo lote: se insertan una sola vez
+    transactions += transactions[:10]
+
+    statements = []
+    listener = lambda *args: statements.append(1)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        started = time.perf_counter()
+        with Session(engine) as session:
+            total, new = store_synced_transactions(session, user_id, transactions)
+            session.commit()
+        elapsed = time.perf_counter() - started
+        with Session(engine) as session:
+            again = store_synced_transactions(session, user_id, transactions)
+            session.commit()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert (total, new) == (count + 10, count), (total, new)
+    assert again == (count + 10, 0), again
+    assert len(statements) < 50, len(statements)
+    assert elapsed < 10, elapsed
+    print(f"✅ backfill de {count} transacciones en {elapsed:.2f}s ({len(statements)} sentencias SQL en total)")
+
+
+def test_pending_to_booked():
+    """Una transacción pendiente antigua se vuelve a pedir hasta que aparece contabilizada"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, sync_engine, fake, connection_ids = _setup(tmp)
+        asyncio.run(sync_engine.sync_connections(connection_ids))
+        _check_pending_to_booked(engine, sync_engine, fake, connection_ids[0])
+
+
+def _check_pending_to_booked(engine, sync_engine, fake, connection_id):
+    with Session(engine) as session:
+        account_id = session.exec(
+            select(BankAccount.account_id).where(BankAccount.connection_id == connection_id)
+        ).first()
+    old_date = TODAY - timedelta(days=WATERMARK_OVERLAP_DAYS + 6)
+    pending = fake_transaction(account_id, 99, old_date)
+    fake.pending[account_id] = [pending]
+    fake.requested_from.clear()
+
+    # La pendiente es anterior a la ventana incremental: el banco la devuelve en la reconciliación
+    asyncio.run(sync_engine.sync_connection(connection_id, SYNC_MODE_FULL))
+    with Session(engine) as session:
+        account = session.exec(select(BankAccount).where(BankAccount.account_id == account_id)).one()
+        assert account.pending_since == old_date, account.pending_since
+        assert account.last_booked_date == TODAY
+
+    # Se contabiliza: la siguiente incremental pide desde la fecha de la pendiente y la importa
+    fake.pending[account_id] = []
+    fake.booked[account_id].append(pending)
+    result = asyncio.run(sync_engine.sync_connection(connection_id))
+    assert fake.requested_from[account_id] == old_date, fake.requested_from[account_id]
+    assert result.new_transactions == 1, result
+    with Session(engine) as session:
+        account = session.exec(select(BankAccount).where(BankAccount.account_id == account_id)).one()
+        assert account.pending_since is None
+        assert account.last_booked_transaction_id == f"{account_id}-tx0"
+
+
+def test_concurrent_sync_limits():
+    with tempfile.TemporaryDirectory() as tmp:
+        _, sync_engine, fake, connection_ids = _setup(tmp)
+
+        results = asyncio.run(sync_engine.sync_connections(connection_ids))
+        total_accounts = len(fake.account_institution)
+
+        assert all(r.status == "SUCCESS" for r in results), [r.error for r in results if r.error]
+        assert sum(r.new_transactions for r in results) == total_accounts * TRANSACTIONS_PER_ACCOUNT
+        assert all(r.duration_seconds > 0 and r.fetch_seconds > 0 for r in results)
+        assert fake.tokens_issued == 1, fake.tokens_issued
+        assert 1 < fake.max_in_flight <= MAX_CONCURRENCY, fake.max_in_flight
+        assert all(m <= PER_INSTITUTION for m in fake.max_by_institution.values()), dict(fake.max_by_institution)
+
+        sequential = total_accounts * RESPONSE_DELAY
+        print(f"✅ {len(connection_ids)} conexiones / {total_accounts} cuentas sincronizadas")
+        print(f"   máx. peticiones simultáneas: {fake.max_in_flight} (límite {MAX_CONCURRENCY})")
+        print(f"   máx. por banco: {dict(fake.max_by_institution)} (límite {PER_INSTITUTION})")
+        print(f"   tiempo de red secuencial estimado: {sequential:.2f}s")
+        for r in results[:3]:
+            print(f"   conexión {r.connection_id}: {r.duration_seconds:.3f}s (fetch {r.fetch_seconds:.3f}s)")
+
+
+def test_incremental_resync():
+    with tempfile.TemporaryDirectory() as tmp:
+        _, sync_engine, fake, connection_ids = _setup(tmp)
+        asyncio.run(sync_engine.sync_connections(connection_ids))
+
+        # Segunda pasada (nuevo event loop): solo el solape desde la marca de agua, nada nuevo, mismo token
+        results = asyncio.run(sync_engine.sync_connections(connection_ids))
+        assert sum(r.new_transactions for r in results) == 0
+        assert sum(r.transactions for r in results) == len(fake.account_institution) * (WATERMARK_OVERLAP_DAYS + 1)
+        assert set(fake.requested_from.values()) == {TODAY - timedelta(days=WATERMARK_OVERLAP_DAYS)}
+        assert fake.tokens_issued == 1
+
+
+def test_full_reconciliation():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, sync_engine, fake, connection_ids = _setup(tmp)
+        asyncio.run(sync_engine.sync_connections(connection_ids))
+
+        # Reconciliación completa: toda la ventana, nada nuevo
+        results = asyncio.run(sync_engine.sync_connections(connection_ids, SYNC_MODE_FULL))
+        assert sum(r.new_transactions for r in results) == 0
+        assert set(fake.requested_from.values()) == {TODAY - timedelta(days=FULL_RECONCILIATION_DAYS)}
+        with Session(engine) as session:
+            assert all(session.exec(select(BankAccount.last_full_reconciliation)).all())
+            expected = len(fake.account_institution) * TRANSACTIONS_PER_ACCOUNT
+            assert session.exec(select(func.count()).select_from(FinancialMovement)).one() == expected
+            statuses = set(session.exec(select(BankConnection.sync_status)).all())
+            assert statuses == {"SUCCESS"}, statuses
+
+
+def test_throttled_institution_does_not_hold_global_slots():
+    # Un banco con cuatro cuentas y límite 1 por banco: mientras sus peticiones esperan turno,
+    # el otro banco usa el segundo hueco global en lugar de esperar detrás
+    with tempfile.TemporaryDirectory() as tmp:
+        _, sync_engine, fake, connection_ids = _setup(
+            tmp, layout=[(INSTITUTIONS[0], 4), (INSTITUTIONS[1], 1)], max_concurrency=2, per_institution=1
+        )
+        # Las cuentas del banco limitado se encolan antes que la del otro banco
+        start_connection = sync_engine._start_connection
+
+        def delayed_start(connection_id):
+            if connection_id == connection_ids[1]:
+                time.sleep(RESPONSE_DELAY / 2)
+            return start_connection(connection_id)
+
+        sync_engine._start_connection = delayed_start
+        results = asyncio.run(sync_engine.sync_connections(connection_ids))
+        assert all(r.status == "SUCCESS" for r in results), [r.error for r in results if r.error]
+        other = [account_id for account_id in fake.started if account_id.startswith(INSTITUTIONS[1])]
+        assert fake.started.index(other[0]) <= 1, fake.started
+        assert fake.max_in_flight == 2, fake.max_in_flight
+
+
+def test_failing_connection_does_not_abort_run():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, sync_engine, fake, connection_ids = _setup(tmp, layout=[(INSTITUTIONS[0], 2), (INSTITUTIONS[1], 2)])
+        fake.failing = {account_id for account_id in fake.account_institution if account_id.startswith(INSTITUTIONS[1])}
+        missing_id = max(connection_ids) + 100
+
+        results = asyncio.run(sync_engine.sync_connections(connection_ids + [missing_id]))
+        by_id = {r.connection_id: r for r in results}
+        assert by_id[connection_ids[0]].status == "SUCCESS"
+        assert by_id[connection_ids[0]].new_transactions == 2 * TRANSACTIONS_PER_ACCOUNT
+        assert by_id[connection_ids[1]].status == "ERROR" and by_id[connection_ids[1]].failed_accounts == 2
+        assert by_id[missing_id].status == "ERROR" and "not found" in by_id[missing_id].error
+        with Session(engine) as session:
+            assert session.get(BankConnection, connection_ids[0]).sync_status == "SUCCESS"
+            assert session.get(BankConnection, connection_ids[1]).sync_status == "ERROR"
+
+
+if __name__ == "__main__":
+    test_concurrent_sync_limits()
+    test_incremental_resync()
+    test_pending_to_booked()
+    test_full_reconciliation()
+    test_throttled_institution_does_not_hold_global_slots()
+    test_failing_connection_does_not_abort_run()
+    test_backfill_batched()
+    print("OK")
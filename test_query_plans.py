@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Comprueba con EXPLAIN que las consultas principales usan los índices de los modelos.
+
+SQLite se prueba siempre (base en memoria). PostgreSQL solo si TEST_POSTGRES_URL está
+definida; las tablas se crean en un esquema temporal que se borra al terminar, sin tocar
+las del esquema por defecto, p.ej.:
+    TEST_POSTGRES_URL=postgresql://postgres@localhost/inmuebles_test python test_query_plans.py
+"""
+
+import os
+import sys
+import uuid
+from datetime import date
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event, text
+from sqlmodel import SQLModel, Session, select
+
+from app.models import (
+    User, Property, FinancialMovement, RentalContract,
+    ClassificationRule, MortgageDetails, MortgageRevision
+)
+
+PROPERTY_IDS = [1, 2, 3]
+START, END = date(2024, 1, 1), date(2024, 12, 31)
+
+# (descripción, consulta, índices aceptables)
+ROUTE_QUERIES = [
+    (
+        "GET /financial-movements (propiedades + sin asignar, rango de fechas)",
+        select(FinancialMovement).where(
+            (FinancialMovement.property_id.in_(PROPERTY_IDS)) |
+            ((FinancialMovement.property_id.is_(None)) & (FinancialMovement.user_id == 1))
+        ).where(FinancialMovement.date >= START, FinancialMovement.date <= END),
+        ("ix_financialmovement_property_date", "ix_financialmovement_user_property_date"),
+    ),
+    (
+        "analytics / summary por propiedad y año",
+        select(FinancialMovement).where(
+            FinancialMovement.property_id == 1,
+            FinancialMovement.date >= START,
+            FinancialMovement.date <= END
+        ),
+        ("ix_financialmovement_property_date",),
+    ),
+    (
+        "movimientos sin asignar del usuario",
+        select(FinancialMovement).where(
+            FinancialMovement.property_id.is_(None),
+            FinancialMovement.user_id == 1,
+            FinancialMovement.date >= START
+        ),
+        ("ix_financialmovement_user_property_date", "ix_financialmovement_property_date"),
+    ),
+    (
+        "sincronización bancaria por external_id",
+        select(FinancialMovement).where(
+            FinancialMovement.user_id == 1,
+            FinancialMovement.external_id == "tx-1"
+        ),
+        ("ix_financialmovement_user_external_id",),
+    ),
+    (
+        "propiedades del usuario",
+        select(Property).where(Property.owner_id == 1),
+        ("ix_property_owner_id",),
+    ),
+    (
+        "reglas activas de una propiedad",
+        select(ClassificationRule).where(
+            ClassificationRule.property_id == 1,
+            ClassificationRule.is_active == True
+        ),
+        ("ix_classificationrule_property_active",),
+    ),
+    (
+        "contratos de una propiedad",
+        select(RentalContract).where(RentalContract.property_id == 1),
+        ("ix_rentalcontract_property_id",),
+    ),
+    (
+        "revisiones de una hipoteca",
+        select(MortgageRevision).where(MortgageRevision.mortgage_id == 1).order_by(MortgageRevision.effective_date),
+        ("ix_mortgagerevision_mortgage_date",),
+    ),
+]
+
+
+def _seed(engine):
+    with Session(engine) as session:
+        user = User(email="plan@test.com", hashed_password="x")
+        other = User(email="other@test.com", hashed_password="x")
+        session.add_all([user, other])
+        session.commit()
+        for i in range(6):
+            session.add(Property(owner_id=user.id if i < 3 else other.id, address=f"Calle {i}"))
+        session.commit()
+        for i in range(600):
+            owner = user if i % 2 else other
+            session.add(FinancialMovement(
+                user_id=owner.id,
+                property_id=(PROPERTY_IDS[i % 3] + (0 if owner is user else 3)) if i % 4 else None,
+                date=date(2023 + i % 3, 1 + i % 12, 1 + i % 28),
+                concept=f"Movimiento {i}",
+                amount=float(i),
+                category="Gasto",
+                external_id=f"tx-{i}"
+            ))
+        session.commit()
+
+
+def _plan(engine, query) -> str:
+    sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            # Con tablas pequeñas el planificador prefiere seq scan; lo desactivamos
+            conn.execute(text("SET enable_seqscan = off"))
+            rows = conn.execute(text("EXPLAIN " + sql)).fetchall()
+        else:
+            rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql)).fetchall()
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+def _check_plans(engine):
+    SQLModel.metadata.create_all(engine)
+    _seed(engine)
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+
+    for description, query, index_names in ROUTE_QUERIES:
+        plan = _plan(engine, query)
+        print(f"[{engine.dialect.name}] {description}:\n{plan}\n")
+        assert any(name in plan for name in index_names), \
+            f"{description}: expected one of {index_names} in plan\n{plan}"
+
+
+def test_sqlite_query_plans():
+    _check_plans(create_engine("sqlite://"))
+
+
+def test_postgresql_query_plans():
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL not set")
+
+    schema = f"query_plans_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+
+    engine = create_engine(url)
+
+    @event.listens_for(engine, "connect")
+    def _use_schema(dbapi_connection, connection_record):
+        # Todas las conexiones del motor trabajan solo dentro del esquema temporal
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'SET search_path TO "{schema}"')
+        cursor.close()
+
+    try:
+        _check_plans(engine)
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+        admin.dispose()
+
+
+if __name__ == "__main__":
+    test_sqlite_query_plans()
+    try:
+        test_postgresql_query_plans()
+    except pytest.skip.Exception as e:
+        print(f"PostgreSQL skipped: {e}")
+    print("OK - all route queries use their indexes")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Lectura de extractos (services/statement_ingestion): columnas con alias, fechas e importes
+europeos, limpieza de conceptos de Bankinter y filas inválidas:
+    python test_statement_ingestion.py
+"""
+
+import io
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from app.services.statement_ingestion import ingest_statement, parse_statement
+
+
+def _xlsx(rows) -> bytes:
+    buffer = io.BytesIO()
+    pd.DataFrame(rows, columns=["Fecha", "Concepto", "Importe"]).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def test_parse_statement():
+    statement = parse_statement(pd.DataFrame({
+        "Fecha valor": ["01/03/2024", "02/03/2024", "no es fecha", "03/03/2024"],
+        "Descripción": ["Recibo  LUZ\nPulsa para ver detalle del movimiento", "Alquiler", "x", "y"],
+        "Importe (EUR)": ["-70,50", "1.200,00", "1,00", "(70,00)"],
+    }))
+    assert statement.total_rows == 4
+    assert [(row, str(d), concept, amount) for row, d, concept, amount in statement.records()] == [
+        (1, "2024-03-01", "Recibo LUZ", -70.5),
+        (2, "2024-03-02", "Alquiler", 1200.0),
+        (4, "2024-03-03", "y", -70.0),
+    ]
+    assert statement.errors == ["Row 3: Invalid or missing date: no es fecha"]
+
+
+def test_blank_concept_xlsx():
+    # Una celda de concepto vacía se guarda como "" (concept es NOT NULL), no rechaza el fichero
+    contents = _xlsx([
+        ["01/03/2024", "Recibo agua", "-20,00"],
+        ["02/03/2024", None, "-5,00"],
+        ["03/03/2024", "Recibo agua", "-20,00"],
+    ])
+    for clean_concepts in (True, False):
+        statement = ingest_statement(contents, "extracto.xlsx", clean_concepts=clean_concepts)
+        concepts = [concept for _, _, concept, _ in statement.records()]
+        assert concepts == ["Recibo agua", "", "Recibo agua"], concepts
+        assert statement.errors == []
+
+
+if __name__ == "__main__":
+    test_parse_statement()
+    test_blank_concept_xlsx()
+    print("OK")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Cola de sincronizaciones en segundo plano (services/sync_jobs) sobre una base SQLite
+temporal y un tipo de trabajo de prueba en JOB_KINDS: alta y deduplicación, un solo
+worker reclama cada trabajo, progreso y estadísticas, estados final completado / fallido,
+barrido de trabajos huérfanos y cancelación:
+    python test_sync_jobs.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, update
+from sqlmodel import SQLModel, Session
+
+from app.config import settings
+from app.models import SyncJob
+from app.services.sync_job_handlers import JOB_KINDS, JobFailed, JobKind
+from app.services.sync_jobs import (
+    JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, LOST_WORKER_ERROR,
+    SyncJobWorker, active_job, cancel_job, claim_next_job, enqueue_job, fail_stale_jobs, run_job
+)
+
+STUB_KIND = "test_stub"
+STEPS = ("Preparando", "Descargando", "Importando")
+# Lo que hace el trabajo de prueba en la siguiente ejecución: {"fail": ..., "seen": ...}
+behaviour = {}
+
+
+def stub_handler(progress, params):
+    progress(40, STEPS[1], downloaded=params.get("rows", 0))
+    if behaviour.get("check_midway"):
+        behaviour["seen"] = behaviour["check_midway"]()
+    if behaviour.get("fail") == "expected":
+        raise JobFailed("No hay fichero de Bankinter")
+    if behaviour.get("fail") == "crash":
+        raise RuntimeError("boom")
+    progress(80, STEPS[2], imported=params.get("rows", 0))
+    return {"new_movements": params.get("rows", 0)}
+
+
+JOB_KINDS[STUB_KIND] = JobKind("Trabajo de prueba", STEPS, stub_handler)
+
+
+def _engine():
+    engine = create_engine(f"sqlite:///{tempfile.mkdtemp(prefix='sync-jobs-')}/jobs.db")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def _job(engine, job_id) -> SyncJob:
+    with Session(engine) as session:
+        return session.get(SyncJob, job_id)
+
+
+def _enqueue(engine, user_id=1, params=None) -> int:
+    with Session(engine) as session:
+        return enqueue_job(session, user_id, STUB_KIND, params).id
+
+
+def _age_heartbeat(engine, job_id, seconds):
+    with Session(engine) as session:
+        session.exec(update(SyncJob).where(SyncJob.id == job_id).values(
+            heartbeat_at=datetime.utcnow() - timedelta(seconds=seconds)
+        ))
+        session.commit()
+
+
+def test_enqueue_and_active_job():
+    engine = _engine()
+    with Session(engine) as session:
+        job = enqueue_job(session, 1, STUB_KIND, {"rows": 3})
+        assert (job.status, job.progress, job.current_step) == (JOB_QUEUED, 0, STEPS[0])
+        assert json.loads(job.params) == {"rows": 3}
+
+        # El endpoint reutiliza el trabajo en marcha en lugar de lanzar otro scrape
+        assert active_job(session, 1, STUB_KIND).id == job.id
+        assert active_job(session, 2, STUB_KIND) is None
+        assert active_job(session, 1, "bankinter_sync_now") is None
+
+        try:
+            enqueue_job(session, 1, "no_existe")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("se esperaba ValueError con un tipo desconocido")
+
+    claim_next_job("w1", engine)
+    with Session(engine) as session:
+        assert active_job(session, 1, STUB_KIND).status == JOB_RUNNING
+    run_job(job.id, engine)
+    with Session(engine) as session:
+        assert active_job(session, 1, STUB_KIND) is None
+
+
+def test_single_claim_per_job():
+    engine = _engine()
+    job_ids = [_enqueue(engine) for _ in range(20)]
+    claims = {}
+    start = threading.Barrier(2)
+
+    def worker(worker_id):
+        start.wait()
+        while True:
+            job_id = claim_next_job(worker_id, engine)
+            if job_id is None:
+                return
+            claims.setdefault(job_id, []).append(worker_id)
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert sorted(claims) == job_ids, "todos los trabajos reclamados"
+    assert all(len(workers) == 1 for workers in claims.values()), claims
+    job = _job(engine, job_ids[0])
+    assert job.status == JOB_RUNNING and job.worker_id == claims[job_ids[0]][0]
+    assert job.started_at and job.heartbeat_at
+    assert claim_next_job("w3", engine) is None
+
+
+def test_progress_and_completed():
+    engine = _engine()
+    job_id = _enqueue(engine, params={"rows": 7})
+    assert claim_next_job("w1", engine) == job_id
+    behaviour.clear()
+    # Lo que vería GET /sync-jobs/{id} desde otro proceso mientras el trabajo corre
+    behaviour["check_midway"] = lambda: _job(engine, job_id)
+
+    assert run_job(job_id, engine) == JOB_COMPLETED
+    midway = behaviour["seen"]
+    assert (midway.status, midway.progress, midway.current_step) == (JOB_RUNNING, 40, STEPS[1])
+    assert json.loads(midway.stats) == {"downloaded": 7}
+
+    job = _job(engine, job_id)
+    assert (job.status, job.progress, job.current_step) == (JOB_COMPLETED, 100, STEPS[2])
+    assert json.loads(job.stats) == {"downloaded": 7, "imported": 7}
+    assert json.loads(job.result) == {"new_movements": 7}
+    assert job.finished_at and job.error is None
+
+
+def test_failed_jobs():
+    engine = _engine()
+    for fail, error in (("expected", "No hay fichero de Bankinter"), ("crash", "boom")):
+        job_id = _enqueue(engine)
+        claim_next_job("w1", engine)
+        behaviour.clear()
+        behaviour["fail"] = fail
+        assert run_job(job_id, engine) == JOB_FAILED
+        job = _job(engine, job_id)
+        assert (job.status, job.error, job.result) == (JOB_FAILED, error, None)
+        assert job.progress == 40 and job.finished_at
+    behaviour.clear()
+
+
+def test_stale_sweep():
+    engine = _engine()
+    stale_id, fresh_id, queued_id = _enqueue(engine), _enqueue(engine), _enqueue(engine)
+    claim_next_job("w1", engine)
+    claim_next_job("w2", engine)
+    _age_heartbeat(engine, stale_id, settings.sync_job_stale_seconds + 60)
+
+    # Solo el que lleva más de sync_job_stale_seconds sin latido; no se reintenta
+    assert fail_stale_jobs(engine) == 1
+    stale = _job(engine, stale_id)
+    assert (stale.status, stale.error) == (JOB_FAILED, LOST_WORKER_ERROR) and stale.finished_at
+    assert _job(engine, fresh_id).status == JOB_RUNNING
+    assert _job(engine, queued_id).status == JOB_QUEUED
+    assert fail_stale_jobs(engine) == 0
+
+
+def test_cancel():
+    engine = _engine()
+    queued_id, running_id, stale_id, done_id = (_enqueue(engine) for _ in range(4))
+    with Session(engine) as session:
+        for job_id in (running_id, stale_id, done_id):
+            session.exec(update(SyncJob).where(SyncJob.id == job_id).values(
+                status=JOB_RUNNING, heartbeat_at=datetime.utcnow()
+            ))
+        session.commit()
+    _age_heartbeat(engine, stale_id, settings.sync_job_stale_seconds + 60)
+    with Session(engine) as session:
+        session.exec(update(SyncJob).where(SyncJob.id == done_id).values(status=JOB_COMPLETED))
+        session.commit()
+
+    with Session(engine) as session:
+        job = session.get(SyncJob, queued_id)
+        assert cancel_job(session, job) and job.status == JOB_CANCELLED and job.finished_at
+        # Un worker no reclama un trabajo cancelado
+        assert claim_next_job("w1", engine) is None
+
+        # En marcha con latido reciente: no se toca
+        job = session.get(SyncJob, running_id)
+        assert not cancel_job(session, job) and job.status == JOB_RUNNING
+
+        # En marcha sin latido: su worker murió, se libera como fallido
+        job = session.get(SyncJob, stale_id)
+        assert cancel_job(session, job) and (job.status, job.error) == (JOB_FAILED, LOST_WORKER_ERROR)
+
+        job = session.get(SyncJob, done_id)
+        assert not cancel_job(session, job) and job.status == JOB_COMPLETED
+
+
+def test_worker_threads_run_jobs():
+    engine = _engine()
+    behaviour.clear()
+    poll_interval = settings.sync_job_poll_interval
+    settings.sync_job_poll_interval = 0.05
+    worker = SyncJobWorker(engine)
+    worker.start(2)
+    try:
+        job_ids = [_enqueue(engine, params={"rows": i}) for i in range(5)]
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            jobs = [_job(engine, job_id) for job_id in job_ids]
+            if all(job.status == JOB_COMPLETED for job in jobs):
+                break
+            time.sleep(0.05)
+        assert [json.loads(job.result)["new_movements"] for job in jobs] == list(range(5)), \
+            [job.status for job in jobs]
+    finally:
+        worker.stop(5)
+        settings.sync_job_poll_interval = poll_interval
+    assert not worker.is_running
+
+
+if __name__ == "__main__":
+    test_enqueue_and_active_job()
+    test_single_claim_per_job()
+    test_progress_and_completed()
+    test_failed_jobs()
+    test_stale_sweep()
+    test_cancel()
+    test_worker_threads_run_jobs()
+    print("OK")